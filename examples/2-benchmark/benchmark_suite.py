@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+
+'''
+Benchmark suite for the core kernels
+
+The workloads (get_jk, DFT numerical integration, AO->MO transformation,
+CCSD iteration, FCI sigma vector, PBC FFTDF/GDF builds) are run for systems
+of increasing size, with and without density fitting, for a list of OpenMP
+thread counts.  Timings are saved in a JSON file tagged with the machine
+information, and compared with a stored baseline of the same machine.
+
+Usage:
+
+    python benchmark_suite.py                       # quick suite, all threads
+    python benchmark_suite.py --size full --threads 1,8,32
+    python benchmark_suite.py --only jk,ccsd --output results.json
+    python benchmark_suite.py --save-baseline       # store as the baseline
+    python benchmark_suite.py --baseline baselines/xxx.json --tolerance .1
+
+The default baseline file is baselines/<machine-id>.json next to this script.
+Workloads which are slower than the baseline by more than the tolerance are
+reported and the script exits with status 1.
+'''
+
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import argparse
+import numpy
+import pyscf
+from pyscf import lib, gto, scf, dft, ao2mo, cc, fci
+
+if hasattr(time, 'process_time'):
+    _cpu_time = time.process_time
+else:
+    _cpu_time = time.clock
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'baselines')
+
+def machine_info():
+    info = {'hostname': platform.node(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'pyscf': pyscf.__version__,
+            'ncpu': os.cpu_count() if hasattr(os, 'cpu_count') else None,
+            'max_threads': lib.num_threads(),
+            'cpu': platform.processor()}
+    if os.path.isfile('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if 'model name' in line:
+                    info['cpu'] = line.split(':', 1)[1].strip()
+                    break
+    if os.path.isfile('/proc/meminfo'):
+        with open('/proc/meminfo') as f:
+            info['memory'] = f.readline().split(':', 1)[1].strip()
+    # Timings are comparable only on the same kind of machine
+    key = '%s-%s-%s' % (info['cpu'], info['ncpu'], info.get('memory'))
+    info['machine_id'] = hashlib.sha1(key.encode()).hexdigest()[:12]
+    return info
+
+def hydrogen_chain(n, basis):
+    return gto.M(atom=[['H', (0, 0, i*1.4)] for i in range(n)], unit='Bohr',
+                 basis=basis, verbose=0, output=None)
+
+def alkane(n, basis):
+    '''Linear alkane CnH2n+2 with idealized geometry'''
+    atoms = []
+    for i in range(n):
+        x = i * 1.26
+        y = .44 * (-1)**i
+        atoms.append(['C', (x, y, 0)])
+        atoms.append(['H', (x, y+1.09*(-1)**i, 0)])
+        atoms.append(['H', (x, y-.36*(-1)**i, .89 * (-1)**i)])
+    atoms.append(['H', (-1.0, -.2, 0)])
+    atoms.append(['H', ((n-1)*1.26+1.0, .44*(-1)**(n-1)-.2, 0)])
+    return gto.M(atom=atoms, basis=basis, verbose=0, output=None)
+
+SIZES = {
+    'quick': {'alkane': [(2, '6-31g'), (4, '6-31g*')],
+              'hchain': [(20, 'ccpvdz')],
+              'cas': [10, 12],
+              'cell': [('gth-szv', 1)]},
+    'full': {'alkane': [(2, '6-31g'), (4, '6-31g*'), (8, 'cc-pvdz'),
+                        (12, 'cc-pvtz')],
+             'hchain': [(20, 'ccpvdz'), (30, 'ccpvtz')],
+             'cas': [12, 14, 16],
+             'cell': [('gth-szv', 1), ('gth-dzvp', 2)]},
+}
+
+def _rhf_dm(mol):
+    return scf.hf.get_init_guess(mol, 'minao')
+
+def bench_jk(size):
+    for n, basis in SIZES[size]['alkane']:
+        mol = alkane(n, basis)
+        dm = _rhf_dm(mol)
+        params = {'mol': 'C%dH%d' % (n, 2*n+2), 'basis': basis, 'nao': mol.nao}
+        mf = scf.RHF(mol)
+        mf.max_memory = 0  # direct SCF
+        yield 'get_jk', dict(params, df=False), lambda: mf.get_jk(mol, dm)
+        mf_df = scf.RHF(mol).density_fit()
+        mf_df.with_df.build()
+        yield 'get_jk', dict(params, df=True), lambda: mf_df.get_jk(mol, dm)
+
+def bench_dft(size):
+    for n, basis in SIZES[size]['alkane']:
+        mol = alkane(n, basis)
+        dm = _rhf_dm(mol)
+        for level in (3, 5):
+            grids = dft.gen_grid.Grids(mol)
+            grids.level = level
+            grids.build()
+            ni = dft.numint.NumInt()
+            params = {'mol': 'C%dH%d' % (n, 2*n+2), 'basis': basis,
+                      'nao': mol.nao, 'grids': grids.weights.size}
+            yield ('nr_rks', dict(params, xc='lda,vwn'),
+                   lambda: ni.nr_rks(mol, grids, 'lda,vwn', dm))
+            yield ('nr_rks', dict(params, xc='b3lyp'),
+                   lambda: ni.nr_rks(mol, grids, 'b3lyp', dm))
+
+def bench_ao2mo(size):
+    for n, basis in SIZES[size]['alkane']:
+        mol = alkane(n, basis)
+        mo = numpy.linalg.qr(numpy.random.RandomState(1).rand(mol.nao, mol.nao))[0]
+        params = {'mol': 'C%dH%d' % (n, 2*n+2), 'basis': basis, 'nao': mol.nao}
+        yield ('ao2mo', dict(params, method='outcore'),
+               lambda: ao2mo.outcore.general_iofree(mol, (mo,)*4))
+        mf = scf.RHF(mol).density_fit()
+        mf.with_df.build()
+        yield ('ao2mo', dict(params, method='df'),
+               lambda: mf.with_df.ao2mo(mo))
+
+def bench_ccsd(size):
+    for n, basis in SIZES[size]['hchain']:
+        mol = hydrogen_chain(n, basis)
+        mf = scf.RHF(mol)
+        mf.max_cycle = 0
+        mf.kernel()
+        mycc = cc.CCSD(mf)
+        eris = mycc.ao2mo()
+        t1, t2 = mycc.get_init_guess(eris)[1:]
+        params = {'mol': 'H%d' % n, 'basis': basis, 'nocc': mycc.nocc,
+                  'nmo': mycc.nmo}
+        yield 'ccsd_update_amps', params, lambda: mycc.update_amps(t1, t2, eris)
+
+def bench_fci(size):
+    for norb in SIZES[size]['cas']:
+        nelec = (norb//2, norb//2)
+        npair = norb*(norb+1)//2
+        rand = numpy.random.RandomState(1)
+        h2 = rand.rand(npair*(npair+1)//2)
+        na = fci.cistring.num_strings(norb, nelec[0])
+        ci0 = rand.rand(na, na)
+        ci0 *= 1/numpy.linalg.norm(ci0)
+        link = fci.cistring.gen_linkstr_index(range(norb), nelec[0], tril=True)
+        params = {'norb': norb, 'nelec': sum(nelec)}
+        yield ('fci_contract_2e', dict(params, solver='spin1'),
+               lambda: fci.direct_spin1.contract_2e(h2, ci0, norb, nelec,
+                                                    (link, link)))
+
+def bench_pbc(size):
+    from pyscf.pbc import gto as pbcgto
+    from pyscf.pbc import df as pbcdf
+    for basis, ncell in SIZES[size]['cell']:
+        cell = pbcgto.Cell()
+        cell.a = numpy.eye(3) * 3.5668 * ncell
+        cell.atom = [['C', numpy.dot(x, numpy.eye(3)*3.5668)]
+                     for x in numpy.vstack([[0, 0, 0], [.5, .5, 0], [.5, 0, .5],
+                                            [0, .5, .5], [.25, .25, .25],
+                                            [.75, .75, .25], [.75, .25, .75],
+                                            [.25, .75, .75]])]
+        if ncell > 1:
+            cell.atom = [[a, r + numpy.dot([i, j, k], numpy.eye(3)*3.5668)]
+                         for a, r in cell.atom for i in range(ncell)
+                         for j in range(ncell) for k in range(ncell)]
+        cell.basis = basis
+        cell.pseudo = 'gth-pade'
+        cell.verbose = 0
+        cell.output = None
+        cell.build()
+        dm = numpy.eye(cell.nao) * .5
+        params = {'cell': 'C%d' % cell.natm, 'basis': basis, 'nao': cell.nao}
+        fftdf = pbcdf.FFTDF(cell)
+        yield ('pbc_get_jk', dict(params, df='FFTDF'),
+               lambda: fftdf.get_jk(dm))
+        def gdf_build():
+            pbcdf.GDF(cell).build()
+        yield 'pbc_df_build', dict(params, df='GDF'), gdf_build
+
+WORKLOADS = {'jk': bench_jk, 'dft': bench_dft, 'ao2mo': bench_ao2mo,
+             'ccsd': bench_ccsd, 'fci': bench_fci, 'pbc': bench_pbc}
+
+def timeit(fn, repeat):
+    '''The best wall time (and its CPU time) of repeated runs'''
+    best = None
+    for i in range(repeat):
+        cpu0, wall0 = _cpu_time(), time.time()
+        fn()
+        t = (time.time() - wall0, _cpu_time() - cpu0)
+        if best is None or t[0] < best[0]:
+            best = t
+    return best
+
+def result_key(res):
+    return json.dumps([res['name'], res['params'], res['threads']],
+                      sort_keys=True)
+
+def run(workloads, size, threads, repeat, log):
+    results = []
+    for wname in workloads:
+        for name, params, fn in WORKLOADS[wname](size):
+            for nthreads in threads:
+                lib.num_threads(nthreads)
+                try:
+                    wall, cpu = timeit(fn, repeat)
+                except Exception as e:
+                    log.warn('%s %s failed: %s', name, params, e)
+                    continue
+                res = {'name': name, 'params': params, 'threads': nthreads,
+                       'wall': wall, 'cpu': cpu}
+                log.note('%-18s threads=%-3d wall=%8.3f s cpu=%8.3f s  %s',
+                         name, nthreads, wall, cpu,
+                         json.dumps(params, sort_keys=True))
+                results.append(res)
+    return results
+
+def compare(results, baseline, tolerance, log):
+    '''Report the workloads which are slower than the baseline.  Returns the
+    number of regressions.'''
+    ref = dict([(result_key(r), r) for r in baseline['results']])
+    nregress = 0
+    for res in results:
+        key = result_key(res)
+        if key not in ref:
+            continue
+        ratio = res['wall'] / max(ref[key]['wall'], 1e-9)
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            nregress += 1
+        log.note('%-18s threads=%-3d %8.3f s  baseline %8.3f s  ratio %5.2f%s',
+                 res['name'], res['threads'], res['wall'], ref[key]['wall'],
+                 ratio, flag)
+    return nregress
+
+def scaling(results, log):
+    '''Parallel efficiency with respect to the smallest thread count'''
+    groups = {}
+    for res in results:
+        key = json.dumps([res['name'], res['params']], sort_keys=True)
+        groups.setdefault(key, []).append(res)
+    for key, group in groups.items():
+        group = sorted(group, key=lambda r: r['threads'])
+        t0, n0 = group[0]['wall'], group[0]['threads']
+        for res in group[1:]:
+            speedup = t0 / max(res['wall'], 1e-9)
+            log.note('%-18s %3d -> %3d threads  speedup %5.2f  efficiency %5.2f',
+                     res['name'], n0, res['threads'], speedup,
+                     speedup * n0 / res['threads'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PySCF benchmark suite')
+    parser.add_argument('--size', default='quick', choices=sorted(SIZES))
+    parser.add_argument('--only', default=','.join(sorted(WORKLOADS)),
+                        help='comma-separated workloads among %s' %
+                        ', '.join(sorted(WORKLOADS)))
+    parser.add_argument('--threads', default=None,
+                        help='comma-separated thread counts (default: 1 and all)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=.2)
+    args = parser.parse_args(argv)
+
+    log = lib.logger.Logger(sys.stdout, lib.logger.NOTE)
+    info = machine_info()
+    log.note('Machine %s', json.dumps(info, sort_keys=True))
+
+    max_threads = lib.num_threads()
+    if args.threads is None:
+        threads = sorted(set([1, max_threads]))
+    else:
+        threads = [int(x) for x in args.threads.split(',')]
+    workloads = [x.strip() for x in args.only.split(',') if x.strip()]
+
+    try:
+        results = run(workloads, args.size, threads, args.repeat, log)
+    finally:
+        lib.num_threads(max_threads)
+    scaling(results, log)
+
+    data = {'machine': info, 'size': args.size,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    output = args.output
+    if output is None:
+        output = 'benchmark-%s-%s.json' % (info['machine_id'],
+                                           time.strftime('%Y%m%d-%H%M%S'))
+    with open(output, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    log.note('Results saved in %s', output)
+
+    baseline_file = args.baseline
+    if baseline_file is None:
+        baseline_file = os.path.join(BASELINE_DIR, '%s.json' % info['machine_id'])
+    if args.save_baseline:
+        if not os.path.isdir(os.path.dirname(baseline_file)):
+            os.makedirs(os.path.dirname(baseline_file))
+        with open(baseline_file, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        log.note('Baseline saved in %s', baseline_file)
+        return 0
+    elif os.path.isfile(baseline_file):
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)
+        if baseline['machine']['machine_id'] != info['machine_id']:
+            log.warn('Baseline %s was measured on a different machine',
+                     baseline_file)
+        nregress = compare(results, baseline, args.tolerance, log)
+        log.note('%d regressions found', nregress)
+        return int(nregress > 0)
+    else:
+        log.note('No baseline found for machine %s', info['machine_id'])
+        return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
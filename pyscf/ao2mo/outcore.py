@@ -111,6 +111,22 @@ def full(mol, mo_coeff, erifile, dataname='eri_mo',
             intor, aosym, comp, max_memory, ioblk_size, verbose, compact)
     return erifile
 
+def _general_cost(mol, mo_coeffs, erifile, dataname='eri_mo',
+                  intor='int2e', aosym='s4', comp=None, *args, **kwargs):
+    '''Estimated (FLOPs, bytes) of :func:`general`.  bytes counts the disk
+    traffic of the half-transformed and the final integrals.'''
+    nao = mo_coeffs[0].shape[0]
+    nmoi, nmoj, nmok, nmol = [c.shape[1] for c in mo_coeffs]
+    if comp is None:
+        comp = 1
+    nao_pair = nao * (nao+1) // 2
+    nkl = nmok * nmol
+    flops = 2. * nao_pair * (nao**2 * nmok + nao * nkl)
+    flops += 2. * nkl * (nao**2 * nmoi + nao * nmoi * nmoj)
+    nbytes = 8. * (2 * nao_pair * nkl + nmoi * nmoj * nkl)
+    return flops * comp, nbytes * comp
+
+@lib.profiler.profile('ao2mo.outcore.general', _general_cost)
 def general(mol, mo_coeffs, erifile, dataname='eri_mo',
             intor='int2e', aosym='s4', comp=None,
             max_memory=MAX_MEMORY, ioblk_size=IOBLK_SIZE, verbose=logger.WARN,
@@ -686,15 +702,18 @@ def prange(start, end, step):
         yield i, min(i+step, end)
 
 def guess_e1bufsize(max_memory, ioblk_size, nij_pair, nao_pair, comp):
-    mem_words = max(1, max_memory * 1e6 / 8)
+# Each thread of AO2MOnr_e2_drv allocates (nao+nmo)**2 (< 8*nao_pair) words
+    thread_buf = lib.num_threads() * nao_pair * 8 * 8
+    mem_words = max(1, (max_memory * 1e6 - thread_buf) / 8)
 # part of the max_memory is used to hold the AO integrals.  The iobuf is the
 # buffer to temporary hold the transformed integrals before streaming to disk.
 # iobuf is then divided to small blocks (ioblk_words) and streamed to disk.
     iobuf_words = max(int(mem_words//6), IOBUF_WORDS)
     ioblk_words = int(min(ioblk_size*1e6/8, iobuf_words))
 
-    e1buflen = int(mem_words*.66/(comp*(nij_pair*2+nao_pair)))
-    e1buflen = max(e1buflen, IOBUF_ROW_MIN)
+    e1buflen = lib.blocking.plan_blksize(comp*(nij_pair*2+nao_pair)*8,
+                                         mem_words*8e-6*.66,
+                                         minimum=IOBUF_ROW_MIN)
     return e1buflen, mem_words, iobuf_words, ioblk_words
 
 def guess_e2bufsize(ioblk_size, nrows, ncols):
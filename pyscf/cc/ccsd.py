@@ -41,6 +41,7 @@ MEMORYMIN = getattr(__config__, 'cc_ccsd_memorymin', 2000)
 
 # t1: ia
 # t2: ijab
+@lib.profiler.profile('cc.ccsd.kernel')
 def kernel(mycc, eris=None, t1=None, t2=None, max_cycle=50, tol=1e-8,
            tolnormt=1e-6, verbose=None):
     log = logger.new_logger(mycc, verbose)
@@ -61,6 +62,9 @@ def kernel(mycc, eris=None, t1=None, t2=None, max_cycle=50, tol=1e-8,
     elif mycc.diis:
         adiis = lib.diis.DIIS(mycc, mycc.diis_file, incore=mycc.incore_complete)
         adiis.space = mycc.diis_space
+        if mycc.diis_compress:
+            adiis.compress = mycc.diis_compress
+            adiis.max_memory = max(0, mycc.max_memory - lib.current_memory()[0])
     else:
         adiis = None
 
@@ -82,6 +86,9 @@ def kernel(mycc, eris=None, t1=None, t2=None, max_cycle=50, tol=1e-8,
         eold, eccsd = eccsd, mycc.energy(t1, t2, eris)
         log.info('cycle = %d  E_corr(CCSD) = %.15g  dE = %.9g  norm(t1,t2) = %.6g',
                  istep+1, eccsd, eccsd - eold, normt)
+        if (mycc.async_chk and mycc.chk_cycle > 0 and
+            (istep+1) % mycc.chk_cycle == 0):
+            mycc.dump_chk((t1, t2), e_corr=eccsd)
         cput1 = log.timer('CCSD iter', *cput1)
         if abs(eccsd-eold) < tol and normt < tolnormt:
             conv = True
@@ -90,6 +97,19 @@ def kernel(mycc, eris=None, t1=None, t2=None, max_cycle=50, tol=1e-8,
     return conv, eccsd, t1, t2
 
 
+def _update_amps_cost(mycc, t1, t2, eris):
+    '''Estimated (FLOPs, bytes) of :func:`update_amps`.  Only the leading
+    terms are counted.'''
+    nocc, nvir = t1.shape
+    flops = (2. * nocc**2 * nvir**4 / 2 + 2. * 10 * nocc**3 * nvir**3
+             + 2. * nocc**4 * nvir**2)
+    # ovvv, ovov, oovv, ovvo and the amplitudes
+    nbytes = 8. * (nocc * nvir**3 / 2 + 5 * nocc**2 * nvir**2)
+    if not mycc.direct:
+        nbytes += 8. * (nvir * (nvir+1) // 2)**2
+    return flops, nbytes
+
+@lib.profiler.profile('cc.ccsd.update_amps', _update_amps_cost)
 def update_amps(mycc, t1, t2, eris):
     if mycc.cc2:
         raise NotImplementedError
@@ -518,7 +538,8 @@ def _contract_s4vvvv_t2(mycc, mol, vvvv, t2, out=None, verbose=None):
         intor = mol._add_suffix('int2e')
         ao2mopt = _ao2mo.AO2MOpt(mol, intor, 'CVHFnr_schwarz_cond',
                                  'CVHFsetnr_direct_scf')
-        blksize = max(BLKMIN, numpy.sqrt(max_memory*.9e6/8/nvirb**2/2.5))
+        blksize = lib.blocking.plan_blksize(nvirb**2*8*2.5, max_memory*.9,
+                                            ndim=2, minimum=BLKMIN)
         blksize = int(min((nvira+3)/4, blksize))
         sh_ranges = ao2mo.outcore.balance_partition(ao_loc, blksize)
         blksize = max(x[2] for x in sh_ranges)
@@ -560,7 +581,8 @@ def _contract_s4vvvv_t2(mycc, mol, vvvv, t2, out=None, verbose=None):
     else:
         nvir_pair = nvirb * (nvirb+1) // 2
         unit = nvira*nvir_pair*2 + nvirb**2*nvira/4 + 1
-        blksize = numpy.sqrt(max(BLKMIN**2, max_memory*.95e6/8/unit))
+        blksize = lib.blocking.plan_blksize(unit*8, max_memory*.95, ndim=2,
+                                            minimum=BLKMIN)
         blksize = int(min((nvira+3)/4, blksize))
 
         tril2sq = lib.square_mat_in_trilu_indices(nvira)
@@ -608,7 +630,8 @@ def _contract_s1vvvv_t2(mycc, mol, vvvv, t2, out=None, verbose=None):
 
     max_memory = mycc.max_memory - lib.current_memory()[0]
     unit = nvirb**2*nvira*2 + nocc2*nvirb + 1
-    blksize = min(nvira, max(BLKMIN, int(max_memory*1e6/8/unit)))
+    blksize = lib.blocking.plan_blksize(unit*8, max_memory, nvira,
+                                        minimum=BLKMIN)
 
     for p0,p1 in lib.prange(0, nvira, blksize):
         Ht2[:,p0:p1] = lib.einsum('xcd,acbd->xab', x2, vvvv[p0:p1])
@@ -832,6 +855,17 @@ class CCSD(lib.StreamObject):
             Allow for asynchronous function execution. Default is True.
         incore_complete : bool
             Avoid all I/O (also for DIIS). Default is False.
+        diis_compress : str
+            Keep the DIIS error vectors in memory in the compact format
+            'float32' or 'blockwise' (see :class:`lib.diis.DIIS`).  When the
+            memory is exhausted, they are stored in memory-mapped files.
+            Default is None.
+        async_chk : bool
+            Write the checkpoints in a background thread and checkpoint the
+            amplitudes during the iterations. Default is False.
+        chk_cycle : int
+            With async_chk, the amplitudes are checkpointed every chk_cycle
+            iterations. Default is 5.
         level_shift : float
             A shift on virtual orbital energies to stablize the CCSD iteration
         frozen : int or list
@@ -876,6 +910,9 @@ class CCSD(lib.StreamObject):
     async_io = getattr(__config__, 'cc_ccsd_CCSD_async_io', True)
     incore_complete = getattr(__config__, 'cc_ccsd_CCSD_incore_complete', False)
     cc2 = getattr(__config__, 'cc_ccsd_CCSD_cc2', False)
+    async_chk = getattr(__config__, 'cc_ccsd_CCSD_async_chk', False)
+    chk_cycle = getattr(__config__, 'cc_ccsd_CCSD_chk_cycle', 5)
+    diis_compress = getattr(__config__, 'cc_ccsd_CCSD_diis_compress', None)
 
     def __init__(self, mf, frozen=None, mo_coeff=None, mo_occ=None):
         if isinstance(mf, gto.Mole):
@@ -925,7 +962,8 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         keys = set(('max_cycle', 'conv_tol', 'iterative_damping',
                     'conv_tol_normt', 'diis', 'diis_space', 'diis_file',
                     'diis_start_cycle', 'diis_start_energy_diff', 'direct',
-                    'async_io', 'incore_complete', 'cc2'))
+                    'async_io', 'incore_complete', 'cc2', 'async_chk',
+                    'chk_cycle', 'diis_compress'))
         self._keys = set(self.__dict__.keys()).union(keys)
 
     @property
@@ -976,6 +1014,11 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         #log.info('diis_file = %s', self.diis_file)
         log.info('diis_start_cycle = %d', self.diis_start_cycle)
         log.info('diis_start_energy_diff = %g', self.diis_start_energy_diff)
+        if self.diis_compress:
+            log.info('diis_compress = %s', self.diis_compress)
+        if self.async_chk:
+            log.info('async_chk = %s, chk_cycle = %d', self.async_chk,
+                     self.chk_cycle)
         log.info('max_memory %d MB (current use %d MB)',
                  self.max_memory, lib.current_memory()[0])
         if (log.verbose >= logger.DEBUG1 and
@@ -1038,10 +1081,11 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         if self.e_hf is None:
             self.e_hf = self._scf.e_tot
 
-        self.converged, self.e_corr, self.t1, self.t2 = \
-                kernel(self, eris, t1, t2, max_cycle=self.max_cycle,
-                       tol=self.conv_tol, tolnormt=self.conv_tol_normt,
-                       verbose=self.verbose)
+        with lib.chkfile.async_flush(self):
+            self.converged, self.e_corr, self.t1, self.t2 = \
+                    kernel(self, eris, t1, t2, max_cycle=self.max_cycle,
+                           tol=self.conv_tol, tolnormt=self.conv_tol_normt,
+                           verbose=self.verbose)
         self._finalize()
         return self.e_corr, self.t1, self.t2
 
@@ -1206,10 +1250,12 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         nov = nocc * nvir
         return nov + nov*(nov+1)//2
 
-    def dump_chk(self, t1_t2=None, frozen=None, mo_coeff=None, mo_occ=None):
+    def dump_chk(self, t1_t2=None, frozen=None, mo_coeff=None, mo_occ=None,
+                 e_corr=None):
         if not self.chkfile:
             return self
         if t1_t2 is None: t1_t2 = self.t1, self.t2
+        if e_corr is None: e_corr = self.e_corr
         t1, t2 = t1_t2
 
         if frozen is None: frozen = self.frozen
@@ -1217,7 +1263,7 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         if frozen is None:
             frozen = 0
 
-        cc_chk = {'e_corr': self.e_corr,
+        cc_chk = {'e_corr': e_corr,
                   't1': t1,
                   't2': t2,
                   'frozen': frozen}
@@ -1227,7 +1273,12 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         if self._nmo is not None: cc_chk['_nmo'] = self._nmo
         if self._nocc is not None: cc_chk['_nocc'] = self._nocc
 
-        lib.chkfile.save(self.chkfile, 'ccsd', cc_chk)
+        if self.async_chk:
+            lib.chkfile.async_writer().submit(
+                (self.chkfile, 'ccsd'), lib.chkfile.save, self.chkfile, 'ccsd',
+                cc_chk)
+        else:
+            lib.chkfile.save(self.chkfile, 'ccsd', cc_chk)
 
     def density_fit(self, auxbasis=None, with_df=None):
         from pyscf.cc import dfccsd
@@ -55,6 +55,9 @@ def kernel(mycc, eris=None, t1=None, t2=None, l1=None, l2=None,
     elif mycc.diis:
         adiis = lib.diis.DIIS(mycc, mycc.diis_file, incore=mycc.incore_complete)
         adiis.space = mycc.diis_space
+        if getattr(mycc, 'diis_compress', None):
+            adiis.compress = mycc.diis_compress
+            adiis.max_memory = max(0, mycc.max_memory - lib.current_memory()[0])
     else:
         adiis = None
     cput0 = log.timer('CCSD lambda initialization', *cput0)
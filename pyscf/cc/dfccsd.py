@@ -18,7 +18,6 @@ import ctypes
 import numpy
 from pyscf import lib
 from pyscf.lib import logger
-from pyscf.ao2mo import _ao2mo
 from pyscf import df
 from pyscf.cc import ccsd
 from pyscf.cc import _ccsd
@@ -145,8 +144,7 @@ def _make_df_eris(cc, mo_coeff=None):
     ijslice = (0, nmo, 0, nmo)
     p1 = 0
     Lpq = None
-    for k, eri1 in enumerate(with_df.loop()):
-        Lpq = _ao2mo.nr_e2(eri1, mo, ijslice, aosym='s2', mosym='s1', out=Lpq)
+    for Lpq in df.addons.loop_ao2mo(with_df, mo, ijslice, out=Lpq):
         p0, p1 = p1, p1 + Lpq.shape[0]
         Lpq = Lpq.reshape(p1-p0,nmo,nmo)
         Loo[p0:p1] = Lpq[:,:nocc,:nocc]
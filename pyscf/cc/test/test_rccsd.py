@@ -124,6 +124,27 @@ class KnownValues(unittest.TestCase):
         self.assertEqual(lib.chkfile.load(cc1._scf.chkfile, 'ccsd/e_corr'),
                          mycc.e_corr)
 
+    def test_async_chk(self):
+        ftmp = tempfile.NamedTemporaryFile()
+        cc1 = ccsd.CCSD(mf)
+        cc1.chkfile = ftmp.name
+        cc1.async_chk = True
+        cc1.chk_cycle = 2
+        dumped = []
+        def dump_chk(t1_t2=None, frozen=None, mo_coeff=None, mo_occ=None,
+                     e_corr=None):
+            # e_corr is not updated during the iterations
+            self.assertTrue(cc1.e_corr is None)
+            dumped.append(e_corr)
+            return ccsd.CCSD.dump_chk(cc1, t1_t2, frozen, mo_coeff, mo_occ,
+                                      e_corr)
+        cc1.dump_chk = dump_chk
+        cc1.kernel(eris=eris)
+        self.assertTrue(len(dumped) > 0)
+        self.assertTrue(len(dumped) <= cc1.max_cycle // 2)
+        self.assertAlmostEqual(lib.chkfile.load(ftmp.name, 'ccsd/e_corr'),
+                               dumped[-1], 12)
+
     def test_ccsd_t(self):
         e = mycc.ccsd_t()
         self.assertAlmostEqual(e, -0.0009964234049929792, 10)
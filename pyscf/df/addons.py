@@ -19,9 +19,13 @@
 import sys
 import copy
 import numpy
+import scipy.sparse
+import h5py
+from pyscf import lib
 from pyscf.lib import logger
 from pyscf import gto
 from pyscf import ao2mo
+from pyscf.ao2mo import _ao2mo
 from pyscf.data import elements
 from pyscf import __config__
 
@@ -77,6 +81,129 @@ class load(ao2mo.load):
         ao2mo.load.__init__(self, eri, dataname)
 
 
+def memmap(h5dat):
+    '''Copy-on-write numpy.memmap of an HDF5 dataset.  None if the dataset
+    is not stored contiguously on disk (chunked or compressed datasets, or
+    datasets of in-memory files).
+
+    Slicing the memmap along the first dimension gives views of the file
+    without copying the data.  The pages are cached by the OS and shared by
+    all processes which map the same file.  Modifying the memmap does not
+    change the file.
+    '''
+    if (not isinstance(h5dat, h5py.Dataset) or h5dat.chunks is not None or
+        h5dat.size == 0 or not h5dat.dtype.isnative or
+        h5dat.file.driver not in ('sec2', 'stdio')):
+        return None
+    offset = h5dat.id.get_offset()
+    if offset is None:  # storage not allocated
+        return None
+    return numpy.memmap(h5dat.file.filename, dtype=h5dat.dtype, mode='c',
+                        offset=offset, shape=h5dat.shape)
+
+def screen_pairs(mol, auxmol, tol, aosym='s2ij', int2c='int2c2e'):
+    '''Indices of the significant AO pairs of the 3-center integrals (ij|L).
+
+    The integrals of a shell pair are bounded by the Schwarz inequality
+    |(ij|L)| <= sqrt((ij|ij)) * sqrt((L|L)).  The AO pairs whose bound is
+    smaller than tol for all auxiliary functions L are dropped.
+
+    Returns:
+        1D int array.  The indices of the significant AO pairs in the
+        compound pair index (i*(i+1)//2+j, i>=j for aosym='s2ij'; i*nao+j
+        for aosym='s1') in ascending order.
+    '''
+    from pyscf.scf import _vhf
+    q_cond = _vhf.get_q_cond(mol)
+    j2c_diag = auxmol.intor(int2c, hermi=1).diagonal()
+    mask = q_cond * numpy.sqrt(abs(j2c_diag).max()) >= tol
+    ao_loc = mol.ao_loc_nr()
+    nao = ao_loc[-1]
+    dims = ao_loc[1:] - ao_loc[:-1]
+    mask = numpy.repeat(numpy.repeat(mask, dims, axis=0), dims, axis=1)
+    if aosym == 's1':
+        return numpy.where(mask.ravel())[0]
+    else:
+        return numpy.hstack([numpy.where(mask[i,:i+1])[0] + i*(i+1)//2
+                             for i in range(nao)])
+
+def unpack_pairs(eri, pair_idx, nao_pair, out=None):
+    '''Scatter the rows of a DF tensor stored for the AO pairs pair_idx
+    (see :func:`screen_pairs`) to all nao_pair AO pairs.'''
+    out = numpy.ndarray((eri.shape[0], nao_pair), dtype=eri.dtype, buffer=out)
+    out[:] = 0
+    out[:,pair_idx] = eri
+    return out
+
+def pair_csr_pattern(pair_idx, nao):
+    '''CSR pattern of the symmetric nao x nao matrices stored on the lower
+    triangular AO pairs pair_idx.
+
+    Returns:
+        (src, indptr, indices).  src[n] is the position in pair_idx of the
+        n-th nonzero element of the CSR matrix.
+    '''
+    pair_idx = numpy.asarray(pair_idx)
+    off = numpy.arange(nao+1) * (numpy.arange(nao+1)+1) // 2
+    i = numpy.searchsorted(off, pair_idx, side='right') - 1
+    j = pair_idx - off[i]
+    offdiag = numpy.where(i != j)[0]
+    src = numpy.hstack((numpy.arange(pair_idx.size), offdiag))
+    rows = numpy.hstack((i, j[offdiag]))
+    cols = numpy.hstack((j, i[offdiag]))
+    idx = numpy.lexsort((cols, rows))
+    indptr = numpy.searchsorted(rows[idx], numpy.arange(nao+1))
+    return src[idx], indptr, cols[idx]
+
+def pairs_to_csr(eri, pattern, nao, block_diag=False):
+    '''Unpack the rows of a DF tensor stored on the AO pairs of pattern (see
+    :func:`pair_csr_pattern`) to a sparse matrix.  The naux symmetric
+    nao x nao matrices are stacked to a (naux*nao,nao) matrix, or put on the
+    diagonal blocks of a (naux*nao,naux*nao) matrix if block_diag is set.
+    '''
+    src, indptr, indices = pattern
+    naux = eri.shape[0]
+    nnz = src.size
+    data = eri[:,src].ravel()
+    indptr = (indptr[:-1] + numpy.arange(naux)[:,None] * nnz).ravel()
+    indptr = numpy.append(indptr, naux*nnz)
+    if block_diag:
+        indices = (indices + numpy.arange(naux)[:,None] * nao).ravel()
+        shape = (naux*nao, naux*nao)
+    else:
+        indices = numpy.tile(indices, naux)
+        shape = (naux*nao, nao)
+    return scipy.sparse.csr_matrix((data, indices, indptr), shape=shape)
+
+def loop_ao2mo(with_df, mo_coeff, orbs_slice, blksize=None, out=None):
+    '''Loop over the DF tensor transformed to the MO pairs of orbs_slice
+    (see :func:`_ao2mo.nr_e2`).  Each block is a 2D array of
+    (blksize,ni*nj).  If the DF tensor is stored for the screened AO pairs
+    only (see :meth:`DF.get_pair_idx`), the transformation is carried out on
+    the stored AO pairs.
+    '''
+    pair_idx = None
+    if getattr(with_df, 'get_pair_idx', None) is not None:
+        pair_idx = with_df.get_pair_idx()
+    if pair_idx is None:
+        for eri1 in with_df.loop(blksize):
+            out = _ao2mo.nr_e2(eri1, mo_coeff, orbs_slice, aosym='s2',
+                               mosym='s1', out=out)
+            yield out
+    else:
+        nao = mo_coeff.shape[0]
+        i0, i1, j0, j1 = orbs_slice
+        pattern = pair_csr_pattern(pair_idx, nao)
+        for eri1 in with_df.sparse_loop(blksize):
+            naux = eri1.shape[0]
+            cderi = pairs_to_csr(eri1, pattern, nao)
+            buf = cderi.dot(mo_coeff[:,j0:j1]).reshape(naux,nao,j1-j0)
+            out = numpy.ndarray((naux,(i1-i0)*(j1-j0)), buffer=out)
+            out[:] = lib.einsum('ui,puj->pij', mo_coeff[:,i0:i1],
+                                buf).reshape(naux,-1)
+            yield out
+
+
 def aug_etb_for_dfbasis(mol, dfbasis=DFBASIS, beta=ETB_BETA,
                         start_at=FIRST_ETB_ELEMENT):
     '''augment weigend basis with even-tempered gaussian basis
@@ -38,6 +38,9 @@ from pyscf.ao2mo.incore import _conc_mos, iden_coeffs
 from pyscf.ao2mo.outcore import _load_from_h5g
 from pyscf import __config__
 
+# The smallest block of DF tensor to load from disk
+BLKMIN = getattr(__config__, 'df_df_DF_blkmin', 8)
+
 class DF(lib.StreamObject):
     r'''
     Object to hold 3-index tensor
@@ -54,7 +57,9 @@ class DF(lib.StreamObject):
             should NOT be modified.
         _cderi_to_save : str
             If _cderi_to_save is specified, the DF integral tensor will be
-            saved in this file.
+            saved in this file.  An interrupted build with the same
+            _cderi_to_save continues from the completed blocks of the DF
+            tensor (see the resume argument of :func:`outcore.cholesky_eri`).
         _cderi : str or numpy array
             If _cderi is specified, the DF integral tensor will be read from
             this HDF5 file (or numpy array). When the DF integral tensor is
@@ -70,10 +75,38 @@ class DF(lib.StreamObject):
             N is the number of basis functions of the orbital basis.
         blockdim : int
             When reading DF integrals from disk the chunk size to load.  It is
-            used to improve IO performance.
+            used to improve IO performance.  Smaller chunks are loaded if
+            blockdim rows do not fit in max_memory.
+        pair_screen_tol : float
+            If given, the DF tensor is stored only for the AO pairs whose
+            3-center integrals are larger than pair_screen_tol (estimated by
+            the Schwarz inequality, see :func:`addons.screen_pairs`).  The
+            indices of the stored AO pairs are returned by
+            :meth:`get_pair_idx`.  :meth:`loop` unpacks the tensor to all AO
+            pairs, :meth:`sparse_loop` yields the stored AO pairs.  get_jk
+            and the MO transformations of :func:`addons.loop_ao2mo` (used
+            by DF-MP2, DF-CCSD and DF-CASSCF) work on the stored AO pairs.
+            Default is None, to store all AO pairs.
+        local_k_radius : float
+            If given, the exchange matrix is computed with local density
+            fitting (see :func:`df_jk.get_k_local`).  The AO pairs (mu,
+            lambda) are fitted with the auxiliary functions of the atoms
+            within local_k_radius (in Bohr) of the atom of lambda.  The
+            density matrix blocks of the atoms further apart than
+            2*local_k_radius are neglected.  Default is None, to fit all AO
+            pairs in the entire auxiliary basis.
+        mmap_cderi : bool
+            Whether to memory-map the DF tensor when it is saved in an HDF5
+            file.  The DF tensor is then stored in one contiguous dataset and
+            :meth:`loop` yields views of the file instead of copies.  The
+            file pages are shared by all processes on the same node.
+            Default is False.
     '''
 
     blockdim = getattr(__config__, 'df_df_DF_blockdim', 240)
+    pair_screen_tol = getattr(__config__, 'df_df_DF_pair_screen_tol', None)
+    local_k_radius = getattr(__config__, 'df_df_DF_local_k_radius', None)
+    mmap_cderi = getattr(__config__, 'df_df_DF_mmap_cderi', False)
 
     # Store DF tensor in a format compatible to pyscf-1.1 - pyscf-1.6
     _compatible_format = getattr(__config__, 'df_df_DF_compatible_format', False)
@@ -92,7 +125,10 @@ class DF(lib.StreamObject):
         self._cderi_to_save = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
 # If _cderi is specified, the 3C-integral tensor will be read from this file
         self._cderi = None
+        self._cderi_pair_idx = None
+        self._cderi_pair_idx_src = None  # The _cderi that _cderi_pair_idx belongs to
         self._vjopt = None
+        self._vkopt = None
         self._rsh_df = {}  # Range separated Coulomb DF objects
         self._keys = set(self.__dict__.keys())
 
@@ -113,6 +149,12 @@ class DF(lib.StreamObject):
         else:
             log.info('auxbasis = auxmol.basis = %s', self.auxmol.basis)
         log.info('max_memory = %s', self.max_memory)
+        if self.mmap_cderi:
+            log.info('mmap_cderi = %s', self.mmap_cderi)
+        if self.pair_screen_tol is not None:
+            log.info('pair_screen_tol = %g', self.pair_screen_tol)
+        if self.local_k_radius is not None:
+            log.info('local_k_radius = %g', self.local_k_radius)
         if isinstance(self._cderi, str):
             log.info('_cderi = %s  where DF integrals are loaded (readonly).',
                      self._cderi)
@@ -138,11 +180,20 @@ class DF(lib.StreamObject):
         max_memory = self.max_memory - lib.current_memory()[0]
         int3c = mol._add_suffix('int3c2e')
         int2c = mol._add_suffix('int2c2e')
+        pair_idx = None
+        if self.pair_screen_tol is not None:
+            pair_idx = addons.screen_pairs(mol, auxmol, self.pair_screen_tol,
+                                           int2c=int2c)
+            log.info('%d AO pairs out of %d are stored in the DF tensor',
+                     pair_idx.size, nao_pair)
+            nao_pair = pair_idx.size
+        self._cderi_pair_idx = pair_idx
         if (nao_pair*naux*8/1e6 < .9*max_memory and
             not isinstance(self._cderi_to_save, str)):
             self._cderi = incore.cholesky_eri(mol, int3c=int3c, int2c=int2c,
                                               auxmol=auxmol,
-                                              max_memory=max_memory, verbose=log)
+                                              max_memory=max_memory, verbose=log,
+                                              pair_idx=pair_idx)
         else:
             if isinstance(self._cderi_to_save, str):
                 cderi = self._cderi_to_save
@@ -154,18 +205,25 @@ class DF(lib.StreamObject):
                 log.warn('Value of _cderi is ignored. DF integrals will be '
                          'saved in file %s .', cderi)
 
-            if self._compatible_format or isinstance(self._cderi_to_save, str):
+            if (self.mmap_cderi or
+                ((self._compatible_format or isinstance(self._cderi_to_save, str))
+                 and pair_idx is None)):
                 outcore.cholesky_eri(mol, cderi, dataname='j3c',
                                      int3c=int3c, int2c=int2c, auxmol=auxmol,
-                                     max_memory=max_memory, verbose=log)
+                                     max_memory=max_memory, verbose=log,
+                                     pair_idx=pair_idx,
+                                     resume=isinstance(self._cderi_to_save, str))
             else:
                 # Store DF tensor in blocks. This is to reduce the
                 # initiailzation overhead
                 outcore.cholesky_eri_b(mol, cderi, dataname='j3c',
                                        int3c=int3c, int2c=int2c, auxmol=auxmol,
-                                       max_memory=max_memory, verbose=log)
+                                       max_memory=max_memory, verbose=log,
+                                       pair_idx=pair_idx,
+                                       resume=isinstance(self._cderi_to_save, str))
             self._cderi = cderi
             log.timer_debug1('Generate density fitting integrals', *t0)
+        self._cderi_pair_idx_src = self._cderi
         return self
 
     def kernel(self, *args, **kwargs):
@@ -177,36 +235,91 @@ class DF(lib.StreamObject):
             self.mol = mol
         self.auxmol = None
         self._cderi = None
+        self._cderi_pair_idx = None
+        self._cderi_pair_idx_src = None
         if not isinstance(self._cderi_to_save, str):
             self._cderi_to_save = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
         self._vjopt = None
+        self._vkopt = None
         self._rsh_df = {}
         return self
 
+    def get_pair_idx(self):
+        '''Indices of the AO pairs stored in the DF tensor (see
+        pair_screen_tol).  None if the DF tensor is stored for all AO pairs.
+        '''
+        if self._cderi is None:
+            self.build()
+        if self._cderi_pair_idx_src is not self._cderi:
+            # _cderi was assigned outside build(). Load the pair indices once
+            pair_idx = None
+            if isinstance(self._cderi, str) and h5py.is_hdf5(self._cderi):
+                with h5py.File(self._cderi, 'r') as f:
+                    if 'j3c_pair_idx' in f:
+                        pair_idx = f['j3c_pair_idx'][:]
+            self._cderi_pair_idx = pair_idx
+            self._cderi_pair_idx_src = self._cderi
+        return self._cderi_pair_idx
+
     def loop(self, blksize=None):
+        '''Loop over the DF tensor by blocks of auxiliary functions.  Each
+        block is a 2D array of (blksize,nao*(nao+1)/2).
+        '''
+        pair_idx = self.get_pair_idx()
+        if pair_idx is None:
+            for eri1 in self.sparse_loop(blksize):
+                yield eri1
+        else:
+            nao = self.mol.nao_nr()
+            nao_pair = nao * (nao+1) // 2
+            for eri1 in self.sparse_loop(blksize):
+                yield addons.unpack_pairs(eri1, pair_idx, nao_pair)
+
+    def sparse_loop(self, blksize=None):
+        '''Similar to :meth:`loop`.  The blocks of the DF tensor are
+        yielded for the AO pairs of :meth:`get_pair_idx` only.
+        '''
         if self._cderi is None:
             self.build()
-        if blksize is None:
-            blksize = self.blockdim
 
         with addons.load(self._cderi, 'j3c') as feri:
             if isinstance(feri, numpy.ndarray):
                 naoaux = feri.shape[0]
+                if blksize is None:
+                    blksize = self.blockdim
                 for b0, b1 in self.prange(0, naoaux, blksize):
                     yield numpy.asarray(feri[b0:b1], order='C')
 
+            elif self.mmap_cderi and addons.memmap(feri) is not None:
+                # Views of the file. Nothing is copied until the data are
+                # accessed.
+                feri = addons.memmap(feri)
+                if blksize is None:
+                    blksize = self.blockdim
+                for b0, b1 in self.prange(0, feri.shape[0], blksize):
+                    yield feri[b0:b1]
+
             else:
                 if isinstance(feri, h5py.Group):
                     # starting from pyscf-1.7, DF tensor may be stored in
                     # block format
                     naoaux = feri['0'].shape[0]
+                    nao_pair = sum([feri[k].shape[1] for k in feri])
                     def load(b0, b1, prefetch):
                         prefetch[0] = _load_from_h5g(feri, b0, b1)
                 else:
-                    naoaux = feri.shape[0]
+                    naoaux, nao_pair = feri.shape
                     def load(b0, b1, prefetch):
                         prefetch[0] = numpy.asarray(feri[b0:b1])
 
+                if blksize is None:
+                    # Two blocks are held in memory by the prefetch.  Half of
+                    # the available memory is left to the caller.
+                    max_memory = self.max_memory - lib.current_memory()[0]
+                    blksize = lib.blocking.plan_blksize(
+                        nao_pair*8*2, max_memory*.5, naoaux,
+                        minimum=BLKMIN, maximum=self.blockdim)
+
                 dat = [None]
                 prefetch = [None]
                 with lib.call_in_background(load) as bload:
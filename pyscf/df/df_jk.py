@@ -22,13 +22,20 @@ import ctypes
 import numpy
 import scipy.linalg
 from pyscf import lib
+from pyscf import gto
 from pyscf import scf
 from pyscf.lib import logger
+from pyscf.gto.moleintor import getints
 from pyscf.ao2mo import _ao2mo
+from pyscf.df import addons
+from pyscf import __config__
 
 libri = lib.load_library('libri')
 
-def density_fit(mf, auxbasis=None, with_df=None, only_dfj=False):
+LINEAR_DEP_THR = getattr(__config__, 'df_df_DF_lindep', 1e-12)
+
+def density_fit(mf, auxbasis=None, with_df=None, only_dfj=False,
+                local_k_radius=None):
     '''For the given SCF object, update the J, K matrix constructor with
     corresponding density fitting integrals.
 
@@ -45,6 +52,11 @@ def density_fit(mf, auxbasis=None, with_df=None, only_dfj=False):
             Compute Coulomb integrals only and no approximation for HF
             exchange. Same to RIJONX in ORCA
 
+        local_k_radius : float
+            Compute HF exchange with local density fitting.  The AO pairs of
+            each atom are fitted with the auxiliary functions of the atoms
+            within local_k_radius (in Bohr).  See :attr:`DF.local_k_radius`
+
     Returns:
         An SCF object with a modified J, K matrix constructor which uses density
         fitting integrals to compute J and K
@@ -75,6 +87,8 @@ def density_fit(mf, auxbasis=None, with_df=None, only_dfj=False):
         with_df.stdout = mf.stdout
         with_df.verbose = mf.verbose
         with_df.auxbasis = auxbasis
+    if local_k_radius is not None:
+        with_df.local_k_radius = local_k_radius
 
     mf_class = mf.__class__
 
@@ -86,6 +100,8 @@ def density_fit(mf, auxbasis=None, with_df=None, only_dfj=False):
             mf = copy.copy(mf)
             mf.with_df = with_df
             mf.only_dfj = only_dfj
+        if local_k_radius is not None:
+            mf.with_df.local_k_radius = local_k_radius
         return mf
 
     class DFHF(_DFHF, mf_class):
@@ -199,8 +215,29 @@ class _DFHF(object):
         return mcscf.DFCASSCF(self, ncas, nelecas, auxbasis, ncore, frozen)
 
 
+def _sparse_loop(dfobj, blksize=None):
+    '''Loop over the DF tensor on the stored AO pairs.  Yields the block of
+    the DF tensor and the indices of the stored AO pairs (None if all AO pairs
+    are stored).
+    '''
+    pair_idx = None
+    if getattr(dfobj, 'get_pair_idx', None) is not None:
+        pair_idx = dfobj.get_pair_idx()
+    if pair_idx is None:
+        for eri1 in dfobj.loop(blksize):
+            yield eri1, None
+    else:
+        for eri1 in dfobj.sparse_loop(blksize):
+            yield eri1, pair_idx
+
 def get_jk(dfobj, dm, hermi=1, with_j=True, with_k=True, direct_scf_tol=1e-13):
     assert(with_j or with_k)
+    if with_k and getattr(dfobj, 'local_k_radius', None) is not None:
+        vj = None
+        if with_j:
+            vj = get_jk(dfobj, dm, hermi, True, False, direct_scf_tol)[0]
+        return vj, get_k_local(dfobj, dm, hermi, direct_scf_tol)
+
     if (not with_k and not dfobj.mol.incore_anyway and
         # 3-center integral tensor is not initialized
         dfobj._cderi is None):
@@ -221,15 +258,25 @@ def get_jk(dfobj, dm, hermi=1, with_j=True, with_k=True, direct_scf_tol=1e-13):
     vj = 0
     vk = numpy.zeros_like(dms)
 
+    nao_pair = nao * (nao+1) // 2
     if with_j:
         idx = numpy.arange(nao)
         dmtril = lib.pack_tril(dms + dms.conj().transpose(0,2,1))
         dmtril[:,idx*(idx+1)//2+idx] *= .5
 
-    if not with_k:
-        for eri1 in dfobj.loop():
+    def add_vj(eri1, pair_idx):
+        '''vj += (ij|L)(L|kl) D_kl on the stored AO pairs'''
+        if pair_idx is None:
             rho = numpy.einsum('ix,px->ip', dmtril, eri1)
-            vj += numpy.einsum('ip,px->ix', rho, eri1)
+            return vj + numpy.einsum('ip,px->ix', rho, eri1)
+        rho = numpy.einsum('ix,px->ip', dmtril[:,pair_idx], eri1)
+        vj1 = numpy.zeros((nset,nao_pair), dtype=rho.dtype)
+        vj1[:,pair_idx] = numpy.einsum('ip,px->ix', rho, eri1)
+        return vj + vj1
+
+    if not with_k:
+        for eri1, pair_idx in _sparse_loop(dfobj):
+            vj = add_vj(eri1, pair_idx)
 
     elif getattr(dm, 'mo_coeff', None) is not None:
 #TODO: test whether dm.mo_coeff matching dm
@@ -254,12 +301,26 @@ def get_jk(dfobj, dm, hermi=1, with_j=True, with_k=True, direct_scf_tol=1e-13):
         max_memory = dfobj.max_memory - lib.current_memory()[0]
         blksize = max(4, int(min(dfobj.blockdim, max_memory*.3e6/8/nao**2)))
         buf = numpy.empty((blksize*nao,nao))
-        for eri1 in dfobj.loop(blksize):
-            naux, nao_pair = eri1.shape
-            assert(nao_pair == nao*(nao+1)//2)
+        pattern = None
+        for eri1, pair_idx in _sparse_loop(dfobj, blksize):
             if with_j:
-                rho = numpy.einsum('ix,px->ip', dmtril, eri1)
-                vj += numpy.einsum('ip,px->ix', rho, eri1)
+                vj = add_vj(eri1, pair_idx)
+            naux = eri1.shape[0]
+            if pair_idx is not None:
+                # Contract K on the stored AO pairs
+                #:vk += einsum('pij,jk,plm,mk->il', cderi, orbo, cderi, orbo)
+                if pattern is None:
+                    pattern = addons.pair_csr_pattern(pair_idx, nao)
+                cderi = addons.pairs_to_csr(eri1, pattern, nao)
+                for k in range(nset):
+                    nocc = orbo[k].shape[1]
+                    if nocc > 0:
+                        buf1 = cderi.dot(orbo[k]).reshape(naux,nao,nocc)
+                        buf1 = buf1.transpose(0,2,1).reshape(-1,nao)
+                        vk[k] += lib.dot(buf1.T, buf1)
+                t1 = log.timer_debug1('jk', *t1)
+                continue
+            assert(eri1.shape[1] == nao_pair)
 
             for k in range(nset):
                 nocc = orbo[k].shape[1]
@@ -283,11 +344,25 @@ def get_jk(dfobj, dm, hermi=1, with_j=True, with_k=True, direct_scf_tol=1e-13):
         max_memory = dfobj.max_memory - lib.current_memory()[0]
         blksize = max(4, int(min(dfobj.blockdim, max_memory*.22e6/8/nao**2)))
         buf = numpy.empty((2,blksize,nao,nao))
-        for eri1 in dfobj.loop(blksize):
-            naux, nao_pair = eri1.shape
+        pattern = None
+        for eri1, pair_idx in _sparse_loop(dfobj, blksize):
             if with_j:
-                rho = numpy.einsum('ix,px->ip', dmtril, eri1)
-                vj += numpy.einsum('ip,px->ix', rho, eri1)
+                vj = add_vj(eri1, pair_idx)
+            naux = eri1.shape[0]
+            if pair_idx is not None:
+                # Contract K on the stored AO pairs
+                #:vk += sum_p cderi[p].dot(dm).dot(cderi[p])
+                if pattern is None:
+                    pattern = addons.pair_csr_pattern(pair_idx, nao)
+                cderi = addons.pairs_to_csr(eri1, pattern, nao)
+                cderi_bd = addons.pairs_to_csr(eri1, pattern, nao, True)
+                for k in range(nset):
+                    buf1 = cderi.dot(dms[k]).reshape(naux,nao,nao)
+                    buf1 = buf1.transpose(0,2,1).reshape(-1,nao)
+                    buf1 = cderi_bd.dot(buf1).reshape(naux,nao,nao)
+                    vk[k] += buf1.sum(axis=0).T
+                t1 = log.timer_debug1('jk', *t1)
+                continue
 
             for k in range(nset):
                 buf1 = buf[0,:naux]
@@ -307,6 +382,15 @@ def get_jk(dfobj, dm, hermi=1, with_j=True, with_k=True, direct_scf_tol=1e-13):
     return vj, vk
 
 def get_j(dfobj, dm, hermi=1, direct_scf_tol=1e-13):
+    '''Integral-direct density fitting Coulomb matrix.  The DF tensor is not
+    stored.  The 3-center integrals (ij|P) are computed on the fly in two
+    passes, screened by the Schwarz inequality and the density matrix
+
+        rho_P = (P|Q)^{-1} (Q|ij) D_ji,   J_ij = (ij|P) rho_P
+
+    The factorization of the metric (P|Q) is cached in dfobj._vjopt.  The
+    memory usage is O(naux^2).
+    '''
     from pyscf.scf import _vhf
     from pyscf.scf import jk
     from pyscf.df import addons
@@ -334,11 +418,16 @@ def get_j(dfobj, dm, hermi=1, direct_scf_tol=1e-13):
                   ctypes.c_int(q_cond.size))
 
         try:
-            opt.j2c = j2c = scipy.linalg.cho_factor(j2c, lower=True)
+            opt.j2c = scipy.linalg.cho_factor(j2c, lower=True)
             opt.j2c_type = 'cd'
         except scipy.linalg.LinAlgError:
-            opt.j2c = j2c
-            opt.j2c_type = 'regular'
+            # Linear dependency in the auxiliary basis. Same treatment as
+            # in incore.cholesky_eri
+            w, v = scipy.linalg.eigh(j2c)
+            idx = w > LINEAR_DEP_THR
+            opt.j2c = v[:,idx] / numpy.sqrt(w[idx])
+            opt.j2c_type = 'eig'
+        j2c = None
 
         # jk.get_jk function supports 4-index integrals. Use bas_placeholder
         # (l=0, nctr=1, 1 function) to hold the last index.
@@ -377,7 +466,7 @@ def get_j(dfobj, dm, hermi=1, direct_scf_tol=1e-13):
     if opt.j2c_type == 'cd':
         rho = scipy.linalg.cho_solve(opt.j2c, jaux.T)
     else:
-        rho = scipy.linalg.solve(opt.j2c, jaux.T)
+        rho = lib.dot(opt.j2c, lib.dot(opt.j2c.T, jaux.T))
     # transform rho to shape (:,1,naux), to adapt to 3c2e integrals (ij|k)
     rho = rho.T[:,numpy.newaxis,:]
     t1 = logger.timer_debug1(dfobj, 'df-vj solve ', *t1)
@@ -405,6 +494,248 @@ def get_j(dfobj, dm, hermi=1, direct_scf_tol=1e-13):
     return numpy.asarray(vj).reshape(dm_shape)
 
 
+def _make_vkopt(dfobj, direct_scf_tol=1e-13):
+    '''Local fitting coefficients for the exchange matrix of get_k_local.
+
+    The AO pairs (mu,lambda) of the atom L (the atom of lambda) and its
+    partner atoms M are fitted in the auxiliary functions of the domain of L,
+    the atoms within local_k_radius of L.  For each atom L, the coefficients
+    c^{mu lambda}_P are stored on the domain of L only.  The products
+
+        d^{mu lambda}_Q = sum_P c^{mu lambda}_P (P|Q)
+
+    are needed for the auxiliary functions Q of the domains of the atoms S
+    which are paired with L in get_k_local.  These are the neighbours of L,
+    the atoms whose domains overlap with the domain of L (within
+    2*local_k_radius of L).  d is computed and stored on the union of the
+    neighbouring domains only.  The metric (P|Q) is evaluated by the blocks
+    of atom pairs.  The full metric of the auxiliary basis is not formed.
+    '''
+    from pyscf.scf import _vhf
+    t0 = (time.clock(), time.time())
+    mol = dfobj.mol
+    if dfobj.auxmol is None:
+        dfobj.auxmol = addons.make_auxmol(mol, dfobj.auxbasis)
+    auxmol = dfobj.auxmol
+    radius = dfobj.local_k_radius
+    natm = mol.natm
+    nbas = mol.nbas
+    ao_slices = mol.aoslice_by_atom()
+    aux_slices = auxmol.aoslice_by_atom()
+    aux_atms = numpy.where(aux_slices[:,3] > aux_slices[:,2])[0]
+
+    j2c_blocks = {}
+    def get_j2c(atms_a, atms_b):
+        '''Blocks of the metric (P|Q) between the aux functions of two lists
+        of atoms'''
+        for a in atms_a:
+            for b in atms_b:
+                if (a, b) not in j2c_blocks:
+                    shls_slice = (aux_slices[a,0], aux_slices[a,1],
+                                  aux_slices[b,0], aux_slices[b,1])
+                    j2c_blocks[(a,b)] = auxmol.intor('int2c2e',
+                                                     shls_slice=shls_slice)
+                    j2c_blocks[(b,a)] = j2c_blocks[(a,b)].T
+        return numpy.vstack([numpy.hstack([j2c_blocks[(a,b)] for b in atms_b])
+                             for a in atms_a])
+
+    j2c_diag = max([abs(get_j2c([a], [a]).diagonal()).max() for a in aux_atms])
+    # Significant atom pairs by the Schwarz inequality
+    q_cond = _vhf.get_q_cond(mol)
+    q_cond *= numpy.sqrt(j2c_diag)
+    atm_q = numpy.zeros((natm,natm))
+    for i, (ish0, ish1) in enumerate(ao_slices[:,:2]):
+        for j, (jsh0, jsh1) in enumerate(ao_slices[:,:2]):
+            if ish0 < ish1 and jsh0 < jsh1:
+                atm_q[i,j] = q_cond[ish0:ish1,jsh0:jsh1].max()
+    pair_mask = atm_q >= direct_scf_tol
+    rr = gto.inter_distance(mol)
+
+    # The domain of each atom and its auxiliary functions
+    domains = [aux_atms[rr[la,aux_atms] <= radius] for la in range(natm)]
+    aux_idx = [numpy.hstack([numpy.arange(*aux_slices[a,2:]) for a in dom]
+                            + [numpy.zeros(0, dtype=int)])
+               for dom in domains]
+
+    partners = []
+    ao_idx = []
+    for la in range(natm):
+        l0, l1 = ao_slices[la,2:]
+        ma = numpy.where(pair_mask[:,la])[0]
+        if l0 == l1 or ma.size == 0 or aux_idx[la].size == 0:
+            ma = ma[:0]
+        idx = [numpy.arange(*ao_slices[ia,2:]) for ia in ma]
+        partners.append(ma)
+        ao_idx.append(numpy.hstack(idx).astype(int) if idx
+                      else numpy.zeros(0, dtype=int))
+    atms = numpy.array([la for la in range(natm) if ao_idx[la].size > 0],
+                       dtype=int)
+
+    int3c = mol._add_suffix('int3c2e')
+    atm, bas, env = gto.mole.conc_env(mol._atm, mol._bas, mol._env,
+                                      auxmol._atm, auxmol._bas, auxmol._env)
+    cintopt = gto.moleintor.make_cintopt(atm, bas, env, int3c)
+    neighbors = []
+    d_rows = []
+    coeffs = []
+    dcoeffs = []
+    for la in range(natm):
+        lsh0, lsh1, l0, l1 = ao_slices[la]
+        ma = partners[la]
+        dom = domains[la]
+        naux_dom = aux_idx[la].size
+        nmu = ao_idx[la].size
+        if nmu == 0:
+            neighbors.append(numpy.zeros(0, dtype=int))
+            d_rows.append({})
+            coeffs.append(numpy.zeros((0, naux_dom, l1-l0)))
+            dcoeffs.append(numpy.zeros((0, 0, l1-l0)))
+            continue
+
+        # (mu lambda|P) for all partners of L, in the layout (P, mu, lambda)
+        ints = numpy.empty((naux_dom, nmu, l1-l0))
+        p0 = 0
+        for ia in ma:
+            ish0, ish1, i0, i1 = ao_slices[ia]
+            q0 = 0
+            for ka in dom:
+                ksh0, ksh1, k0, k1 = aux_slices[ka]
+                shls_slice = (ish0, ish1, lsh0, lsh1, nbas+ksh0, nbas+ksh1)
+                buf = getints(int3c, atm, bas, env, shls_slice, 1, 0, 's1',
+                              None, cintopt)
+                ints[q0:q0+k1-k0,p0:p0+i1-i0] = \
+                        buf.reshape(i1-i0, l1-l0, k1-k0).transpose(2,0,1)
+                q0 += k1 - k0
+            p0 += i1 - i0
+        ints = ints.reshape(naux_dom, -1)
+
+        j2c_dom = get_j2c(dom, dom)
+        try:
+            c = scipy.linalg.cho_solve(scipy.linalg.cho_factor(j2c_dom), ints)
+        except scipy.linalg.LinAlgError:
+            c = scipy.linalg.lstsq(j2c_dom, ints)[0]
+        ints = j2c_dom = None
+
+        # d on the union of the domains of the neighbours of L
+        nbr = atms[rr[la,atms] <= radius * 2]
+        union = numpy.unique(numpy.hstack([domains[sa] for sa in nbr]))
+        union_aux = numpy.hstack([numpy.arange(*aux_slices[a,2:]) for a in union])
+        neighbors.append(nbr)
+        d_rows.append(dict([(sa, numpy.searchsorted(union_aux, aux_idx[sa]))
+                            for sa in nbr]))
+        dcoeffs.append(lib.dot(get_j2c(union, dom), c).reshape(-1, nmu, l1-l0))
+        # The layout (mu, P, lambda) for the second GEMM of get_k_local
+        coeffs.append(numpy.asarray(c.reshape(naux_dom, nmu, l1-l0)
+                                    .transpose(1,0,2), order='C'))
+    j2c_blocks = None
+
+    opt = _LocalKOpt(radius, direct_scf_tol, partners, ao_idx, aux_idx,
+                     neighbors, d_rows, coeffs, dcoeffs)
+    naux = auxmol.nao_nr()
+    nao = mol.nao_nr()
+    logger.debug(dfobj, 'local-K: %d significant atom pairs of %d',
+                 sum([x.size for x in partners]), natm**2)
+    logger.debug(dfobj, 'local-K: fitting coefficients %.2f MB, '
+                 'DF tensor %.2f MB', opt.nbytes/1e6,
+                 naux*nao*(nao+1)/2*8/1e6)
+    logger.timer_debug1(dfobj, 'local-K fitting coefficients', *t0)
+    return opt
+
+class _LocalKOpt(object):
+    def __init__(self, radius, direct_scf_tol, partners, ao_idx, aux_idx,
+                 neighbors, d_rows, coeffs, dcoeffs):
+        self.radius = radius
+        self.direct_scf_tol = direct_scf_tol
+        self.partners = partners
+        self.ao_idx = ao_idx
+        # The auxiliary functions of the domain of each atom
+        self.aux_idx = aux_idx
+        # The atoms S paired with each atom L in get_k_local, and the rows
+        # of dcoeffs[L] on the domain of S
+        self.neighbors = neighbors
+        self.d_rows = d_rows
+        self.coeffs = coeffs
+        self.dcoeffs = dcoeffs
+        # For the estimation of the contributions of the density blocks
+        self.cmax = numpy.array([abs(c).max() if c.size else 0 for c in coeffs])
+        self.dmax = numpy.array([abs(d).max() if d.size else 0 for d in dcoeffs])
+
+    @property
+    def nbytes(self):
+        return (sum([c.nbytes for c in self.coeffs]) +
+                sum([d.nbytes for d in self.dcoeffs]))
+
+def get_k_local(dfobj, dm, hermi=1, direct_scf_tol=1e-13):
+    '''Exchange matrix with local density fitting.
+
+    The AO pairs of the atom L and its partner atoms M are fitted in the
+    domain of the auxiliary functions around L (see :func:`_make_vkopt`)
+
+        (mu lambda|nu sigma) ~ sum_{PQ} c^{mu lambda}_P (P|Q) c^{nu sigma}_Q
+                             = sum_Q d^{mu lambda}_Q c^{nu sigma}_Q
+
+    The approximated integrals are positive semi-definite for any domain size,
+    and equal to the regular density fitting integrals if the domains cover
+    all atoms.  K_{mu nu} = sum_{lambda sigma} (mu lambda|nu sigma) D_{lambda sigma}
+    is contracted by two GEMMs for each atom block (L,S) of the density
+    matrix, for the neighbours S of L whose domains overlap with the domain
+    of L.  The block is skipped if the estimated contribution
+    max|D_LS| max|d_L| max|c_S| is smaller than direct_scf_tol.
+    '''
+    t0 = (time.clock(), time.time())
+    opt = dfobj._vkopt
+    if (opt is None or opt.radius != dfobj.local_k_radius or
+        opt.direct_scf_tol != direct_scf_tol):
+        opt = dfobj._vkopt = _make_vkopt(dfobj, direct_scf_tol)
+    ao_idx = opt.ao_idx
+    neighbors = opt.neighbors
+    d_rows = opt.d_rows
+    coeffs = opt.coeffs
+    dcoeffs = opt.dcoeffs
+
+    mol = dfobj.mol
+    ao_slices = mol.aoslice_by_atom()
+    natm = mol.natm
+    dms = numpy.asarray(dm)
+    dm_shape = dms.shape
+    nao = dm_shape[-1]
+    dms = dms.reshape(-1,nao,nao)
+    vk = numpy.zeros(dms.shape, dtype=numpy.result_type(dms, coeffs[0]))
+
+    atms = [a for a in range(natm) if ao_idx[a].size > 0]
+    nskip = 0
+    for k, dm in enumerate(dms):
+        dm_cond = numpy.zeros((natm,natm))
+        for la in atms:
+            l0, l1 = ao_slices[la,2:]
+            for sa in atms:
+                s0, s1 = ao_slices[sa,2:]
+                dm_cond[la,sa] = abs(dm[l0:l1,s0:s1]).max()
+        dm_cond *= opt.dmax[:,None] * opt.cmax
+
+        for la in atms:
+            l0, l1 = ao_slices[la,2:]
+            nmu = ao_idx[la].size
+            for sa in neighbors[la]:
+                if dm_cond[la,sa] < direct_scf_tol:
+                    nskip += 1
+                    continue
+                s0, s1 = ao_slices[sa,2:]
+                rows = d_rows[la][sa]
+                # tmp[Q,mu,s] = d[Q,mu,l] D[l,s]
+                tmp = lib.dot(dcoeffs[la][rows].reshape(-1,l1-l0),
+                              dm[l0:l1,s0:s1])
+                tmp = tmp.reshape(rows.size,nmu,s1-s0).transpose(1,0,2)
+                # vk[mu,nu] = tmp[mu,Q,s] c[nu,Q,s]
+                vk_ls = lib.dot(tmp.reshape(nmu,-1),
+                                coeffs[sa].reshape(ao_idx[sa].size,-1).T)
+                vk[k][ao_idx[la][:,None],ao_idx[sa]] += vk_ls
+    logger.debug1(dfobj, 'local-K: %d of %d atom blocks skipped',
+                  nskip, sum([neighbors[la].size for la in atms]) * len(dms))
+    logger.timer(dfobj, 'local-K', *t0)
+    return vk.reshape(dm_shape)
+
+
 def r_get_jk(dfobj, dms, hermi=1, with_j=True, with_k=True):
     '''Relativistic density fitting JK'''
     t0 = (time.clock(), time.time())
@@ -92,10 +92,17 @@ def fill_2c2e(mol, auxmol, intor='int2c2e', comp=None, hermi=1, out=None):
 # array
 def cholesky_eri(mol, auxbasis='weigend+etb', auxmol=None,
                  int3c='int3c2e', aosym='s2ij', int2c='int2c2e', comp=1,
-                 max_memory=MAX_MEMORY, verbose=0, fauxe2=aux_e2):
+                 max_memory=MAX_MEMORY, verbose=0, fauxe2=aux_e2,
+                 pair_idx=None):
     '''
+    Kwargs:
+        pair_idx : 1D int array
+            If given, the DF tensor is computed and stored for these AO pairs
+            only (see :func:`addons.screen_pairs`).
+
     Returns:
-        2D array of (naux,nao*(nao+1)/2) in C-contiguous
+        2D array of (naux,nao*(nao+1)/2) in C-contiguous.  The second
+        dimension is len(pair_idx) if pair_idx is given.
     '''
     from pyscf.df.outcore import _guess_shell_ranges
     assert(comp == 1)
@@ -130,7 +137,12 @@ def cholesky_eri(mol, auxbasis='weigend+etb', auxmol=None,
     else:
         nao_pair = nao * (nao+1) // 2
 
-    cderi = numpy.empty((naux, nao_pair))
+    if pair_idx is None:
+        cderi = numpy.empty((naux, nao_pair))
+    else:
+        pair_idx = numpy.asarray(pair_idx)
+        cderi = numpy.empty((naux, pair_idx.size))
+        log.debug('%d significant AO pairs out of %d', pair_idx.size, nao_pair)
 
     max_words = max_memory*.98e6/8 - low.size - cderi.size
     # Divide by 3 because scipy.linalg.solve may create a temporary copy for
@@ -143,7 +155,7 @@ def cholesky_eri(mol, auxbasis='weigend+etb', auxmol=None,
     bufs1 = numpy.empty((comp*max([x[2] for x in shranges]),naoaux))
     bufs2 = numpy.empty_like(bufs1)
 
-    p1 = 0
+    p1 = q1 = 0
     for istep, sh_range in enumerate(shranges):
         log.debug('int3c2e [%d/%d], AO [%d:%d], nrow = %d', \
                   istep+1, len(shranges), *sh_range)
@@ -159,6 +171,12 @@ def cholesky_eri(mol, auxbasis='weigend+etb', auxmol=None,
             ints = ints.reshape((-1,naoaux)).T
 
         p0, p1 = p1, p1 + nrow
+        if pair_idx is None:
+            q0, q1 = p0, p1
+            sel = slice(None)
+        else:
+            q0, q1 = q1, numpy.searchsorted(pair_idx, p1)
+            sel = pair_idx[q0:q1] - p0
         if tag == 'cd':
             if ints.flags.c_contiguous:
                 ints = lib.transpose(ints, out=bufs2).T
@@ -167,10 +185,10 @@ def cholesky_eri(mol, auxbasis='weigend+etb', auxmol=None,
                                                 overwrite_b=True, check_finite=False)
             if dat.flags.f_contiguous:
                 dat = lib.transpose(dat.T, out=bufs2)
-            cderi[:,p0:p1] = dat
+            cderi[:,q0:q1] = dat[:,sel]
         else:
             dat = numpy.ndarray((naux, ints.shape[1]), buffer=bufs2)
-            cderi[:,p0:p1] = lib.dot(low.T, ints, c=dat)
+            cderi[:,q0:q1] = lib.dot(low.T, ints, c=dat)[:,sel]
         dat = ints = None
 
     log.timer('cholesky_eri', *t0)
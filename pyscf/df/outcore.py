@@ -16,7 +16,10 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
+import os
 import time
+import hashlib
+import traceback
 import tempfile
 import numpy
 import scipy.linalg
@@ -32,15 +35,53 @@ from pyscf import __config__
 
 MAX_MEMORY = getattr(__config__, 'df_outcore_max_memory', 2000)  # 2GB
 LINEAR_DEP_THR = getattr(__config__, 'df_df_DF_lindep', 1e-12)
+# Number of processes to generate the blocks of cholesky_eri_b
+NPROC = getattr(__config__, 'df_outcore_nproc', 1)
 
 #
 # for auxe1 (P|ij)
 #
 
+def _cholesky_eri_cost(mol, erifile, auxbasis='weigend+etb', dataname='j3c',
+                       tmpdir=None, int3c='int3c2e', aosym='s2ij',
+                       int2c='int2c2e', comp=1, max_memory=MAX_MEMORY,
+                       auxmol=None, verbose=None):
+    '''Estimated (FLOPs, bytes) of :func:`cholesky_eri`.  bytes counts the
+    disk traffic of the swap file and the output.'''
+    if auxmol is None:
+        auxmol = make_auxmol(mol, auxbasis)
+    naux = auxmol.nao_nr()
+    nao = mol.nao_nr()
+    if aosym == 's1':
+        nao_pair = nao**2
+    else:
+        nao_pair = nao * (nao+1) // 2
+    # Cholesky decomposition of the 2-center integrals and the triangular
+    # solver for the 3-center integrals
+    flops = naux**3 / 3. + 1. * naux**2 * nao_pair
+    nbytes = 8. * 3 * naux * nao_pair
+    return flops, nbytes
+
+@lib.profiler.profile('df.outcore.cholesky_eri', _cholesky_eri_cost)
 def cholesky_eri(mol, erifile, auxbasis='weigend+etb', dataname='j3c', tmpdir=None,
                  int3c='int3c2e', aosym='s2ij', int2c='int2c2e', comp=1,
-                 max_memory=MAX_MEMORY, auxmol=None, verbose=logger.NOTE):
-    '''3-index density-fitting tensor.
+                 max_memory=MAX_MEMORY, auxmol=None, verbose=logger.NOTE,
+                 pair_idx=None, nproc=NPROC, resume=False):
+    '''3-index density-fitting tensor.  The tensor is stored in one
+    contiguous dataset which can be memory-mapped (see :func:`addons.memmap`).
+
+    Kwargs:
+        pair_idx : 1D int array
+            If given, the DF tensor is stored for these AO pairs only (see
+            :func:`cholesky_eri_b`).
+        nproc : int
+            Number of processes to compute the blocks of the DF tensor (see
+            :func:`cholesky_eri_b`).
+        resume : bool
+            Whether to continue an interrupted calculation.  The blocks of
+            the DF tensor are generated in the file erifile+'.swap', which is
+            kept until the tensor is stored in erifile.  The completed
+            blocks in the swap file are reused (see :func:`cholesky_eri_b`).
     '''
     assert(aosym in ('s1', 's2ij'))
     assert(comp == 1)
@@ -50,12 +91,19 @@ def cholesky_eri(mol, erifile, auxbasis='weigend+etb', dataname='j3c', tmpdir=No
     if auxmol is None:
         auxmol = make_auxmol(mol, auxbasis)
 
-    if tmpdir is None:
-        tmpdir = lib.param.TMPDIR
-    swapfile = tempfile.NamedTemporaryFile(dir=tmpdir)
-    cholesky_eri_b(mol, swapfile.name, auxbasis, dataname,
-                   int3c, aosym, int2c, comp, max_memory, auxmol, verbose=log)
-    fswap = h5py.File(swapfile.name, 'r')
+    if resume:
+        # A persistent swap file next to erifile
+        swapfile = None
+        swapname = erifile + '.swap'
+    else:
+        if tmpdir is None:
+            tmpdir = lib.param.TMPDIR
+        swapfile = tempfile.NamedTemporaryFile(dir=tmpdir)
+        swapname = swapfile.name
+    cholesky_eri_b(mol, swapname, auxbasis, dataname,
+                   int3c, aosym, int2c, comp, max_memory, auxmol, verbose=log,
+                   pair_idx=pair_idx, nproc=nproc, resume=resume)
+    fswap = h5py.File(swapname, 'r')
     time1 = log.timer('generate (ij|L) 1 pass', *time0)
 
     # Cannot let naoaux = auxmol.nao_nr() if auxbasis has linear dependence
@@ -66,6 +114,11 @@ def cholesky_eri(mol, erifile, auxbasis='weigend+etb', dataname='j3c', tmpdir=No
         nao_pair = nao * (nao+1) // 2
 
     feri = _create_h5file(erifile, dataname)
+    if dataname+'_pair_idx' in feri:
+        del(feri[dataname+'_pair_idx'])
+    if pair_idx is not None:
+        nao_pair = len(pair_idx)
+        feri[dataname+'_pair_idx'] = numpy.asarray(pair_idx)
     if comp == 1:
         naoaux = fswap['%s/0'%dataname].shape[0]
         h5d_eri = feri.create_dataset(dataname, (naoaux,nao_pair), 'f8')
@@ -94,14 +147,31 @@ def cholesky_eri(mol, erifile, auxbasis='weigend+etb', dataname='j3c', tmpdir=No
 
     fswap.close()
     feri.close()
+    if swapfile is None:
+        os.remove(swapname)
     log.timer('cholesky_eri', *time0)
     return erifile
 
 def cholesky_eri_b(mol, erifile, auxbasis='weigend+etb', dataname='j3c',
                  int3c='int3c2e', aosym='s2ij', int2c='int2c2e', comp=1,
-                 max_memory=MAX_MEMORY, auxmol=None, verbose=logger.NOTE):
+                 max_memory=MAX_MEMORY, auxmol=None, verbose=logger.NOTE,
+                 pair_idx=None, nproc=NPROC, resume=False):
     '''3-center 2-electron DF tensor. Similar to cholesky_eri while this
     function stores DF tensor in blocks.
+
+    Kwargs:
+        pair_idx : 1D int array
+            If given, the DF tensor is stored for these AO pairs only (see
+            :func:`addons.screen_pairs`).  The indices are saved in the
+            dataset dataname+'_pair_idx' of erifile.
+        nproc : int
+            The blocks are computed by nproc forked processes.  The blocks
+            are written to erifile by the parent process.
+        resume : bool
+            Whether to continue an interrupted calculation.  The blocks
+            completed in erifile are kept if erifile was generated for the
+            same molecule and auxiliary basis.  The block partition of the
+            interrupted calculation is used.
     '''
     assert(aosym in ('s1', 's2ij'))
     log = logger.new_logger(mol, verbose)
@@ -141,7 +211,6 @@ def cholesky_eri_b(mol, erifile, auxbasis='weigend+etb', dataname='j3c',
         shranges = _guess_shell_ranges(mol, buflen, 's2ij')
     log.debug('erifile %.8g MB, IO buf size %.8g MB',
               naoaux*nao_pair*8/1e6, comp*buflen*naoaux*8/1e6)
-    log.debug1('shranges = %s', shranges)
     # TODO: Libcint-3.14 and newer version support to compute int3c2e without
     # the opt for the 3rd index.
     #if '3c2e' in int3c:
@@ -149,10 +218,60 @@ def cholesky_eri_b(mol, erifile, auxbasis='weigend+etb', dataname='j3c',
     #else:
     #    cintopt = gto.moleintor.make_cintopt(atm, bas, env, int3c)
     cintopt = gto.moleintor.make_cintopt(atm, bas, env, int3c)
+    if pair_idx is not None:
+        pair_idx = numpy.asarray(pair_idx)
+        log.debug('%d significant AO pairs out of %d', pair_idx.size, nao_pair)
+
+    # The block partition (shranges) depends on the free memory.  It is not
+    # part of the fingerprint.  A resumed calculation takes the partition
+    # of the interrupted one.
+    fingerprint = numpy.bytes_(_fingerprint(atm, bas, env, low, pair_idx,
+                                            int3c, aosym, comp))
+    feri = None
+    if resume and h5py.is_hdf5(erifile):
+        feri = h5py.File(erifile, 'a')
+        if (dataname in feri and
+            feri[dataname].attrs.get('fingerprint', b'') == fingerprint and
+            'shranges' in feri[dataname].attrs):
+            shranges = [tuple(x) for x in feri[dataname].attrs['shranges'].tolist()]
+        else:
+            feri.close()
+            feri = None
+    if feri is None:
+        feri = _create_h5file(erifile, dataname)
+        feri.create_group(dataname).attrs['fingerprint'] = fingerprint
+        feri[dataname].attrs['shranges'] = numpy.asarray(shranges)
+        log.debug1('shranges = %s', shranges)
     bufs1 = numpy.empty((comp*max([x[2] for x in shranges]),naoaux))
 
-    feri = _create_h5file(erifile, dataname)
+    # Each task computes one shell range and stores it as one block of the
+    # HDF5 group.  Empty blocks (without significant AO pairs) are skipped.
+    tasks = []
+    p1 = q1 = 0
+    for istep, sh_range in enumerate(shranges):
+        p0, p1 = p1, p1 + sh_range[2]
+        if pair_idx is not None:
+            q0, q1 = q1, numpy.searchsorted(pair_idx, p1)
+            if q0 == q1 and not (len(tasks) == 0 and istep+1 == len(shranges)):
+                continue
+        else:
+            q0, q1 = p0, p1
+        tasks.append((istep, '%s/%d'%(dataname,len(tasks)), p0, q0, q1))
+
+    done = [label for istep, label, p0, q0, q1 in tasks
+            if label in feri and feri[label].attrs.get('complete', False)]
+    if done:
+        log.info('Resume %s: %d blocks out of %d were completed',
+                 erifile, len(done), len(tasks))
+        tasks = [t for t in tasks if t[1] not in done]
+    if dataname+'_pair_idx' in feri:
+        del(feri[dataname+'_pair_idx'])
+    if pair_idx is not None:
+        feri[dataname+'_pair_idx'] = pair_idx
+
     def store(buf, label):
+        if label in feri:  # incomplete block of the interrupted run
+            del(feri[label])
         if comp == 1:
             feri[label] = buf
         else:
@@ -160,6 +279,9 @@ def cholesky_eri_b(mol, erifile, auxbasis='weigend+etb', dataname='j3c',
             fdat = feri.create_dataset(label, shape, buf[0].dtype.char)
             for i, b in enumerate(buf):
                 fdat[i] = b
+        # Mark the block after the data are written, for the restart
+        feri[label].attrs['complete'] = True
+        feri.flush()
 
     def transform(b):
         if b.ndim == 3 and b.flags.f_contiguous:
@@ -174,21 +296,35 @@ def cholesky_eri_b(mol, erifile, auxbasis='weigend+etb', dataname='j3c',
         else:
             return lib.dot(low.T, b)
 
-    with lib.call_in_background(store) as bstore:
-        for istep, sh_range in enumerate(shranges):
-            log.debug('int3c2e [%d/%d], AO [%d:%d], nrow = %d', \
-                      istep+1, len(shranges), *sh_range)
-            bstart, bend, nrow = sh_range
-            shls_slice = (bstart, bend, 0, mol.nbas, mol.nbas, mol.nbas+auxmol.nbas)
-            ints = gto.moleintor.getints3c(int3c, atm, bas, env, shls_slice, comp,
-                                           aosym, ao_loc, cintopt, out=bufs1)
+    def compute(task):
+        istep, label, p0, q0, q1 = task
+        bstart, bend, nrow = shranges[istep]
+        log.debug('int3c2e [%d/%d], AO [%d:%d], nrow = %d',
+                  istep+1, len(shranges), bstart, bend, nrow)
+        shls_slice = (bstart, bend, 0, mol.nbas, mol.nbas, mol.nbas+auxmol.nbas)
+        ints = gto.moleintor.getints3c(int3c, atm, bas, env, shls_slice, comp,
+                                       aosym, ao_loc, cintopt, out=bufs1)
+        if comp == 1:
+            buf = transform(ints)
+        else:
+            buf = [transform(x) for x in ints]
+        if pair_idx is not None:
+            sel = pair_idx[q0:q1] - p0
             if comp == 1:
-                buf = transform(ints)
+                buf = numpy.asarray(buf[:,sel], order='C')
             else:
-                buf = [transform(x) for x in ints]
-            bstore(buf, '%s/%d'%(dataname,istep))
-            buf = ints = None
-            time1 = log.timer('gen CD eri [%d/%d]' % (istep+1,len(shranges)), *time1)
+                buf = [numpy.asarray(x[:,sel], order='C') for x in buf]
+        return buf
+
+    if nproc is not None and nproc > 1 and len(tasks) > 1 and hasattr(os, 'fork'):
+        bufsize = comp * low.shape[1] * max([q1-q0 for _, _, _, q0, q1 in tasks])
+        _compute_in_processes(compute, store, tasks, nproc, bufsize, log)
+    else:
+        with lib.call_in_background(store) as bstore:
+            for task in tasks:
+                bstore(compute(task), task[1])
+                time1 = log.timer('gen CD eri [%d/%d]' % (task[0]+1,len(shranges)),
+                                  *time1)
     bufs1 = None
 
     feri.close()
@@ -271,6 +407,88 @@ def _guess_shell_ranges(mol, buflen, aosym):
         nao = ao_loc[-1]
         return balance_partition(ao_loc*nao, buflen)
 
+def _fingerprint(atm, bas, env, low, pair_idx, int3c, aosym, comp):
+    '''Fingerprint of the input of cholesky_eri_b, to validate the blocks of
+    an interrupted calculation'''
+    h = hashlib.sha1()
+    h.update(('%s %s %d' % (int3c, aosym, comp)).encode())
+    for x in (atm, bas, env, low):
+        h.update(numpy.ascontiguousarray(x).tobytes())
+    if pair_idx is not None:
+        h.update(numpy.ascontiguousarray(pair_idx).tobytes())
+    return h.hexdigest()
+
+def _compute_in_processes(compute, store, tasks, nproc, bufsize, log):
+    '''Evaluate compute(task) on nproc forked processes and store the results
+    in the parent process.  The workers pull the tasks from a queue and send
+    the results back through shared memory buffers of bufsize doubles.
+    '''
+    import multiprocessing
+    from multiprocessing import sharedctypes
+    try:
+        import queue
+    except ImportError:  # Python 2
+        import Queue as queue
+    try:
+        ctx = multiprocessing.get_context('fork')
+    except AttributeError:  # Python 2
+        ctx = multiprocessing
+    nproc = min(nproc, len(tasks))
+    nthreads = max(1, lib.num_threads() // nproc)
+    shm = [sharedctypes.RawArray('d', bufsize) for i in range(nproc)]
+    free = [ctx.Semaphore(1) for i in range(nproc)]
+    task_q = ctx.Queue()
+    result_q = ctx.Queue()
+    for k in range(len(tasks)):
+        task_q.put(k)
+    for i in range(nproc):
+        task_q.put(None)
+
+    def work(rank):
+        lib.num_threads(nthreads)
+        try:
+            for k in iter(task_q.get, None):
+                buf = compute(tasks[k])
+                free[rank].acquire()
+                out = numpy.ndarray(numpy.shape(buf), buffer=shm[rank])
+                out[:] = buf
+                result_q.put((rank, k, out.shape, None))
+        except BaseException:
+            result_q.put((rank, None, None, traceback.format_exc()))
+
+    ps = []
+    for rank in range(nproc):
+        p = ctx.Process(target=work, args=(rank,))
+        p.start()
+        ps.append(p)
+    try:
+        t1 = (time.clock(), time.time())
+        ndone = 0
+        while ndone < len(tasks):
+            try:
+                rank, k, shape, err = result_q.get(True, 1)
+            except queue.Empty:
+                if any(p.exitcode not in (None, 0) for p in ps):
+                    raise lib.misc.ProcessRuntimeError(
+                        'Worker process of cholesky_eri_b died')
+                continue
+            if err is not None:
+                raise lib.misc.ProcessRuntimeError(
+                    'Error on worker process %d of cholesky_eri_b:\n%s' %
+                    (rank, err))
+            buf = numpy.ndarray(shape, buffer=shm[rank])
+            if len(shape) == 3:
+                buf = list(buf)
+            store(buf, tasks[k][1])
+            free[rank].release()
+            ndone += 1
+            t1 = log.timer('gen CD eri %s' % tasks[k][1], *t1)
+    finally:
+        for p in ps:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+
 def _create_h5file(erifile, dataname):
     if h5py.is_hdf5(erifile):
         feri = h5py.File(erifile, 'a')
@@ -19,6 +19,7 @@ import os
 import unittest
 import tempfile
 import numpy
+import h5py
 from pyscf import lib
 from pyscf import gto
 from pyscf import scf
@@ -85,6 +86,82 @@ class KnownValues(unittest.TestCase):
         eri1 = dfobj.get_eri()
         self.assertAlmostEqual(abs(eri0-eri1).max(), 0, 9)
 
+    def test_build_resume(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        swapname = ftmp.name + '.swap'
+        eri0 = df.DF(mol).get_eri()
+        auxmol = df.addons.make_auxmol(mol)  # the auxbasis of DF.build
+        # An interrupted build, with a different block partition
+        df.outcore.cholesky_eri_b(mol, swapname, auxmol=auxmol, max_memory=.05)
+        with h5py.File(swapname, 'r+') as feri:
+            self.assertTrue(len(feri['j3c']) > 2)
+            del(feri['j3c/1'].attrs['complete'])
+            feri['j3c/1'][:] = 0
+            del(feri['j3c/2'])
+
+        dfobj = df.DF(mol)
+        dfobj.max_memory = 0.01
+        dfobj._cderi_to_save = ftmp.name
+        dfobj.build()
+        self.assertFalse(os.path.exists(swapname))
+        self.assertAlmostEqual(abs(dfobj.get_eri()-eri0).max(), 0, 9)
+
+    def test_pair_screen(self):
+        mol1 = gto.M(atom=[['H', (0, 0, i*2.)] for i in range(10)],
+                     basis='ccpvdz', verbose=0)
+        nao = mol1.nao_nr()
+        numpy.random.seed(2)
+        dm = numpy.random.random((2,nao,nao)) - .5
+        dm = dm + dm.transpose(0,2,1)
+        ref = df.DF(mol1).get_jk(dm)
+        eri0 = df.DF(mol1).get_eri()
+        for max_memory in (4000, 0.01):  # incore and outcore
+            dfobj = df.DF(mol1)
+            dfobj.pair_screen_tol = 1e-9
+            dfobj.max_memory = max_memory
+            dfobj.build()
+            pair_idx = dfobj.get_pair_idx()
+            self.assertTrue(pair_idx.size < nao*(nao+1)//2)
+            self.assertEqual(next(dfobj.sparse_loop()).shape[1], pair_idx.size)
+            vj, vk = dfobj.get_jk(dm)
+            self.assertAlmostEqual(abs(vj-ref[0]).max(), 0, 6)
+            self.assertAlmostEqual(abs(vk-ref[1]).max(), 0, 6)
+            vj = df.df_jk.get_jk(dfobj, dm, with_k=False)[0]
+            self.assertAlmostEqual(abs(vj-ref[0]).max(), 0, 6)
+            self.assertAlmostEqual(abs(dfobj.get_eri()-eri0).max(), 0, 7)
+            self.assertTrue(dfobj.get_pair_idx() is pair_idx)
+
+            mo = numpy.linalg.eigh(dm[0])[1]
+            mo_occ = numpy.zeros(nao)
+            mo_occ[:5] = 2
+            dm1 = lib.tag_array(numpy.dot(mo*mo_occ, mo.T), mo_coeff=mo, mo_occ=mo_occ)
+            vk = dfobj.get_jk(dm1, with_j=False)[1]
+            self.assertAlmostEqual(abs(vk-df.DF(mol1).get_jk(dm1)[1]).max(), 0, 6)
+
+            Lpq = numpy.vstack([x.copy() for x in
+                                df.addons.loop_ao2mo(dfobj, mo, (0, 3, 0, nao))])
+            eri1 = ao2mo.general(eri0, (mo[:,:3], mo, mo[:,:3], mo), compact=False)
+            self.assertAlmostEqual(abs(lib.dot(Lpq.T, Lpq)-eri1).max(), 0, 7)
+
+    def test_mmap_cderi(self):
+        nao = mol.nao_nr()
+        numpy.random.seed(2)
+        dm = numpy.random.random((nao,nao))
+        dm = dm + dm.T
+        ref = df.DF(mol).get_jk(dm)
+        eri0 = df.DF(mol).get_eri()
+        for pair_screen_tol in (None, 1e-9):
+            dfobj = df.DF(mol)
+            dfobj.max_memory = 0.01
+            dfobj.mmap_cderi = True
+            dfobj.pair_screen_tol = pair_screen_tol
+            dfobj.build()
+            self.assertTrue(isinstance(next(dfobj.sparse_loop()), numpy.memmap))
+            vj, vk = dfobj.get_jk(dm)
+            self.assertAlmostEqual(abs(vj-ref[0]).max(), 0, 7)
+            self.assertAlmostEqual(abs(vk-ref[1]).max(), 0, 7)
+            self.assertAlmostEqual(abs(dfobj.get_eri()-eri0).max(), 0, 7)
+
     def test_init_denisty_fit(self):
         from pyscf.df import df_jk
         from pyscf import cc
@@ -192,6 +192,49 @@ class KnownValues(unittest.TestCase):
         self.assertAlmostEqual(abs(vj0-vj1).max(), 0, 12)
         self.assertAlmostEqual(lib.finger(vj0), -194.15910890730052, 9)
 
+    def test_get_j_lindep(self):
+        numpy.random.seed(1)
+        nao = mol.nao_nr()
+        dms = numpy.random.random((2,nao,nao))
+        auxbasis = {'O': 'weigend', 'H': ('weigend', 'weigend')}
+        dfobj = df.DF(mol, auxbasis)
+        vj0 = df_jk.get_jk(dfobj, dms, hermi=0)[0]
+        vj1 = df_jk.get_j(df.DF(mol, auxbasis), dms, hermi=0)
+        self.assertAlmostEqual(abs(vj0-vj1).max(), 0, 7)
+
+    def test_local_k(self):
+        numpy.random.seed(1)
+        nao = mol.nao_nr()
+        dms = numpy.random.random((2,nao,nao))
+        mf = scf.RHF(mol).density_fit(auxbasis='weigend')
+        vj0, vk0 = mf.get_jk(mol, dms, hermi=0)
+
+        # Fitting domains covering all atoms recover the regular DF exchange
+        mf1 = scf.RHF(mol).density_fit(auxbasis='weigend', local_k_radius=1e9)
+        vj1, vk1 = mf1.get_jk(mol, dms, hermi=0)
+        self.assertAlmostEqual(abs(vj1-vj0).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 9)
+
+        mf1.with_df.local_k_radius = 2.
+        self.assertAlmostEqual(mf1.kernel(), mf.kernel(), 2)
+
+    def test_local_k_memory(self):
+        # The fitting coefficients of local-K versus the DF tensor of
+        # regular DF-K for a long chain
+        hchain = gto.M(atom=[['H', (0, 0, i*2.)] for i in range(100)],
+                       basis='6-31g', verbose=0)
+        mf = scf.RHF(hchain).density_fit(auxbasis='weigend', local_k_radius=3.)
+        dm = mf.get_init_guess()
+        vk1 = mf.get_k(hchain, dm)
+        opt = mf.with_df._vkopt
+        nao = hchain.nao_nr()
+        naux = mf.with_df.auxmol.nao_nr()
+        self.assertTrue(opt.nbytes < naux * nao*(nao+1)//2 * 8)
+        self.assertTrue(sum([x.size for x in opt.partners]) < hchain.natm**2)
+        self.assertTrue(all([d.shape[0] < naux for d in opt.dcoeffs]))
+        vk0 = scf.RHF(hchain).density_fit(auxbasis='weigend').get_k(hchain, dm)
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 2)
+
 
 if __name__ == "__main__":
     print("Full Tests for df")
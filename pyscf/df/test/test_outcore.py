@@ -93,6 +93,31 @@ class KnownValues(unittest.TestCase):
         with h5py.File(ftmp.name, 'r') as feri:
             self.assertTrue(numpy.allclose(feri['eri_mo'], cderi0))
 
+    def test_cholesky_eri_b_resume(self):
+        from pyscf.ao2mo.outcore import _load_from_h5g
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        cderi0 = df.incore.cholesky_eri(mol)
+        naux = cderi0.shape[0]
+        df.outcore.cholesky_eri_b(mol, ftmp.name, max_memory=.05, nproc=3)
+        with h5py.File(ftmp.name, 'r+') as feri:
+            nblk = len(feri['j3c'])
+            self.assertTrue(nblk > 2)
+            self.assertTrue(numpy.allclose(_load_from_h5g(feri['j3c'], 0, naux), cderi0))
+            # Interrupted run: one block is incomplete, one is not computed
+            del(feri['j3c/1'].attrs['complete'])
+            feri['j3c/1'][:] = 0
+            del(feri['j3c/2'])
+            # The completed blocks are not computed again
+            feri['j3c/0'][:] *= 2
+
+        df.outcore.cholesky_eri_b(mol, ftmp.name, max_memory=.05, resume=True)
+        with h5py.File(ftmp.name, 'r') as feri:
+            self.assertEqual(len(feri['j3c']), nblk)
+            cderi1 = _load_from_h5g(feri['j3c'], 0, naux)
+            n0 = feri['j3c/0'].shape[1]
+        self.assertTrue(numpy.allclose(cderi1[:,:n0], cderi0[:,:n0]*2))
+        self.assertTrue(numpy.allclose(cderi1[:,n0:], cderi0[:,n0:]))
+
     def test_lindep(self):
         ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
         df.outcore.cholesky_eri(mol, ftmp.name, auxmol=auxmol, verbose=7)
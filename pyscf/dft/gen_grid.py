@@ -26,7 +26,9 @@ Reference for Lebedev-Laikov grid:
 
 
 import ctypes
+import collections
 import numpy
+import scipy.special
 from pyscf import lib
 from pyscf.lib import logger
 from pyscf import gto
@@ -35,6 +37,15 @@ from pyscf import __config__
 
 libdft = lib.load_library('libdft')
 BLKSIZE = 128  # needs to be the same to lib/gto/grid_ao_drv.c
+# Number of grids in each batch of the screened Becke partition
+BECKE_BLKSIZE = getattr(__config__, 'dft_gen_grid_becke_blksize', 1024)
+# Without becke_cutoff, the cached Becke weights of the grids are reused for
+# the new geometry if their change is bounded by BECKE_WEIGHT_TOL.  In
+# practice this covers rigid translations of the molecule only.
+BECKE_WEIGHT_TOL = getattr(__config__, 'dft_gen_grid_becke_weight_tol', 1e-14)
+# make_mask skips the primitive Gaussians exp(-a*r^2) with a*r^2-log(c) above
+# EXPCUTOFF.  It needs to be the same to lib/gto/grid_ao_drv.h
+EXPCUTOFF = 50
 
 # ~= (L+1)**2/3
 LEBEDEV_ORDER = {
@@ -215,6 +226,93 @@ def original_becke(g):
 #    return g
     pass
 
+def _radial_grid_error(rad, dr, exps, ls):
+    '''Largest relative error of the radial integrals of the products of the
+    primitive Gaussians r^(l1+l2) exp(-(a1+a2) r^2)
+    '''
+    a = (exps[:,None] + exps)[numpy.tril_indices(exps.size)]
+    l = (ls[:,None] + ls)[numpy.tril_indices(ls.size)]
+    # int r^(l+2) exp(-a r^2) dr
+    ref = scipy.special.gamma(l*.5+1.5) / (2 * a**(l*.5+1.5))
+    val = numpy.einsum('r,pr->p', rad**2*dr,
+                       rad**l[:,None] * numpy.exp(-a[:,None] * rad**2))
+    return abs(val/ref - 1).max()
+
+def adaptive_atom_grid(mol, precision=1e-8, radi_method=radi.treutler,
+                       max_rad=200):
+    '''Number of radial and angular grids for each element, determined by
+    the basis exponents and the target integration error precision.
+
+    The number of radial grids is the smallest one (in steps of 5) which
+    integrates the radial parts of the products of the primitive functions
+    on the atom to the relative error precision.  The angular grids are the
+    grids of the level corresponding to precision (level 3 for 1e-8, one
+    level per two digits), enlarged if needed to integrate the products of
+    the atomic shells exactly.  The angular grids of each radial shell are
+    further pruned by Grids.prune.
+
+    Returns:
+        A dict {symbol: (n_rad, n_ang)} in the format of Grids.atom_grid
+    '''
+    level = int(min(max(round(-numpy.log10(precision)*.5 - 1), 0), 8))
+    tab = numpy.array((2 , 10, 18, 36, 54, 86, 118))
+    lebedev_orders = numpy.array(sorted(LEBEDEV_ORDER))
+    atom_grid = {}
+    for ia in range(mol.natm):
+        symb = mol.atom_symbol(ia)
+        if symb in atom_grid:
+            continue
+        chg = gto.charge(symb)
+        shls = mol.atom_shell_ids(ia)
+        if len(shls) == 0:
+            atom_grid[symb] = (_default_rad(chg, level), _default_ang(chg, level))
+            continue
+
+        exps = numpy.hstack([mol.bas_exp(ib) for ib in shls])
+        ls = numpy.hstack([[mol.bas_angular(ib)] * mol.bas_nprim(ib)
+                           for ib in shls])
+        for n_rad in range(10, max_rad+1, 5):
+            rad, dr = radi_method(n_rad, chg, ia)
+            if _radial_grid_error(rad, dr, exps, ls) < precision:
+                break
+        else:
+            logger.warn(mol, 'Radial grids of %s do not reach precision %g '
+                        'with %d grids', symb, precision, max_rad)
+
+        period = (chg > tab).sum()
+        order = max(ANG_ORDER[level,period], 2*ls.max())
+        order = lebedev_orders[min(lebedev_orders.searchsorted(order),
+                                   lebedev_orders.size-1)]
+        atom_grid[symb] = (n_rad, LEBEDEV_ORDER[order])
+        logger.debug(mol, 'adaptive grids for %s: rad %d ang %d',
+                     symb, n_rad, LEBEDEV_ORDER[order])
+    return atom_grid
+
+# Atomic grids do not depend on the molecule.  The ATOMIC_GRIDS_CACHE_SIZE
+# most recently used atomic grids are cached for the molecules processed in
+# the current process.
+ATOMIC_GRIDS_CACHE_SIZE = getattr(__config__, 'dft_gen_grid_atomic_grids_cache_size', 64)
+_atomic_grids_cache = collections.OrderedDict()
+
+def _atomic_grids_key(chg, n_rad, n_ang, radi_method, prune, kwargs):
+    '''Key of the atomic grids cache.  The atomic radii that radi_method and
+    prune may use are part of the key, so that the cache is not stale when
+    the radii tables are modified.  None if the key is not hashable.'''
+    radii = [radi.BRAGG_RADII[chg]]
+    if chg < len(radi.SG1RADII):
+        radii.append(radi.SG1RADII[chg])
+    for f in (radi_method, prune):
+        for x in (getattr(f, '__defaults__', None) or ()):
+            if isinstance(x, numpy.ndarray) and chg < len(x):
+                radii.append(x[chg])
+    key = (chg, n_rad, n_ang, radi_method, prune,
+           tuple(sorted(kwargs.items())), tuple(numpy.hstack(radii).tolist()))
+    try:
+        hash(key)
+    except TypeError:
+        key = None
+    return key
+
 def gen_atomic_grids(mol, atom_grid={}, radi_method=radi.gauss_chebyshev,
                      level=3, prune=nwchem_prune, **kwargs):
     '''Generate number of radial grids and angular grids for the given molecule.
@@ -247,6 +345,14 @@ def gen_atomic_grids(mol, atom_grid={}, radi_method=radi.gauss_chebyshev,
             else:
                 n_rad = _default_rad(chg, level)
                 n_ang = _default_ang(chg, level)
+
+            key = _atomic_grids_key(chg, n_rad, n_ang, radi_method, prune, kwargs)
+            if key in _atomic_grids_cache:
+                # Move the entry to the end, as the most recently used one
+                atom_grids_tab[symb] = _atomic_grids_cache[key] = \
+                        _atomic_grids_cache.pop(key)
+                continue
+
             rad, dr = radi_method(n_rad, chg, ia, **kwargs)
 
             rad_weight = 4*numpy.pi * rad**2 * dr
@@ -271,19 +377,145 @@ def gen_atomic_grids(mol, atom_grid={}, radi_method=radi.gauss_chebyshev,
                                                grid[:,:3]).reshape(-1,3))
                     vol.append(numpy.einsum('i,j->ji', rad_weight[idx[i0:i1]],
                                             grid[:,3]).ravel())
-            atom_grids_tab[symb] = (numpy.vstack(coords), numpy.hstack(vol))
+            coords = numpy.vstack(coords)
+            vol = numpy.hstack(vol)
+            if key is not None:
+                # The cached grids are shared by all molecules
+                coords.flags.writeable = False
+                vol.flags.writeable = False
+                _atomic_grids_cache[key] = (coords, vol)
+                while len(_atomic_grids_cache) > ATOMIC_GRIDS_CACHE_SIZE:
+                    _atomic_grids_cache.popitem(last=False)
+            atom_grids_tab[symb] = (coords, vol)
     return atom_grids_tab
 
 
+def _becke_cell_bound(x, becke_scheme=original_becke, a=None):
+    '''Upper bound of the cell function s(mu) given the lower bound x of mu.
+    a is the atomic size adjustment of mu.
+    '''
+    x = numpy.clip(x, -1, 1)
+    if a is not None:
+        # mu + a*(1-mu**2) increases with mu for |a| <= .5
+        x = x + a * (1 - x**2)
+    if becke_scheme is original_becke:
+        g = x
+        for i in range(3):
+            g = (3 - g**2) * g * .5
+    else:
+        g = becke_scheme(x)
+    return .5 * (1 - g)
+
+def becke_neighbors(atm_dist, ia, rmax, becke_cutoff,
+                    becke_scheme=original_becke, radii_table=None):
+    '''Atoms which need to be included in the Becke partition for the grids
+    of atom ia within the distance rmax to atom ia.
+
+    On these grids, mu_BC = (r_B-r_C)/R_BC is not smaller than
+    (R_AB-R_AC-2*rmax)/R_BC (A = atom ia), which gives the upper bound of the
+    cell function s(mu_BC).  Atom B is needed if s(mu_BA), the upper bound of
+    the Becke weight of atom B, is larger than becke_cutoff, or if
+    s(mu_CA)*s(mu_BC) is larger than becke_cutoff for any atom C, since
+    s(mu_CB) = 1 - s(mu_BC) is a factor of the Becke weight of atom C.
+
+    The cell functions of the Stratmann scheme are exactly zero beyond
+    mu = .64.  The original Becke scheme decays slowly, only the grids close
+    to the nucleus have short lists of neighbours.
+
+    radii_table[B,C] is the atomic size adjustment of mu_BC.
+
+    Returns:
+        Sorted indices of the atoms, including atom ia.
+    '''
+    def cell_bound(c):
+        # Upper bounds of s(mu_BC) for atoms c and all atoms B
+        dist_bc = atm_dist[c]
+        x = ((atm_dist[ia] - atm_dist[ia,c,None] - 2*rmax) /
+             numpy.where(dist_bc==0, 1, dist_bc))
+        if radii_table is None:
+            s = _becke_cell_bound(x, becke_scheme)
+        else:
+            s = _becke_cell_bound(x, becke_scheme, radii_table[:,c].T)
+        s[dist_bc == 0] = 1
+        return s
+
+    s_a = cell_bound(numpy.array([ia]))[0]
+    nb = s_a > becke_cutoff
+    nb[ia] = False
+    c = numpy.where(nb)[0]
+    if c.size > 0:
+        nb |= (s_a[c,None] * cell_bound(c) > becke_cutoff).any(axis=0)
+    nb[ia] = True
+    return numpy.where(nb)[0]
+
+def _becke_cell_slope(becke_scheme=original_becke, adjusted=False):
+    '''Upper bound of |ds/dmu| of the cell function s(mu).  The atomic size
+    adjustment mu + a*(1-mu**2) (|a| <= .5) doubles the bound.
+    '''
+    if becke_scheme is original_becke:
+        # s = (1-f(f(f(mu))))/2, f(x) = (3-x**2)*x/2, f'(0) = 3/2
+        slope = 27/16.
+    else:
+        # Largest slope on a fine mesh, with a margin for the points between
+        x = numpy.linspace(-1, 1, 4001)
+        slope = abs(numpy.diff(becke_scheme(x))).max() / (x[1]-x[0]) * .5
+        slope *= 1.01
+    if adjusted:
+        slope *= 2
+    return slope
+
+def _becke_weight_change(atm_coords, ref_coords, ia, psum_min, slope):
+    '''Upper bound of the change of the Becke weights (divided by the volume
+    of the grids) of the grids of atom ia, when the atoms (including atom ia)
+    are moved from ref_coords to atm_coords and the grids move with atom ia.
+
+    With rel_B the displacement of atom B relative to atom ia, the change of
+    mu_BC = (r_B-r_C)/R_BC is bounded by 2*(rel_B+rel_C)/(R_BC-rel_B-rel_C),
+    and the change of each cell product P_B by the sum of the changes of its
+    cell functions s(mu_BC).  The sum of the changes, E, bounds the change of
+    the normalization sum_B P_B (not smaller than psum_min at ref_coords),
+    and the weight P_A/sum_B P_B changes by at most 2*E/(psum_min-E).
+    '''
+    disp = atm_coords - ref_coords
+    rel = numpy.linalg.norm(disp - disp[ia], axis=1)
+    if rel.max() == 0:
+        return 0
+    natm = rel.size
+    offdiag = ~numpy.eye(natm, dtype=bool)
+    rel_bc = (rel[:,None] + rel)[offdiag]
+    r_bc = numpy.linalg.norm(ref_coords[:,None] - ref_coords, axis=2)[offdiag]
+    r_bc -= rel_bc
+    if (r_bc <= 0).any():
+        return numpy.inf
+    err = (slope * 2 * rel_bc / r_bc).sum()
+    if err >= psum_min:
+        return numpy.inf
+    return 2 * err / (psum_min - err)
+
 def get_partition(mol, atom_grids_tab,
                   radii_adjust=None, atomic_radii=radi.BRAGG_RADII,
-                  becke_scheme=original_becke, concat=True):
+                  becke_scheme=original_becke, concat=True,
+                  becke_cutoff=None, cache=None):
     '''Generate the mesh grid coordinates and weights for DFT numerical integration.
     We can change radii_adjust, becke_scheme functions to generate different meshgrid.
 
     Kwargs:
         concat: bool
             Whether to concatenate grids and weights in return
+        becke_cutoff : float
+            If given, the Becke weights of the grids of each atom are
+            computed with the neighbouring atoms only (see
+            :func:`becke_neighbors`).  The grids are processed by radial
+            shells, the grids close to the nucleus have fewer neighbours.
+        cache : dict
+            The weights of each batch of grids are stored in cache, together
+            with the positions of the neighbours (all atoms if becke_cutoff
+            is not given) at which they were computed.  The grids move with
+            their atoms.  In the next calls, the weights of a batch are
+            reused if its neighbour list is not changed and the change of the
+            weights due to the displacements of the neighbours relative to
+            the atom of the grids (see :func:`_becke_weight_change`) is
+            smaller than becke_cutoff (BECKE_WEIGHT_TOL without becke_cutoff).
 
     Returns:
         grid_coord and grid_weight arrays.  grid_coord array has shape (N,3);
@@ -293,57 +525,119 @@ def get_partition(mol, atom_grids_tab,
         f_radii_adjust = radii_adjust(mol, atomic_radii)
     else:
         f_radii_adjust = None
+    natm = mol.natm
     atm_coords = numpy.asarray(mol.atom_coords() , order='C')
     atm_dist = gto.inter_distance(mol)
-    if (becke_scheme is original_becke and
-        (radii_adjust is radi.treutler_atomic_radii_adjust or
-         radii_adjust is radi.becke_atomic_radii_adjust or
-         f_radii_adjust is None)):
-        if f_radii_adjust is None:
-            p_radii_table = lib.c_null_ptr()
-        else:
-            f_radii_table = numpy.asarray([f_radii_adjust(i, j, 0)
-                                           for i in range(mol.natm)
-                                           for j in range(mol.natm)])
-            p_radii_table = f_radii_table.ctypes.data_as(ctypes.c_void_p)
-
-        def gen_grid_partition(coords):
+    use_c_partition = (becke_scheme is original_becke and
+                       (radii_adjust is radi.treutler_atomic_radii_adjust or
+                        radii_adjust is radi.becke_atomic_radii_adjust or
+                        f_radii_adjust is None))
+    if f_radii_adjust is None or not (use_c_partition or becke_cutoff is not None):
+        f_radii_table = None
+    else:
+        f_radii_table = numpy.asarray([f_radii_adjust(i, j, 0)
+                                       for i in range(natm)
+                                       for j in range(natm)])
+        f_radii_table = f_radii_table.reshape(natm,natm)
+
+    if use_c_partition:
+        def gen_grid_partition(coords, atom_id=None):
+            if atom_id is None:
+                atom_id = numpy.arange(natm)
             coords = numpy.asarray(coords, order='F')
             ngrids = coords.shape[0]
-            pbecke = numpy.empty((mol.natm,ngrids))
+            nsub = len(atom_id)
+            sub_coords = numpy.asarray(atm_coords[atom_id], order='C')
+            if f_radii_table is None:
+                p_radii_table = lib.c_null_ptr()
+            else:
+                sub_table = numpy.asarray(f_radii_table[atom_id[:,None],atom_id],
+                                          order='C')
+                p_radii_table = sub_table.ctypes.data_as(ctypes.c_void_p)
+            pbecke = numpy.empty((nsub,ngrids))
             libdft.VXCgen_grid(pbecke.ctypes.data_as(ctypes.c_void_p),
                                coords.ctypes.data_as(ctypes.c_void_p),
-                               atm_coords.ctypes.data_as(ctypes.c_void_p),
+                               sub_coords.ctypes.data_as(ctypes.c_void_p),
                                p_radii_table,
-                               ctypes.c_int(mol.natm), ctypes.c_int(ngrids))
+                               ctypes.c_int(nsub), ctypes.c_int(ngrids))
             return pbecke
     else:
-        def gen_grid_partition(coords):
+        def gen_grid_partition(coords, atom_id=None):
+            if atom_id is None:
+                atom_id = numpy.arange(natm)
             ngrids = coords.shape[0]
-            grid_dist = numpy.empty((mol.natm,ngrids))
-            for ia in range(mol.natm):
+            nsub = len(atom_id)
+            grid_dist = numpy.empty((nsub,ngrids))
+            for k, ia in enumerate(atom_id):
                 dc = coords - atm_coords[ia]
-                grid_dist[ia] = numpy.sqrt(numpy.einsum('ij,ij->i',dc,dc))
-            pbecke = numpy.ones((mol.natm,ngrids))
-            for i in range(mol.natm):
-                for j in range(i):
-                    g = 1/atm_dist[i,j] * (grid_dist[i]-grid_dist[j])
+                grid_dist[k] = numpy.sqrt(numpy.einsum('ij,ij->i',dc,dc))
+            pbecke = numpy.ones((nsub,ngrids))
+            for ki, i in enumerate(atom_id):
+                for kj, j in enumerate(atom_id[:ki]):
+                    g = 1/atm_dist[i,j] * (grid_dist[ki]-grid_dist[kj])
                     if f_radii_adjust is not None:
                         g = f_radii_adjust(i, j, g)
                     g = becke_scheme(g)
-                    pbecke[i] *= .5 * (1-g)
-                    pbecke[j] *= .5 * (1+g)
+                    pbecke[ki] *= .5 * (1-g)
+                    pbecke[kj] *= .5 * (1+g)
             return pbecke
 
+    if cache is not None:
+        key = (radii_adjust, atomic_radii, becke_scheme, becke_cutoff,
+               tuple(mol.atom_charges()))
+        if (cache.get('key') is None or
+            any(a is not b for a, b in zip(cache['key'][:3], key[:3])) or
+            cache['key'][3:] != key[3:]):
+            cache.clear()
+            cache['key'] = key
+    if becke_cutoff is None:
+        weight_tol = BECKE_WEIGHT_TOL
+    else:
+        weight_tol = becke_cutoff
+    slope = _becke_cell_slope(becke_scheme, f_radii_adjust is not None)
+
     coords_all = []
     weights_all = []
-    for ia in range(mol.natm):
-        coords, vol = atom_grids_tab[mol.atom_symbol(ia)]
+    for ia in range(natm):
+        atom_grid = atom_grids_tab[mol.atom_symbol(ia)]
+        coords, vol = atom_grid
+        entry = None
+        if cache is not None and ia in cache and cache[ia][0] is atom_grid:
+            entry = cache[ia]
+        rad = numpy.sqrt(numpy.einsum('ij,ij->i', coords, coords))
         coords = coords + atm_coords[ia]
-        pbecke = gen_grid_partition(coords)
-        weights = vol * pbecke[ia] * (1./pbecke.sum(axis=0))
+        weights = numpy.empty_like(vol)
+        chunks = []
+        # Grids are sorted by the distance to atom ia.  The grids close to
+        # the nucleus are partitioned with a short list of neighbours.  The
+        # weights of a batch of grids are reused if the neighbour list is not
+        # changed and the change of the weights is bounded by weight_tol.
+        idx = numpy.argsort(rad, kind='mergesort')
+        for k, (p0, p1) in enumerate(prange(0, idx.size, BECKE_BLKSIZE)):
+            sub_idx = idx[p0:p1]
+            if becke_cutoff is None:
+                atom_id = numpy.arange(natm)
+            else:
+                atom_id = becke_neighbors(atm_dist, ia, rad[sub_idx[-1]],
+                                          becke_cutoff, becke_scheme,
+                                          f_radii_table)
+            i = numpy.searchsorted(atom_id, ia)
+            if entry is not None:
+                ref_atom_id, ref_coords, psum_min = entry[1][k]
+                if (numpy.array_equal(ref_atom_id, atom_id) and
+                    _becke_weight_change(atm_coords[atom_id], ref_coords, i,
+                                         psum_min, slope) < weight_tol):
+                    weights[sub_idx] = entry[2][sub_idx]
+                    chunks.append(entry[1][k])
+                    continue
+            pbecke = gen_grid_partition(coords[sub_idx], atom_id)
+            psum = pbecke.sum(axis=0)
+            weights[sub_idx] = vol[sub_idx] * pbecke[i] * (1./psum)
+            chunks.append((atom_id, atm_coords[atom_id], psum.min()))
         coords_all.append(coords)
         weights_all.append(weights)
+        if cache is not None:
+            cache[ia] = (atom_grid, chunks, weights)
 
     if concat:
         coords_all = numpy.vstack(coords_all)
@@ -392,6 +686,136 @@ def make_mask(mol, coords, relativity=0, shls_slice=None, verbose=None):
                            mol._env.ctypes.data_as(ctypes.c_void_p))
     return non0tab
 
+def _shell_screen_radii(mol):
+    '''The distance to the atom beyond which make_mask drops each shell.
+    -1 for the shells which are dropped everywhere.'''
+    radii = numpy.empty(mol.nbas)
+    for ib in range(mol.nbas):
+        nprim = mol._bas[ib,gto.NPRIM_OF]
+        nctr = mol._bas[ib,gto.NCTR_OF]
+        ptr = mol._bas[ib,gto.PTR_EXP]
+        es = mol._env[ptr:ptr+nprim]
+        ptr = mol._bas[ib,gto.PTR_COEFF]
+        cs = abs(mol._env[ptr:ptr+nprim*nctr].reshape(nctr,nprim)).max(axis=0)
+        with numpy.errstate(divide='ignore'):
+            r2 = ((EXPCUTOFF + numpy.log(cs)) / es).max()
+        radii[ib] = numpy.sqrt(r2) if r2 > 0 else -1
+    return radii
+
+def _mask_margin(mol, coords, screen_radii):
+    '''For each block of grids, the smallest |d - r| over the shells, with d
+    the distance between the block and the atom of the shell and r the
+    screening radius of the shell.  The mask of the block is not changed
+    unless d changes by this margin.'''
+    atm_coords = mol.atom_coords()
+    blk_start = numpy.arange(0, coords.shape[0], BLKSIZE)
+    dist = numpy.empty((blk_start.size, mol.natm))
+    for ia in range(mol.natm):
+        dc = coords - atm_coords[ia]
+        dist[:,ia] = numpy.minimum.reduceat(numpy.einsum('ij,ij->i', dc, dc),
+                                            blk_start)
+    dist = numpy.sqrt(dist)
+    return abs(dist[:,mol._bas[:,gto.ATOM_OF]] - screen_radii).min(axis=1)
+
+def _update_mask(mol, coords, atm_grids, cache):
+    '''The mask (see :func:`make_mask`) of the grids which move with the
+    atoms.  atm_grids are the atomic grids (without the translation) of each
+    atom, coords are the grids of all atoms in the order of atoms.
+
+    make_mask keeps a shell on a block if a grid of the block is within the
+    screening radius of the shell.  The mask of the previous call is held in
+    cache with the margin of each block (see :func:`_mask_margin`).  A grid
+    moves with its atom, its distance to atom B changes at most by the
+    displacement of atom B relative to the atom of the grid.  The margins are
+    reduced by these displacements in each call, and the mask is recomputed
+    only on the blocks whose margin is used up.
+    '''
+    atm_coords = mol.atom_coords()
+    ngrids = coords.shape[0]
+    nblk = (ngrids+BLKSIZE-1) // BLKSIZE
+    # The basis without the nuclear coordinates
+    env = mol._env.copy()
+    ptr = mol._atm[:,gto.PTR_COORD]
+    env[ptr[:,None] + numpy.arange(3)] = 0
+    if (cache.get('non0tab') is None or
+        len(cache['atm_grids']) != len(atm_grids) or
+        any(a is not b for a, b in zip(cache['atm_grids'], atm_grids)) or
+        not numpy.array_equal(cache['bas'], mol._bas) or
+        not numpy.array_equal(cache['env'], env)):
+        non0tab = numpy.empty((nblk,mol.nbas), dtype=numpy.uint8)
+        margin = numpy.empty(nblk)
+        screen_radii = _shell_screen_radii(mol)
+        blks = numpy.arange(nblk)
+    else:
+        non0tab = cache['non0tab'].copy()
+        screen_radii = cache['screen_radii']
+        disp = atm_coords - cache['atm_coords']
+        # The largest displacement of the atoms relative to each atom
+        rel = numpy.linalg.norm(disp[:,None] - disp, axis=2).max(axis=1)
+        # The atoms of the first and the last grids of each block.  The
+        # grids are ordered by atoms, a block rarely covers more than two
+        # atoms.
+        atm_end = numpy.cumsum([x.shape[0] for x in atm_grids])
+        blk_start = numpy.arange(0, ngrids, BLKSIZE)
+        blk_end = numpy.minimum(blk_start+BLKSIZE, ngrids) - 1
+        atm0 = numpy.searchsorted(atm_end, blk_start, side='right')
+        atm1 = numpy.searchsorted(atm_end, blk_end, side='right')
+        blk_disp = numpy.maximum(rel[atm0], rel[atm1])
+        for k in numpy.where(atm1 - atm0 > 1)[0]:
+            blk_disp[k] = rel[atm0[k]:atm1[k]+1].max()
+        margin = cache['margin'] - blk_disp
+        blks = numpy.where(margin <= 0)[0]
+
+    if blks.size > 0:
+        idx = (blks[:,None] * BLKSIZE + numpy.arange(BLKSIZE)).ravel()
+        idx = idx[idx < ngrids]
+        non0tab[blks] = make_mask(mol, coords[idx])
+        margin[blks] = _mask_margin(mol, coords[idx], screen_radii)
+    cache['non0tab'] = non0tab
+    cache['margin'] = margin
+    cache['screen_radii'] = screen_radii
+    cache['atm_grids'] = atm_grids
+    cache['atm_coords'] = atm_coords
+    cache['bas'] = mol._bas.copy()
+    cache['env'] = env
+    return non0tab
+
+def _morton_code(ix, iy, iz, nbits):
+    '''Interleave the bits of the integer coordinates'''
+    code = numpy.zeros(ix.size, dtype=numpy.int64)
+    for b in range(nbits):
+        code |= ((ix >> b) & 1) << (3*b+2)
+        code |= ((iy >> b) & 1) << (3*b+1)
+        code |= ((iz >> b) & 1) << (3*b)
+    return code
+
+def arg_group_grids(mol, coords, nbits=10):
+    '''Indices to sort grids along the Morton (Z-order) space filling curve,
+    so that the grids in a block of consecutive grids are close in space.
+
+    Args:
+        mol : an instance of :class:`Mole`
+
+        coords : 2D array, shape (N,3)
+            The coordinates of grids.
+
+    Kwargs:
+        nbits : int
+            The bounding box of the grids is divided into 2**nbits cells in
+            each direction.
+
+    Returns:
+        1D int array.  coords[idx] are the sorted grids.
+    '''
+    coords = numpy.asarray(coords)
+    if coords.shape[0] == 0:
+        return numpy.zeros(0, dtype=int)
+    lower = coords.min(axis=0)
+    extent = max((coords.max(axis=0) - lower).max(), 1e-9)
+    ncell = 2**nbits
+    icell = numpy.asarray((coords - lower) * ((ncell-1) / extent), dtype=numpy.int64)
+    code = _morton_code(icell[:,0], icell[:,1], icell[:,2], nbits)
+    return numpy.argsort(code, kind='mergesort')
 
 
 class Grids(lib.StreamObject):
@@ -446,6 +870,38 @@ class Grids(lib.StreamObject):
             Eg, grids.atom_grid = {'H': (20,110)} will generate 20 radial
             grids and 110 angular grids for H atom.
 
+        sort_grids : bool
+            Whether to reorder the grids along a space filling curve (see
+            :func:`arg_group_grids`), so that each block of grids is compact
+            in space and only a small number of AOs are significant on the
+            block.  The blocks of grids can then be integrated with the
+            significant AOs only (see :meth:`NumInt.sparse_block_loop`).
+            Default is False.
+
+        becke_cutoff : float
+            If given, the Becke partition of the grids of each atom only
+            includes the neighbouring atoms whose cell functions are larger
+            than becke_cutoff (see :func:`becke_neighbors`).  The weights
+            are kept and reused in the next build (e.g. in the scanner or
+            geometry optimization) for the grids whose neighbours are not
+            moved.  Default is None, to include all atoms.
+
+            The grids move with the atoms.  Grids.reset keeps the Becke
+            weights and the non0tab mask of the last build, to be updated in
+            the next build (e.g. in geometry optimization or MD).  The
+            weights of a batch of grids are recomputed only if its neighbour
+            list is changed or the displacements of the neighbours can change
+            the weights by more than becke_cutoff.  The mask of a block of
+            grids is recomputed only if the displacements can move a shell
+            across its screening radius.
+
+        precision : float
+            If given, the radial and angular grids of the atoms which are
+            not specified in atom_grid are determined by the basis exponents
+            to integrate the basis products to this precision (see
+            :func:`adaptive_atom_grid`).  level is not used for these atoms.
+            Default is None.
+
         Examples:
 
         >>> mol = gto.M(atom='H 0 0 0; H 0 0 1.1')
@@ -497,11 +953,16 @@ class Grids(lib.StreamObject):
         self.prune = _load_conf(None, 'dft_gen_grid_Grids_prune', nwchem_prune)
 
         self.level = getattr(__config__, 'dft_gen_grid_Grids_level', 3)
+        self.sort_grids = getattr(__config__, 'dft_gen_grid_Grids_sort_grids', False)
+        self.becke_cutoff = getattr(__config__, 'dft_gen_grid_Grids_becke_cutoff', None)
+        self.precision = getattr(__config__, 'dft_gen_grid_Grids_precision', None)
 
 ##################################################
 # don't modify the following attributes, they are not input options
         self.coords  = None
         self.weights = None
+        self._partition_cache = {}
+        self._mask_cache = {}
         self._keys = set(self.__dict__.keys())
 
     @property
@@ -510,7 +971,8 @@ class Grids(lib.StreamObject):
 
     def __setattr__(self, key, val):
         if key in ('atom_grid', 'atomic_radii', 'radii_adjust', 'radi_method',
-                   'becke_scheme', 'prune', 'level'):
+                   'becke_scheme', 'prune', 'level', 'sort_grids',
+                   'becke_cutoff', 'precision'):
             self.reset()
         super(Grids, self).__setattr__(key, val)
 
@@ -520,6 +982,11 @@ class Grids(lib.StreamObject):
         logger.info(self, 'pruning grids: %s', self.prune)
         logger.info(self, 'grids dens level: %d', self.level)
         logger.info(self, 'symmetrized grids: %s', self.symmetry)
+        logger.info(self, 'sorted grids: %s', self.sort_grids)
+        if self.becke_cutoff is not None:
+            logger.info(self, 'becke partition cutoff: %g', self.becke_cutoff)
+        if self.precision is not None:
+            logger.info(self, 'adaptive grids precision: %g', self.precision)
         if self.radii_adjust is not None:
             logger.info(self, 'atomic radii adjust function: %s',
                         self.radii_adjust)
@@ -532,14 +999,28 @@ class Grids(lib.StreamObject):
         if mol is None: mol = self.mol
         if self.verbose >= logger.WARN:
             self.check_sanity()
-        atom_grids_tab = self.gen_atomic_grids(mol, self.atom_grid,
+        atom_grid = self.atom_grid
+        if self.precision is not None and isinstance(atom_grid, dict):
+            atom_grid = adaptive_atom_grid(mol, self.precision, self.radi_method)
+            atom_grid.update(self.atom_grid)
+        atom_grids_tab = self.gen_atomic_grids(mol, atom_grid,
                                                self.radi_method,
                                                self.level, self.prune, **kwargs)
         self.coords, self.weights = \
                 self.get_partition(mol, atom_grids_tab,
                                    self.radii_adjust, self.atomic_radii,
-                                   self.becke_scheme)
-        if with_non0tab:
+                                   self.becke_scheme,
+                                   becke_cutoff=self.becke_cutoff)
+        if self.sort_grids:
+            idx = arg_group_grids(mol, self.coords)
+            self.coords = self.coords[idx]
+            self.weights = self.weights[idx]
+        if with_non0tab and not self.sort_grids:
+            atm_grids = [atom_grids_tab[mol.atom_symbol(ia)][0]
+                         for ia in range(mol.natm)]
+            self.non0tab = _update_mask(mol, self.coords, atm_grids,
+                                        self._mask_cache)
+        elif with_non0tab:
             self.non0tab = self.make_mask(mol, self.coords)
         else:
             self.non0tab = None
@@ -551,7 +1032,10 @@ class Grids(lib.StreamObject):
         return self.build(mol, with_non0tab)
 
     def reset(self, mol=None):
-        '''Reset mol and clean up relevant attributes for scanner mode'''
+        '''Reset mol and clean up relevant attributes for scanner mode.
+        The Becke weights and the mask of the grids are kept in the partition
+        and mask caches, to be updated for the new geometry.
+        '''
         if mol is not None:
             self.mol = mol
         self.coords = None
@@ -571,11 +1055,14 @@ class Grids(lib.StreamObject):
     @lib.with_doc(get_partition.__doc__)
     def get_partition(self, mol, atom_grids_tab=None,
                       radii_adjust=None, atomic_radii=radi.BRAGG_RADII,
-                      becke_scheme=original_becke, concat=True):
+                      becke_scheme=original_becke, concat=True,
+                      becke_cutoff=None):
         if atom_grids_tab is None:
             atom_grids_tab = self.gen_atomic_grids(mol)
         return get_partition(mol, atom_grids_tab, radii_adjust, atomic_radii,
-                             becke_scheme, concat=concat)
+                             becke_scheme, concat=concat,
+                             becke_cutoff=becke_cutoff,
+                             cache=self._partition_cache)
 
     gen_partition = get_partition
 
@@ -25,6 +25,7 @@ import numpy
 import scipy.linalg
 from pyscf import lib
 from pyscf.lib import logger
+from pyscf.scf import hf
 from pyscf.scf import ghf
 from pyscf.dft import rks
 
@@ -75,39 +76,32 @@ def get_veff(ks, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
     #enabling range-separated hybrids
     omega, alpha, hyb = ni.rsh_and_hybrid_coeff(ks.xc, spin=mol.spin)
 
-    if abs(hyb) < 1e-10 and abs(alpha) < 1e-10:
-        vk = None
-        if (ks._eri is None and ks.direct_scf and
-            getattr(vhf_last, 'vj', None) is not None):
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
+    hybrid = abs(hyb) > 1e-10 or abs(alpha) > 1e-10
+
+    # J/K are built from dm-dm_last if vhf_last holds the J/K matrices of dm_last
+    ddm, incremental, tol = ks._direct_scf_ddm(
+        dm, dm_last, getattr(vhf_last, 'vk' if hybrid else 'vj', None) is not None)
+    with hf._direct_scf_tol(ks, tol):
+        if not hybrid:
+            vk = None
             vj = ks.get_j(mol, ddm, hermi)
-            vj += vhf_last.vj
         else:
-            vj = ks.get_j(mol, dm, hermi)
-        vxc += vj
-    else:
-        if (ks._eri is None and ks.direct_scf and
-            getattr(vhf_last, 'vk', None) is not None):
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
             vj, vk = ks.get_jk(mol, ddm, hermi)
             vk *= hyb
-            if abs(omega) > 1e-10:
+            if abs(omega) > 1e-10:  # For range separated Coulomb operator
                 vklr = ks.get_k(mol, ddm, hermi, omega=omega)
                 vklr *= (alpha - hyb)
                 vk += vklr
-            vj += vhf_last.vj
+    if incremental:
+        vj += vhf_last.vj
+        if hybrid:
             vk += vhf_last.vk
-        else:
-            vj, vk = ks.get_jk(mol, dm, hermi)
-            vk *= hyb
-            if abs(omega) > 1e-10:
-                vklr = ks.get_k(mol, dm, hermi, omega=omega)
-                vklr *= (alpha - hyb)
-                vk += vklr
-        vxc += vj - vk
-
+    vxc += vj
+    if hybrid:
+        vxc -= vk
         if ground_state:
             exc -= numpy.einsum('ij,ji', dm, vk).real * .5
+
     if ground_state:
         ecoul = numpy.einsum('ij,ji', dm, vj).real * .5
     else:
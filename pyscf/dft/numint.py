@@ -16,10 +16,16 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
+import os
+import sys
+import copy
+import traceback
+import tempfile
 import warnings
 import ctypes
 import numpy
 from pyscf import lib
+from pyscf import gto
 from pyscf.dft.sap import sap_effective_charge
 try:
     from pyscf.dft import libxc
@@ -32,7 +38,7 @@ except (ImportError, OSError):
         from pyscf.dft import xc
         libxc = xc
 
-from pyscf.dft.gen_grid import make_mask, BLKSIZE
+from pyscf.dft.gen_grid import make_mask, arg_group_grids, BLKSIZE
 from pyscf import __config__
 
 libdft = lib.load_library('libdft')
@@ -41,6 +47,33 @@ OCCDROP = getattr(__config__, 'dft_numint_OCCDROP', 1e-12)
 # If the number of AOs in the system is less than this value, all tensors are
 # treated as dense quantities and contracted by dgemm directly.
 SWITCH_SIZE = getattr(__config__, 'dft_numint_SWITCH_SIZE', 800)
+# Limit the blocks of NumInt.block_loop to fit the L3 cache.  The minimal
+# number of BLKSIZE chunks of grids for each thread in one block is
+# BLKSIZE_THREAD_CHUNKS.
+BLKSIZE_CACHE_FIT = getattr(__config__, 'dft_numint_NumInt_blksize_cache_fit', False)
+BLKSIZE_THREAD_CHUNKS = getattr(__config__, 'dft_numint_blksize_thread_chunks', 8)
+# In NumInt.sparse_block_loop, a block of grids is integrated with the
+# significant AOs only if the fraction of the significant AOs is smaller than
+# SPARSE_AO_CUTOFF.
+SPARSE_AO_CUTOFF = getattr(__config__, 'dft_numint_sparse_ao_cutoff', .5)
+SPARSE_BLKSIZE_CHUNKS = getattr(__config__, 'dft_numint_sparse_blksize_chunks', 8)
+# Keep the AO values of NumInt.block_loop and reuse them in the next calls for
+# the same molecule and grids (e.g. in the SCF iterations).  The AO values
+# beyond CACHE_AO_MEMORY (in MB) are stored in a memory-mapped temporary file.
+CACHE_AO = getattr(__config__, 'dft_numint_NumInt_cache_ao', False)
+CACHE_AO_MEMORY = getattr(__config__, 'dft_numint_NumInt_cache_ao_memory', 1000)
+# Evaluate the AO values and the XC potential matrix in single precision in
+# the SCF iterations while the density matrix changes by more than
+# MIXED_PRECISION_TOL.  See NumInt.mixed_precision
+MIXED_PRECISION = getattr(__config__, 'dft_numint_NumInt_mixed_precision', False)
+MIXED_PRECISION_TOL = getattr(__config__, 'dft_numint_NumInt_mixed_precision_tol', 1e-4)
+# In the VV10 kernel, the grids are grouped in spatial blocks.  A pair of
+# blocks is skipped if the upper bound of its contributions to the kernel
+# integrals on each grid is smaller than VV10_SCREEN_THRESH.  Set it to None
+# to disable the screening.
+VV10_SCREEN_THRESH = getattr(__config__, 'dft_numint_vv10_screen_thresh', 1e-10)
+# Number of processes to evaluate nr_rks and nr_uks.  See NumInt.nproc
+NPROC = getattr(__config__, 'dft_numint_NumInt_nproc', 1)
 
 def eval_ao(mol, coords, deriv=0, shls_slice=None,
             non0tab=None, out=None, verbose=None):
@@ -104,7 +137,8 @@ def eval_ao(mol, coords, deriv=0, shls_slice=None,
     return mol.eval_gto(feval, coords, comp, shls_slice, non0tab, out=out)
 
 #TODO: \nabla^2 rho and tau = 1/2 (\nabla f)^2
-def eval_rho(mol, ao, dm, non0tab=None, xctype='LDA', hermi=0, verbose=None):
+def eval_rho(mol, ao, dm, non0tab=None, xctype='LDA', hermi=0, verbose=None,
+             buf=None):
     r'''Calculate the electron density for LDA functional, and the density
     derivatives for GGA functional.
 
@@ -129,6 +163,8 @@ def eval_rho(mol, ao, dm, non0tab=None, xctype='LDA', hermi=0, verbose=None):
             dm is hermitian or not
         verbose : int or object of :class:`Logger`
             No effects.
+        buf : 1D array
+            Workspace for the intermediates ao.dm (see :func:`_rho_workspace`).
 
     Returns:
         1D array of size N to store electron density if xctype = LDA;  2D array
@@ -161,13 +197,15 @@ def eval_rho(mol, ao, dm, non0tab=None, xctype='LDA', hermi=0, verbose=None):
 
     shls_slice = (0, mol.nbas)
     ao_loc = mol.ao_loc_nr()
+    c0buf, c1buf = _buf_pieces(buf, 2, ngrids * nao *
+                               numpy.result_type(ao, dm).itemsize)
     if xctype == 'LDA' or xctype == 'HF':
-        c0 = _dot_ao_dm(mol, ao, dm, non0tab, shls_slice, ao_loc)
+        c0 = _dot_ao_dm(mol, ao, dm, non0tab, shls_slice, ao_loc, out=c0buf)
         #:rho = numpy.einsum('pi,pi->p', ao, c0)
         rho = _contract_rho(ao, c0)
     elif xctype in ('GGA', 'NLC'):
         rho = numpy.empty((4,ngrids))
-        c0 = _dot_ao_dm(mol, ao[0], dm, non0tab, shls_slice, ao_loc)
+        c0 = _dot_ao_dm(mol, ao[0], dm, non0tab, shls_slice, ao_loc, out=c0buf)
         #:rho[0] = numpy.einsum('pi,pi->p', c0, ao[0])
         rho[0] = _contract_rho(c0, ao[0])
         for i in range(1, 4):
@@ -179,18 +217,19 @@ def eval_rho(mol, ao, dm, non0tab=None, xctype='LDA', hermi=0, verbose=None):
     else: # meta-GGA
         # rho[4] = \nabla^2 rho, rho[5] = 1/2 |nabla f|^2
         rho = numpy.empty((6,ngrids))
-        c0 = _dot_ao_dm(mol, ao[0], dm, non0tab, shls_slice, ao_loc)
+        c0 = _dot_ao_dm(mol, ao[0], dm, non0tab, shls_slice, ao_loc, out=c0buf)
         #:rho[0] = numpy.einsum('pi,pi->p', ao[0], c0)
         rho[0] = _contract_rho(ao[0], c0)
         rho[5] = 0
+        c1 = c1buf
         for i in range(1, 4):
             #:rho[i] = numpy.einsum('pi,pi->p', c0, ao[i]) * 2 # *2 for +c.c.
             rho[i] = _contract_rho(c0, ao[i]) * 2
-            c1 = _dot_ao_dm(mol, ao[i], dm.T, non0tab, shls_slice, ao_loc)
+            c1 = _dot_ao_dm(mol, ao[i], dm.T, non0tab, shls_slice, ao_loc,
+                            out=c1)
             #:rho[5] += numpy.einsum('pi,pi->p', c1, ao[i])
             rho[5] += _contract_rho(c1, ao[i])
-        XX, YY, ZZ = 4, 7, 9
-        ao2 = ao[XX] + ao[YY] + ao[ZZ]
+        ao2 = _laplacian_ao(ao, out=c1)
         #:rho[4] = numpy.einsum('pi,pi->p', c0, ao2)
         rho[4] = _contract_rho(c0, ao2)
         rho[4] += rho[5]
@@ -199,7 +238,7 @@ def eval_rho(mol, ao, dm, non0tab=None, xctype='LDA', hermi=0, verbose=None):
     return rho
 
 def eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
-              verbose=None):
+              verbose=None, buf=None):
     r'''Calculate the electron density for LDA functional, and the density
     derivatives for GGA functional.  This function has the same functionality
     as :func:`eval_rho` except that the density are evaluated based on orbital
@@ -225,6 +264,9 @@ def eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
             LDA/GGA/mGGA.  It affects the shape of the return density.
         verbose : int or object of :class:`Logger`
             No effects.
+        buf : 1D array
+            Workspace for the intermediates ao.C and the Laplacian of AO
+            values (see :func:`_rho_workspace`).
 
     Returns:
         1D array of size N to store electron density if xctype = LDA;  2D array
@@ -243,38 +285,47 @@ def eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
                              dtype=numpy.uint8)
     shls_slice = (0, mol.nbas)
     ao_loc = mol.ao_loc_nr()
+    c0buf, c1buf, ao2buf = _buf_pieces(buf, 3, ngrids * nao *
+                                       numpy.result_type(ao, mo_coeff).itemsize)
     pos = mo_occ > OCCDROP
     if pos.sum() > 0:
         cpos = numpy.einsum('ij,j->ij', mo_coeff[:,pos], numpy.sqrt(mo_occ[pos]))
         if xctype == 'LDA' or xctype == 'HF':
-            c0 = _dot_ao_dm(mol, ao, cpos, non0tab, shls_slice, ao_loc)
+            c0 = _dot_ao_dm(mol, ao, cpos, non0tab, shls_slice, ao_loc,
+                            out=c0buf)
             #:rho = numpy.einsum('pi,pi->p', c0, c0)
             rho = _contract_rho(c0, c0)
         elif xctype in ('GGA', 'NLC'):
             rho = numpy.empty((4,ngrids))
-            c0 = _dot_ao_dm(mol, ao[0], cpos, non0tab, shls_slice, ao_loc)
+            c0 = _dot_ao_dm(mol, ao[0], cpos, non0tab, shls_slice, ao_loc,
+                            out=c0buf)
             #:rho[0] = numpy.einsum('pi,pi->p', c0, c0)
             rho[0] = _contract_rho(c0, c0)
+            c1 = c1buf
             for i in range(1, 4):
-                c1 = _dot_ao_dm(mol, ao[i], cpos, non0tab, shls_slice, ao_loc)
+                c1 = _dot_ao_dm(mol, ao[i], cpos, non0tab, shls_slice, ao_loc,
+                                out=c1)
                 #:rho[i] = numpy.einsum('pi,pi->p', c0, c1) * 2 # *2 for +c.c.
                 rho[i] = _contract_rho(c0, c1) * 2
         else: # meta-GGA
             # rho[4] = \nabla^2 rho, rho[5] = 1/2 |nabla f|^2
             rho = numpy.empty((6,ngrids))
-            c0 = _dot_ao_dm(mol, ao[0], cpos, non0tab, shls_slice, ao_loc)
+            c0 = _dot_ao_dm(mol, ao[0], cpos, non0tab, shls_slice, ao_loc,
+                            out=c0buf)
             #:rho[0] = numpy.einsum('pi,pi->p', c0, c0)
             rho[0] = _contract_rho(c0, c0)
             rho[5] = 0
+            c1 = c1buf
             for i in range(1, 4):
-                c1 = _dot_ao_dm(mol, ao[i], cpos, non0tab, shls_slice, ao_loc)
+                c1 = _dot_ao_dm(mol, ao[i], cpos, non0tab, shls_slice, ao_loc,
+                                out=c1)
                 #:rho[i] = numpy.einsum('pi,pi->p', c0, c1) * 2 # *2 for +c.c.
                 #:rho[5] += numpy.einsum('pi,pi->p', c1, c1)
                 rho[i] = _contract_rho(c0, c1) * 2
                 rho[5] += _contract_rho(c1, c1)
-            XX, YY, ZZ = 4, 7, 9
-            ao2 = ao[XX] + ao[YY] + ao[ZZ]
-            c1 = _dot_ao_dm(mol, ao2, cpos, non0tab, shls_slice, ao_loc)
+            ao2 = _laplacian_ao(ao, out=ao2buf)
+            c1 = _dot_ao_dm(mol, ao2, cpos, non0tab, shls_slice, ao_loc,
+                            out=c1)
             #:rho[4] = numpy.einsum('pi,pi->p', c0, c1)
             rho[4] = _contract_rho(c0, c1)
             rho[4] += rho[5]
@@ -293,31 +344,38 @@ def eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
     if neg.sum() > 0:
         cneg = numpy.einsum('ij,j->ij', mo_coeff[:,neg], numpy.sqrt(-mo_occ[neg]))
         if xctype == 'LDA' or xctype == 'HF':
-            c0 = _dot_ao_dm(mol, ao, cneg, non0tab, shls_slice, ao_loc)
+            c0 = _dot_ao_dm(mol, ao, cneg, non0tab, shls_slice, ao_loc,
+                            out=c0buf)
             #:rho -= numpy.einsum('pi,pi->p', c0, c0)
             rho -= _contract_rho(c0, c0)
         elif xctype == 'GGA':
-            c0 = _dot_ao_dm(mol, ao[0], cneg, non0tab, shls_slice, ao_loc)
+            c0 = _dot_ao_dm(mol, ao[0], cneg, non0tab, shls_slice, ao_loc,
+                            out=c0buf)
             #:rho[0] -= numpy.einsum('pi,pi->p', c0, c0)
             rho[0] -= _contract_rho(c0, c0)
+            c1 = c1buf
             for i in range(1, 4):
-                c1 = _dot_ao_dm(mol, ao[i], cneg, non0tab, shls_slice, ao_loc)
+                c1 = _dot_ao_dm(mol, ao[i], cneg, non0tab, shls_slice, ao_loc,
+                                out=c1)
                 #:rho[i] -= numpy.einsum('pi,pi->p', c0, c1) * 2 # *2 for +c.c.
                 rho[i] -= _contract_rho(c0, c1) * 2 # *2 for +c.c.
         else:
-            c0 = _dot_ao_dm(mol, ao[0], cneg, non0tab, shls_slice, ao_loc)
+            c0 = _dot_ao_dm(mol, ao[0], cneg, non0tab, shls_slice, ao_loc,
+                            out=c0buf)
             #:rho[0] -= numpy.einsum('pi,pi->p', c0, c0)
             rho[0] -= _contract_rho(c0, c0)
             rho5 = 0
+            c1 = c1buf
             for i in range(1, 4):
-                c1 = _dot_ao_dm(mol, ao[i], cneg, non0tab, shls_slice, ao_loc)
+                c1 = _dot_ao_dm(mol, ao[i], cneg, non0tab, shls_slice, ao_loc,
+                                out=c1)
                 #:rho[i] -= numpy.einsum('pi,pi->p', c0, c1) * 2 # *2 for +c.c.
                 #:rho5 += numpy.einsum('pi,pi->p', c1, c1)
                 rho[i] -= _contract_rho(c0, c1) * 2 # *2 for +c.c.
                 rho5 += _contract_rho(c1, c1)
-            XX, YY, ZZ = 4, 7, 9
-            ao2 = ao[XX] + ao[YY] + ao[ZZ]
-            c1 = _dot_ao_dm(mol, ao2, cneg, non0tab, shls_slice, ao_loc)
+            ao2 = _laplacian_ao(ao, out=ao2buf)
+            c1 = _dot_ao_dm(mol, ao2, cneg, non0tab, shls_slice, ao_loc,
+                            out=c1)
             #:rho[4] -= numpy.einsum('pi,pi->p', c0, c1) * 2
             rho[4] -= _contract_rho(c0, c1) * 2
             rho[4] -= rho5 * 2
@@ -325,7 +383,8 @@ def eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
             rho[5] -= rho5 * .5
     return rho
 
-def _vv10nlc(rho,coords,vvrho,vvweight,vvcoords,nlc_pars):
+def _vv10nlc(rho,coords,vvrho,vvweight,vvcoords,nlc_pars,
+             screen_thresh=VV10_SCREEN_THRESH):
     thresh=1e-8
 
     #output
@@ -374,6 +433,18 @@ def _vv10nlc(rho,coords,vvrho,vvweight,vvcoords,nlc_pars):
     K=Kvv*(R**(1./6.))
     dKdR=(1./6.)*K
 
+    if screen_thresh is not None and R.size > 0 and Rp.size > 0:
+        # The factors to scale U and W in vxc.  vxc[1] (d/dsigma) is measured
+        # by its contribution 2*vxc[1]*nabla rho to the potential matrix.
+        Ufac = 1.5 * abs(dKdR)
+        Wfac = 1.5 * numpy.maximum(abs(dW0dR), abs(dW0dG)*2*G**.5)
+        F, U, W = _vv10_screened_kernel(coords, W0, K, vvcoords, W0p, Kp, RpW,
+                                        Ufac, Wfac, screen_thresh)
+        exc[threshind] = Beta+0.5*F
+        vxc[0,threshind] = Beta+F+1.5*(U*dKdR+W*dW0dR)
+        vxc[1,threshind] = 1.5*W*dW0dG
+        return exc,vxc
+
     vvcoords = numpy.asarray(vvcoords, order='C')
     coords = numpy.asarray(coords, order='C')
     F = numpy.empty_like(R)
@@ -411,6 +482,84 @@ def _vv10nlc(rho,coords,vvrho,vvweight,vvcoords,nlc_pars):
     vxc[1,threshind] = 1.5*W*dW0dG
     return exc,vxc
 
+def _vv10_blocks(coords):
+    '''Group grids in spatial blocks of BLKSIZE grids.  Returns the sorting
+    indices, the offsets of the blocks and the bounding boxes of the blocks.'''
+    idx = arg_group_grids(None, coords)
+    coords = numpy.asarray(coords[idx], order='C')
+    ngrids = coords.shape[0]
+    blk_loc = numpy.append(numpy.arange(0, ngrids, BLKSIZE), ngrids)
+    blk_loc = numpy.asarray(blk_loc, dtype=numpy.int32)
+    lower = numpy.minimum.reduceat(coords, blk_loc[:-1], axis=0)
+    upper = numpy.maximum.reduceat(coords, blk_loc[:-1], axis=0)
+    return idx, coords, blk_loc, lower, upper
+
+def _vv10_screened_kernel(coords, W0, K, vvcoords, W0p, Kp, RpW, Ufac, Wfac,
+                          screen_thresh):
+    '''The integrals F, U, W of VXC_vv10nlc evaluated with the block pairs
+    which can change exc or vxc (F + Ufac*U + Wfac*W) by more than
+    screen_thresh on any grid.'''
+    idx, coords, blk_loc, lower, upper = _vv10_blocks(coords)
+    W0 = numpy.asarray(W0[idx], order='C')
+    K = numpy.asarray(K[idx], order='C')
+    vvidx, vvcoords, vvblk_loc, vvlower, vvupper = _vv10_blocks(vvcoords)
+    W0p = numpy.asarray(W0p[vvidx], order='C')
+    Kp = numpy.asarray(Kp[vvidx], order='C')
+    RpW = numpy.asarray(RpW[vvidx], order='C')
+
+    # The kernel g*gp*(g+gp) increases monotonically with R2, W0 and K.  The
+    # lower bounds of g and gp are given by the minimal distance between two
+    # blocks and the minimal W0 and K in each block.
+    W0min = numpy.minimum.reduceat(W0, blk_loc[:-1])
+    Kmin = numpy.minimum.reduceat(K, blk_loc[:-1])
+    Ufac = numpy.maximum.reduceat(Ufac[idx], blk_loc[:-1])
+    Wfac = numpy.maximum.reduceat(Wfac[idx], blk_loc[:-1])
+    W0pmin = numpy.minimum.reduceat(W0p, vvblk_loc[:-1])
+    Kpmin = numpy.minimum.reduceat(Kp, vvblk_loc[:-1])
+    RpWsum = numpy.add.reduceat(RpW, vvblk_loc[:-1])
+    nblk = blk_loc.size - 1
+    nvvblk = vvblk_loc.size - 1
+    pair_mask = numpy.empty((nblk,nvvblk), dtype=numpy.int8)
+    for b0, b1 in lib.prange(0, nblk, max(1, 4000000//nvvblk)):
+        gap = numpy.maximum(vvlower[None,:,:] - upper[b0:b1,None,:],
+                            lower[b0:b1,None,:] - vvupper[None,:,:])
+        R2min = numpy.einsum('ijx,ijx->ij', gap.clip(0), gap.clip(0))
+        g = R2min * W0min[b0:b1,None] + Kmin[b0:b1,None]
+        gp = R2min * W0pmin + Kpmin
+        Fmax = RpWsum / (g * gp * (g + gp))
+        # U ~ F*(1/g+1/gt) < F*2/g;  W ~ U*R2 < F*2/W0
+        bound = Fmax * (1.5 + Ufac[b0:b1,None]*2/g
+                        + Wfac[b0:b1,None]*2/W0min[b0:b1,None])
+        pair_mask[b0:b1] = bound > screen_thresh
+        gap = R2min = g = gp = Fmax = bound = None
+
+    ngrids = coords.shape[0]
+    F = numpy.empty(ngrids)
+    U = numpy.empty(ngrids)
+    W = numpy.empty(ngrids)
+    libdft.VXC_vv10nlc_screened(F.ctypes.data_as(ctypes.c_void_p),
+                                U.ctypes.data_as(ctypes.c_void_p),
+                                W.ctypes.data_as(ctypes.c_void_p),
+                                vvcoords.ctypes.data_as(ctypes.c_void_p),
+                                coords.ctypes.data_as(ctypes.c_void_p),
+                                W0p.ctypes.data_as(ctypes.c_void_p),
+                                W0.ctypes.data_as(ctypes.c_void_p),
+                                K.ctypes.data_as(ctypes.c_void_p),
+                                Kp.ctypes.data_as(ctypes.c_void_p),
+                                RpW.ctypes.data_as(ctypes.c_void_p),
+                                vvblk_loc.ctypes.data_as(ctypes.c_void_p),
+                                blk_loc.ctypes.data_as(ctypes.c_void_p),
+                                pair_mask.ctypes.data_as(ctypes.c_void_p),
+                                ctypes.c_int(nvvblk), ctypes.c_int(nblk))
+    # Restore the original order of the grids
+    Fout = numpy.empty(ngrids)
+    Uout = numpy.empty(ngrids)
+    Wout = numpy.empty(ngrids)
+    Fout[idx] = F
+    Uout[idx] = U
+    Wout[idx] = W
+    return Fout, Uout, Wout
+
 def eval_mat(mol, ao, weight, rho, vxc,
              non0tab=None, xctype='LDA', spin=0, verbose=None):
     r'''Calculate XC potential matrix.
@@ -520,8 +669,7 @@ def eval_mat(mol, ao, weight, rho, vxc,
                 if transpose_for_uks:
                     vlapl = vlapl.T
                 vlapl = vlapl[0]
-            XX, YY, ZZ = 4, 7, 9
-            ao2 = ao[XX] + ao[YY] + ao[ZZ]
+            ao2 = _laplacian_ao(ao)
             #:aow = numpy.einsum('pi,p->pi', ao2, .5 * weight * vlapl, out=aow)
             aow = _scale_ao(ao2, .5 * weight * vlapl, out=aow)
             mat += _dot_ao_ao(mol, ao[0], aow, non0tab, shls_slice, ao_loc)
@@ -544,9 +692,32 @@ def eval_mat(mol, ao, weight, rho, vxc,
     return mat + mat.T.conj()
 
 
+def _laplacian_ao(ao, out=None):
+    '''The Laplacian of AO values, ao[XX] + ao[YY] + ao[ZZ]'''
+    XX, YY, ZZ = 4, 7, 9
+    ao2 = _ndarray_from_buf(ao[XX].shape, out, ao.dtype, order='F')
+    ao2 = numpy.add(ao[XX], ao[YY], out=ao2)
+    ao2 += ao[ZZ]
+    return ao2
+
+def _add_tau_vmat(vmat, mol, ao, wv, mask, shls_slice, ao_loc, aow=None):
+    '''vmat += sum_i ao[i].T * wv * ao[i] for the gradients i=x,y,z.  The
+    scaled AO values are written to the buffer aow.'''
+    for i in range(1, 4):
+        aow = _scale_ao(ao[i], wv, out=aow)
+        vmat += _dot_ao_ao(mol, ao[i], aow, mask, shls_slice, ao_loc)
+    return aow
+
 def _dot_ao_ao(mol, ao1, ao2, non0tab, shls_slice, ao_loc, hermi=0):
     '''return numpy.dot(ao1.T, ao2)'''
     ngrids, nao = ao1.shape
+    if ao1.dtype in _SINGLE or ao2.dtype in _SINGLE:
+        idx = _non0_ao_idx(non0tab, shls_slice, ao_loc, ngrids, nao)
+        if idx is None:
+            return numpy.dot(ao1.T.conj(), ao2)
+        vv = numpy.zeros((nao,nao), dtype=numpy.result_type(ao1, ao2))
+        vv[idx[:,None],idx] = numpy.dot(ao1[:,idx].T.conj(), ao2[:,idx])
+        return vv
     if nao < SWITCH_SIZE:
         return lib.dot(ao1.T.conj(), ao2)
 
@@ -577,10 +748,116 @@ def _dot_ao_ao(mol, ao1, ao2, non0tab, shls_slice, ao_loc, hermi=0):
        pnon0tab, pshls_slice, pao_loc)
     return vv
 
+# The AO values in single precision (NumInt.mixed_precision)
+_SINGLE = (numpy.dtype(numpy.float32), numpy.dtype(numpy.complex64))
+
+def _non0_ao_idx(non0tab, shls_slice, ao_loc, ngrids, nao):
+    '''Indices of the AOs which are significant on any grid of the block.
+    None if all AOs are needed or the mask is not available.  This is the
+    screening of the single precision GEMMs, which replaces the screening of
+    the VXCdot_ao_* kernels on the (grids, shell) blocks.'''
+    if (nao < SWITCH_SIZE or non0tab is None or shls_slice is None or
+        ao_loc is None):
+        return None
+    sh0, sh1 = shls_slice
+    nblk = (ngrids+BLKSIZE-1) // BLKSIZE
+    shls = numpy.where(non0tab[:nblk,sh0:sh1].any(axis=0))[0] + sh0
+    if ao_loc[shls+1].sum() - ao_loc[shls].sum() == nao:
+        return None
+    idx = [numpy.arange(ao_loc[i], ao_loc[i+1]) for i in shls]
+    if len(idx) == 0:
+        return numpy.zeros(0, dtype=int)
+    return numpy.hstack(idx) - ao_loc[sh0]
+
+def _ao_astype(ao, dtype, buf=None):
+    '''Copy the AO values to dtype, in the memory layout of eval_ao (the
+    transposed view of a (comp,nao,ngrids) array).
+
+    The GTOval kernels of libcgto evaluate the AO values in double precision
+    only.  The single precision AO values are copied from them into a
+    reusable buffer.  The copy is a memory-bound pass over the block, which
+    is cheap compared to the GEMMs on the block.'''
+    if ao.ndim == 2:
+        out = _ndarray_from_buf(ao.T.shape, buf, dtype).T
+    else:
+        out = _ndarray_from_buf(ao.transpose(0,2,1).shape, buf, dtype)
+        out = out.transpose(0,2,1)
+    out[:] = ao
+    return out
+
+def _dm_astype(dm, ao_dtype):
+    '''Convert the density matrix (or orbitals) to the precision of the AO
+    values.  Returns dm if no conversion is needed.'''
+    if numpy.dtype(ao_dtype) not in _SINGLE:
+        return dm
+    if numpy.iscomplexobj(dm):
+        return numpy.asarray(dm, dtype=numpy.complex64)
+    else:
+        return numpy.asarray(dm, dtype=numpy.float32)
+
+def _ndarray_from_buf(shape, buf, dtype=numpy.double, order='C'):
+    '''An array of the given shape on buf.  A new array is allocated if buf
+    is None or too small.'''
+    if (buf is not None and
+        buf.nbytes < numpy.prod(shape) * numpy.dtype(dtype).itemsize):
+        buf = None
+    return numpy.ndarray(shape, dtype=dtype, order=order, buffer=buf)
+
+def _buf_pieces(buf, n, nbytes):
+    '''n pieces of nbytes on the workspace buf.  The pieces which do not fit
+    in buf are too small, and _ndarray_from_buf allocates new arrays for them.
+    '''
+    if buf is None:
+        return [None] * n
+    size = (nbytes + 7) // 8
+    return [buf[i*size:(i+1)*size] for i in range(n)]
+
+def _rho_workspace(buf, ngrids, nao, dtype):
+    '''The workspace of eval_rho and eval_rho2 (c0, c1 and the Laplacian of
+    AO values) on ngrids.  The first piece is also large enough for the
+    scaled AO values aow of the XC potential.  buf is reused if it is large
+    enough.'''
+    dtype = numpy.result_type(dtype, numpy.double)
+    size = 3 * ((ngrids * nao * dtype.itemsize + 7) // 8)
+    if buf is None or buf.size < size:
+        buf = numpy.empty(size)
+    return buf
+
+def _rho_on_block(make_rho, dms, idm, ao, mask, xctype, pmol, ao_idx, hermi,
+                  buf=None):
+    '''Density on a block of sparse_block_loop'''
+    if ao_idx is None:
+        return make_rho(idm, ao, mask, xctype, buf)
+    dm = dms[idm][ao_idx[:,None],ao_idx]
+    return eval_rho(pmol, ao, dm, mask, xctype, hermi, buf=buf)
+
+def _add_ao_ao_on_block(vmat, mol, pmol, ao1, ao2, mask, ao_idx,
+                        shls_slice, ao_loc):
+    '''vmat += numpy.dot(ao1.T, ao2) on a block of sparse_block_loop'''
+    if ao_idx is None:
+        vmat += _dot_ao_ao(mol, ao1, ao2, mask, shls_slice, ao_loc)
+    else:
+        vmat[ao_idx[:,None],ao_idx] += _dot_ao_ao(pmol, ao1, ao2, mask,
+                                                  (0, pmol.nbas),
+                                                  pmol.ao_loc_nr())
+    return vmat
+
 def _dot_ao_dm(mol, ao, dm, non0tab, shls_slice, ao_loc, out=None):
     '''return numpy.dot(ao, dm)'''
     ngrids, nao = ao.shape
+    if ao.dtype in _SINGLE:
+        # No-op if the caller converted dm in advance (see _gen_rho_evaluator)
+        dm = _dm_astype(dm, ao.dtype)
+        idx = _non0_ao_idx(non0tab, shls_slice, ao_loc, ngrids, nao)
+        vm = _ndarray_from_buf((ngrids,dm.shape[1]), out,
+                               numpy.result_type(ao, dm))
+        if idx is None:
+            return numpy.dot(ao, dm, out=vm)
+        return numpy.dot(ao[:,idx], dm[idx], out=vm)
     if nao < SWITCH_SIZE:
+        if out is not None and ao.dtype == dm.dtype == numpy.double:
+            vm = _ndarray_from_buf((ngrids,dm.shape[1]), out, order='F')
+            return lib.dot(dm.T, ao.T, c=vm.T).T
         return lib.dot(dm.T, ao.T).T
 
     if not ao.flags.f_contiguous:
@@ -599,7 +876,7 @@ def _dot_ao_dm(mol, ao, dm, non0tab, shls_slice, ao_loc, out=None):
         pshls_slice = (ctypes.c_int*2)(*shls_slice)
         pao_loc     = ao_loc.ctypes.data_as(ctypes.c_void_p)
 
-    vm = numpy.ndarray((ngrids,dm.shape[1]), dtype=ao.dtype, order='F', buffer=out)
+    vm = _ndarray_from_buf((ngrids,dm.shape[1]), out, ao.dtype, order='F')
     dm = numpy.asarray(dm, order='C')
     fn(vm.ctypes.data_as(ctypes.c_void_p),
        ao.ctypes.data_as(ctypes.c_void_p),
@@ -620,9 +897,11 @@ def _scale_ao(ao, wv, out=None):
 
     wv = numpy.asarray(wv, order='C')
     comp, nao, ngrids = ao.shape
-    aow = numpy.ndarray((nao,ngrids), dtype=ao.dtype, buffer=out).T
+    aow = _ndarray_from_buf((nao,ngrids), out, ao.dtype).T
 
-    if not ao.flags.c_contiguous:
+    if ao.dtype in _SINGLE:
+        aow = numpy.einsum('nip,np->pi', ao, wv.astype(numpy.float32), out=aow)
+    elif not ao.flags.c_contiguous:
         aow = numpy.einsum('nip,np->pi', ao, wv)
     elif aow.dtype == numpy.double:
         libdft.VXC_dscale_ao(aow.ctypes.data_as(ctypes.c_void_p),
@@ -648,7 +927,11 @@ def _contract_rho(bra, ket):
     nao, ngrids = bra.shape
     rho = numpy.empty(ngrids)
 
-    if not (bra.flags.c_contiguous and ket.flags.c_contiguous):
+    if bra.dtype in _SINGLE or ket.dtype in _SINGLE:
+        rho  = numpy.einsum('ip,ip->p', bra.real, ket.real).astype(numpy.double)
+        if numpy.iscomplexobj(bra) and numpy.iscomplexobj(ket):
+            rho += numpy.einsum('ip,ip->p', bra.imag, ket.imag)
+    elif not (bra.flags.c_contiguous and ket.flags.c_contiguous):
         rho  = numpy.einsum('ip,ip->p', bra.real, ket.real)
         rho += numpy.einsum('ip,ip->p', bra.imag, ket.imag)
     elif bra.dtype == numpy.double and ket.dtype == numpy.double:
@@ -751,7 +1034,7 @@ def nr_sap_vxc(ni, mol, grids, max_memory=2000, verbose=None):
     eps = numpy.finfo(float).eps
 
     for ao, mask, weight, coords in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
-        aow = numpy.ndarray(ao.shape, order='F', buffer=aow)
+        aow = _ndarray_from_buf(ao.shape, aow, ao.dtype, order='F')
         vxc = numpy.ndarray(coords.shape[0], buffer=vxcw)
         vxc.fill(0.0)
         # Form potential
@@ -773,6 +1056,191 @@ def nr_sap_vxc(ni, mol, grids, max_memory=2000, verbose=None):
     vmat = vmat + vmat.conj().T
     return vmat
 
+def _nr_ks_cost(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
+                max_memory=2000, verbose=None):
+    '''Estimated (FLOPs, bytes) of :func:`nr_rks` and :func:`nr_uks`'''
+    nao = numpy.shape(dms)[-1]
+    nset = numpy.size(dms) // nao**2
+    ngrids = numpy.size(grids.weights)
+    xctype = ni._xc_type(xc_code)
+    if xctype == 'LDA':
+        ncomp = 1
+    elif xctype == 'GGA':
+        ncomp = 4
+    else:
+        ncomp = 10
+    # rho = ao.dm.ao and vmat = ao.v.ao, with the derivatives of AO values
+    # in the GGA/MGGA density and the potential
+    flops = 4. * ngrids * nao**2 * nset * min(ncomp, 4)
+    nbytes = 8. * ngrids * nao * ncomp
+    return flops, nbytes
+
+def _split_grids(grids, nproc):
+    '''Split grids into nproc segments of similar cost.  The segments are
+    aligned to BLKSIZE so that each segment has its own piece of non0tab.
+    '''
+    ngrids = grids.weights.size
+    nblk = (ngrids + BLKSIZE - 1) // BLKSIZE
+    if grids.non0tab is None:
+        cost = numpy.ones(nblk)
+    else:
+        cost = grids.non0tab[:nblk].sum(axis=1) + 1.
+    cum = numpy.append(0, numpy.cumsum(cost))
+    displs = lib.misc._balanced_partition(cum, nproc)
+    segs = []
+    for b0, b1 in zip(displs[:-1], displs[1:]):
+        if b1 <= b0:
+            continue
+        p0, p1 = b0 * BLKSIZE, min(ngrids, b1 * BLKSIZE)
+        sub = copy.copy(grids)
+        sub.coords = grids.coords[p0:p1]
+        sub.weights = grids.weights[p0:p1]
+        if grids.non0tab is not None:
+            sub.non0tab = grids.non0tab[b0:b1]
+        segs.append(sub)
+    return segs
+
+def _mp_context():
+    '''Multiprocessing context of the XC worker processes.  The workers are
+    not forked from the current process because forking after the OpenMP
+    threads (GNU libgomp) were started may hang the workers.'''
+    import multiprocessing
+    if sys.version_info < (3,):
+        return multiprocessing
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        # Workers are forked from the server with numint already imported
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    else:
+        return multiprocessing.get_context('spawn')
+
+def _nr_vxc_worker(fn, ni, molstr, seg, xc_code, dms, relativity, hermi,
+                   max_memory, nthreads, k, buf, nsize, vsize, dtype,
+                   result_q):
+    '''Evaluate fn on one segment of grids in a worker process.  nelec,
+    excsum and the XC potential matrix are written to the k-th slots of the
+    shared buffer buf.'''
+    try:
+        lib.num_threads(nthreads)
+        mol = gto.loads(molstr)
+        mol.verbose = 0
+        grids = lib.StreamObject()
+        grids.coords, grids.weights, grids.non0tab, grids.sort_grids = seg
+        nelec, excsum, vmat = fn(ni, mol, grids, xc_code, dms, relativity,
+                                 hermi, max_memory, 0)
+        nelec = numpy.ravel(nelec)
+        excsum = numpy.ravel(excsum)
+        nworker = len(buf) // (nsize + vsize * (dtype.itemsize // 8))
+        buf = numpy.ndarray(len(buf), buffer=buf)
+        scalars = buf[:nworker*nsize].reshape(nworker,nsize)
+        vmats = buf[nworker*nsize:].view(dtype).reshape(nworker,vsize)
+        scalars[k,:nelec.size] = nelec
+        scalars[k,nelec.size:nelec.size+excsum.size] = excsum
+        vmats[k] = numpy.ravel(vmat)
+        result_q.put((k, None))
+    except BaseException:
+        result_q.put((k, traceback.format_exc()))
+
+def _nr_vxc_in_processes(fn, ni, mol, grids, xc_code, dms, relativity=0,
+                         hermi=0, max_memory=2000, verbose=None):
+    '''Evaluate fn (nr_rks or nr_uks) with the grids split over ni.nproc
+    processes.  The worker processes are started by a fork server (spawned
+    if not available).  The molecule, the density matrices and the segments
+    of the grids are sent to the workers explicitly, and the partial results
+    are reduced through a shared memory buffer.
+    '''
+    from multiprocessing import sharedctypes
+    try:
+        import queue
+    except ImportError:  # Python 2
+        import Queue as queue
+    ctx = _mp_context()
+    if grids.coords is None:
+        grids.build(with_non0tab=True)
+    segs = _split_grids(grids, ni.nproc)
+    nworker = len(segs) - 1
+    nthreads = max(1, lib.num_threads() // len(segs))
+    vsize = numpy.size(dms)
+    dtype = numpy.result_type(*dms) if isinstance(dms, (list, tuple)) \
+            else numpy.asarray(dms).dtype
+    dtype = numpy.result_type(dtype, numpy.double)
+    # nelec and excsum of each worker, followed by the XC potential matrix
+    nao = numpy.shape(dms)[-1]
+    nsize = 2 * vsize // nao**2
+    itemsize = dtype.itemsize // 8
+    buf_ctypes = sharedctypes.RawArray('d', nworker*(nsize+vsize*itemsize))
+    buf = numpy.ndarray(nworker*(nsize+vsize*itemsize), buffer=buf_ctypes)
+    scalars = buf[:nworker*nsize].reshape(nworker,nsize)
+    vmats = buf[nworker*nsize:].view(dtype).reshape(nworker,vsize)
+
+    # The AO cache is not shared between the processes
+    ni_worker = copy.copy(ni)
+    ni_worker.nproc = 1
+    ni_worker.cache_ao = False
+    ni_worker._ao_cache = None
+    molstr = mol.dumps()
+    result_q = ctx.Queue()
+    ps = []
+    for k in range(nworker):
+        seg = segs[k+1]
+        seg = (seg.coords, seg.weights, seg.non0tab,
+               getattr(seg, 'sort_grids', False))
+        p = ctx.Process(target=_nr_vxc_worker,
+                        args=(fn, ni_worker, molstr, seg, xc_code, dms,
+                              relativity, hermi, max_memory/len(segs),
+                              nthreads, k, buf_ctypes, nsize, vsize, dtype,
+                              result_q))
+        p.start()
+        ps.append(p)
+    ndone = 0
+    try:
+        # The first segment is evaluated in the parent process
+        with lib.temporary_env(ni, nproc=1, cache_ao=False):
+            with lib.with_omp_threads(nthreads):
+                nelec, excsum, vmat = fn(ni, mol, segs[0], xc_code, dms,
+                                         relativity, hermi,
+                                         max_memory/len(segs), verbose)
+        while ndone < nworker:
+            try:
+                k, err = result_q.get(True, 1)
+            except queue.Empty:
+                for p in ps:
+                    if p.exitcode not in (None, 0):
+                        raise lib.misc.ProcessRuntimeError(
+                            'XC worker process %s died (exit code %s)' %
+                            (p, p.exitcode))
+                continue
+            if err is not None:
+                raise lib.misc.ProcessRuntimeError(
+                    'Error on XC worker process %d:\n%s' % (k, err))
+            ndone += 1
+    finally:
+        for p in ps:
+            if p.is_alive() and ndone < nworker:
+                p.terminate()
+            p.join()
+
+    nelec = numpy.asarray(nelec, dtype=numpy.double)
+    excsum = numpy.asarray(excsum, dtype=numpy.double)
+    vmat = numpy.asarray(vmat, dtype=dtype)
+    n0, n1 = nelec.size, nelec.size + excsum.size
+    nelec = nelec + scalars[:,:n0].sum(axis=0).reshape(nelec.shape)
+    excsum = excsum + scalars[:,n0:n1].sum(axis=0).reshape(excsum.shape)
+    vmat = vmat + vmats.sum(axis=0).reshape(vmat.shape)
+    if nelec.ndim == 0:
+        nelec = float(nelec)
+    if excsum.ndim == 0:
+        excsum = float(excsum)
+    return nelec, excsum, vmat
+
+def _use_processes(ni, xctype):
+    '''Whether to split the XC integration over the processes'''
+    # The VV10 kernel needs the densities on all grids
+    return (getattr(ni, 'nproc', 1) > 1 and xctype != 'NLC' and
+            hasattr(os, 'fork'))
+
+@lib.profiler.profile('dft.numint.nr_rks', _nr_ks_cost)
 def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
            max_memory=2000, verbose=None):
     '''Calculate RKS XC functional and potential matrix on given meshgrids
@@ -816,6 +1284,9 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
     >>> nelec, exc, vxc = ni.nr_rks(mol, grids, 'lda,vwn', dm)
     '''
     xctype = ni._xc_type(xc_code)
+    if _use_processes(ni, xctype):
+        return _nr_vxc_in_processes(nr_rks, ni, mol, grids, xc_code, dms,
+                                    relativity, hermi, max_memory, verbose)
     make_rho, nset, nao = ni._gen_rho_evaluator(mol, dms, hermi)
 
     shls_slice = (0, mol.nbas)
@@ -827,14 +1298,18 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
         vmat = numpy.zeros((nset,nao,nao), dtype=dms.dtype)
     else:
         vmat = numpy.zeros((nset,nao,nao), dtype=numpy.result_type(*dms))
-    aow = None
+    buf = None
+    if xctype in ('LDA', 'GGA'):
+        dm_blks = numpy.asarray(dms).reshape(nset,nao,nao)
     if xctype == 'LDA':
         ao_deriv = 0
-        for ao, mask, weight, coords \
-                in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
-            aow = numpy.ndarray(ao.shape, order='F', buffer=aow)
+        for ao, mask, weight, coords, pmol, ao_idx \
+                in ni.sparse_block_loop(mol, grids, nao, ao_deriv, max_memory):
+            buf = _rho_workspace(buf, weight.size, nao, vmat.dtype)
+            aow = _ndarray_from_buf(ao.shape, buf, ao.dtype, order='F')
             for idm in range(nset):
-                rho = make_rho(idm, ao, mask, 'LDA')
+                rho = _rho_on_block(make_rho, dm_blks, idm, ao, mask, 'LDA',
+                                    pmol, ao_idx, hermi, buf)
                 exc, vxc = ni.eval_xc(xc_code, rho, spin=0,
                                       relativity=relativity, deriv=1,
                                       verbose=verbose)[:2]
@@ -845,16 +1320,19 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
                 # *.5 because vmat + vmat.T
                 #:aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho, out=aow)
                 aow = _scale_ao(ao, .5*weight*vrho, out=aow)
-                vmat[idm] += _dot_ao_ao(mol, ao, aow, mask, shls_slice, ao_loc)
+                _add_ao_ao_on_block(vmat[idm], mol, pmol, ao, aow, mask, ao_idx,
+                                    shls_slice, ao_loc)
                 rho = exc = vxc = vrho = None
     elif xctype == 'GGA':
         ao_deriv = 1
-        for ao, mask, weight, coords \
-                in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
+        for ao, mask, weight, coords, pmol, ao_idx \
+                in ni.sparse_block_loop(mol, grids, nao, ao_deriv, max_memory):
             ngrid = weight.size
-            aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
+            buf = _rho_workspace(buf, weight.size, nao, vmat.dtype)
+            aow = _ndarray_from_buf(ao[0].shape, buf, ao.dtype, order='F')
             for idm in range(nset):
-                rho = make_rho(idm, ao, mask, 'GGA')
+                rho = _rho_on_block(make_rho, dm_blks, idm, ao, mask, 'GGA',
+                                    pmol, ao_idx, hermi, buf)
                 exc, vxc = ni.eval_xc(xc_code, rho, spin=0,
                                       relativity=relativity, deriv=1,
                                       verbose=verbose)[:2]
@@ -865,7 +1343,8 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
                 wv = _rks_gga_wv0(rho, vxc, weight)
                 #:aow = numpy.einsum('npi,np->pi', ao, wv, out=aow)
                 aow = _scale_ao(ao, wv, out=aow)
-                vmat[idm] += _dot_ao_ao(mol, ao[0], aow, mask, shls_slice, ao_loc)
+                _add_ao_ao_on_block(vmat[idm], mol, pmol, ao[0], aow, mask,
+                                    ao_idx, shls_slice, ao_loc)
                 rho = exc = vxc = wv = None
     elif xctype == 'NLC':
         nlc_pars = ni.nlc_coeff(xc_code[:-6])
@@ -874,50 +1353,56 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
                                       'The supported functionals are %s' %
                                       (xc_code[:-6], ni.libxc.VV10_XC))
         ao_deriv = 1
-        vvrho=numpy.empty([nset,4,0])
-        vvweight=numpy.empty([nset,0])
-        vvcoords=numpy.empty([nset,0,3])
+        # The densities on all grids are needed by the nonlocal kernel. The
+        # kernel is evaluated for all grids at once, then the potential is
+        # integrated block by block.
+        if grids.coords is None:
+            grids.build(with_non0tab=True)
+        vvcoords = grids.coords
+        vvweight = grids.weights
+        vvrho = numpy.empty((nset,4,vvweight.size))
+        p1 = 0
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
-            rhotmp = numpy.empty([0,4,weight.size])
-            weighttmp = numpy.empty([0,weight.size])
-            coordstmp = numpy.empty([0,weight.size,3])
+            p0, p1 = p1, p1 + weight.size
+            buf = _rho_workspace(buf, weight.size, nao, vmat.dtype)
             for idm in range(nset):
-                rho = make_rho(idm, ao, mask, 'GGA')
-                rho = numpy.expand_dims(rho,axis=0)
-                rhotmp = numpy.concatenate((rhotmp,rho),axis=0)
-                weighttmp = numpy.concatenate((weighttmp,numpy.expand_dims(weight,axis=0)),axis=0)
-                coordstmp = numpy.concatenate((coordstmp,numpy.expand_dims(coords,axis=0)),axis=0)
-                rho = None
-            vvrho=numpy.concatenate((vvrho,rhotmp),axis=2)
-            vvweight=numpy.concatenate((vvweight,weighttmp),axis=1)
-            vvcoords=numpy.concatenate((vvcoords,coordstmp),axis=1)
-            rhotmp = weighttmp = coordstmp = None
+                vvrho[idm,:,p0:p1] = make_rho(idm, ao, mask, 'GGA', buf)
+
+        vvexc = numpy.empty((nset,vvweight.size))
+        vvvxc = numpy.empty((nset,2,vvweight.size))
+        for idm in range(nset):
+            vvexc[idm], vvvxc[idm] = _vv10nlc(vvrho[idm], vvcoords, vvrho[idm],
+                                              vvweight, vvcoords, nlc_pars)
+
+        p1 = 0
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
-            aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
+            p0, p1 = p1, p1 + weight.size
+            buf = _rho_workspace(buf, weight.size, nao, vmat.dtype)
+            aow = _ndarray_from_buf(ao[0].shape, buf, ao.dtype, order='F')
             for idm in range(nset):
-                rho = make_rho(idm, ao, mask, 'GGA')
-                exc, vxc = _vv10nlc(rho,coords,vvrho[idm],vvweight[idm],vvcoords[idm],nlc_pars)
+                rho = vvrho[idm,:,p0:p1]
                 den = rho[0] * weight
                 nelec[idm] += den.sum()
-                excsum[idm] += numpy.dot(den, exc)
+                excsum[idm] += numpy.dot(den, vvexc[idm,p0:p1])
 # ref eval_mat function
-                wv = _rks_gga_wv0(rho, vxc, weight)
+                wv = _rks_gga_wv0(rho, vvvxc[idm,:,p0:p1], weight)
                 #:aow = numpy.einsum('npi,np->pi', ao, wv, out=aow)
                 aow = _scale_ao(ao, wv, out=aow)
                 vmat[idm] += _dot_ao_ao(mol, ao[0], aow, mask, shls_slice, ao_loc)
-                rho = exc = vxc = wv = None
-        vvrho = vvweight = vvcoords = None
+                rho = wv = None
+        vvrho = vvexc = vvvxc = vvweight = vvcoords = None
     elif xctype == 'MGGA':
         if (any(x in xc_code.upper() for x in ('CC06', 'CS', 'BR89', 'MK00'))):
             raise NotImplementedError('laplacian in meta-GGA method')
         ao_deriv = 2
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
-            aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
+            buf = _rho_workspace(buf, weight.size, nao, vmat.dtype)
+            aow = _ndarray_from_buf(ao[0].shape, buf, ao.dtype, order='F')
             for idm in range(nset):
-                rho = make_rho(idm, ao, mask, 'MGGA')
+                rho = make_rho(idm, ao, mask, 'MGGA', buf)
                 exc, vxc = ni.eval_xc(xc_code, rho, spin=0,
                                       relativity=relativity, deriv=1,
                                       verbose=verbose)[:2]
@@ -933,10 +1418,9 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
 
 # FIXME: .5 * .5   First 0.5 for v+v.T symmetrization.
 # Second 0.5 is due to the Libxc convention tau = 1/2 \nabla\phi\dot\nabla\phi
-                wv = (.5 * .5 * weight * vtau).reshape(-1,1)
-                vmat[idm] += _dot_ao_ao(mol, ao[1], wv*ao[1], mask, shls_slice, ao_loc)
-                vmat[idm] += _dot_ao_ao(mol, ao[2], wv*ao[2], mask, shls_slice, ao_loc)
-                vmat[idm] += _dot_ao_ao(mol, ao[3], wv*ao[3], mask, shls_slice, ao_loc)
+                wv = .5 * .5 * weight * vtau
+                aow = _add_tau_vmat(vmat[idm], mol, ao, wv, mask, shls_slice,
+                                    ao_loc, aow)
 
                 rho = exc = vxc = vrho = wv = None
 
@@ -948,6 +1432,7 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
         vmat = vmat[0]
     return nelec, excsum, vmat
 
+@lib.profiler.profile('dft.numint.nr_uks', _nr_ks_cost)
 def nr_uks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
            max_memory=2000, verbose=None):
     '''Calculate UKS XC functional and potential matrix on given meshgrids
@@ -989,6 +1474,9 @@ def nr_uks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
     >>> nelec, exc, vxc = ni.nr_uks(mol, grids, 'lda,vwn', dm)
     '''
     xctype = ni._xc_type(xc_code)
+    if _use_processes(ni, xctype):
+        return _nr_vxc_in_processes(nr_uks, ni, mol, grids, xc_code, dms,
+                                    relativity, hermi, max_memory, verbose)
     if xctype == 'NLC':
         dms_sf = dms[0] + dms[1]
         nelec, excsum, vmat = nr_rks(ni, mol, grids, xc_code, dms_sf, relativity, hermi,
@@ -1006,15 +1494,21 @@ def nr_uks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
     nelec = numpy.zeros((2,nset))
     excsum = numpy.zeros(nset)
     vmat = numpy.zeros((2,nset,nao,nao), dtype=numpy.result_type(dma, dmb))
-    aow = None
+    buf = None
+    if xctype in ('LDA', 'GGA'):
+        dma_blks = numpy.asarray(dma).reshape(nset,nao,nao)
+        dmb_blks = numpy.asarray(dmb).reshape(nset,nao,nao)
     if xctype == 'LDA':
         ao_deriv = 0
-        for ao, mask, weight, coords \
-                in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
-            aow = numpy.ndarray(ao.shape, order='F', buffer=aow)
+        for ao, mask, weight, coords, pmol, ao_idx \
+                in ni.sparse_block_loop(mol, grids, nao, ao_deriv, max_memory):
+            buf = _rho_workspace(buf, weight.size, nao, vmat.dtype)
+            aow = _ndarray_from_buf(ao.shape, buf, ao.dtype, order='F')
             for idm in range(nset):
-                rho_a = make_rhoa(idm, ao, mask, xctype)
-                rho_b = make_rhob(idm, ao, mask, xctype)
+                rho_a = _rho_on_block(make_rhoa, dma_blks, idm, ao, mask,
+                                      xctype, pmol, ao_idx, hermi, buf)
+                rho_b = _rho_on_block(make_rhob, dmb_blks, idm, ao, mask,
+                                      xctype, pmol, ao_idx, hermi, buf)
                 exc, vxc = ni.eval_xc(xc_code, (rho_a, rho_b), spin=1,
                                       relativity=relativity, deriv=1,
                                       verbose=verbose)[:2]
@@ -1029,19 +1523,24 @@ def nr_uks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
                 # *.5 due to +c.c. in the end
                 #:aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho[:,0], out=aow)
                 aow = _scale_ao(ao, .5*weight*vrho[:,0], out=aow)
-                vmat[0,idm] += _dot_ao_ao(mol, ao, aow, mask, shls_slice, ao_loc)
+                _add_ao_ao_on_block(vmat[0,idm], mol, pmol, ao, aow, mask,
+                                    ao_idx, shls_slice, ao_loc)
                 #:aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho[:,1], out=aow)
                 aow = _scale_ao(ao, .5*weight*vrho[:,1], out=aow)
-                vmat[1,idm] += _dot_ao_ao(mol, ao, aow, mask, shls_slice, ao_loc)
+                _add_ao_ao_on_block(vmat[1,idm], mol, pmol, ao, aow, mask,
+                                    ao_idx, shls_slice, ao_loc)
                 rho_a = rho_b = exc = vxc = vrho = None
     elif xctype == 'GGA':
         ao_deriv = 1
-        for ao, mask, weight, coords \
-                in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
-            aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
+        for ao, mask, weight, coords, pmol, ao_idx \
+                in ni.sparse_block_loop(mol, grids, nao, ao_deriv, max_memory):
+            buf = _rho_workspace(buf, weight.size, nao, vmat.dtype)
+            aow = _ndarray_from_buf(ao[0].shape, buf, ao.dtype, order='F')
             for idm in range(nset):
-                rho_a = make_rhoa(idm, ao, mask, xctype)
-                rho_b = make_rhob(idm, ao, mask, xctype)
+                rho_a = _rho_on_block(make_rhoa, dma_blks, idm, ao, mask,
+                                      xctype, pmol, ao_idx, hermi, buf)
+                rho_b = _rho_on_block(make_rhob, dmb_blks, idm, ao, mask,
+                                      xctype, pmol, ao_idx, hermi, buf)
                 exc, vxc = ni.eval_xc(xc_code, (rho_a, rho_b), spin=1,
                                       relativity=relativity, deriv=1,
                                       verbose=verbose)[:2]
@@ -1055,10 +1554,12 @@ def nr_uks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
                 wva, wvb = _uks_gga_wv0((rho_a,rho_b), vxc, weight)
                 #:aow = numpy.einsum('npi,np->pi', ao, wva, out=aow)
                 aow = _scale_ao(ao, wva, out=aow)
-                vmat[0,idm] += _dot_ao_ao(mol, ao[0], aow, mask, shls_slice, ao_loc)
+                _add_ao_ao_on_block(vmat[0,idm], mol, pmol, ao[0], aow, mask,
+                                    ao_idx, shls_slice, ao_loc)
                 #:aow = numpy.einsum('npi,np->pi', ao, wvb, out=aow)
                 aow = _scale_ao(ao, wvb, out=aow)
-                vmat[1,idm] += _dot_ao_ao(mol, ao[0], aow, mask, shls_slice, ao_loc)
+                _add_ao_ao_on_block(vmat[1,idm], mol, pmol, ao[0], aow, mask,
+                                    ao_idx, shls_slice, ao_loc)
                 rho_a = rho_b = exc = vxc = wva = wvb = None
     elif xctype == 'MGGA':
         if (any(x in xc_code.upper() for x in ('CC06', 'CS', 'BR89', 'MK00'))):
@@ -1066,10 +1567,11 @@ def nr_uks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
         ao_deriv = 2
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
-            aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
+            buf = _rho_workspace(buf, weight.size, nao, vmat.dtype)
+            aow = _ndarray_from_buf(ao[0].shape, buf, ao.dtype, order='F')
             for idm in range(nset):
-                rho_a = make_rhoa(idm, ao, mask, xctype)
-                rho_b = make_rhob(idm, ao, mask, xctype)
+                rho_a = make_rhoa(idm, ao, mask, xctype, buf)
+                rho_b = make_rhob(idm, ao, mask, xctype, buf)
                 exc, vxc = ni.eval_xc(xc_code, (rho_a, rho_b), spin=1,
                                       relativity=relativity, deriv=1,
                                       verbose=verbose)[:2]
@@ -1091,14 +1593,12 @@ def nr_uks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
 
 # FIXME: .5 * .5   First 0.5 for v+v.T symmetrization.
 # Second 0.5 is due to the Libxc convention tau = 1/2 \nabla\phi\dot\nabla\phi
-                wv = (.25 * weight * vtau[:,0]).reshape(-1,1)
-                vmat[0,idm] += _dot_ao_ao(mol, ao[1], wv*ao[1], mask, shls_slice, ao_loc)
-                vmat[0,idm] += _dot_ao_ao(mol, ao[2], wv*ao[2], mask, shls_slice, ao_loc)
-                vmat[0,idm] += _dot_ao_ao(mol, ao[3], wv*ao[3], mask, shls_slice, ao_loc)
-                wv = (.25 * weight * vtau[:,1]).reshape(-1,1)
-                vmat[1,idm] += _dot_ao_ao(mol, ao[1], wv*ao[1], mask, shls_slice, ao_loc)
-                vmat[1,idm] += _dot_ao_ao(mol, ao[2], wv*ao[2], mask, shls_slice, ao_loc)
-                vmat[1,idm] += _dot_ao_ao(mol, ao[3], wv*ao[3], mask, shls_slice, ao_loc)
+                wv = .25 * weight * vtau[:,0]
+                aow = _add_tau_vmat(vmat[0,idm], mol, ao, wv, mask, shls_slice,
+                                    ao_loc, aow)
+                wv = .25 * weight * vtau[:,1]
+                aow = _add_tau_vmat(vmat[1,idm], mol, ao, wv, mask, shls_slice,
+                                    ao_loc, aow)
                 rho_a = rho_b = exc = vxc = vrho = wva = wvb = None
 
     for i in range(nset):
@@ -1131,6 +1631,93 @@ def _format_uks_dm(dms):
 nr_rks_vxc = nr_rks
 nr_uks_vxc = nr_uks
 
+def _format_fxc_dms(dms, hermi):
+    '''Response density matrices as a (nset,nao,nao) array.  Non-hermitian
+    density matrices are symmetrized, as in NumInt._gen_rho_evaluator.'''
+    dms = numpy.asarray(dms)
+    nao = dms.shape[-1]
+    dms = dms.reshape(-1,nao,nao)
+    if hermi != 1:
+        dms = (dms + dms.conj().transpose(0,2,1)) * .5
+    return dms
+
+def _fxc_batch_size(nao, ngrid, max_memory):
+    '''Number of density matrices processed together on a block of grids.
+    max_memory is the memory (in MB) available to the intermediates.'''
+    # intermediates ao*dm and ao*wv for each density matrix
+    return max(1, int(max_memory*1e6 / (2*ngrid*nao*8)))
+
+def _fxc_batch(buf, nao, ngrid, nset, max_memory, nspin=1):
+    '''Number of density matrices processed together on a block of grids and
+    the buffer of the intermediate ao*wv for nspin*nbatch density matrices.
+    buf is reused if it is large enough.'''
+    nbatch = max(1, _fxc_batch_size(nao, ngrid, max_memory) // nspin)
+    nbatch = min(nbatch, nset)
+    size = ngrid * nspin * nbatch * nao
+    if buf is None or buf.size < size:
+        buf = numpy.empty(size)
+    return nbatch, buf
+
+def _rho1_on_block(ao, dms, xctype):
+    '''Densities (and density gradients for GGA) of the hermitian density
+    matrices dms on a block of grids.  The AO-DM contraction of all density
+    matrices is a single GEMM.
+
+    Returns:
+        A (nset,ngrid) array for LDA or (nset,4,ngrid) array for GGA
+    '''
+    ao0 = ao if xctype == 'LDA' else ao[0]
+    ngrid, nao = ao0.shape
+    nset = dms.shape[0]
+    c = lib.dot(ao0, dms.transpose(1,0,2).reshape(nao,nset*nao))
+    c = c.reshape(ngrid,nset,nao)
+    if numpy.iscomplexobj(c):
+        # density of a hermitian density matrix is real
+        c = c.real
+    if xctype == 'LDA':
+        return numpy.einsum('pnj,pj->np', c, ao0)
+    rho1 = numpy.empty((nset,4,ngrid))
+    rho1[:,0] = numpy.einsum('pnj,pj->np', c, ao0)
+    for i in range(1, 4):
+        rho1[:,i] = numpy.einsum('pnj,pj->np', c, ao[i]) * 2
+    return rho1
+
+def _add_vmat_on_block(vmats, ao, wv, xctype, ao_idx=None, buf=None):
+    '''vmats[n] += sum_p ao[p,i] (sum_x ao_x[p,j] wv[n,x,p]) for all sets of
+    wv on a block of grids, evaluated with a single GEMM.  For GGA, v+v.T
+    should be applied in the caller.
+
+    Kwargs:
+        ao_idx : 1D int array
+            The AOs which are significant on the block (see
+            :func:`_non0_ao_idx`).  The other AOs are skipped.
+        buf : 1D array
+            Buffer for the intermediate ao*wv
+    '''
+    ao0 = ao if xctype == 'LDA' else ao[0]
+    ngrid = ao0.shape[0]
+    nset = wv.shape[0]
+    if ao_idx is not None:
+        ao0 = ao0[:,ao_idx]
+    nidx = ao0.shape[1]
+    aow = _ndarray_from_buf((ngrid,nset,nidx), buf,
+                            numpy.result_type(ao0, wv))
+    if xctype == 'LDA':
+        numpy.multiply(ao0[:,None,:], wv.T[:,:,None], out=aow)
+    else:
+        numpy.multiply(ao0[:,None,:], wv[:,0].T[:,:,None], out=aow)
+        for i in range(1, 4):
+            aoi = ao[i] if ao_idx is None else ao[i][:,ao_idx]
+            for n in range(nset):
+                aow[:,n] += aoi * wv[n,i,:,None]
+    v = lib.dot(ao0.T, aow.reshape(ngrid,nset*nidx)).reshape(nidx,nset,nidx)
+    for n in range(nset):
+        if ao_idx is None:
+            vmats[n] += v[:,n]
+        else:
+            vmats[n][ao_idx[:,None],ao_idx] += v[:,n]
+    return vmats
+
 def nr_rks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
                rho0=None, vxc=None, fxc=None, max_memory=2000, verbose=None):
     '''Contract RKS XC (singlet hessian) kernel matrix with given density matrices
@@ -1172,26 +1759,27 @@ def nr_rks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
     '''
     xctype = ni._xc_type(xc_code)
 
-    make_rho, nset, nao = ni._gen_rho_evaluator(mol, dms, hermi)
+    # The response densities of all density matrices are evaluated and
+    # contracted together on each block of grids
+    dm1s = _format_fxc_dms(dms, hermi)
+    nset, nao = dm1s.shape[:2]
     if ((xctype == 'LDA' and fxc is None) or
         (xctype == 'GGA' and rho0 is None)):
         make_rho0 = ni._gen_rho_evaluator(mol, dm0, 1)[0]
 
-    shls_slice = (0, mol.nbas)
-    ao_loc = mol.ao_loc_nr()
-
     if isinstance(dms, numpy.ndarray):
         vmat = numpy.zeros((nset,nao,nao), dtype=dms.dtype)
     else:
         vmat = numpy.zeros((nset,nao,nao), dtype=numpy.result_type(*dms))
-    aow = None
+    shls_slice = (0, mol.nbas)
+    ao_loc = mol.ao_loc_nr()
+    buf = None
     if xctype == 'LDA':
         ao_deriv = 0
         ip = 0
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
             ngrid = weight.size
-            aow = numpy.ndarray(ao.shape, order='F', buffer=aow)
             if fxc is None:
                 rho = make_rho0(0, ao, mask, 'LDA')
                 fxc0 = ni.eval_xc(xc_code, rho, spin=0, relativity=relativity,
@@ -1201,11 +1789,12 @@ def nr_rks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
                 frr = fxc[0][ip:ip+ngrid]
                 ip += ngrid
 
-            for i in range(nset):
-                rho1 = make_rho(i, ao, mask, 'LDA')
-                #:aow = numpy.einsum('pi,p->pi', ao, weight*frr*rho1, out=aow)
-                aow = _scale_ao(ao, weight*frr*rho1, out=aow)
-                vmat[i] += _dot_ao_ao(mol, aow, ao, mask, shls_slice, ao_loc)
+            ao_idx = _non0_ao_idx(mask, shls_slice, ao_loc, ngrid, nao)
+            nbatch, buf = _fxc_batch(buf, nao, ngrid, nset, max_memory)
+            for i0, i1 in lib.prange(0, nset, nbatch):
+                rho1 = _rho1_on_block(ao, dm1s[i0:i1], 'LDA')
+                _add_vmat_on_block(vmat[i0:i1], ao, weight*frr*rho1, 'LDA',
+                                   ao_idx, buf)
                 rho1 = None
 
     elif xctype == 'GGA':
@@ -1214,7 +1803,6 @@ def nr_rks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
             ngrid = weight.size
-            aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
             if rho0 is None:
                 rho = make_rho0(0, ao, mask, 'GGA')
             else:
@@ -1228,13 +1816,13 @@ def nr_rks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
                 fxc0 = (fxc[0][ip:ip+ngrid], fxc[1][ip:ip+ngrid], fxc[2][ip:ip+ngrid])
                 ip += ngrid
 
-            for i in range(nset):
-                rho1 = make_rho(i, ao, mask, 'GGA')
+            ao_idx = _non0_ao_idx(mask, shls_slice, ao_loc, ngrid, nao)
+            nbatch, buf = _fxc_batch(buf, nao, ngrid, nset, max_memory)
+            for i0, i1 in lib.prange(0, nset, nbatch):
+                rho1 = _rho1_on_block(ao, dm1s[i0:i1], 'GGA')
                 wv = _rks_gga_wv1(rho, rho1, vxc0, fxc0, weight)
-                #:aow = numpy.einsum('npi,np->pi', ao, wv, out=aow)
-                aow = _scale_ao(ao, wv, out=aow)
-                vmat[i] += _dot_ao_ao(mol, aow, ao[0], mask, shls_slice, ao_loc)
-                rho1 = None
+                _add_vmat_on_block(vmat[i0:i1], ao, wv, 'GGA', ao_idx, buf)
+                rho1 = wv = None
 
         for i in range(nset):  # for (\nabla\mu) \nu + \mu (\nabla\nu)
             vmat[i] = vmat[i] + vmat[i].T.conj()
@@ -1259,26 +1847,25 @@ def nr_rks_fxc_st(ni, mol, grids, xc_code, dm0, dms_alpha, relativity=0, singlet
     '''
     xctype = ni._xc_type(xc_code)
 
-    make_rho, nset, nao = ni._gen_rho_evaluator(mol, dms_alpha, hermi=0)
+    dm1s = _format_fxc_dms(dms_alpha, hermi=0)
+    nset, nao = dm1s.shape[:2]
     if ((xctype == 'LDA' and fxc is None) or
         (xctype == 'GGA' and rho0 is None)):
         make_rho0 = ni._gen_rho_evaluator(mol, dm0, hermi=1)[0]
 
-    shls_slice = (0, mol.nbas)
-    ao_loc = mol.ao_loc_nr()
-
     if isinstance(dms_alpha, numpy.ndarray):
         vmat = numpy.zeros((nset,nao,nao), dtype=dms_alpha.dtype)
     else:
         vmat = numpy.zeros((nset,nao,nao), dtype=numpy.result_type(*dms_alpha))
-    aow = None
+    shls_slice = (0, mol.nbas)
+    ao_loc = mol.ao_loc_nr()
+    buf = None
     if xctype == 'LDA':
         ao_deriv = 0
         ip = 0
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
             ngrid = weight.size
-            aow = numpy.ndarray(ao.shape, order='F', buffer=aow)
             if fxc is None:
                 rho = make_rho0(0, ao, mask, 'LDA')
                 rho *= .5  # alpha density
@@ -1295,11 +1882,12 @@ def nr_rks_fxc_st(ni, mol, grids, xc_code, dm0, dms_alpha, relativity=0, singlet
             else:
                 frho = u_u - u_d
 
-            for i in range(nset):
-                rho1 = make_rho(i, ao, mask, 'LDA')
-                #:aow = numpy.einsum('pi,p->pi', ao, weight*frho*rho1, out=aow)
-                aow = _scale_ao(ao, weight*frho*rho1, out=aow)
-                vmat[i] += _dot_ao_ao(mol, aow, ao, mask, shls_slice, ao_loc)
+            ao_idx = _non0_ao_idx(mask, shls_slice, ao_loc, ngrid, nao)
+            nbatch, buf = _fxc_batch(buf, nao, ngrid, nset, max_memory)
+            for i0, i1 in lib.prange(0, nset, nbatch):
+                rho1 = _rho1_on_block(ao, dm1s[i0:i1], 'LDA')
+                _add_vmat_on_block(vmat[i0:i1], ao, weight*frho*rho1, 'LDA',
+                                   ao_idx, buf)
                 rho1 = None
 
     elif xctype == 'GGA':
@@ -1308,7 +1896,6 @@ def nr_rks_fxc_st(ni, mol, grids, xc_code, dm0, dms_alpha, relativity=0, singlet
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
             ngrid = weight.size
-            aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
             if vxc is None or fxc is None:
                 rho = make_rho0(0, ao, mask, 'GGA')
                 rho *= .5  # alpha density
@@ -1341,15 +1928,15 @@ def nr_rks_fxc_st(ni, mol, grids, xc_code, dm0, dms_alpha, relativity=0, singlet
                 fgg = uu_uu - uu_dd
                 frhogamma = u_uu - u_dd
 
-            for i in range(nset):
-                # rho1[0 ] = |b><j| z_{bj}
-                # rho1[1:] = \nabla(|b><j|) z_{bj}
-                rho1 = make_rho(i, ao, mask, 'GGA')
+            ao_idx = _non0_ao_idx(mask, shls_slice, ao_loc, ngrid, nao)
+            nbatch, buf = _fxc_batch(buf, nao, ngrid, nset, max_memory)
+            for i0, i1 in lib.prange(0, nset, nbatch):
+                # rho1[:,0 ] = |b><j| z_{bj}
+                # rho1[:,1:] = \nabla(|b><j|) z_{bj}
+                rho1 = _rho1_on_block(ao, dm1s[i0:i1], 'GGA')
                 wv = _rks_gga_wv1(rho, rho1, (None,fgamma), (frho,frhogamma,fgg), weight)
-                #:aow = numpy.einsum('npi,np->pi', ao, wv, out=aow)
-                aow = _scale_ao(ao, wv, out=aow)
-                vmat[i] += _dot_ao_ao(mol, aow, ao[0], mask, shls_slice, ao_loc)
-                rho1 = None
+                _add_vmat_on_block(vmat[i0:i1], ao, wv, 'GGA', ao_idx, buf)
+                rho1 = wv = None
 
         for i in range(nset):  # for (\nabla\mu) \nu + \mu (\nabla\nu)
             vmat[i] = vmat[i] + vmat[i].T.conj()
@@ -1373,18 +1960,19 @@ def _rks_gga_wv0(rho, vxc, weight):
     return wv
 
 def _rks_gga_wv1(rho0, rho1, vxc, fxc, weight):
+    # rho1 can be a (4,ngrid) array or (nset,4,ngrid) array for multiple sets
     vgamma = vxc[1]
     frho, frhogamma, fgg = fxc[:3]
     # sigma1 ~ \nabla(\rho_\alpha+\rho_\beta) dot \nabla(|b><j|) z_{bj}
-    sigma1 = numpy.einsum('xi,xi->i', rho0[1:4], rho1[1:4])
+    sigma1 = numpy.einsum('xi,...xi->...i', rho0[1:4], rho1[...,1:4,:])
     ngrid = vgamma.size
-    wv = numpy.empty((4,ngrid))
-    wv[0]  = frho * rho1[0]
-    wv[0] += frhogamma * sigma1 * 2
-    wv[1:] = (fgg * sigma1 * 4 + frhogamma * rho1[0] * 2) * rho0[1:4]
-    wv[1:]+= vgamma * rho1[1:4] * 2
+    wv = numpy.empty(rho1.shape[:-2] + (4,ngrid))
+    wv[...,0,:]  = frho * rho1[...,0,:]
+    wv[...,0,:] += frhogamma * sigma1 * 2
+    wv[...,1:,:] = (fgg * sigma1 * 4 + frhogamma * rho1[...,0,:] * 2)[...,None,:] * rho0[1:4]
+    wv[...,1:,:]+= vgamma * rho1[...,1:4,:] * 2
     wv *= weight
-    wv[0] *= .5  # v+v.T should be applied in the caller
+    wv[...,0,:] *= .5  # v+v.T should be applied in the caller
     return wv
 
 def _rks_gga_wv2(rho0, rho1, fxc, kxc, weight):
@@ -1454,25 +2042,26 @@ def nr_uks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
 
     dma, dmb = _format_uks_dm(dms)
     nao = dms.shape[-1]
-    make_rhoa, nset = ni._gen_rho_evaluator(mol, dma, hermi)[:2]
-    make_rhob       = ni._gen_rho_evaluator(mol, dmb, hermi)[0]
+    # Alpha and beta density matrices of all sets are stacked and contracted
+    # together on each block of grids
+    dm1s = numpy.vstack((_format_fxc_dms(dma, hermi),
+                         _format_fxc_dms(dmb, hermi)))
+    nset = dm1s.shape[0] // 2
 
     if ((xctype == 'LDA' and fxc is None) or
         (xctype == 'GGA' and rho0 is None)):
         make_rho0 = ni._gen_rho_evaluator(mol, _format_uks_dm(dm0), 1)[0]
 
+    vmat = numpy.zeros((2,nset,nao,nao), dtype=numpy.result_type(dma, dmb))
     shls_slice = (0, mol.nbas)
     ao_loc = mol.ao_loc_nr()
-
-    vmat = numpy.zeros((2,nset,nao,nao), dtype=numpy.result_type(dma, dmb))
-    aow = None
+    buf = None
     if xctype == 'LDA':
         ao_deriv = 0
         ip = 0
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
             ngrid = weight.size
-            aow = numpy.ndarray(ao.shape, order='F', buffer=aow)
             if fxc is None:
                 rho0a = make_rho0(0, ao, mask, xctype)
                 rho0b = make_rho0(1, ao, mask, xctype)
@@ -1484,19 +2073,20 @@ def nr_uks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
                 u_u, u_d, d_d = fxc[0][ip:ip+ngrid].T
                 ip += ngrid
 
-            for i in range(nset):
-                rho1a = make_rhoa(i, ao, mask, xctype)
-                rho1b = make_rhob(i, ao, mask, xctype)
-                wv = u_u * rho1a + u_d * rho1b
+            ao_idx = _non0_ao_idx(mask, shls_slice, ao_loc, ngrid, nao)
+            nbatch, buf = _fxc_batch(buf, nao, ngrid, nset, max_memory, 2)
+            for i0, i1 in lib.prange(0, nset, nbatch):
+                n = i1 - i0
+                rho1 = _rho1_on_block(ao, numpy.vstack((dm1s[i0:i1],
+                                                        dm1s[nset+i0:nset+i1])),
+                                      xctype)
+                rho1a, rho1b = rho1[:n], rho1[n:]
+                wv = numpy.vstack((u_u * rho1a + u_d * rho1b,
+                                   u_d * rho1a + d_d * rho1b))
                 wv *= weight
-                #:aow = numpy.einsum('pi,p->pi', ao, wv, out=aow)
-                aow = _scale_ao(ao, wv, out=aow)
-                vmat[0,i] += _dot_ao_ao(mol, aow, ao, mask, shls_slice, ao_loc)
-                wv = u_d * rho1a + d_d * rho1b
-                wv *= weight
-                #:aow = numpy.einsum('pi,p->pi', ao, wv, out=aow)
-                aow = _scale_ao(ao, wv, out=aow)
-                vmat[1,i] += _dot_ao_ao(mol, aow, ao, mask, shls_slice, ao_loc)
+                _add_vmat_on_block(list(vmat[0,i0:i1]) + list(vmat[1,i0:i1]),
+                                   ao, wv, xctype, ao_idx, buf)
+                rho1 = rho1a = rho1b = wv = None
 
     elif xctype == 'GGA':
         ao_deriv = 1
@@ -1504,7 +2094,6 @@ def nr_uks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
         for ao, mask, weight, coords \
                 in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
             ngrid = weight.size
-            aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
             if rho0 is None:
                 rho0a = make_rho0(0, ao, mask, xctype)
                 rho0b = make_rho0(1, ao, mask, xctype)
@@ -1520,16 +2109,19 @@ def nr_uks_fxc(ni, mol, grids, xc_code, dm0, dms, relativity=0, hermi=0,
                 fxc0 = (fxc[0][ip:ip+ngrid], fxc[1][ip:ip+ngrid], fxc[2][ip:ip+ngrid])
                 ip += ngrid
 
-            for i in range(nset):
-                rho1a = make_rhoa(i, ao, mask, xctype)
-                rho1b = make_rhob(i, ao, mask, xctype)
-                wva, wvb = _uks_gga_wv1((rho0a,rho0b), (rho1a,rho1b), vxc0, fxc0, weight)
-                #:aow = numpy.einsum('npi,np->pi', ao, wva, out=aow)
-                aow = _scale_ao(ao, wva, out=aow)
-                vmat[0,i] += _dot_ao_ao(mol, aow, ao[0], mask, shls_slice, ao_loc)
-                #:aow = numpy.einsum('npi,np->pi', ao, wvb, out=aow)
-                aow = _scale_ao(ao, wvb, out=aow)
-                vmat[1,i] += _dot_ao_ao(mol, aow, ao[0], mask, shls_slice, ao_loc)
+            ao_idx = _non0_ao_idx(mask, shls_slice, ao_loc, ngrid, nao)
+            nbatch, buf = _fxc_batch(buf, nao, ngrid, nset, max_memory, 2)
+            for i0, i1 in lib.prange(0, nset, nbatch):
+                n = i1 - i0
+                rho1 = _rho1_on_block(ao, numpy.vstack((dm1s[i0:i1],
+                                                        dm1s[nset+i0:nset+i1])),
+                                      xctype)
+                wva, wvb = _uks_gga_wv1((rho0a,rho0b), (rho1[:n],rho1[n:]),
+                                        vxc0, fxc0, weight)
+                _add_vmat_on_block(list(vmat[0,i0:i1]) + list(vmat[1,i0:i1]),
+                                   ao, numpy.vstack((wva, wvb)), xctype,
+                                   ao_idx, buf)
+                rho1 = wva = wvb = None
 
         for i in range(nset):  # for (\nabla\mu) \nu + \mu (\nabla\nu)
             vmat[0,i] = vmat[0,i] + vmat[0,i].T.conj()
@@ -1559,6 +2151,8 @@ def _uks_gga_wv0(rho, vxc, weight):
     return wva, wvb
 
 def _uks_gga_wv1(rho0, rho1, vxc, fxc, weight):
+    # rho1 can be a pair of (4,ngrid) arrays or (nset,4,ngrid) arrays for
+    # multiple sets
     uu, ud, dd = vxc[1].T
     u_u, u_d, d_d = fxc[0].T
     u_uu, u_ud, u_dd, d_uu, d_ud, d_dd = fxc[1].T
@@ -1567,64 +2161,38 @@ def _uks_gga_wv1(rho0, rho1, vxc, fxc, weight):
 
     rho0a, rho0b = rho0
     rho1a, rho1b = rho1
-    a0a1 = numpy.einsum('xi,xi->i', rho0a[1:4], rho1a[1:4])
-    a0b1 = numpy.einsum('xi,xi->i', rho0a[1:4], rho1b[1:4])
-    b0a1 = numpy.einsum('xi,xi->i', rho0b[1:4], rho1a[1:4])
-    b0b1 = numpy.einsum('xi,xi->i', rho0b[1:4], rho1b[1:4])
-
-    wva = numpy.empty((4,ngrid))
-    wvb = numpy.empty((4,ngrid))
-    # alpha = alpha-alpha * alpha
-    wva[0]  = u_u * rho1a[0]
-    wva[0] += u_uu * a0a1 * 2
-    wva[0] += u_ud * b0a1
-    wva[1:] = uu * rho1a[1:4] * 2
-    wva[1:]+= u_uu * rho1a[0] * rho0a[1:4] * 2
-    wva[1:]+= u_ud * rho1a[0] * rho0b[1:4]
-    wva[1:]+= uu_uu * a0a1 * rho0a[1:4] * 4
-    wva[1:]+= uu_ud * a0a1 * rho0b[1:4] * 2
-    wva[1:]+= uu_ud * b0a1 * rho0a[1:4] * 2
-    wva[1:]+= ud_ud * b0a1 * rho0b[1:4]
-
-    # alpha = alpha-beta  * beta
-    wva[0] += u_d * rho1b[0]
-    wva[0] += u_ud * a0b1
-    wva[0] += u_dd * b0b1 * 2
-    wva[1:]+= ud * rho1b[1:4]
-    wva[1:]+= d_uu * rho1b[0] * rho0a[1:4] * 2
-    wva[1:]+= d_ud * rho1b[0] * rho0b[1:4]
-    wva[1:]+= uu_ud * a0b1 * rho0a[1:4] * 2
-    wva[1:]+= ud_ud * a0b1 * rho0b[1:4]
-    wva[1:]+= uu_dd * b0b1 * rho0a[1:4] * 4
-    wva[1:]+= ud_dd * b0b1 * rho0b[1:4] * 2
+    a1 = rho1a[...,0,:]
+    b1 = rho1b[...,0,:]
+    a0a1 = numpy.einsum('xi,...xi->...i', rho0a[1:4], rho1a[...,1:4,:])
+    a0b1 = numpy.einsum('xi,...xi->...i', rho0a[1:4], rho1b[...,1:4,:])
+    b0a1 = numpy.einsum('xi,...xi->...i', rho0b[1:4], rho1a[...,1:4,:])
+    b0b1 = numpy.einsum('xi,...xi->...i', rho0b[1:4], rho1b[...,1:4,:])
+    ab = a0b1 + b0a1
+
+    # Coefficients of \nabla\rho_\alpha and \nabla\rho_\beta in the
+    # response of the potentials
+    c_aa = (u_uu * a1 + d_uu * b1) * 2 + (uu_uu * a0a1 + uu_dd * b0b1) * 4 + uu_ud * ab * 2
+    c_ab = u_ud * a1 + d_ud * b1 + (uu_ud * a0a1 + ud_dd * b0b1) * 2 + ud_ud * ab
+    c_bb = (u_dd * a1 + d_dd * b1) * 2 + (uu_dd * a0a1 + dd_dd * b0b1) * 4 + ud_dd * ab * 2
+
+    shape = rho1a.shape[:-2] + (4,ngrid)
+    wva = numpy.empty(shape)
+    wvb = numpy.empty(shape)
+    wva[...,0,:]  = u_u * a1 + u_d * b1 + u_ud * ab
+    wva[...,0,:] += (u_uu * a0a1 + u_dd * b0b1) * 2
+    wva[...,1:,:] = uu * rho1a[...,1:4,:] * 2 + ud * rho1b[...,1:4,:]
+    wva[...,1:,:]+= c_aa[...,None,:] * rho0a[1:4]
+    wva[...,1:,:]+= c_ab[...,None,:] * rho0b[1:4]
     wva *= weight
-    wva[0] *= .5  # v+v.T should be applied in the caller
-
-    # beta = beta-alpha * alpha
-    wvb[0]  = u_d * rho1a[0]
-    wvb[0] += d_ud * b0a1
-    wvb[0] += d_uu * a0a1 * 2
-    wvb[1:] = ud * rho1a[1:4]
-    wvb[1:]+= u_dd * rho1a[0] * rho0b[1:4] * 2
-    wvb[1:]+= u_ud * rho1a[0] * rho0a[1:4]
-    wvb[1:]+= ud_dd * b0a1 * rho0b[1:4] * 2
-    wvb[1:]+= ud_ud * b0a1 * rho0a[1:4]
-    wvb[1:]+= uu_dd * a0a1 * rho0b[1:4] * 4
-    wvb[1:]+= uu_ud * a0a1 * rho0a[1:4] * 2
-
-    # beta = beta-beta  * beta
-    wvb[0] += d_d * rho1b[0]
-    wvb[0] += d_dd * b0b1 * 2
-    wvb[0] += d_ud * a0b1
-    wvb[1:]+= dd * rho1b[1:4] * 2
-    wvb[1:]+= d_dd * rho1b[0] * rho0b[1:4] * 2
-    wvb[1:]+= d_ud * rho1b[0] * rho0a[1:4]
-    wvb[1:]+= dd_dd * b0b1 * rho0b[1:4] * 4
-    wvb[1:]+= ud_dd * b0b1 * rho0a[1:4] * 2
-    wvb[1:]+= ud_dd * a0b1 * rho0b[1:4] * 2
-    wvb[1:]+= ud_ud * a0b1 * rho0a[1:4]
+    wva[...,0,:] *= .5  # v+v.T should be applied in the caller
+
+    wvb[...,0,:]  = u_d * a1 + d_d * b1 + d_ud * ab
+    wvb[...,0,:] += (d_uu * a0a1 + d_dd * b0b1) * 2
+    wvb[...,1:,:] = ud * rho1a[...,1:4,:] + dd * rho1b[...,1:4,:] * 2
+    wvb[...,1:,:]+= c_ab[...,None,:] * rho0a[1:4]
+    wvb[...,1:,:]+= c_bb[...,None,:] * rho0b[1:4]
     wvb *= weight
-    wvb[0] *= .5  # v+v.T should be applied in the caller
+    wvb[...,0,:] *= .5  # v+v.T should be applied in the caller
     return wva, wvb
 
 def _uks_gga_wv2(rho0, rho1, fxc, kxc, weight):
@@ -1919,11 +2487,121 @@ def get_rho(ni, mol, dm, grids, max_memory=2000):
     return rho
 
 
+class _AOCache(object):
+    '''AO values on the blocks of grids generated by :meth:`NumInt.block_loop`.
+    The blocks are held in memory up to max_memory (MB).  The rest blocks are
+    stored in a temporary file and loaded as memory-mapped arrays.
+    '''
+    def __init__(self, mol, grids, nao, deriv, blksize, max_memory,
+                 dtype=numpy.double):
+        self.atm = mol._atm.copy()
+        self.bas = mol._bas.copy()
+        self.env = mol._env.copy()
+        self.coords = grids.coords
+        self.weights = grids.weights
+        self.non0tab = grids.non0tab
+        # The mask of AO values which is yielded with the cached AO values
+        self.mask = None
+        self.nao = nao
+        self.deriv = deriv
+        self.blksize = blksize
+        self.dtype = numpy.dtype(dtype)
+        self.max_memory = max_memory
+        self.blocks = []
+        self.incore_size = 0
+        self.complete = False
+        self._file = None
+        self._offset = 0
+
+    def match(self, mol, grids, nao, deriv, blksize=None, dtype=numpy.double):
+        '''Whether the cached AO values can be used for mol and grids'''
+        return (self.complete and self.dtype == dtype and
+                self.coords is grids.coords and
+                self.weights is grids.weights and
+                self.non0tab is grids.non0tab and
+                self.nao == nao and self.deriv >= deriv and
+                (blksize is None or blksize == self.blksize) and
+                numpy.array_equal(self.atm, mol._atm) and
+                numpy.array_equal(self.bas, mol._bas) and
+                numpy.array_equal(self.env, mol._env))
+
+    def append(self, ao):
+        '''Store the AO values of the next block'''
+        if ao.ndim == 2:
+            ao = ao[numpy.newaxis]
+        # eval_ao returns the transposed view of a (comp,nao,ngrids) array
+        raw = numpy.asarray(ao.transpose(0,2,1), order='C')
+        if self.incore_size + raw.nbytes <= self.max_memory * 1e6:
+            if raw.base is not None:
+                raw = raw.copy()
+            raw.flags.writeable = False
+            self.incore_size += raw.nbytes
+        else:
+            if self._file is None:
+                self._file = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+            raw.tofile(self._file.file)
+            self._file.flush()
+            raw = numpy.memmap(self._file.name, dtype=raw.dtype, mode='r',
+                               offset=self._offset, shape=raw.shape)
+            self._offset += raw.nbytes
+        self.blocks.append(raw)
+
+    def get(self, i, deriv):
+        '''The AO values of block i, in the layout of eval_ao'''
+        comp = (deriv+1)*(deriv+2)*(deriv+3)//6
+        ao = self.blocks[i][:comp].transpose(0,2,1)
+        if deriv == 0:
+            ao = ao[0]
+        return ao
+
+
 class NumInt(object):
+    '''Numerical integration of the XC functionals
+
+    Attributes:
+        cache_ao : bool
+            Whether to keep the AO values of :meth:`block_loop` and reuse
+            them in the next calls for the same molecule and grids.  The
+            cache is invalidated when the molecule or grids are changed.
+            Default is False.
+        cache_ao_memory : float
+            Memory (in MB) for the cached AO values.  The AO values beyond
+            this size are stored in a memory-mapped file in lib.param.TMPDIR.
+        blksize_cache_fit : bool
+            Whether to limit the blocks of grids in :meth:`block_loop` to
+            fit the AO values in the L3 cache.  The blocks are not reduced
+            below BLKSIZE_THREAD_CHUNKS chunks of grids per thread.  Default
+            is False (blocks are sized by max_memory only).
+        mixed_precision : bool
+            Whether to evaluate the AO values, the densities and the XC
+            potential matrix in single precision in the early SCF
+            iterations.  The DFT get_veff switches to double precision when
+            the largest change of the density matrix between two iterations
+            is smaller than mixed_precision_tol.  Default is False.
+        mixed_precision_tol : float
+            See mixed_precision.  Default is 1e-4.
+        nproc : int
+            Number of processes to evaluate :meth:`nr_rks` and
+            :meth:`nr_uks`.  The grids are split into nproc segments, which
+            are evaluated concurrently in worker processes started by a fork
+            server (spawned if not available), so the NumInt object needs to
+            be picklable.  The OpenMP threads are divided between the
+            processes.  The AO cache (cache_ao) is not used in this mode.
+            Default is 1.
+    '''
     libxc = libxc
 
     def __init__(self):
         self.omega = None  # RSH paramter
+        self.cache_ao = CACHE_AO
+        self.cache_ao_memory = CACHE_AO_MEMORY
+        self.blksize_cache_fit = BLKSIZE_CACHE_FIT
+        self._ao_cache = None
+        self.mixed_precision = MIXED_PRECISION
+        self.mixed_precision_tol = MIXED_PRECISION_TOL
+        # The data type of the AO values generated by block_loop
+        self._ao_dtype = numpy.double
+        self.nproc = NPROC
 
     @lib.with_doc(nr_vxc.__doc__)
     def nr_vxc(self, mol, grids, xc_code, dms, spin=0, relativity=0, hermi=0,
@@ -1969,41 +2647,158 @@ class NumInt(object):
 
     @lib.with_doc(eval_rho2.__doc__)
     def eval_rho2(self, mol, ao, mo_coeff, mo_occ, non0tab=None, xctype='LDA',
-                  verbose=None):
-        return eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab, xctype, verbose)
+                  verbose=None, buf=None):
+        return eval_rho2(mol, ao, mo_coeff, mo_occ, non0tab, xctype, verbose,
+                         buf)
 
     @lib.with_doc(eval_rho.__doc__)
-    def eval_rho(self, mol, ao, dm, non0tab=None, xctype='LDA', hermi=0, verbose=None):
-        return eval_rho(mol, ao, dm, non0tab, xctype, hermi, verbose)
+    def eval_rho(self, mol, ao, dm, non0tab=None, xctype='LDA', hermi=0,
+                 verbose=None, buf=None):
+        return eval_rho(mol, ao, dm, non0tab, xctype, hermi, verbose, buf)
 
     def block_loop(self, mol, grids, nao=None, deriv=0, max_memory=2000,
                    non0tab=None, blksize=None, buf=None):
         '''Define this macro to loop over grids by blocks.
+
+        If :attr:`cache_ao` is set, the AO values are evaluated in the first
+        call and loaded from the AO cache in the next calls.  The cached AO
+        values are read-only.
+
+        The AO values are converted to single precision if _ao_dtype is set
+        to numpy.float32 (see :attr:`mixed_precision`).
         '''
         if grids.coords is None:
             grids.build(with_non0tab=True)
         if nao is None:
             nao = mol.nao
         ngrids = grids.coords.shape[0]
+        ao_dtype = numpy.dtype(getattr(self, '_ao_dtype', numpy.double))
+
+        cache = None
+        if getattr(self, 'cache_ao', False) and non0tab is None:
+            cache = getattr(self, '_ao_cache', None)
+            if (cache is None or
+                not cache.match(mol, grids, nao, deriv, blksize, ao_dtype)):
+                cache = None
         comp = (deriv+1)*(deriv+2)*(deriv+3)//6
 # NOTE to index grids.non0tab, the blksize needs to be the integer multiplier of BLKSIZE
-        if blksize is None:
+        if cache is not None:
+            blksize = cache.blksize
+        elif blksize is None and getattr(self, 'blksize_cache_fit', False):
+            # The AO values of a block are reused in several passes (rho,
+            # vmat), so the block is limited to fit the L3 cache unless the
+            # block is too small to keep all threads busy.
+            blksize = lib.blocking.plan_blksize(
+                comp*2*nao*8, max_memory, ngrids, cache_unit=comp*nao*8,
+                align=BLKSIZE, minimum=BLKSIZE, maximum=BLKSIZE*1200,
+                thread_chunk=BLKSIZE*BLKSIZE_THREAD_CHUNKS)
+        elif blksize is None:
             blksize = int(max_memory*1e6/(comp*2*nao*8*BLKSIZE))*BLKSIZE
             blksize = max(BLKSIZE, min(blksize, ngrids, BLKSIZE*1200))
+        if getattr(self, 'cache_ao', False) and non0tab is None:
+            if cache is not None:
+                for i, ip0 in enumerate(range(0, ngrids, blksize)):
+                    ip1 = min(ngrids, ip0+blksize)
+                    yield (cache.get(i, deriv), cache.mask[ip0//BLKSIZE:],
+                           grids.weights[ip0:ip1], grids.coords[ip0:ip1])
+                return
+            # A new cache. It can be used only if the loop is completed.
+            cache = self._ao_cache = _AOCache(mol, grids, nao, deriv, blksize,
+                                              self.cache_ao_memory, ao_dtype)
         if non0tab is None:
             non0tab = grids.non0tab
         if non0tab is None:
             non0tab = numpy.ones(((ngrids+BLKSIZE-1)//BLKSIZE,mol.nbas),
                                  dtype=numpy.uint8)
+        if cache is not None:
+            cache.mask = non0tab
         if buf is None:
             buf = numpy.empty((comp,blksize,nao))
+        buf1 = None
+        if ao_dtype != numpy.double:
+            buf1 = numpy.empty((comp,blksize,nao), dtype=ao_dtype)
         for ip0 in range(0, ngrids, blksize):
             ip1 = min(ngrids, ip0+blksize)
             coords = grids.coords[ip0:ip1]
             weight = grids.weights[ip0:ip1]
             non0 = non0tab[ip0//BLKSIZE:]
             ao = self.eval_ao(mol, coords, deriv=deriv, non0tab=non0, out=buf)
+            if buf1 is not None:
+                ao = _ao_astype(ao, ao_dtype, buf1)
+            if cache is not None:
+                cache.append(ao)
+                ao = cache.get(len(cache.blocks)-1, deriv)
             yield ao, non0, weight, coords
+        if cache is not None:
+            cache.complete = True
+
+    def sparse_block_loop(self, mol, grids, nao=None, deriv=0, max_memory=2000,
+                          blksize=None):
+        '''Similar to :meth:`block_loop`.  On the blocks where only a small
+        fraction (< SPARSE_AO_CUTOFF) of the AOs are significant, AO values
+        are evaluated for the significant shells only.  This is effective
+        when grids are sorted in space (Grids.sort_grids).
+
+        Yields:
+            ao, mask, weight, coords, pmol, ao_idx.  pmol is a shallow copy of
+            mol which holds the significant shells.  ao and mask are
+            associated with the shells of pmol.  ao_idx is the indices of
+            the AOs of pmol in mol.  ao_idx is None and pmol is mol if all
+            AOs are evaluated.
+
+        If the grids are not sorted, this function is the same as
+        :meth:`block_loop`.
+        '''
+        if not getattr(grids, 'sort_grids', False):
+            for ao, mask, weight, coords in self.block_loop(
+                    mol, grids, nao, deriv, max_memory, blksize=blksize):
+                yield ao, mask, weight, coords, mol, None
+            return
+
+        if grids.coords is None:
+            grids.build(with_non0tab=True)
+        if grids.non0tab is None:
+            grids.non0tab = grids.make_mask(mol, grids.coords)
+        if nao is None:
+            nao = mol.nao
+        ngrids = grids.coords.shape[0]
+        comp = (deriv+1)*(deriv+2)*(deriv+3)//6
+        if blksize is None:
+            # Small blocks to keep the lists of significant AOs short, but
+            # enough chunks of BLKSIZE grids for all threads
+            blksize = lib.blocking.plan_blksize(
+                comp*2*nao*8, max_memory, ngrids, align=BLKSIZE,
+                minimum=BLKSIZE,
+                maximum=BLKSIZE*max(SPARSE_BLKSIZE_CHUNKS, lib.num_threads()))
+        non0tab = grids.non0tab
+        ao_loc = mol.ao_loc_nr()
+        ao_dtype = numpy.dtype(getattr(self, '_ao_dtype', numpy.double))
+        buf = numpy.empty((comp,blksize,nao))
+        buf1 = None
+        if ao_dtype != numpy.double:
+            buf1 = numpy.empty((comp,blksize,nao), dtype=ao_dtype)
+        for ip0 in range(0, ngrids, blksize):
+            ip1 = min(ngrids, ip0+blksize)
+            coords = grids.coords[ip0:ip1]
+            weight = grids.weights[ip0:ip1]
+            non0 = non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+            shls = numpy.where(non0.any(axis=0))[0]
+            nao_sub = (ao_loc[shls+1] - ao_loc[shls]).sum()
+            if nao_sub >= nao * SPARSE_AO_CUTOFF:
+                ao = self.eval_ao(mol, coords, deriv=deriv, non0tab=non0, out=buf)
+                if buf1 is not None:
+                    ao = _ao_astype(ao, ao_dtype, buf1)
+                yield ao, non0, weight, coords, mol, None
+            else:
+                pmol = copy.copy(mol)
+                pmol._bas = numpy.asarray(mol._bas[shls], order='C')
+                mask = numpy.asarray(non0[:,shls], order='C')
+                ao_idx = numpy.hstack([numpy.arange(ao_loc[i], ao_loc[i+1])
+                                       for i in shls]).astype(int)
+                ao = self.eval_ao(pmol, coords, deriv=deriv, non0tab=mask, out=buf)
+                if buf1 is not None:
+                    ao = _ao_astype(ao, ao_dtype, buf1)
+                yield ao, mask, weight, coords, pmol, ao_idx
 
     def _gen_rho_evaluator(self, mol, dms, hermi=0):
         if getattr(dms, 'mo_coeff', None) is not None:
@@ -2015,9 +2810,18 @@ class NumInt(object):
                 mo_occ = [mo_occ]
             nao = mo_coeff[0].shape[0]
             ndms = len(mo_occ)
-            def make_rho(idm, ao, non0tab, xctype):
+            ao_dtype = getattr(self, '_ao_dtype', numpy.double)
+            if numpy.dtype(ao_dtype) in _SINGLE:
+                # Convert once for all blocks of the single precision AOs
+                mo_coeff = [_dm_astype(c, ao_dtype) for c in mo_coeff]
+                mo_occ = [numpy.asarray(occ, dtype=numpy.float32)
+                          for occ in mo_occ]
+            def make_rho(idm, ao, non0tab, xctype, buf=None):
+                # buf is passed only if given, for the subclasses whose
+                # eval_rho2 does not take buf (e.g. pbc.dft.numint.NumInt)
+                kwargs = {} if buf is None else {'buf': buf}
                 return self.eval_rho2(mol, ao, mo_coeff[idm], mo_occ[idm],
-                                      non0tab, xctype)
+                                      non0tab, xctype, **kwargs)
         else:
             if isinstance(dms, numpy.ndarray) and dms.ndim == 2:
                 dms = [dms]
@@ -2026,8 +2830,13 @@ class NumInt(object):
                 dms = [(dm+dm.conj().T)*.5 for dm in dms]
             nao = dms[0].shape[0]
             ndms = len(dms)
-            def make_rho(idm, ao, non0tab, xctype):
-                return self.eval_rho(mol, ao, dms[idm], non0tab, xctype, hermi=1)
+            ao_dtype = getattr(self, '_ao_dtype', numpy.double)
+            if numpy.dtype(ao_dtype) in _SINGLE:
+                dms = [_dm_astype(dm, ao_dtype) for dm in dms]
+            def make_rho(idm, ao, non0tab, xctype, buf=None):
+                kwargs = {} if buf is None else {'buf': buf}
+                return self.eval_rho(mol, ao, dms[idm], non0tab, xctype,
+                                     hermi=1, **kwargs)
         return make_rho, ndms, nao
 
 ####################
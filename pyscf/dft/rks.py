@@ -88,50 +88,43 @@ def get_veff(ks, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
         n, exc, vxc = 0, 0, 0
     else:
         max_memory = ks.max_memory - lib.current_memory()[0]
-        n, exc, vxc = ni.nr_rks(mol, ks.grids, ks.xc, dm, max_memory=max_memory)
-        if ks.nlc != '':
-            assert('VV10' in ks.nlc.upper())
-            _, enlc, vnlc = ni.nr_rks(mol, ks.nlcgrids, ks.xc+'__'+ks.nlc, dm,
-                                      max_memory=max_memory)
-            exc += enlc
-            vxc += vnlc
+        with _xc_precision(ks, dm, dm_last):
+            n, exc, vxc = ni.nr_rks(mol, ks.grids, ks.xc, dm, max_memory=max_memory)
+            if ks.nlc != '':
+                assert('VV10' in ks.nlc.upper())
+                _, enlc, vnlc = ni.nr_rks(mol, ks.nlcgrids, ks.xc+'__'+ks.nlc, dm,
+                                          max_memory=max_memory)
+                exc += enlc
+                vxc += vnlc
         logger.debug(ks, 'nelec by numeric integration = %s', n)
         t0 = logger.timer(ks, 'vxc', *t0)
 
     #enabling range-separated hybrids
     omega, alpha, hyb = ni.rsh_and_hybrid_coeff(ks.xc, spin=mol.spin)
 
-    if abs(hyb) < 1e-10 and abs(alpha) < 1e-10:
-        vk = None
-        if (ks._eri is None and ks.direct_scf and
-            getattr(vhf_last, 'vj', None) is not None):
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
+    hybrid = abs(hyb) > 1e-10 or abs(alpha) > 1e-10
+
+    # J/K are built from dm-dm_last if vhf_last holds the J/K matrices of dm_last
+    ddm, incremental, tol = ks._direct_scf_ddm(
+        dm, dm_last, getattr(vhf_last, 'vk' if hybrid else 'vj', None) is not None)
+    with hf._direct_scf_tol(ks, tol):
+        if not hybrid:
+            vk = None
             vj = ks.get_j(mol, ddm, hermi)
-            vj += vhf_last.vj
         else:
-            vj = ks.get_j(mol, dm, hermi)
-        vxc += vj
-    else:
-        if (ks._eri is None and ks.direct_scf and
-            getattr(vhf_last, 'vk', None) is not None):
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
             vj, vk = ks.get_jk(mol, ddm, hermi)
             vk *= hyb
             if abs(omega) > 1e-10:  # For range separated Coulomb operator
                 vklr = ks.get_k(mol, ddm, hermi, omega=omega)
                 vklr *= (alpha - hyb)
                 vk += vklr
-            vj += vhf_last.vj
+    if incremental:
+        vj += vhf_last.vj
+        if hybrid:
             vk += vhf_last.vk
-        else:
-            vj, vk = ks.get_jk(mol, dm, hermi)
-            vk *= hyb
-            if abs(omega) > 1e-10:
-                vklr = ks.get_k(mol, dm, hermi, omega=omega)
-                vklr *= (alpha - hyb)
-                vk += vklr
-        vxc += vj - vk * .5
-
+    vxc += vj
+    if hybrid:
+        vxc -= vk * .5
         if ground_state:
             exc -= numpy.einsum('ij,ji', dm, vk).real * .5 * .5
 
@@ -143,6 +136,20 @@ def get_veff(ks, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
     vxc = lib.tag_array(vxc, ecoul=ecoul, exc=exc, vj=vj, vk=vk)
     return vxc
 
+def _xc_precision(ks, dm, dm_last=0):
+    '''Temporarily evaluate the XC potential in single precision if
+    NumInt.mixed_precision is enabled and the density matrix changes by more
+    than NumInt.mixed_precision_tol from dm_last.  Double precision is used
+    when dm_last is not given.'''
+    ni = ks._numint
+    if (getattr(ni, 'mixed_precision', False) and
+        dm_last is not None and numpy.ndim(dm_last) > 0):
+        ddm = abs(numpy.asarray(dm) - numpy.asarray(dm_last)).max()
+        if ddm > ni.mixed_precision_tol:
+            logger.debug(ks, 'XC potential in single precision, |ddm| = %g', ddm)
+            return lib.temporary_env(ni, _ao_dtype=numpy.float32)
+    return lib.temporary_env(ni)
+
 def get_vsap(ks, mol=None):
     '''Superposition of atomic potentials
 
@@ -257,6 +264,10 @@ def energy_elec(ks, dm=None, h1e=None, vhf=None):
 
 
 NELEC_ERROR_TOL = getattr(__config__, 'dft_rks_prune_error_tol', 0.02)
+# Bounds of the errors of the number of electrons and the XC energy in
+# prune_grids_by_density_
+PRUNE_NELEC_TOL = getattr(__config__, 'dft_rks_prune_nelec_tol', 1e-6)
+PRUNE_EXC_TOL = getattr(__config__, 'dft_rks_prune_exc_tol', 1e-7)
 def prune_small_rho_grids_(ks, mol, dm, grids):
     rho = ks._numint.get_rho(mol, dm, grids, ks.max_memory)
     n = numpy.dot(rho, grids.weights)
@@ -270,6 +281,104 @@ def prune_small_rho_grids_(ks, mol, dm, grids):
         grids.non0tab = grids.make_mask(mol, grids.coords)
     return grids
 
+def grids_contribution(ks, dm=None, grids=None):
+    '''Contributions of each grid to the number of electrons and to the XC
+    energy (the NLC part is not included) for the density matrix dm of RKS
+    (a 2D array) or UKS (alpha and beta density matrices).
+
+    Returns:
+        den, exc : 1D arrays.  den = rho*weight and exc = e_xc*rho*weight
+    '''
+    mol = ks.mol
+    if dm is None: dm = ks.make_rdm1()
+    if grids is None: grids = ks.grids
+    if grids.coords is None:
+        grids.build(with_non0tab=True)
+    dm = numpy.asarray(dm)
+    spin = int(dm.ndim == 3)
+    ni = ks._numint
+    xctype = ni._xc_type(ks.xc)
+    if xctype == 'GGA':
+        ao_deriv = 1
+    elif xctype == 'MGGA':
+        ao_deriv = 2
+    else:
+        ao_deriv = 0
+    rho_type = xctype if xctype in ('GGA', 'MGGA') else 'LDA'
+    make_rho, nset, nao = ni._gen_rho_evaluator(mol, dm, hermi=1)
+
+    ngrids = grids.weights.size
+    den = numpy.empty(ngrids)
+    exc = numpy.zeros(ngrids)
+    p1 = 0
+    for ao, mask, weight, coords \
+            in ni.block_loop(mol, grids, nao, ao_deriv, ks.max_memory):
+        p0, p1 = p1, p1 + weight.size
+        if spin:
+            rho = (make_rho(0, ao, mask, rho_type),
+                   make_rho(1, ao, mask, rho_type))
+            rho0 = rho[0] + rho[1]
+        else:
+            rho = rho0 = make_rho(0, ao, mask, rho_type)
+        if rho0.ndim > 1:
+            rho0 = rho0[0]
+        den[p0:p1] = rho0 * weight
+        if xctype in ('LDA', 'GGA', 'MGGA'):
+            exc[p0:p1] = ni.eval_xc(ks.xc, rho, spin, deriv=0)[0] * den[p0:p1]
+    return den, exc
+
+def prune_grids_by_density_(ks, dm=None, grids=None, nelec_tol=None,
+                            exc_tol=None):
+    '''Remove the grids which have the smallest contributions to the number
+    of electrons and to the XC energy for the density matrix dm (by default,
+    the density matrix of ks, e.g. the converged density).  Unlike
+    :func:`prune_small_rho_grids_`, the removed grids change the number of
+    electrons and the XC energy by no more than nelec_tol and exc_tol.
+    '''
+    if grids is None: grids = ks.grids
+    if nelec_tol is None: nelec_tol = PRUNE_NELEC_TOL
+    if exc_tol is None: exc_tol = PRUNE_EXC_TOL
+    den, exc = grids_contribution(ks, dm, grids)
+    den = abs(den)
+    exc = abs(exc)
+    idx = numpy.argsort(numpy.maximum(den/nelec_tol, exc/exc_tol))
+    ndrop = numpy.count_nonzero((numpy.cumsum(den[idx]) <= nelec_tol) &
+                                (numpy.cumsum(exc[idx]) <= exc_tol))
+    logger.debug(ks, 'Drop grids %d, nelec error < %g, Exc error < %g',
+                 ndrop, den[idx[:ndrop]].sum(), exc[idx[:ndrop]].sum())
+    idx = numpy.sort(idx[ndrop:])
+    grids.coords  = numpy.asarray(grids.coords [idx], order='C')
+    grids.weights = numpy.asarray(grids.weights[idx], order='C')
+    grids.non0tab = grids.make_mask(ks.mol, grids.coords)
+    return grids
+
+def verify_grids(ks, dm=None, grids=None, ref_grids=None):
+    '''Errors of the number of electrons and the XC energy integrated on
+    grids against the reference grids.  The default reference grids have
+    two more grid levels than grids and are not pruned by density.
+
+    Returns:
+        nelec_error, exc_error
+    '''
+    if grids is None: grids = ks.grids
+    if ref_grids is None:
+        ref_grids = gen_grid.Grids(ks.mol)
+        for key in ('atomic_radii', 'radii_adjust', 'radi_method',
+                    'becke_scheme', 'prune'):
+            setattr(ref_grids, key, getattr(grids, key))
+        ref_grids.level = min(grids.level + 2, 9)
+        if grids.precision is not None:
+            ref_grids.precision = grids.precision * 1e-4
+        ref_grids.build(with_non0tab=True)
+    den, exc = grids_contribution(ks, dm, grids)
+    den0, exc0 = grids_contribution(ks, dm, ref_grids)
+    nelec_error = den.sum() - den0.sum()
+    exc_error = exc.sum() - exc0.sum()
+    logger.info(ks, 'Grids error (%d grids vs reference %d grids): '
+                'nelec %.3g  Exc %.3g', grids.weights.size,
+                ref_grids.weights.size, nelec_error, exc_error)
+    return nelec_error, exc_error
+
 def define_xc_(ks, description, xctype='LDA', hyb=0, rsh=(0,0,0)):
     libxc = ks._numint.libxc
     ks._numint = libxc.define_xc_(ks._numint, description, xctype, hyb, rsh)
@@ -371,6 +480,9 @@ class KohnShamDFT(object):
         return self
 
     define_xc_ = define_xc_
+    grids_contribution = grids_contribution
+    prune_grids_by_density_ = prune_grids_by_density_
+    verify_grids = verify_grids
 
     def to_rhf(self):
         '''Convert the input mean-field object to a RHF/ROHF object.
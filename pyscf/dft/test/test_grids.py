@@ -116,6 +116,23 @@ class KnownValues(unittest.TestCase):
         grid.atom_grid = {"H": (10, 58), "O": (10, 50),}
         self.assertRaises(ValueError, grid.build)
 
+    def test_atomic_grids_cache(self):
+        atom_grid = {'O': (20, 50), 'H': (20, 50)}
+        with lib.temporary_env(gen_grid, ATOMIC_GRIDS_CACHE_SIZE=2):
+            gen_grid._atomic_grids_cache.clear()
+            tab0 = gen_grid.gen_atomic_grids(h2o, atom_grid, radi.becke)
+            tab1 = gen_grid.gen_atomic_grids(h2o, atom_grid, radi.becke)
+            self.assertTrue(tab0['O'][0] is tab1['O'][0])
+            gen_grid.gen_atomic_grids(h2o, {'O': (30, 50), 'H': (30, 50)})
+            self.assertEqual(len(gen_grid._atomic_grids_cache), 2)
+
+            radii = radi.BRAGG_RADII.copy()
+            radii[8] *= 1.2
+            with lib.temporary_env(radi, BRAGG_RADII=radii):
+                tab1 = gen_grid.gen_atomic_grids(h2o, atom_grid, radi.becke)
+            self.assertAlmostEqual(abs(tab1['H'][0] - tab0['H'][0]).max(), 0, 12)
+            self.assertTrue(abs(tab1['O'][0] - tab0['O'][0]).max() > 1e-3)
+
     def test_make_mask(self):
         grid = gen_grid.Grids(h2o)
         grid.atom_grid = {"H": (10, 110), "O": (10, 110),}
@@ -125,6 +142,90 @@ class KnownValues(unittest.TestCase):
         self.assertEqual(non0.sum(), 106)
         self.assertAlmostEqual(lib.finger(non0), -0.81399929716237085, 9)
 
+    def test_sort_grids(self):
+        grid = gen_grid.Grids(h2o)
+        grid.atom_grid = {"H": (10, 110), "O": (10, 110),}
+        grid.build()
+        idx = gen_grid.arg_group_grids(h2o, grid.coords)
+        self.assertEqual(sorted(idx), list(range(grid.weights.size)))
+        coords0 = grid.coords[idx]
+        weights0 = grid.weights[idx]
+        grid.sort_grids = True
+        self.assertTrue(grid.weights is None)
+        grid.build()
+        self.assertAlmostEqual(abs(grid.coords - coords0).max(), 0, 12)
+        self.assertAlmostEqual(abs(grid.weights - weights0).max(), 0, 12)
+
+    def test_becke_cutoff(self):
+        mol = gto.M(atom=[['He', (0, 0, i*2.5)] for i in range(6)],
+                    basis='sto3g', verbose=0)
+        for scheme, cutoff, prec in ((gen_grid.original_becke, 1e-10, 9),
+                                     (gen_grid.stratmann, 0, 12)):
+            grid = gen_grid.Grids(mol)
+            grid.atom_grid = (20, 110)
+            grid.becke_scheme = scheme
+            grid.build()
+            ref = grid.weights
+            grid.becke_cutoff = cutoff
+            grid.build()
+            self.assertAlmostEqual(abs(grid.weights - ref).max(), 0, prec)
+
+        # Move the first atom. The cached weights are reused for the grids
+        # which do not see the first atom.
+        coords = mol.atom_coords()
+        coords[0,2] -= .2
+        mol1 = mol.set_geom_(coords, unit='Bohr', inplace=False)
+        grid.reset(mol1).build()
+        ref = gen_grid.Grids(mol1).set(atom_grid=(20, 110),
+                                       becke_scheme=gen_grid.stratmann).build()
+        self.assertAlmostEqual(abs(grid.coords - ref.coords).max(), 0, 12)
+        self.assertAlmostEqual(abs(grid.weights - ref.weights).max(), 0, 12)
+
+        self.assertEqual(list(gen_grid.becke_neighbors(
+            gto.inter_distance(mol), 0, .1, 0, gen_grid.stratmann)), [0])
+
+    def test_moving_grids(self):
+        grid = gen_grid.Grids(h2o)
+        grid.atom_grid = {"H": (10, 110), "O": (10, 110),}
+        grid.build(with_non0tab=True)
+        coords = h2o.atom_coords()
+        # Move one atom, translate the entire molecule, then move all atoms
+        for disp in ([[0, 0, 0], [0, .2, .1], [0, 0, 0]],
+                     [[.5, -1., 2.]] * 3,
+                     [[.1, 0, 0], [0, .1, 0], [0, 0, .1]]):
+            coords = coords + numpy.array(disp)
+            mol1 = h2o.set_geom_(coords, unit='Bohr', inplace=False)
+            grid.reset(mol1).build(with_non0tab=True)
+            ref = gen_grid.Grids(mol1)
+            ref.atom_grid = {"H": (10, 110), "O": (10, 110),}
+            ref.build(with_non0tab=True)
+            self.assertAlmostEqual(abs(grid.coords - ref.coords).max(), 0, 12)
+            self.assertAlmostEqual(abs(grid.weights - ref.weights).max(), 0, 9)
+            self.assertTrue(numpy.array_equal(grid.non0tab, ref.non0tab))
+
+    def test_moving_grids_becke_cutoff(self):
+        numpy.random.seed(3)
+        grid = gen_grid.Grids(h2o)
+        grid.atom_grid = {"H": (10, 110), "O": (10, 110),}
+        grid.becke_cutoff = 1e-8
+        grid.build(with_non0tab=True)
+        coords = h2o.atom_coords()
+        # Small steps of all atoms, as in geometry optimization or MD
+        for i in range(4):
+            coords = coords + (numpy.random.random((3,3)) - .5) * .02
+            mol1 = h2o.set_geom_(coords, unit='Bohr', inplace=False)
+            grid.reset(mol1).build(with_non0tab=True)
+            ref = gen_grid.Grids(mol1)
+            ref.atom_grid = {"H": (10, 110), "O": (10, 110),}
+            ref.becke_cutoff = 1e-8
+            ref.build(with_non0tab=True)
+            atom_grids_tab = ref.gen_atomic_grids(mol1, ref.atom_grid)
+            vol = numpy.hstack([atom_grids_tab[mol1.atom_symbol(ia)][1]
+                                for ia in range(mol1.natm)])
+            self.assertAlmostEqual(abs(grid.coords - ref.coords).max(), 0, 12)
+            self.assertTrue((abs(grid.weights - ref.weights) <= 1e-8*vol).all())
+            self.assertTrue(numpy.array_equal(grid.non0tab, ref.non0tab))
+
     def test_overwriting_grids_attribute(self):
         g = gen_grid.Grids(h2o).run()
         self.assertEqual(g.weights.size, 34310)
@@ -510,6 +510,64 @@ class KnownValues(unittest.TestCase):
         self.assertEqual(dm.ndim, 3)
         self.assertAlmostEqual(lib.fp(dm), 1.9698972986009409, 9)
 
+    def test_adaptive_grids(self):
+        atom_grid = dft.gen_grid.adaptive_atom_grid(h2o, 1e-6)
+        atom_grid1 = dft.gen_grid.adaptive_atom_grid(h2o, 1e-10)
+        self.assertTrue(atom_grid['O'][0] > atom_grid['H'][0])
+        self.assertTrue(atom_grid1['O'][0] > atom_grid['O'][0])
+
+        mf = dft.RKS(h2o)
+        mf.xc = 'b88,p86'
+        mf.grids.precision = 1e-6
+        mf.grids.atom_grid = {'H': atom_grid['H']}
+        ref = dft.gen_grid.Grids(h2o).set(atom_grid=atom_grid).build()
+        self.assertAlmostEqual(abs(mf.grids.build().weights - ref.weights).max(), 0, 12)
+        mf.kernel()
+
+        ngrids = mf.grids.weights.size
+        den, exc = mf.grids_contribution()
+        mf.prune_grids_by_density_(nelec_tol=1e-5, exc_tol=1e-6)
+        self.assertTrue(mf.grids.weights.size < ngrids)
+        den1, exc1 = mf.grids_contribution()
+        self.assertTrue(abs(den1.sum() - den.sum()) <= 1e-5)
+        self.assertTrue(abs(exc1.sum() - exc.sum()) <= 1e-6)
+
+        nelec_error, exc_error = mf.verify_grids()
+        self.assertAlmostEqual(nelec_error, 0, 4)
+        self.assertAlmostEqual(exc_error, 0, 4)
+
+        mf = dft.UKS(h2o_cation).set(xc='lda,vwn')
+        mf.grids.atom_grid = (30, 110)
+        mf.kernel()
+        den, exc = mf.grids_contribution()
+        self.assertAlmostEqual(den.sum(), h2o_cation.nelectron, 3)
+        self.assertAlmostEqual(exc.sum(), mf.scf_summary['exc'], 7)
+
+    def test_mixed_precision(self):
+        mf = dft.RKS(h2o).set(xc='b88,p86', conv_tol=1e-11)
+        mf.grids.atom_grid = (40, 110)
+        e_ref = mf.kernel()
+        dm = mf.make_rdm1()
+
+        ni = mf._numint
+        n, exc, vxc = ni.nr_rks(h2o, mf.grids, mf.xc, dm)
+        with lib.temporary_env(ni, _ao_dtype=numpy.float32):
+            n1, exc1, vxc1 = ni.nr_rks(h2o, mf.grids, mf.xc, dm)
+        self.assertEqual(vxc1.dtype, numpy.double)
+        self.assertAlmostEqual(exc1, exc, 4)
+        self.assertAlmostEqual(abs(vxc1 - vxc).max(), 0, 4)
+
+        mf = dft.RKS(h2o).set(xc='b88,p86', conv_tol=1e-11)
+        mf.grids.atom_grid = (40, 110)
+        mf._numint.mixed_precision = True
+        self.assertAlmostEqual(mf.kernel(), e_ref, 9)
+
+        mf = dft.UKS(h2o_cation).set(xc='b88,p86', conv_tol=1e-11)
+        mf.grids.atom_grid = (40, 110)
+        e_ref = mf.kernel()
+        mf._numint.mixed_precision = True
+        self.assertAlmostEqual(mf.kernel(), e_ref, 9)
+
 if __name__ == "__main__":
     print("Full Tests for H2O")
     unittest.main()
@@ -75,6 +75,72 @@ class KnownValues(unittest.TestCase):
         self.assertAlmostEqual(finger(non0), -2.6880474684794895, 9)
         self.assertAlmostEqual(finger(numpy.cos(non0)), 2.5961863522983433, 9)
 
+    def test_sparse_block_loop(self):
+        grids = dft.gen_grid.Grids(mol)
+        grids.atom_grid = {"H": (50, 110)}
+        grids.build()
+        dm = mf.get_init_guess(key='minao')
+        ref = mf._numint.nr_rks(mol, grids, 'b88,', dm)
+        refu = mf._numint.nr_uks(mol, grids, 'lda,', (dm*.5, dm*.5))
+
+        grids.sort_grids = True
+        grids.build()
+        with lib.temporary_env(dft.numint, SPARSE_AO_CUTOFF=1.1):
+            nblk = 0
+            for ao, mask, weight, coords, pmol, ao_idx in \
+                    mf._numint.sparse_block_loop(mol, grids, nao, 0):
+                self.assertEqual(ao.shape[1], ao_idx.size)
+                nblk += 1
+            self.assertTrue(nblk > 1)
+            res = mf._numint.nr_rks(mol, grids, 'b88,', dm)
+            resu = mf._numint.nr_uks(mol, grids, 'lda,', (dm*.5, dm*.5))
+        self.assertAlmostEqual(res[0], ref[0], 9)
+        self.assertAlmostEqual(res[1], ref[1], 9)
+        self.assertAlmostEqual(abs(res[2]-ref[2]).max(), 0, 9)
+        self.assertAlmostEqual(resu[1], refu[1], 9)
+        self.assertAlmostEqual(abs(resu[2]-refu[2]).max(), 0, 9)
+
+    def test_blksize_cache_fit(self):
+        dm = mf_h4.get_init_guess(key='minao')
+        grids = mf_h4.grids
+        ni = dft.numint.NumInt()
+        ngrids = grids.coords.shape[0]
+        ref = ni.nr_rks(h4, grids, 'b88,', dm)
+        blks = [ao.shape[1] for ao, mask, weight, coords
+                in ni.block_loop(h4, grids, h4.nao, 1, max_memory=2000)]
+        self.assertEqual(blks[0], min(ngrids, dft.gen_grid.BLKSIZE*1200))
+        ni.blksize_cache_fit = True
+        res = ni.nr_rks(h4, grids, 'b88,', dm)
+        self.assertAlmostEqual(res[1], ref[1], 12)
+        self.assertAlmostEqual(abs(res[2]-ref[2]).max(), 0, 12)
+
+    def test_cache_ao(self):
+        dm = mf_h4.get_init_guess(key='minao')
+        grids = mf_h4.grids
+        ni = dft.numint.NumInt()
+        ref = ni.nr_rks(h4, grids, 'b88,', dm)
+        ni.cache_ao = True
+        for cache_ao_memory in (1000, 0):
+            ni.cache_ao_memory = cache_ao_memory
+            ni._ao_cache = None
+            res = ni.nr_rks(h4, grids, 'b88,', dm)
+            self.assertTrue(ni._ao_cache.complete)
+            cache = ni._ao_cache
+            res1 = ni.nr_rks(h4, grids, 'lda,', dm)
+            self.assertTrue(ni._ao_cache is cache)
+            res = ni.nr_rks(h4, grids, 'b88,', dm)
+            self.assertAlmostEqual(res[1], ref[1], 12)
+            self.assertAlmostEqual(abs(res[2]-ref[2]).max(), 0, 12)
+        self.assertTrue(isinstance(ni._ao_cache.blocks[0], numpy.memmap))
+        ref1 = dft.numint.NumInt().nr_rks(h4, grids, 'lda,', dm)
+        self.assertAlmostEqual(abs(res1[2]-ref1[2]).max(), 0, 12)
+
+        # The cache is invalidated when the molecule is changed
+        h4a = h4.copy()
+        h4a.set_geom_(h4.atom_coords()+.01, unit='Bohr')
+        ni.nr_rks(h4a, grids, 'lda,', dm)
+        self.assertTrue(ni._ao_cache is not cache)
+
     def test_dot_ao_dm(self):
         dm = mf_h4.get_init_guess(key='minao')
         ao_loc = h4.ao_loc_nr()
@@ -106,6 +172,25 @@ class KnownValues(unittest.TestCase):
         v2 = dft.numint._dot_ao_ao(h4, ao, ao, None, None, None)
         self.assertAlmostEqual(abs(v1-v2).max(), 0, 9)
 
+    def test_dot_ao_single(self):
+        # A block of grids near the first atom, where the AOs of the far
+        # atoms are screened out
+        coords = mf.grids.coords[:dft.gen_grid.BLKSIZE*2]
+        non0tab = mf.grids.make_mask(mol, coords)
+        ao_loc = mol.ao_loc_nr()
+        ao = dft.numint.eval_ao(mol, coords, deriv=1, non0tab=non0tab)
+        ao32 = dft.numint._ao_astype(ao, numpy.float32)
+        self.assertEqual(ao32.strides[1:], (ao.strides[1]//2, ao.strides[2]//2))
+        numpy.random.seed(1)
+        dm = numpy.random.random((ao.shape[2],)*2)
+        res0 = dft.numint._dot_ao_dm(mol, ao[0], dm, non0tab, (0,mol.nbas), ao_loc)
+        res1 = dft.numint._dot_ao_dm(mol, ao32[0], dm, non0tab, (0,mol.nbas), ao_loc)
+        self.assertEqual(res1.dtype, numpy.float32)
+        self.assertAlmostEqual(abs(res1-res0).max(), 0, 4)
+        res0 = dft.numint._dot_ao_ao(mol, ao[0], ao[1], non0tab, (0,mol.nbas), ao_loc)
+        res1 = dft.numint._dot_ao_ao(mol, ao32[0], ao32[1], non0tab, (0,mol.nbas), ao_loc)
+        self.assertAlmostEqual(abs(res1-res0).max(), 0, 4)
+
     def test_dot_ao_ao_high_cost(self):
         non0tab = mf.grids.make_mask(mol, mf.grids.coords)
         ao = dft.numint.eval_ao(mol, mf.grids.coords, deriv=1)
@@ -149,6 +234,19 @@ class KnownValues(unittest.TestCase):
         self.assertTrue(numpy.allclose(rho0, rho1))
         self.assertTrue(numpy.allclose(rho0, rho2))
 
+        # The intermediates on a workspace
+        buf = dft.numint._rho_workspace(None, ngrids, nao, numpy.double)
+        for xctype, ao1 in (('LDA', ao[0]), ('GGA', ao[:4]), ('MGGA', ao)):
+            rho1 = ni.eval_rho (mol, ao1, dm, xctype=xctype)
+            rho2 = ni.eval_rho2(mol, ao1, mo_coeff, mo_occ, xctype=xctype)
+            buf[:] = numpy.nan
+            self.assertAlmostEqual(abs(ni.eval_rho(mol, ao1, dm, xctype=xctype,
+                                                   buf=buf) - rho1).max(), 0, 12)
+            buf[:] = numpy.nan
+            self.assertAlmostEqual(abs(ni.eval_rho2(mol, ao1, mo_coeff, mo_occ,
+                                                    xctype=xctype, buf=buf) -
+                                       rho2).max(), 0, 12)
+
     def test_eval_mat(self):
         numpy.random.seed(10)
         ngrids = 500
@@ -332,6 +430,69 @@ class KnownValues(unittest.TestCase):
                                rho0=rvf[0], vxc=rvf[1], fxc=rvf[2])
         self.assertAlmostEqual(abs(v-v1).max(), 0, 8)
 
+    def test_fxc_batch(self):
+        numpy.random.seed(10)
+        nao = mol1.nao_nr()
+        dm0 = numpy.random.random((2,nao,nao))
+        e, mo_coeff = numpy.linalg.eigh(dm0)
+        mo_occ = numpy.ones((2,nao))
+        mo_occ[:,-2:] = -1
+        dm0 = numpy.einsum('xpi,xi,xqi->xpq', mo_coeff, mo_occ, mo_coeff)
+        dms = numpy.random.random((2,5,nao,nao))
+        ni = dft.numint.NumInt()
+        # All density matrices in one batch vs. one density matrix per batch
+        for xc in ('LDA,', 'B88,'):
+            v = ni.nr_fxc(mol1, mf.grids, xc, dm0, dms, spin=1)
+            v1 = ni.nr_fxc(mol1, mf.grids, xc, dm0, dms, spin=1, max_memory=1e-3)
+            self.assertAlmostEqual(abs(v-v1).max(), 0, 9)
+            for i in range(5):
+                v1 = ni.nr_fxc(mol1, mf.grids, xc, dm0, dms[:,i], spin=1)
+                self.assertAlmostEqual(abs(v[:,i]-v1).max(), 0, 9)
+
+            v = ni.nr_fxc(mol1, mf.grids, xc, dm0[0]+dm0[1], dms[0], spin=0)
+            v1 = ni.nr_fxc(mol1, mf.grids, xc, dm0[0]+dm0[1], dms[0], spin=0,
+                           max_memory=1e-3)
+            self.assertAlmostEqual(abs(v-v1).max(), 0, 9)
+            v1 = ni.nr_fxc(mol1, mf.grids, xc, dm0[0]+dm0[1], dms[0,3], spin=0)
+            self.assertAlmostEqual(abs(v[3]-v1).max(), 0, 9)
+
+            v = dft.numint.nr_rks_fxc_st(ni, mol1, mf.grids, xc, dm0[0], dms[0])
+            v1 = dft.numint.nr_rks_fxc_st(ni, mol1, mf.grids, xc, dm0[0], dms[0,2])
+            self.assertAlmostEqual(abs(v[2]-v1).max(), 0, 9)
+
+    def test_nr_vxc_nproc(self):
+        numpy.random.seed(2)
+        nao = mol1.nao_nr()
+        dms = numpy.random.random((2,2,nao,nao))
+        dms = dms + dms.transpose(0,1,3,2)
+        ni = dft.numint.NumInt()
+        ni1 = dft.numint.NumInt()
+        ni1.nproc = 3
+        for xc in ('LDA,', 'B88,', 'TPSS'):
+            for spin, dm in ((0, dms[0]), (0, dms[0,0]), (1, dms)):
+                ref = ni.nr_vxc(mol1, mf.grids, xc, dm, spin=spin)
+                res = ni1.nr_vxc(mol1, mf.grids, xc, dm, spin=spin)
+                self.assertAlmostEqual(abs(numpy.asarray(res[0]) - ref[0]).max(), 0, 9)
+                self.assertAlmostEqual(abs(numpy.asarray(res[1]) - ref[1]).max(), 0, 9)
+                self.assertAlmostEqual(abs(res[2] - ref[2]).max(), 0, 9)
+                self.assertEqual(res[2].shape, ref[2].shape)
+
+    def test_nr_vxc_blocks(self):
+        numpy.random.seed(3)
+        nao = mol1.nao_nr()
+        dms = numpy.random.random((2,nao,nao))
+        dms = dms + dms.transpose(0,2,1)
+        ni = dft.numint.NumInt()
+        # The workspace buffers are reused across many small blocks
+        for xc in ('LDA,', 'B88,', 'TPSS'):
+            for spin, dm in ((0, dms[0]), (1, dms)):
+                ref = ni.nr_vxc(mol1, mf.grids, xc, dm, spin=spin)
+                res = ni.nr_vxc(mol1, mf.grids, xc, dm, spin=spin, max_memory=1e-3)
+                self.assertAlmostEqual(abs(res[2] - ref[2]).max(), 0, 9)
+                with lib.temporary_env(ni, _ao_dtype=numpy.float32):
+                    res = ni.nr_vxc(mol1, mf.grids, xc, dm, spin=spin, max_memory=1e-3)
+                self.assertAlmostEqual(abs(res[2] - ref[2]).max(), 0, 3)
+
     def test_vv10nlc(self):
         numpy.random.seed(10)
         rho = numpy.random.random((4,20))
@@ -24,6 +24,7 @@ import time
 import numpy
 from pyscf import lib
 from pyscf.lib import logger
+from pyscf.scf import hf
 from pyscf.scf import uhf
 from pyscf.dft import rks
 
@@ -58,54 +59,48 @@ def get_veff(ks, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
         n, exc, vxc = (0,0), 0, 0
     else:
         max_memory = ks.max_memory - lib.current_memory()[0]
-        n, exc, vxc = ni.nr_uks(mol, ks.grids, ks.xc, dm, max_memory=max_memory)
-        if ks.nlc != '':
-            assert('VV10' in ks.nlc.upper())
-            _, enlc, vnlc = ni.nr_rks(mol, ks.nlcgrids, ks.xc+'__'+ks.nlc, dm[0]+dm[1],
-                                      max_memory=max_memory)
-            exc += enlc
-            vxc += vnlc
+        with rks._xc_precision(ks, dm, dm_last):
+            n, exc, vxc = ni.nr_uks(mol, ks.grids, ks.xc, dm, max_memory=max_memory)
+            if ks.nlc != '':
+                assert('VV10' in ks.nlc.upper())
+                _, enlc, vnlc = ni.nr_rks(mol, ks.nlcgrids, ks.xc+'__'+ks.nlc, dm[0]+dm[1],
+                                          max_memory=max_memory)
+                exc += enlc
+                vxc += vnlc
         logger.debug(ks, 'nelec by numeric integration = %s', n)
         t0 = logger.timer(ks, 'vxc', *t0)
 
     #enabling range-separated hybrids
     omega, alpha, hyb = ni.rsh_and_hybrid_coeff(ks.xc, spin=mol.spin)
 
-    if abs(hyb) < 1e-10 and abs(alpha) < 1e-10:
-        vk = None
-        if (ks._eri is None and ks.direct_scf and
-            getattr(vhf_last, 'vj', None) is not None):
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
+    hybrid = abs(hyb) > 1e-10 or abs(alpha) > 1e-10
+
+    # J/K are built from dm-dm_last if vhf_last holds the J/K matrices of dm_last
+    ddm, incremental, tol = ks._direct_scf_ddm(
+        dm, dm_last, getattr(vhf_last, 'vk' if hybrid else 'vj', None) is not None)
+    with hf._direct_scf_tol(ks, tol):
+        if not hybrid:
+            vk = None
             vj = ks.get_j(mol, ddm[0]+ddm[1], hermi)
-            vj += vhf_last.vj
         else:
-            vj = ks.get_j(mol, dm[0]+dm[1], hermi)
-        vxc += vj
-    else:
-        if (ks._eri is None and ks.direct_scf and
-            getattr(vhf_last, 'vk', None) is not None):
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
             vj, vk = ks.get_jk(mol, ddm, hermi)
-            vk *= hyb
-            if abs(omega) > 1e-10:
-                vklr = ks.get_k(mol, ddm, hermi, omega)
-                vklr *= (alpha - hyb)
-                vk += vklr
-            vj = vj[0] + vj[1] + vhf_last.vj
-            vk += vhf_last.vk
-        else:
-            vj, vk = ks.get_jk(mol, dm, hermi)
             vj = vj[0] + vj[1]
             vk *= hyb
-            if abs(omega) > 1e-10:
-                vklr = ks.get_k(mol, dm, hermi, omega)
+            if abs(omega) > 1e-10:  # For range separated Coulomb operator
+                vklr = ks.get_k(mol, ddm, hermi, omega=omega)
                 vklr *= (alpha - hyb)
                 vk += vklr
-        vxc += vj - vk
-
+    if incremental:
+        vj += vhf_last.vj
+        if hybrid:
+            vk += vhf_last.vk
+    vxc += vj
+    if hybrid:
+        vxc -= vk
         if ground_state:
-            exc -=(numpy.einsum('ij,ji', dm[0], vk[0]).real +
-                   numpy.einsum('ij,ji', dm[1], vk[1]).real) * .5
+            exc -= (numpy.einsum('ij,ji', dm[0], vk[0]).real +
+                    numpy.einsum('ij,ji', dm[1], vk[1]).real) * .5
+
     if ground_state:
         ecoul = numpy.einsum('ij,ji', dm[0]+dm[1], vj).real * .5
     else:
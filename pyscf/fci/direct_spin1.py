@@ -84,6 +84,15 @@ def contract_1e(f1e, fcivec, norb, nelec, link_index=None):
                             link_indexb.ctypes.data_as(ctypes.c_void_p))
     return ci1
 
+def _contract_2e_cost(eri, fcivec, norb, nelec, link_index=None):
+    '''Estimated (FLOPs, bytes) of :func:`contract_2e`'''
+    ndet = numpy.size(fcivec)
+    npair = norb * (norb+1) // 2
+    flops = 2. * ndet * npair**2
+    nbytes = 8. * 2 * ndet * npair
+    return flops, nbytes
+
+@lib.profiler.profile('fci.direct_spin1.contract_2e', _contract_2e_cost)
 def contract_2e(eri, fcivec, norb, nelec, link_index=None):
     r'''Contract the 4-index tensor eri[pqrs] with a FCI vector
 
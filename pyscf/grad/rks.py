@@ -48,8 +48,6 @@ def get_veff(ks_grad, mol=None, dm=None):
     if grids.coords is None:
         grids.build(with_non0tab=True)
 
-    if mf.nlc != '':
-        raise NotImplementedError
     #enabling range-separated hybrids
     omega, alpha, hyb = ni.rsh_and_hybrid_coeff(mf.xc, spin=mol.spin)
 
@@ -65,6 +63,16 @@ def get_veff(ks_grad, mol=None, dm=None):
                            max_memory=max_memory, verbose=ks_grad.verbose)
     t0 = logger.timer(ks_grad, 'vxc', *t0)
 
+    if mf.nlc != '':
+        if ks_grad.grid_response:
+            raise NotImplementedError('Grid response for VV10')
+        if mf.nlcgrids.coords is None:
+            mf.nlcgrids.build(with_non0tab=True)
+        enlc, vnlc = get_nlc_vxc(ni, mol, mf.nlcgrids, mf.xc, dm,
+                                 max_memory=max_memory, verbose=ks_grad.verbose)
+        vxc += vnlc
+        t0 = logger.timer(ks_grad, 'vnlc', *t0)
+
     if abs(hyb) < 1e-10 and abs(alpha) < 1e-10:
         vj = ks_grad.get_j(mol, dm)
         vxc += vj
@@ -120,6 +128,43 @@ def get_vxc(ni, mol, grids, xc_code, dms, relativity=0, hermi=1,
     # - sign because nabla_X = -nabla_x
     return exc, -vmat
 
+def get_nlc_vxc(ni, mol, grids, xc_code, dm, relativity=0, hermi=1,
+                max_memory=2000, verbose=None):
+    '''Nuclear gradients of the VV10 nonlocal correlation potential (without
+    the response of grids).  xc_code is the semi-local functional which
+    determines the VV10 parameters.
+    '''
+    make_rho, nset, nao = ni._gen_rho_evaluator(mol, dm, hermi)
+    assert(nset == 1)
+    ao_loc = mol.ao_loc_nr()
+    nlc_pars = ni.nlc_coeff(xc_code)
+    if nlc_pars == [0,0]:
+        raise NotImplementedError('VV10 cannot be used with %s. '
+                                  'The supported functionals are %s' %
+                                  (xc_code, ni.libxc.VV10_XC))
+
+    vvrho = numpy.empty((4,grids.weights.size))
+    p1 = 0
+    for ao, mask, weight, coords \
+            in ni.block_loop(mol, grids, nao, 1, max_memory):
+        p0, p1 = p1, p1 + weight.size
+        vvrho[:,p0:p1] = make_rho(0, ao, mask, 'GGA')
+    vxc = numint._vv10nlc(vvrho, grids.coords, vvrho, grids.weights,
+                          grids.coords, nlc_pars)[1]
+
+    vmat = numpy.zeros((3,nao,nao))
+    p1 = 0
+    for ao, mask, weight, coords \
+            in ni.block_loop(mol, grids, nao, 2, max_memory):
+        p0, p1 = p1, p1 + weight.size
+        wv = numint._rks_gga_wv0(vvrho[:,p0:p1], vxc[:,p0:p1], weight)
+        _gga_grad_sum_(vmat, mol, ao, wv, mask, ao_loc)
+        wv = None
+
+    exc = None
+    # - sign because nabla_X = -nabla_x
+    return exc, -vmat
+
 def _make_dR_dao_w(ao, wv):
     aow = numpy.einsum('npi,p->npi', ao[1:4], wv[0])
     # XX, XY, XZ = 4, 5, 6
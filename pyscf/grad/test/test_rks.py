@@ -408,6 +408,28 @@ class KnownValues(unittest.TestCase):
         e2 = smf(mol2)
         self.assertAlmostEqual((e1-e2)/dx, g[1,0], 5)
 
+    def test_vv10(self):
+        mol1 = gto.M(atom="H; F 1 1.", basis='631g', verbose=0)
+        mf = dft.RKS(mol1)
+        mf.xc = 'wb97m_v'
+        mf.nlc = 'vv10'
+        mf.conv_tol = 1e-12
+        mf.kernel()
+        g = mf.nuc_grad_method().kernel()
+
+        smf = mf.as_scanner()
+        mol1 = gto.M(atom="H; F 1 1.001", basis='631g')
+        mol2 = gto.M(atom="H; F 1 0.999", basis='631g')
+        dx = (mol1.atom_coord(1) - mol2.atom_coord(1))[0]
+        e1 = smf(mol1)
+        e2 = smf(mol2)
+        self.assertAlmostEqual((e1-e2)/dx, g[1,0], 4)
+
+        mf = dft.UKS(mol1).set(xc='wb97m_v', nlc='vv10').run()
+        g1 = mf.nuc_grad_method().kernel()
+        g = dft.RKS(mol1).set(xc='wb97m_v', nlc='vv10').run().nuc_grad_method().kernel()
+        self.assertAlmostEqual(abs(g1 - g).max(), 0, 5)
+
 
 if __name__ == "__main__":
     print("Full Tests for RKS Gradients")
@@ -48,8 +48,6 @@ def get_veff(ks_grad, mol=None, dm=None):
     if grids.coords is None:
         grids.build(with_non0tab=True)
 
-    if mf.nlc != '':
-        raise NotImplementedError
     #enabling range-separated hybrids
     omega, alpha, hyb = ni.rsh_and_hybrid_coeff(mf.xc, spin=mol.spin)
 
@@ -65,6 +63,17 @@ def get_veff(ks_grad, mol=None, dm=None):
                            max_memory=max_memory, verbose=ks_grad.verbose)
     t0 = logger.timer(ks_grad, 'vxc', *t0)
 
+    if mf.nlc != '':
+        if ks_grad.grid_response:
+            raise NotImplementedError('Grid response for VV10')
+        if mf.nlcgrids.coords is None:
+            mf.nlcgrids.build(with_non0tab=True)
+        enlc, vnlc = rks_grad.get_nlc_vxc(ni, mol, mf.nlcgrids, mf.xc,
+                                          dm[0]+dm[1], max_memory=max_memory,
+                                          verbose=ks_grad.verbose)
+        vxc += vnlc
+        t0 = logger.timer(ks_grad, 'vnlc', *t0)
+
     if abs(hyb) < 1e-10:
         vj = ks_grad.get_j(mol, dm)
         vxc += vj[0] + vj[1]
@@ -1046,7 +1046,7 @@ def unpack(moldic):
 def dumps(mol):
     '''Serialize Mole object to a JSON formatted str.
     '''
-    exclude_keys = set(('output', 'stdout', '_keys',
+    exclude_keys = set(('output', 'stdout', '_keys', '_profiler',
                         # Constructing in function loads
                         'symm_orb', 'irrep_id', 'irrep_name'))
     nparray_keys = set(('_atm', '_bas', '_env', '_ecpbas',
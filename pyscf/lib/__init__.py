@@ -24,10 +24,12 @@ param = parameters
 from pyscf.lib import numpy_helper
 from pyscf.lib import linalg_helper
 from pyscf.lib import logger
+from pyscf.lib import profiler
 from pyscf.lib import misc
 from pyscf.lib.misc import *
 from pyscf.lib.numpy_helper import *
 from pyscf.lib.linalg_helper import *
 from pyscf.lib import chkfile
 from pyscf.lib import diis
+from pyscf.lib import blocking
 from pyscf.lib.misc import StreamObject
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# Copyright 2014-2020 The PySCF Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+Block sizes of the memory-bound loops
+
+:func:`plan_blksize` determines the size of the blocks of a loop from the
+memory budget, the number of OpenMP threads and the size of the CPU caches.
+The memory model of a loop is
+
+    fixed + nthreads * thread_fixed + blksize**ndim * (unit + nthreads * thread_unit)
+
+where unit is the size of the buffers shared by all threads and thread_unit
+is the size of the buffers which are allocated by each thread.
+
+The cache sizes are read from the system (sysconf or /sys) and can be
+overwritten by the config keys lib_blocking_l2_cache and
+lib_blocking_l3_cache (in bytes).
+'''
+
+import os
+import numpy
+from pyscf.lib.misc import num_threads
+from pyscf import __config__
+
+L2_CACHE = getattr(__config__, 'lib_blocking_l2_cache', None)
+L3_CACHE = getattr(__config__, 'lib_blocking_l3_cache', None)
+# Cache sizes when they cannot be determined from the system
+L2_CACHE_DEFAULT = 256 * 1024
+L3_CACHE_DEFAULT = 8 * 1024**2
+
+_cache_sizes = {}
+
+def _read_sys_cache(level):
+    name = 'SC_LEVEL%d_CACHE_SIZE' % level
+    try:
+        size = os.sysconf(name)
+        if size > 0:
+            return size
+    except (AttributeError, ValueError, OSError):
+        pass
+
+    path = '/sys/devices/system/cpu/cpu0/cache'
+    if not os.path.isdir(path):
+        return None
+    for index in sorted(os.listdir(path)):
+        try:
+            with open(os.path.join(path, index, 'level')) as f:
+                if int(f.read()) != level:
+                    continue
+            with open(os.path.join(path, index, 'type')) as f:
+                if f.read().strip() == 'Instruction':
+                    continue
+            with open(os.path.join(path, index, 'size')) as f:
+                size = f.read().strip()
+        except (IOError, OSError, ValueError):
+            continue
+        if size[-1] in 'Kk':
+            return int(size[:-1]) * 1024
+        elif size[-1] in 'Mm':
+            return int(size[:-1]) * 1024**2
+        else:
+            return int(size)
+    return None
+
+def cache_size(level=2):
+    '''Size (in bytes) of the L2 cache of one core or the shared L3 cache'''
+    if level == 2 and L2_CACHE is not None:
+        return L2_CACHE
+    elif level == 3 and L3_CACHE is not None:
+        return L3_CACHE
+    if level not in _cache_sizes:
+        size = _read_sys_cache(level)
+        if size is None:
+            if level == 2:
+                size = L2_CACHE_DEFAULT
+            else:
+                size = L3_CACHE_DEFAULT
+        _cache_sizes[level] = size
+    return _cache_sizes[level]
+
+def plan_blksize(unit, max_memory, ntotal=None, ndim=1, fixed=0,
+                 thread_unit=0, thread_fixed=0, cache_unit=0, cache_level=3,
+                 align=1, minimum=1, maximum=None, thread_chunk=0,
+                 nthreads=None):
+    '''Block size of a loop which fits in the memory budget.
+
+    Args:
+        unit : float
+            Bytes of the buffers shared by all threads, per block element.
+        max_memory : float
+            Memory budget in MB.
+
+    Kwargs:
+        ntotal : int
+            The length of the loop.  Blocks are balanced so that the last
+            block is not much smaller than the others.
+        ndim : int
+            The memory grows as blksize**ndim (e.g. ndim=2 for the loops over
+            pairs of indices).
+        fixed : float
+            Bytes of the buffers which do not depend on the block size.
+        thread_unit : float
+            Bytes of the buffers allocated by each thread, per block element.
+        thread_fixed : float
+            Bytes of the buffers allocated by each thread, independent of the
+            block size.
+        cache_unit : float
+            Bytes of the data per block element which are reused in the
+            loop body.  If given, the block is limited to fit the cache of
+            cache_level (the L2 cache of each thread or the shared L3 cache).
+        align : int
+            Block size is a multiple of align.
+        minimum : int
+            The smallest block size.  It has priority over the memory budget.
+        maximum : int
+            The largest block size.
+        thread_chunk : int
+            Number of elements processed by one thread in the loop body.  The
+            cache limit does not reduce the block size below
+            thread_chunk * nthreads, to keep all threads busy.
+
+    Returns:
+        An integer, the block size.
+    '''
+    if nthreads is None:
+        nthreads = num_threads()
+    mem = max_memory * 1e6 - fixed - nthreads * thread_fixed
+    row = unit + nthreads * thread_unit
+    if row > 0:
+        blksize = max(mem, 0) / row
+    else:
+        blksize = numpy.inf
+
+    if cache_unit > 0:
+        if cache_level == 2:
+            cache_limit = cache_size(2) * nthreads / cache_unit
+        else:
+            cache_limit = cache_size(3) / cache_unit
+        cache_limit = max(cache_limit, thread_chunk * nthreads)
+        blksize = min(blksize, cache_limit)
+
+    if ndim > 1:
+        blksize = blksize ** (1./ndim)
+    if maximum is not None:
+        blksize = min(blksize, maximum)
+    if ntotal is not None and ntotal <= blksize:
+        return max(int(ntotal), 1)
+    if blksize == numpy.inf:
+        blksize = max(minimum, align)
+    blksize = int(blksize) // align * align
+    blksize = max(blksize, minimum, align)
+
+    if ntotal is not None and ndim == 1 and blksize < ntotal:
+        # Balance the blocks. The balanced block size is never larger than
+        # the block size above, and never smaller than minimum.
+        nblk = (ntotal + blksize - 1) // blksize
+        balanced = (ntotal + nblk - 1) // nblk
+        balanced = (balanced + align - 1) // align * align
+        blksize = max(min(balanced, blksize), minimum)
+    return int(blksize)
@@ -17,8 +17,19 @@
 #
 
 import sys
+import time
 import json
+import atexit
+import threading
+import contextlib
+import numpy
 import h5py
+from pyscf.lib import logger
+from pyscf.lib.misc import call_in_background
+from pyscf import __config__
+
+# Maximum number of checkpoints waiting in the queue of AsyncWriter
+ASYNC_MAX_PENDING = getattr(__config__, 'lib_chkfile_async_max_pending', 4)
 
 if sys.version_info < (3,):
     RANGE_TYPE = list
@@ -190,3 +201,154 @@ def save_mol(mol, chkfile):
     dump(chkfile, 'mol', mol.dumps())
 dump_mol = save_mol
 
+
+
+class AsyncWriter(object):
+    '''Write checkpoints in a background thread.
+
+    The data of a checkpoint are copied when it is submitted, so the caller
+    can continue updating its arrays.  The queued checkpoints are identified
+    by a tag, e.g. (chkfile, key).  A checkpoint supersedes the pending one of
+    the same tag, so only the latest iteration is written when I/O falls
+    behind.  The caller is blocked only when more than max_pending distinct
+    checkpoints are waiting, and in :func:`flush`.
+
+    Attributes:
+        max_pending : int
+            Size of the queue.
+        sync : bool
+            Write checkpoints in the caller's thread.
+
+    Examples:
+
+    >>> writer = AsyncWriter()
+    >>> writer.submit(('h2o.chk', 'scf'), dump, 'h2o.chk', 'scf', {'e_tot': -76.})
+    >>> writer.flush()
+    '''
+    def __init__(self, max_pending=ASYNC_MAX_PENDING, sync=None):
+        self.max_pending = max_pending
+        self._pending = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._running = False
+        if sync is None:
+            self._bg = call_in_background(self._drain)
+        else:
+            self._bg = call_in_background(self._drain, sync=sync)
+        self._async_drain = self._bg.__enter__()
+        self.reset_stat()
+
+    def reset_stat(self):
+        self.nsubmit = 0
+        self.ncoalesced = 0
+        self.blocked_time = 0
+
+    def submit(self, tag, fn, *args):
+        '''Queue fn(*args) for writing.  Arrays in args are copied.'''
+        t0 = time.time()
+        args = _copy_arrays(args)
+        with self._lock:
+            self.nsubmit += 1
+            if tag in self._pending:
+                self.ncoalesced += 1
+                self._order.remove(tag)
+            self._pending[tag] = (fn, args)
+            self._order.append(tag)
+            full = len(self._order) > self.max_pending
+            start = not self._running
+            if start:
+                self._running = True
+        if start:
+            self._async_drain()
+        if full:
+            self._wait()
+        self.blocked_time += time.time() - t0
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._order:
+                    self._running = False
+                    return
+                tag = self._order.pop(0)
+                fn, args = self._pending.pop(tag)
+            try:
+                fn(*args)
+            except Exception:
+                with self._lock:
+                    self._running = False
+                raise
+
+    def _wait(self):
+        handler = self._bg.handlers[0]
+        if handler is None:  # sync mode
+            return
+        elif hasattr(handler, 'result'):
+            handler.result()
+        else:
+            handler.join()
+
+    def flush(self):
+        '''Wait until all pending checkpoints are written.  Errors raised
+        in the background thread are reraised here.
+
+        Returns:
+            (nsubmit, ncoalesced, blocked_time) since the last flush
+        '''
+        t0 = time.time()
+        try:
+            self._wait()
+        except Exception:
+            self._bg.handlers[0] = None
+            raise
+        finally:
+            with self._lock:
+                pending = [self._pending.pop(tag) for tag in self._order]
+                self._order = []
+                self._running = False
+            # Checkpoints left by a failed background write
+            for fn, args in pending:
+                fn(*args)
+        self.blocked_time += time.time() - t0
+        stat = (self.nsubmit, self.ncoalesced, self.blocked_time)
+        self.reset_stat()
+        return stat
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._bg.__exit__(None, None, None)
+
+def _copy_arrays(obj):
+    if isinstance(obj, numpy.ndarray):
+        return obj.copy()
+    elif isinstance(obj, dict):
+        return dict([(k, _copy_arrays(v)) for k, v in obj.items()])
+    elif isinstance(obj, (tuple, list)):
+        return type(obj)([_copy_arrays(v) for v in obj])
+    else:
+        return obj
+
+_async_writer = []
+def async_writer():
+    '''The AsyncWriter shared by all objects in the current process.  It is
+    flushed when the program exits.'''
+    if not _async_writer:
+        _async_writer.append(AsyncWriter())
+        atexit.register(_async_writer[0].close)
+    return _async_writer[0]
+
+@contextlib.contextmanager
+def async_flush(obj):
+    '''Flush the background checkpoint writes of obj when leaving the
+    context, also when an exception was raised.  The time that obj was
+    blocked by the checkpoint I/O is reported in the log.'''
+    try:
+        yield
+    finally:
+        if _async_writer:
+            nsubmit, ncoalesced, blocked_time = _async_writer[0].flush()
+            if nsubmit > 0:
+                logger.info(obj, 'Async chkfile: %d checkpoints, %d superseded, '
+                            'blocked %.3g s', nsubmit, ncoalesced, blocked_time)
@@ -277,3 +277,54 @@ void VXC_vv10nlc(double *Fvec, double *Uvec, double *Wvec,
         }
 }
 }
+
+/*
+ * Same to VXC_vv10nlc, but the grids are grouped in spatial blocks.  The
+ * contributions of the block pairs (ib, jb) with pair_mask[ib*nvvblk+jb] == 0
+ * are skipped.  Grids of the ib-th block are in [blk_loc[ib], blk_loc[ib+1]).
+ */
+void VXC_vv10nlc_screened(double *Fvec, double *Uvec, double *Wvec,
+                          double *vvcoords, double *coords,
+                          double *W0p, double *W0, double *K, double *Kp,
+                          double *RpW, int *vvblk_loc, int *blk_loc,
+                          char *pair_mask, int nvvblk, int nblk)
+{
+#pragma omp parallel
+{
+        double DX, DY, DZ, R2;
+        double gp, g, gt, T, F, U, W;
+        int i, j, ib, jb;
+        char *mask;
+#pragma omp for schedule(dynamic, 4)
+        for (ib = 0; ib < nblk; ib++) {
+                mask = pair_mask + (size_t)ib * nvvblk;
+                for (i = blk_loc[ib]; i < blk_loc[ib+1]; i++) {
+                        F = 0;
+                        U = 0;
+                        W = 0;
+                        for (jb = 0; jb < nvvblk; jb++) {
+                                if (!mask[jb]) {
+                                        continue;
+                                }
+                                for (j = vvblk_loc[jb]; j < vvblk_loc[jb+1]; j++) {
+                                        DX = vvcoords[j*3+0] - coords[i*3+0];
+                                        DY = vvcoords[j*3+1] - coords[i*3+1];
+                                        DZ = vvcoords[j*3+2] - coords[i*3+2];
+                                        R2 = DX*DX + DY*DY + DZ*DZ;
+                                        gp = R2*W0p[j] + Kp[j];
+                                        g  = R2*W0[i] + K[i];
+                                        gt = g + gp;
+                                        T = RpW[j] / (g*gp*gt);
+                                        F += T;
+                                        T *= 1./g + 1./gt;
+                                        U += T;
+                                        W += T * R2;
+                                }
+                        }
+                        Fvec[i] = F * -1.5;
+                        Uvec[i] = U;
+                        Wvec[i] = W;
+                }
+        }
+}
+}
@@ -21,15 +21,19 @@ DIIS
 """
 
 import sys
+import tempfile
 import numpy
 import scipy.linalg
 from pyscf.lib import logger
 from pyscf.lib import misc
+from pyscf.lib import param
 from pyscf.lib import numpy_helper
 from pyscf import __config__
 
 INCORE_SIZE = getattr(__config__, 'lib_diis_incore_size', 10000000)  # 80 MB
 BLOCK_SIZE  = getattr(__config__, 'lib_diis_block_size', 20000000)  # ~ 160/320 MB
+# Number of elements which share one scaling factor in the blockwise compression
+COMPRESS_BLKSIZE = getattr(__config__, 'lib_diis_compress_blksize', 4096)
 
 # PCCP, 4, 11 (2002); DOI:10.1039/B108658H
 # GEDIIS, JCTC, 2, 835 (2006); DOI:10.1021/ct050275a
@@ -44,6 +48,21 @@ class DIIS(object):
             DIIS subspace size. The maximum number of the vectors to be stored.
         min_space
             The minimal size of subspace before DIIS extrapolation.
+        compress : str
+            Keep the error vectors in memory in a compact format.  'float32'
+            stores the vectors in single precision.  'blockwise' stores 16-bit
+            integers with one scaling factor for every COMPRESS_BLKSIZE
+            elements.  Default is None (no compression).
+        compress_vec : bool
+            Whether to compress the target vectors as well.  The precision of
+            the extrapolated vector is limited by the compression.  Default
+            is False.
+        max_memory : float
+            Memory budget (in MB) for the vectors kept in memory.  Beyond it,
+            the compressed vectors are stored in memory-mapped temporary
+            files and the uncompressed vectors in the DIIS file.  Vectors
+            which are not compressed are kept on disk unless they are smaller
+            than INCORE_SIZE or incore is set.
 
     Functions:
         update(x, xerr=None) :
@@ -108,6 +127,9 @@ class DIIS(object):
         self.space = 6
         self.min_space = 1
         self.incore = incore
+        self.compress = None
+        self.compress_vec = False
+        self.max_memory = None
 
 ##################################################
 # don't modify the following private variables, they are not input options
@@ -119,11 +141,49 @@ class DIIS(object):
         self._H = None
         self._xprev = None
         self._err_vec_touched = False
+        self._err_last = None
+
+    def _incore(self, size):
+        return size < INCORE_SIZE or self.incore
+
+    def _compressed(self, key):
+        # Only the vectors which are compressed are forced in memory.  The
+        # uncompressed target vectors follow the regular on-disk path.
+        return bool(self.compress) and (
+            key[0] == 'e' or
+            (key[0] == 'x' and self.compress_vec and key != 'xprev'))
+
+    def _resident_nbytes(self):
+        nbytes = 0
+        for v in self._buffer.values():
+            if isinstance(v, CompressedVector):
+                nbytes += v.resident_nbytes
+            elif not isinstance(v, numpy.memmap):
+                nbytes += v.nbytes
+        return nbytes
 
     def _store(self, key, value):
-        incore = value.size < INCORE_SIZE or self.incore
-        if incore:
-            self._buffer[key] = value
+        compressed = self._compressed(key)
+        incore = compressed or self._incore(value.size)
+        if key in self._buffer:
+            del(self._buffer[key])
+        if compressed:
+            if key[0] == 'e':
+                # Keep the last error vector in full precision for the
+                # overlaps of the current iteration
+                self._err_last = value
+            if (self.max_memory is not None and
+                self._resident_nbytes() + value.nbytes*.5 > self.max_memory * 1e6):
+                self._buffer[key] = CompressedVector(value, self.compress,
+                                                     _memmap_empty)
+            else:
+                self._buffer[key] = CompressedVector(value, self.compress)
+        elif incore:
+            if (self.max_memory is not None and not self.incore and
+                self._resident_nbytes() + value.nbytes > self.max_memory * 1e6):
+                incore = False
+            else:
+                self._buffer[key] = value
 
         # save the error vector if filename is given, this file can be used to
         # restore the DIIS state
@@ -173,7 +233,7 @@ class DIIS(object):
             ekey = 'e%d'%self._head
             xkey = 'x%d'%self._head
             self._store(xkey, x)
-            if x.size < INCORE_SIZE or self.incore:
+            if self._incore(x.size) or self._compressed(ekey):
                 self._store(ekey, x - numpy.asarray(self._xprev))
             else:  # not call _store to reduce memory footprint
                 if ekey not in self._diisfile:
@@ -185,16 +245,18 @@ class DIIS(object):
             self._head += 1
 
     def get_err_vec(self, idx):
-        if self._buffer:
-            return self._buffer['e%d'%idx]
+        key = 'e%d'%idx
+        if key in self._buffer:
+            return self._buffer[key]
         else:
-            return self._diisfile['e%d'%idx]
+            return self._diisfile[key]
 
     def get_vec(self, idx):
-        if self._buffer:
-            return self._buffer['x%d'%idx]
+        key = 'x%d'%idx
+        if key in self._buffer:
+            return self._buffer[key]
         else:
-            return self._diisfile['x%d'%idx]
+            return self._diisfile[key]
 
     def get_num_vec(self):
         return len(self._bookkeep)
@@ -217,7 +279,10 @@ class DIIS(object):
         if nd < self.min_space:
             return x
 
-        dt = numpy.array(self.get_err_vec(self._head-1), copy=False)
+        dt = self._err_last
+        if dt is None:
+            dt = numpy.array(self.get_err_vec(self._head-1), copy=False)
+        self._err_last = None
         if self._H is None:
             self._H = numpy.zeros((self.space+1,self.space+1), dt.dtype)
             self._H[0,1:] = self._H[1:,0] = 1
@@ -339,3 +404,103 @@ def restore(filename):
     '''Restore/construct diis object based on a diis file'''
     return DIIS().restore(filename)
 
+
+def _memmap_empty(shape, dtype):
+    # The temporary file is removed when the memmap array is released
+    ftmp = tempfile.NamedTemporaryFile(dir=param.TMPDIR)
+    arr = numpy.memmap(ftmp, dtype=dtype, mode='w+', shape=shape)
+    arr._tmpfile = ftmp
+    return arr
+
+class CompressedVector(object):
+    '''A 1D vector stored in the compact format of DIIS.  Slices of the
+    vector are decompressed on access.
+
+    Args:
+        x : ndarray
+            The vector to store.
+        compress : str
+            'float32' or 'blockwise'.
+        empty : function(shape, dtype)
+            Allocator of the compressed data, e.g. for memory-mapped files.
+    '''
+    def __init__(self, x, compress='float32', empty=numpy.empty):
+        x = numpy.asarray(x).ravel()
+        self.dtype = x.dtype
+        self.size = x.size
+        self.compress = compress
+        # Complex vectors are compressed as a real vector of twice the size
+        xr = x.view(x.real.dtype)
+        self._real_dtype = xr.dtype
+        self._ncomp = xr.size // max(1, x.size)
+        n = xr.size
+
+        if compress == 'float32':
+            self._data = empty((n,), numpy.float32)
+            for p0, p1 in misc.prange(0, n, BLOCK_SIZE):
+                self._data[p0:p1] = xr[p0:p1]
+            self._scale = None
+        elif compress == 'blockwise':
+            blksize = COMPRESS_BLKSIZE
+            nblk = (n + blksize - 1) // blksize
+            self._data = empty((nblk*blksize,), numpy.int16)
+            self._scale = numpy.empty(nblk)
+            step = max(1, BLOCK_SIZE // blksize) * blksize
+            for p0, p1 in misc.prange(0, n, step):
+                b0, b1 = p0 // blksize, (p1 + blksize - 1) // blksize
+                blk = numpy.zeros(((b1-b0)*blksize))
+                blk[:p1-p0] = xr[p0:p1]
+                blk = blk.reshape(b1-b0, blksize)
+                scale = abs(blk).max(axis=1)
+                self._scale[b0:b1] = scale / 32767
+                scale[scale == 0] = 1
+                blk *= (32767 / scale)[:,None]
+                self._data[p0:p0+blk.size] = numpy.rint(blk).ravel()
+        else:
+            raise ValueError('Unknown DIIS compression %s' % compress)
+
+    @property
+    def nbytes(self):
+        if self._scale is None:
+            return self._data.nbytes
+        else:
+            return self._data.nbytes + self._scale.nbytes
+
+    @property
+    def resident_nbytes(self):
+        '''Size of the compressed data held in RAM'''
+        if isinstance(self._data, numpy.memmap):
+            return 0 if self._scale is None else self._scale.nbytes
+        return self.nbytes
+
+    @property
+    def shape(self):
+        return (self.size,)
+
+    def _decompress(self, p0, p1):
+        if self._scale is None:
+            return numpy.asarray(self._data[p0:p1], dtype=self._real_dtype)
+        blksize = COMPRESS_BLKSIZE
+        b0, b1 = p0 // blksize, (p1 + blksize - 1) // blksize
+        blk = numpy.asarray(self._data[b0*blksize:b1*blksize], dtype=float)
+        blk = blk.reshape(b1-b0, blksize) * self._scale[b0:b1,None]
+        return blk.ravel()[p0-b0*blksize:p1-b0*blksize]
+
+    def __getitem__(self, s):
+        if not isinstance(s, slice) or s.step not in (None, 1):
+            raise IndexError('CompressedVector only supports contiguous slices')
+        p0, p1, _ = s.indices(self.size)
+        p1 = max(p0, p1)
+        xr = self._decompress(p0*self._ncomp, p1*self._ncomp)
+        return xr.astype(self._real_dtype, copy=False).view(self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        x = self[:]
+        if dtype is not None:
+            x = x.astype(dtype)
+        return x
+
+    def __len__(self):
+        return self.size
+
+
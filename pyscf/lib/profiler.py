@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# Copyright 2014-2020 The PySCF Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+Profiler for the hot kernels
+
+The kernels decorated by :func:`profile` record the number of calls, the CPU
+and wall time, and the estimated FLOPs and bytes (of memory or disk traffic)
+of each call.  The records can be collected globally, or for a particular
+object.  In the latter case, the calls which take the object (e.g. a Mole, SCF
+or CCSD object) as an argument are recorded, as well as the profiled calls
+nested in them.  When profiling is enabled for a Mole object, the methods
+built on this Mole object (which hold it as the attribute .mol) are profiled
+as well.
+
+Examples:
+
+>>> from pyscf import gto, scf, lib
+>>> mol = gto.M(atom='H 0 0 0; F 0 0 1.1', basis='ccpvdz')
+>>> prof = lib.profiler.enable(mol)
+>>> scf.RHF(mol).run()
+>>> prof.report()
+>>> prof.dump_json('hf.json')
+>>> prof.dump_folded('hf.folded')  # input of flamegraph.pl
+'''
+
+import sys
+import time
+import json
+import functools
+import threading
+from pyscf.lib.misc import StreamObject
+from pyscf import __config__
+
+ENABLED = getattr(__config__, 'lib_profiler_enabled', False)
+
+if hasattr(time, 'process_time'):
+    _cpu_time = time.process_time
+else:
+    _cpu_time = time.clock
+
+class Profiler(object):
+    '''Container of the profiling records.
+
+    Attributes:
+        records : dict
+            {name: [ncalls, cpu_time, wall_time, flops, nbytes]}
+        stacks : dict
+            {"outer;inner": self wall time in microseconds} for the
+            flame graph.
+    '''
+    def __init__(self):
+        self.records = {}
+        self.stacks = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.records = {}
+            self.stacks = {}
+        return self
+
+    def add(self, name, cpu, wall, flops=0, nbytes=0, stack=None, self_wall=None):
+        with self._lock:
+            if name not in self.records:
+                self.records[name] = [0, 0., 0., 0., 0.]
+            rec = self.records[name]
+            rec[0] += 1
+            rec[1] += cpu
+            rec[2] += wall
+            rec[3] += flops
+            rec[4] += nbytes
+            if stack is None:
+                stack = name
+            if self_wall is None:
+                self_wall = wall
+            self.stacks[stack] = self.stacks.get(stack, 0) + int(self_wall*1e6)
+
+    def to_dict(self):
+        dat = {}
+        for name, (ncalls, cpu, wall, flops, nbytes) in self.records.items():
+            dat[name] = {'ncalls': ncalls, 'cpu': cpu, 'wall': wall,
+                         'flops': flops, 'bytes': nbytes}
+            if wall > 0:
+                dat[name]['gflops_per_sec'] = flops / wall * 1e-9
+                dat[name]['gbytes_per_sec'] = nbytes / wall * 1e-9
+        return dat
+
+    def dump_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+
+    def dump_folded(self, filename):
+        '''Save the call stacks in the folded format of flamegraph.pl.  The
+        sample counts are the self wall time in microseconds.'''
+        with open(filename, 'w') as f:
+            for stack in sorted(self.stacks):
+                f.write('%s %d\n' % (stack, self.stacks[stack]))
+
+    def report(self, stdout=sys.stdout):
+        stdout.write('%-32s %8s %10s %10s %10s %10s\n' %
+                     ('kernel', 'ncalls', 'CPU (s)', 'wall (s)',
+                      'GFLOP/s', 'GB/s'))
+        for name, dat in sorted(self.to_dict().items(),
+                                key=lambda x: -x[1]['wall']):
+            stdout.write('%-32s %8d %10.2f %10.2f %10.3g %10.3g\n' %
+                         (name, dat['ncalls'], dat['cpu'], dat['wall'],
+                          dat.get('gflops_per_sec', 0),
+                          dat.get('gbytes_per_sec', 0)))
+        stdout.flush()
+
+_global_profiler = Profiler()
+# The stack of the profiled calls of each thread
+_local = threading.local()
+
+def enable(obj=None):
+    '''Enable profiling globally, or for the calls which take obj as an
+    argument.  Returns the Profiler which holds the records.'''
+    global ENABLED
+    if obj is None:
+        ENABLED = True
+        return _global_profiler
+    else:
+        if getattr(obj, '_profiler', None) is None:
+            obj._profiler = Profiler()
+        return obj._profiler
+
+def disable(obj=None):
+    global ENABLED
+    if obj is None:
+        ENABLED = False
+    else:
+        obj._profiler = None
+
+def get_profiler(obj=None):
+    if obj is None:
+        return _global_profiler
+    else:
+        return getattr(obj, '_profiler', None)
+
+def profile(name, cost=None):
+    '''Decorator to record the timing of a kernel function.
+
+    Args:
+        name : str
+            Name of the kernel in the records.
+        cost : function
+            It takes the same arguments as the decorated function and returns
+            the estimated (flops, nbytes) of the call.
+    '''
+    def decorator(fn):
+        @functools.wraps(fn)
+        def profiled_fn(*args, **kwargs):
+            if not hasattr(_local, 'stack'):
+                _local.stack = []
+            if _local.stack:
+                profilers = list(_local.stack[-1][2])
+            else:
+                profilers = []
+            if ENABLED and not profilers:
+                profilers.append(_global_profiler)
+            for a in args:
+                p = getattr(a, '_profiler', None)
+                if p is None and isinstance(a, StreamObject):
+                    p = getattr(getattr(a, 'mol', None), '_profiler', None)
+                if p is not None and p not in profilers:
+                    profilers.append(p)
+            if not profilers:
+                return fn(*args, **kwargs)
+
+            # [name, wall time of the child calls, profilers]
+            frame = [name, 0., profilers]
+            _local.stack.append(frame)
+            cpu0, wall0 = _cpu_time(), time.time()
+            finished = False
+            try:
+                result = fn(*args, **kwargs)
+                finished = True
+                return result
+            finally:
+                cpu = _cpu_time() - cpu0
+                wall = time.time() - wall0
+                stack = ';'.join([f[0] for f in _local.stack])
+                _local.stack.pop()
+                if _local.stack:
+                    _local.stack[-1][1] += wall
+                if cost is None or not finished:
+                    flops = nbytes = 0
+                else:
+                    flops, nbytes = cost(*args, **kwargs)
+                for p in profilers:
+                    p.add(name, cpu, wall, flops, nbytes, stack, wall-frame[1])
+        return profiled_fn
+    return decorator
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# Copyright 2014-2020 The PySCF Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+from pyscf import lib
+from pyscf.lib.blocking import plan_blksize
+
+class KnownValues(unittest.TestCase):
+    def test_memory(self):
+        self.assertEqual(plan_blksize(800, 1, nthreads=1), 1250)
+        self.assertEqual(plan_blksize(800, 1, ndim=2, nthreads=1), 35)
+        self.assertEqual(plan_blksize(800, 0, minimum=16, nthreads=1), 16)
+        self.assertEqual(plan_blksize(800, 10, thread_unit=800, nthreads=1), 6250)
+        self.assertEqual(plan_blksize(800, 10, thread_unit=800, nthreads=9), 1250)
+        self.assertEqual(plan_blksize(800, 10, thread_fixed=5e6, nthreads=1), 6250)
+
+    def test_align_and_balance(self):
+        blksize = plan_blksize(800, 1, ntotal=100000, align=128, minimum=128,
+                               nthreads=1)
+        self.assertEqual(blksize % 128, 0)
+        self.assertTrue(blksize <= 1250)
+        nblk = (100000 + blksize - 1) // blksize
+        self.assertEqual(nblk, (100000 + 1151) // 1152)
+        self.assertEqual(plan_blksize(800, 1000, ntotal=1000, align=128,
+                                      nthreads=1), 1000)
+        self.assertEqual(plan_blksize(800, 1000, ntotal=1000, maximum=240,
+                                      nthreads=1), 200)
+        # Balancing does not go below the minimum
+        self.assertEqual(plan_blksize(800, 1000, ntotal=150, maximum=100,
+                                      minimum=100, nthreads=1), 100)
+        self.assertEqual(plan_blksize(800, 1000, ntotal=150, maximum=80,
+                                      minimum=60, nthreads=1), 75)
+
+    def test_cache(self):
+        l3 = lib.blocking.cache_size(3)
+        self.assertTrue(l3 > 0)
+        blksize = plan_blksize(8, 1000, cache_unit=800, nthreads=1)
+        self.assertEqual(blksize, l3 // 800)
+        blksize = plan_blksize(8, 1000, cache_unit=l3, thread_chunk=64,
+                               nthreads=4)
+        self.assertEqual(blksize, 256)
+
+if __name__ == "__main__":
+    print("Full Tests for lib.blocking")
+    unittest.main()
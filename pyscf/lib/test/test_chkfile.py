@@ -60,6 +60,23 @@ class KnownValues(unittest.TestCase):
         self.assertTrue(numpy.all(a['x'][1] == dat['x'][1]))
         self.assertTrue(numpy.all(a['y'][0] == dat['y'][0]))
 
+    def test_async_writer(self):
+        fchk = tempfile.NamedTemporaryFile()
+        writer = lib.chkfile.AsyncWriter(max_pending=2)
+        a = numpy.zeros(4)
+        for i in range(6):
+            a[:] = i
+            writer.submit((fchk.name, 'a'), lib.chkfile.save, fchk.name, 'a', a)
+        a[:] = -1
+        nsubmit, ncoalesced, blocked_time = writer.flush()
+        self.assertEqual(nsubmit, 6)
+        self.assertTrue(numpy.all(lib.chkfile.load(fchk.name, 'a') == 5))
+
+        writer.submit((fchk.name, 'b'), lib.chkfile.save, fchk.name, 'b',
+                      {'x': numpy.eye(3)})
+        writer.close()
+        self.assertTrue(numpy.all(lib.chkfile.load(fchk.name, 'b/x') == numpy.eye(3)))
+
 
 if __name__ == "__main__":
     print("Full Tests for lib.chkfile")
@@ -48,6 +48,50 @@ class KnownValues(unittest.TestCase):
         self.assertAlmostEqual(abs(a.dot(x) - b).max(), 0, 6)
         self.assertAlmostEqual(abs(x - numpy.linalg.solve(a,b)).max(), 0, 6)
 
+    def test_compress(self):
+        a, b, adiag, arest, x0 = make_ab(16)
+        for compress in ('float32', 'blockwise'):
+            ad = lib.diis.DIIS()
+            ad.compress = compress
+            ad.max_memory = 0  # memory-mapped storage
+            x = x0
+            for i in range(20):
+                e = b - a.dot(x)
+                x = (b - arest.dot(x)) / adiag
+                x = ad.update(x, xerr=e)
+            self.assertTrue(isinstance(ad.get_err_vec(0), lib.diis.CompressedVector))
+            self.assertAlmostEqual(abs(x - numpy.linalg.solve(a,b)).max(), 0, 6)
+
+        x = numpy.random.random(10000) + numpy.random.random(10000) * 1j
+        v = lib.diis.CompressedVector(x, 'blockwise')
+        self.assertAlmostEqual(abs(v[11:5000] - x[11:5000]).max(), 0, 4)
+
+    def test_compress_resident_memory(self):
+        a, b, adiag, arest, x = make_ab(16)
+        lib.diis.INCORE_SIZE, bak = 4, lib.diis.INCORE_SIZE
+        try:
+            ad = lib.diis.DIIS()
+            ad.compress = 'float32'
+            ad.compress_vec = False
+            for i in range(20):
+                e = b - a.dot(x)
+                x = (b - arest.dot(x)) / adiag
+                x = ad.update(x, xerr=e)
+            # Uncompressed target vectors stay on disk
+            self.assertTrue(all(k[0] == 'e' for k in ad._buffer))
+            self.assertTrue('x0' in ad._diisfile)
+            self.assertEqual(ad._resident_nbytes(), ad.space * 16 * 4)
+            self.assertAlmostEqual(abs(x - numpy.linalg.solve(a,b)).max(), 0, 6)
+        finally:
+            lib.diis.INCORE_SIZE = bak
+
+        # Vectors beyond max_memory are not kept in memory
+        ad = lib.diis.DIIS()
+        ad.compress = 'float32'
+        ad.max_memory = 0
+        ad.update(x, xerr=b - a.dot(x))
+        self.assertEqual(ad._resident_nbytes(), 0)
+
     def test_restore(self):
         a, b, adiag, arest, x = make_ab(16)
         lib.diis.INCORE_SIZE, bak = 4, lib.diis.INCORE_SIZE
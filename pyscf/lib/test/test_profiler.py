@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Copyright 2014-2020 The PySCF Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+import json
+import tempfile
+from pyscf import lib
+from pyscf import gto, scf
+
+class KnownValues(unittest.TestCase):
+    def test_nested_calls(self):
+        class Obj(lib.StreamObject):
+            pass
+
+        @lib.profiler.profile('inner', lambda n: (2.*n, 8.*n))
+        def inner(n):
+            return sum(range(n))
+
+        @lib.profiler.profile('outer')
+        def outer(obj, n):
+            return inner(n) + inner(n)
+
+        obj = Obj()
+        prof = lib.profiler.enable(obj)
+        outer(obj, 1000)
+        inner(1000)  # not recorded
+        dat = prof.to_dict()
+        self.assertEqual(dat['outer']['ncalls'], 1)
+        self.assertEqual(dat['inner']['ncalls'], 2)
+        self.assertAlmostEqual(dat['inner']['flops'], 4000, 9)
+        self.assertEqual(sorted(prof.stacks.keys()), ['outer', 'outer;inner'])
+
+        ftmp = tempfile.NamedTemporaryFile()
+        prof.dump_json(ftmp.name)
+        with open(ftmp.name, 'r') as f:
+            self.assertEqual(json.load(f)['inner']['bytes'], 16000)
+        lib.profiler.disable(obj)
+        self.assertTrue(lib.profiler.get_profiler(obj) is None)
+
+    def test_scf(self):
+        mol = gto.M(atom='H 0 0 0; F 0 0 1.1', basis='6-31g', verbose=0)
+        prof = lib.profiler.enable(mol)
+        mf = scf.RHF(mol)
+        mf.max_memory = 0
+        mf.run()
+        dat = prof.to_dict()
+        self.assertEqual(dat['scf.hf.kernel']['ncalls'], 1)
+        self.assertTrue(dat['scf._vhf.direct']['ncalls'] > 1)
+        self.assertTrue(dat['scf._vhf.direct']['flops'] > 0)
+        self.assertTrue('scf.hf.kernel;scf._vhf.direct' in prof.stacks)
+        self.assertTrue('_profiler' not in mol.dumps())
+
+
+if __name__ == "__main__":
+    print("Full Tests for lib.profiler")
+    unittest.main()
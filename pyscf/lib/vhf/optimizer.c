@@ -169,6 +169,42 @@ int CVHFnrs8_vk_prescreen(int *shls, CVHFOpt *opt,
             || (  dm_cond[i*n+l]*qijkl > direct_scf_cutoff));
 }
 
+/*
+ * J and K matrices of different density matrices in one integral pass.
+ * dm_cond has two blocks of nbas*nbas.  The first block bounds the density
+ * matrices of J, the second block bounds the density matrices of K.
+ */
+int CVHFnrs8_jk_split_prescreen(int *shls, CVHFOpt *opt,
+                                int *atm, int *bas, double *env)
+{
+        if (!opt) {
+                return 1; // no screen
+        }
+        int i = shls[0];
+        int j = shls[1];
+        int k = shls[2];
+        int l = shls[3];
+        int n = opt->nbas;
+        double *q_cond = opt->q_cond;
+        double *dmj_cond = opt->dm_cond;
+        double *dmk_cond = opt->dm_cond + n*n;
+        assert(q_cond);
+        assert(opt->dm_cond);
+        assert(i < n);
+        assert(j < n);
+        assert(k < n);
+        assert(l < n);
+        double qijkl = q_cond[i*n+j] * q_cond[k*n+l];
+        double direct_scf_cutoff = opt->direct_scf_cutoff;
+        return qijkl > direct_scf_cutoff
+            &&((4*dmj_cond[j*n+i]*qijkl > direct_scf_cutoff)
+            || (4*dmj_cond[l*n+k]*qijkl > direct_scf_cutoff)
+            || (  dmk_cond[j*n+k]*qijkl > direct_scf_cutoff)
+            || (  dmk_cond[j*n+l]*qijkl > direct_scf_cutoff)
+            || (  dmk_cond[i*n+k]*qijkl > direct_scf_cutoff)
+            || (  dmk_cond[i*n+l]*qijkl > direct_scf_cutoff));
+}
+
 // return flag to decide whether transpose01324
 int CVHFr_vknoscreen(int *shls, CVHFOpt *opt,
                      double **dms_cond, int n_dm, double *dm_atleast,
@@ -283,6 +319,19 @@ void CVHFsetnr_direct_scf(CVHFOpt *opt, int (*intor)(), CINTOpt *cintopt,
 void CVHFset_int2e_q_cond(int (*intor)(), CINTOpt *cintopt, double *q_cond,
                           int *ao_loc, int *atm, int natm,
                           int *bas, int nbas, double *env)
+{
+        CVHFupdate_int2e_q_cond(intor, cintopt, q_cond, NULL, ao_loc,
+                                atm, natm, bas, nbas, env);
+}
+
+/*
+ * Recompute q_cond for the shell pairs which contain at least one shell
+ * flagged in shls_mask.  The other elements of q_cond are not touched.  All
+ * shell pairs are computed if shls_mask is NULL.
+ */
+void CVHFupdate_int2e_q_cond(int (*intor)(), CINTOpt *cintopt, double *q_cond,
+                             int *shls_mask, int *ao_loc, int *atm, int natm,
+                             int *bas, int nbas, double *env)
 {
         int shls_slice[] = {0, nbas};
         const int cache_size = GTOmax_cache_size(intor, shls_slice, 1,
@@ -303,6 +352,9 @@ void CVHFset_int2e_q_cond(int (*intor)(), CINTOpt *cintopt, double *q_cond,
         for (ij = 0; ij < nbas*(nbas+1)/2; ij++) {
                 ish = (int)(sqrt(2*ij+.25) - .5 + 1e-7);
                 jsh = ij - ish*(ish+1)/2;
+                if (shls_mask != NULL && !shls_mask[ish] && !shls_mask[jsh]) {
+                        continue;
+                }
                 di = ao_loc[ish+1] - ao_loc[ish];
                 dj = ao_loc[jsh+1] - ao_loc[jsh];
                 shls[0] = ish;
@@ -61,3 +61,6 @@ void CVHFnr_optimizer(CVHFOpt **vhfopt, int (*intor)(), CINTOpt *cintopt,
 void CVHFset_int2e_q_cond(int (*intor)(), CINTOpt *cintopt, double *q_cond,
                           int *ao_loc, int *atm, int natm,
                           int *bas, int nbas, double *env);
+void CVHFupdate_int2e_q_cond(int (*intor)(), CINTOpt *cintopt, double *q_cond,
+                             int *shls_mask, int *ao_loc, int *atm, int natm,
+                             int *bas, int nbas, double *env);
@@ -17,12 +17,10 @@
 #
 
 import time
-import ctypes
 from functools import reduce
 import numpy
 from pyscf import lib
 from pyscf.lib import logger
-from pyscf.ao2mo import _ao2mo
 from pyscf import df
 
 
@@ -218,23 +216,13 @@ def approx_hessian(casscf, auxbasis=None, with_df=None):
             ncore = self.ncore
             eris.j_pc = numpy.zeros((nmo,ncore))
             k_cp = numpy.zeros((ncore,nmo))
-            fmmm = _ao2mo.libao2mo.AO2MOmmm_nr_s2_iltj
-            fdrv = _ao2mo.libao2mo.AO2MOnr_e2_drv
-            ftrans = _ao2mo.libao2mo.AO2MOtranse2_nr_s2
 
             max_memory = self.max_memory - lib.current_memory()[0]
             blksize = max(4, int(min(self.with_df.blockdim, max_memory*.3e6/8/nmo**2)))
             bufs1 = numpy.empty((blksize,nmo,nmo))
-            for eri1 in self.with_df.loop(blksize):
-                naux = eri1.shape[0]
-                buf = bufs1[:naux]
-                fdrv(ftrans, fmmm,
-                     buf.ctypes.data_as(ctypes.c_void_p),
-                     eri1.ctypes.data_as(ctypes.c_void_p),
-                     mo.ctypes.data_as(ctypes.c_void_p),
-                     ctypes.c_int(naux), ctypes.c_int(nao),
-                     (ctypes.c_int*4)(0, nmo, 0, nmo),
-                     ctypes.c_void_p(0), ctypes.c_int(0))
+            for buf in df.addons.loop_ao2mo(self.with_df, mo, (0, nmo, 0, nmo),
+                                            blksize, bufs1):
+                buf = buf.reshape(-1,nmo,nmo)
                 bufd = numpy.einsum('kii->ki', buf)
                 eris.j_pc += numpy.einsum('ki,kj->ij', bufd, bufd[:,:ncore])
                 k_cp += numpy.einsum('kij,kij->ij', buf[:,:ncore], buf[:,:ncore])
@@ -286,21 +274,12 @@ class _ERIS(object):
         blksize = max(4, int(min(with_df.blockdim, (max_memory*.95e6/8-naoaux*nmo*ncas)/3/nmo**2)))
         bufpa = numpy.empty((naoaux,nmo,ncas))
         bufs1 = numpy.empty((blksize,nmo,nmo))
-        fmmm = _ao2mo.libao2mo.AO2MOmmm_nr_s2_iltj
-        fdrv = _ao2mo.libao2mo.AO2MOnr_e2_drv
-        ftrans = _ao2mo.libao2mo.AO2MOtranse2_nr_s2
         fxpp_keys = []
         b0 = 0
-        for k, eri1 in enumerate(with_df.loop(blksize)):
-            naux = eri1.shape[0]
-            bufpp = bufs1[:naux]
-            fdrv(ftrans, fmmm,
-                 bufpp.ctypes.data_as(ctypes.c_void_p),
-                 eri1.ctypes.data_as(ctypes.c_void_p),
-                 mo.ctypes.data_as(ctypes.c_void_p),
-                 ctypes.c_int(naux), ctypes.c_int(nao),
-                 (ctypes.c_int*4)(0, nmo, 0, nmo),
-                 ctypes.c_void_p(0), ctypes.c_int(0))
+        for k, bufpp in enumerate(df.addons.loop_ao2mo(with_df, mo, (0, nmo, 0, nmo),
+                                                       blksize, bufs1)):
+            naux = bufpp.shape[0]
+            bufpp = bufpp.reshape(naux,nmo,nmo)
             fxpp_keys.append([str(k), b0, b0+naux])
             fxpp[str(k)] = bufpp.transpose(1,2,0)
             bufpa[b0:b0+naux] = bufpp[:,:,ncore:nocc]
@@ -605,6 +605,8 @@ class CASSCF(casci.CASCI):
         chkfile : str
             Checkpoint file to save the intermediate orbitals during the CASSCF optimization.
             Default is the checkpoint file of mean field object.
+        async_chk : bool
+            Whether to write the checkpoints in a background thread.  Default is False.
         ci_response_space : int
             subspace size to solve the CI vector response.  Default is 3.
         callback : function(envs_dict) => None
@@ -689,6 +691,7 @@ class CASSCF(casci.CASCI):
     ci_grad_trust_region = getattr(__config__, 'mcscf_mc1step_CASSCF_ci_grad_trust_region', 3.0)
     with_dep4 = getattr(__config__, 'mcscf_mc1step_CASSCF_with_dep4', False)
     chk_ci = getattr(__config__, 'mcscf_mc1step_CASSCF_chk_ci', False)
+    async_chk = getattr(__config__, 'mcscf_mc1step_CASSCF_async_chk', False)
     kf_interval = getattr(__config__, 'mcscf_mc1step_CASSCF_kf_interval', 4)
     kf_trust_region = getattr(__config__, 'mcscf_mc1step_CASSCF_kf_trust_region', 3.0)
 
@@ -725,7 +728,7 @@ class CASSCF(casci.CASCI):
                     'ah_conv_tol', 'ah_max_cycle', 'ah_lindep',
                     'ah_start_tol', 'ah_start_cycle', 'ah_grad_trust_region',
                     'internal_rotation', 'ci_response_space',
-                    'ci_grad_trust_region', 'with_dep4', 'chk_ci',
+                    'ci_grad_trust_region', 'with_dep4', 'chk_ci', 'async_chk',
                     'kf_interval', 'kf_trust_region', 'fcisolver_max_cycle',
                     'fcisolver_conv_tol', 'natorb', 'canonicalization',
                     'sorting_mo_energy', 'scale_restoration'))
@@ -809,11 +812,12 @@ To enable the solvent model for CASSCF, the following code needs to be called
             self.check_sanity()
         self.dump_flags()
 
-        self.converged, self.e_tot, self.e_cas, self.ci, \
-                self.mo_coeff, self.mo_energy = \
-                _kern(self, mo_coeff,
-                      tol=self.conv_tol, conv_tol_grad=self.conv_tol_grad,
-                      ci0=ci0, callback=callback, verbose=self.verbose)
+        with lib.chkfile.async_flush(self):
+            self.converged, self.e_tot, self.e_cas, self.ci, \
+                    self.mo_coeff, self.mo_energy = \
+                    _kern(self, mo_coeff,
+                          tol=self.conv_tol, conv_tol_grad=self.conv_tol_grad,
+                          ci0=ci0, callback=callback, verbose=self.verbose)
         logger.note(self, 'CASSCF energy = %.15g', self.e_tot)
         self._finalize()
         return self.e_tot, self.e_cas, self.ci, self.mo_coeff, self.mo_energy
@@ -1175,10 +1179,16 @@ To enable the solvent model for CASSCF, the following code needs to be called
             mo_energy = envs['mo_energy']
         else:
             mo_energy = 'None'
-        chkfile.dump_mcscf(self, self.chkfile, 'mcscf', envs['e_tot'],
-                           mo_coeff, ncore, self.ncas, mo_occ,
-                           mo_energy, envs['e_cas'], civec, envs['casdm1'],
-                           overwrite_mol=False)
+        if self.async_chk:
+            lib.chkfile.async_writer().submit(
+                (self.chkfile, 'mcscf'), chkfile.dump_mcscf, self, self.chkfile,
+                'mcscf', envs['e_tot'], mo_coeff, ncore, self.ncas, mo_occ,
+                mo_energy, envs['e_cas'], civec, envs['casdm1'], False)
+        else:
+            chkfile.dump_mcscf(self, self.chkfile, 'mcscf', envs['e_tot'],
+                               mo_coeff, ncore, self.ncas, mo_occ,
+                               mo_energy, envs['e_cas'], civec, envs['casdm1'],
+                               overwrite_mol=False)
         return self
 
     def update_from_chk(self, chkfile=None):
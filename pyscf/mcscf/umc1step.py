@@ -28,6 +28,7 @@ from functools import reduce
 import numpy
 import pyscf.gto
 import pyscf.scf
+from pyscf import lib
 from pyscf.lib import logger
 from pyscf.mcscf import ucasci
 from pyscf.mcscf.mc1step import expmat, rotate_orb_cc
@@ -364,6 +365,7 @@ class UCASSCF(ucasci.UCASCI):
     ci_response_space = getattr(__config__, 'mcscf_umc1step_UCASSCF_ci_response_space', 4)
     with_dep4 = getattr(__config__, 'mcscf_umc1step_UCASSCF_with_dep4', False)
     chk_ci = getattr(__config__, 'mcscf_umc1step_UCASSCF_chk_ci', False)
+    async_chk = getattr(__config__, 'mcscf_umc1step_UCASSCF_async_chk', False)
     kf_interval = getattr(__config__, 'mcscf_umc1step_UCASSCF_kf_interval', 4)
     kf_trust_region = getattr(__config__, 'mcscf_umc1step_UCASSCF_kf_trust_region', 3.0)
 
@@ -397,7 +399,7 @@ class UCASSCF(ucasci.UCASCI):
                     'ah_conv_tol', 'ah_max_cycle', 'ah_lindep',
                     'ah_start_tol', 'ah_start_cycle', 'ah_grad_trust_region',
                     'internal_rotation', 'ci_response_space',
-                    'with_dep4', 'chk_ci',
+                    'with_dep4', 'chk_ci', 'async_chk',
                     'kf_interval', 'kf_trust_region', 'fcisolver_max_cycle',
                     'fcisolver_conv_tol', 'natorb', 'canonicalization',
                     'sorting_mo_energy'))
@@ -457,10 +459,11 @@ class UCASSCF(ucasci.UCASCI):
             self.check_sanity()
         self.dump_flags()
 
-        self.converged, self.e_tot, self.e_cas, self.ci, self.mo_coeff = \
-                _kern(self, mo_coeff,
-                      tol=self.conv_tol, conv_tol_grad=self.conv_tol_grad,
-                      ci0=ci0, callback=callback, verbose=self.verbose)
+        with lib.chkfile.async_flush(self):
+            self.converged, self.e_tot, self.e_cas, self.ci, self.mo_coeff = \
+                    _kern(self, mo_coeff,
+                          tol=self.conv_tol, conv_tol_grad=self.conv_tol_grad,
+                          ci0=ci0, callback=callback, verbose=self.verbose)
         logger.note(self, 'UCASSCF energy = %.15g', self.e_tot)
         #if self.verbose >= logger.INFO:
         #    self.analyze(mo_coeff, self.ci, verbose=self.verbose)
@@ -776,10 +779,16 @@ class UCASSCF(ucasci.UCASCI):
             mo_occ[1,ncore[1]:noccb] = envs['casdm1'][1].diagonal()
         mo_energy = 'None'
 
-        chkfile.dump_mcscf(self, self.chkfile, 'mcscf', envs['e_tot'],
-                           mo_coeff, ncore, ncas, mo_occ,
-                           mo_energy, envs['e_cas'], civec, envs['casdm1'],
-                           overwrite_mol=False)
+        if self.async_chk:
+            lib.chkfile.async_writer().submit(
+                (self.chkfile, 'mcscf'), chkfile.dump_mcscf, self, self.chkfile,
+                'mcscf', envs['e_tot'], mo_coeff, ncore, ncas, mo_occ,
+                mo_energy, envs['e_cas'], civec, envs['casdm1'], False)
+        else:
+            chkfile.dump_mcscf(self, self.chkfile, 'mcscf', envs['e_tot'],
+                               mo_coeff, ncore, ncas, mo_occ,
+                               mo_energy, envs['e_cas'], civec, envs['casdm1'],
+                               overwrite_mol=False)
         return self
 
     def rotate_mo(self, mo, u, log=None):
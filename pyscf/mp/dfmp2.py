@@ -20,7 +20,6 @@ density fitting MP2,  3-center integrals incore.
 import numpy
 from pyscf import lib
 from pyscf.lib import logger
-from pyscf.ao2mo import _ao2mo
 from pyscf import df
 from pyscf.mp import mp2
 from pyscf.mp.mp2 import make_rdm1, make_rdm2
@@ -100,8 +99,7 @@ class DFMP2(mp2.MP2):
         max_memory = max(2000, self.max_memory*.9-mem_now)
         blksize = int(min(naux, max(with_df.blockdim,
                                     (max_memory*1e6/8-nocc*nvir**2*2)/(nocc*nvir))))
-        for eri1 in with_df.loop(blksize=blksize):
-            Lov = _ao2mo.nr_e2(eri1, mo, ijslice, aosym='s2', out=Lov)
+        for Lov in df.addons.loop_ao2mo(with_df, mo, ijslice, blksize, Lov):
             yield Lov
 
     def ao2mo(self, mo_coeff=None):
@@ -451,6 +451,9 @@ class GDF(aft.AFTDF):
         self.exxdiv = None  # to mimic KRHF/KUHF object in function get_coulG
         self.auxcell = None
         self.blockdim = getattr(__config__, 'pbc_df_df_DF_blockdim', 240)
+        # Whether to read the contiguous datasets of the 3-index tensor
+        # through memory maps (see df.addons.memmap)
+        self.mmap_cderi = getattr(__config__, 'pbc_df_df_GDF_mmap_cderi', False)
         self.linear_dep_threshold = LINEAR_DEP_THR
         self._j_only = False
 # If _cderi_to_save is specified, the 3C-integral tensor will be saved in this file.
@@ -499,6 +502,8 @@ class GDF(aft.AFTDF):
             log.info('auxbasis = %s', self.auxcell.basis)
         log.info('eta = %s', self.eta)
         log.info('exp_to_discard = %s', self.exp_to_discard)
+        if self.mmap_cderi:
+            log.info('mmap_cderi = %s', self.mmap_cderi)
         if isinstance(self._cderi, str):
             log.info('_cderi = %s  where DF integrals are loaded (readonly).',
                      self._cderi)
@@ -668,7 +673,8 @@ class GDF(aft.AFTDF):
             return LpqR, LpqI
 
         LpqR = LpqI = None
-        with _load3c(self._cderi, 'j3c', kpti_kptj, 'j3c-kptij') as j3c:
+        with _load3c(self._cderi, 'j3c', kpti_kptj, 'j3c-kptij',
+                     mmap=self.mmap_cderi) as j3c:
             naux = j3c.shape[0]
             if unpack:
                 buf = numpy.empty((min(blksize, naux), nao * (nao + 1) // 2))
@@ -681,7 +687,7 @@ class GDF(aft.AFTDF):
             # CDERI tensor of negative part.
             LpqR = LpqI = None
             with _load3c(self._cderi, 'j3c-', kpti_kptj, 'j3c-kptij',
-                         ignore_key_error=True) as j3c:
+                         ignore_key_error=True, mmap=self.mmap_cderi) as j3c:
                 naux = j3c.shape[0]
                 if unpack:
                     buf = numpy.empty((min(blksize, naux), nao * (nao + 1) // 2))
@@ -861,8 +867,9 @@ def fuse_auxcell(mydf, auxcell):
 
 class _load3c(object):
     def __init__(self, cderi, label, kpti_kptj, kptij_label=None,
-                 ignore_key_error=False):
+                 ignore_key_error=False, mmap=False):
         self.cderi = cderi
+        self.mmap = mmap
         self.label = label
         if kptij_label is None:
             self.kptij_label = label + '-kptij'
@@ -884,12 +891,15 @@ class _load3c(object):
         kpti_kptj = numpy.asarray(self.kpti_kptj)
         kptij_lst = self.feri[self.kptij_label][()]
         return _getitem(self.feri, self.label, kpti_kptj, kptij_lst,
-                        self.ignore_key_error)
+                        self.ignore_key_error, self.mmap)
 
     def __exit__(self, type, value, traceback):
         self.feri.close()
 
-def _getitem(h5group, label, kpti_kptj, kptij_lst, ignore_key_error=False):
+def _getitem(h5group, label, kpti_kptj, kptij_lst, ignore_key_error=False,
+             mmap=False):
+    '''The 3-index tensor of kpti_kptj.  If mmap is set, the blocks stored
+    contiguously in the HDF5 file are read through memory maps.'''
     k_id = member(kpti_kptj, kptij_lst)
     if len(k_id) > 0:
         key = label + '/' + str(k_id[0])
@@ -905,8 +915,12 @@ def _getitem(h5group, label, kpti_kptj, kptij_lst, ignore_key_error=False):
             # foramt (v1.5.1 or older). The old format puts the entire
             # 3-index tensor in an HDF5 dataset. The new format divides
             # the tensor into pieces and stores them in different groups.
-            # The code below combines the slices into a single tensor.
-            dat = numpy.hstack([dat[str(i)] for i in range(len(dat))])
+            # The slices are combined when the rows are loaded.
+            dat = _load_blocks(dat, mmap)
+        elif mmap:
+            mdat = addons.memmap(dat)
+            if mdat is not None:
+                dat = mdat
 
     else:
         # swap ki,kj due to the hermiticity
@@ -927,36 +941,44 @@ def _getitem(h5group, label, kpti_kptj, kptij_lst, ignore_key_error=False):
 
 #TODO: put the numpy.hstack() call in _load_and_unpack class to lazily load
 # the 3D tensor if it is too big.
-        dat = _load_and_unpack(h5group[key])
+        dat = _load_and_unpack(h5group[key], mmap)
     return dat
 
-class _load_and_unpack(object):
-    '''Load data lazily'''
-    def __init__(self, dat):
+class _load_blocks(object):
+    '''Load data lazily.  If mmap is set, the blocks stored contiguously in
+    the HDF5 file are read through memory maps.'''
+    def __init__(self, dat, mmap=False):
         self.dat = dat
-    def __getitem__(self, s):
-        dat = self.dat
         if isinstance(dat, h5py.Group):
-            v = numpy.hstack([dat[str(i)][s] for i in range(len(dat))])
+            self.blocks = [dat[str(i)] for i in range(len(dat))]
         else: # For mpi4pyscf, pyscf-1.5.1 or older
-            v = numpy.asarray(dat[s])
-
-        nao = int(numpy.sqrt(v.shape[-1]))
-        v1 = lib.transpose(v.reshape(-1,nao,nao), axes=(0,2,1)).conj()
-        return v1.reshape(v.shape)
+            self.blocks = [dat]
+        if mmap:
+            for i, x in enumerate(self.blocks):
+                mx = addons.memmap(x)
+                if mx is not None:
+                    self.blocks[i] = mx
+    def __getitem__(self, s):
+        if len(self.blocks) == 1:
+            return numpy.asarray(self.blocks[0][s])
+        else:
+            return numpy.hstack([x[s] for x in self.blocks])
     def __array__(self):
         '''Create a numpy array'''
         return self[()]
 
     @property
     def shape(self):
-        dat = self.dat
-        if isinstance(dat, h5py.Group):
-            all_shape = [dat[str(i)].shape for i in range(len(dat))]
-            shape = all_shape[0][:-1] + (sum(x[-1] for x in all_shape),)
-            return shape
-        else: # For mpi4pyscf, pyscf-1.5.1 or older
-            return dat.shape
+        all_shape = [x.shape for x in self.blocks]
+        return all_shape[0][:-1] + (sum(x[-1] for x in all_shape),)
+
+class _load_and_unpack(_load_blocks):
+    '''Load data lazily and transpose the orbital pairs'''
+    def __getitem__(self, s):
+        v = _load_blocks.__getitem__(self, s)
+        nao = int(numpy.sqrt(v.shape[-1]))
+        v1 = lib.transpose(v.reshape(-1,nao,nao), axes=(0,2,1)).conj()
+        return v1.reshape(v.shape)
 
 
 def _gaussian_int(cell):
@@ -348,6 +348,7 @@ class MDF(df.DF):
         self.exxdiv = None  # to mimic KRHF/KUHF object in function get_coulG
         self.auxcell = None
         self.blockdim = getattr(__config__, 'df_df_DF_blockdim', 240)
+        self.mmap_cderi = getattr(__config__, 'pbc_df_df_GDF_mmap_cderi', False)
         self.linear_dep_threshold = df.LINEAR_DEP_THR
         self._j_only = False
 # If _cderi_to_save is specified, the 3C-integral tensor will be saved in this file.
@@ -85,6 +85,18 @@ class KnownValues(unittest.TestCase):
         eri0000 = ao2mo.restore(1, eri0000, cell.nao_nr()).reshape(eri4444.shape)
         self.assertAlmostEqual(abs(eri0000-eri4444).max(), 0, 4)
 
+    def test_mmap_cderi(self):
+        odf = df.DF(cell)
+        odf.linear_dep_threshold = 1e-7
+        odf.auxbasis = 'weigend'
+        odf.mesh = (6,)*3
+        eri0 = odf.get_eri()
+        odf.mmap_cderi = True
+        eri1 = odf.get_eri()
+        self.assertAlmostEqual(abs(eri1-eri0).max(), 0, 12)
+        with df._load3c(odf._cderi, 'j3c', numpy.zeros((2,3)), mmap=True) as j3c:
+            self.assertTrue(any(isinstance(x, numpy.memmap) for x in j3c.blocks))
+
     def test_get_eri_1111(self):
         eri1111 = kmdf.get_eri((kpts[1],kpts[1],kpts[1],kpts[1]))
         self.assertTrue(eri1111.dtype == numpy.complex128)
@@ -114,6 +114,8 @@ from pyscf.scf import dhf
 from pyscf.scf import chkfile
 from pyscf.scf import addons
 from pyscf.scf import diis
+from pyscf.scf import batch
+from pyscf.scf.batch import batch_kernel
 from pyscf.scf.diis import DIIS, CDIIS, EDIIS, ADIIS
 from pyscf.scf.uhf import spin_square
 from pyscf.scf.hf import get_init_guess
@@ -192,8 +194,9 @@ def sfx2c1e(mf):
     return mf.sfx2c1e()
 sfx2c = sfx2c1e
 
-def density_fit(mf, auxbasis=None, with_df=None, only_dfj=False):
-    return mf.density_fit(auxbasis, with_df, only_dfj)
+def density_fit(mf, auxbasis=None, with_df=None, only_dfj=False,
+                local_k_radius=None):
+    return mf.density_fit(auxbasis, with_df, only_dfj, local_k_radius)
 
 def newton(mf):
     from pyscf.soscf import newton_ah
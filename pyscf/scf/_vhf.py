@@ -16,7 +16,9 @@
 import sys
 import ctypes
 import _ctypes
+import hashlib
 import numpy
+import h5py
 from pyscf import lib
 from pyscf import gto
 from pyscf.gto.moleintor import make_cintopt, make_loc, ascint3
@@ -117,7 +119,12 @@ class VHFOpt(object):
         data = ctypes.cast(self._this.contents.q_cond,
                            ctypes.POINTER(ctypes.c_double))
         return numpy.ctypeslib.as_array(data, shape=shape)
-    q_cond = property(get_q_cond)
+    def set_q_cond(self, q_cond):
+        '''Copy the given array to q_cond'''
+        q_cond = numpy.asarray(q_cond, order='C')
+        libcvhf.CVHFset_q_cond(self._this, q_cond.ctypes.data_as(ctypes.c_void_p),
+                               ctypes.c_int(q_cond.size))
+    q_cond = property(get_q_cond, set_q_cond)
 
     def get_dm_cond(self, shape=None):
         '''Return an array associated to dm_cond. Contents of dm_cond can be
@@ -131,6 +138,127 @@ class VHFOpt(object):
         return numpy.ctypeslib.as_array(data, shape=shape)
     dm_cond = property(get_dm_cond)
 
+def get_q_cond(mol, intor='int2e', cintopt=None, q_cond=None, shls_mask=None):
+    '''Schwarz inequality conditions sqrt(max|(ij|ij)|) of all shell pairs.
+
+    Kwargs:
+        q_cond : 2D array
+            If given, it is updated inplace.  Only the shell pairs which
+            contain the shells flagged in shls_mask are recomputed.
+        shls_mask : 1D bool array
+            Shells to be updated.  All shell pairs are computed if not given.
+    '''
+    intor = mol._add_suffix(intor)
+    nbas = mol.nbas
+    if q_cond is None:
+        q_cond = numpy.empty((nbas,nbas))
+        shls_mask = None
+    if shls_mask is None:
+        c_mask = lib.c_null_ptr()
+    else:
+        shls_mask = numpy.asarray(shls_mask, dtype=numpy.int32)
+        c_mask = shls_mask.ctypes.data_as(ctypes.c_void_p)
+    if cintopt is None:
+        cintopt = make_cintopt(mol._atm, mol._bas, mol._env, intor)
+    ao_loc = make_loc(mol._bas, intor)
+    libcvhf.CVHFupdate_int2e_q_cond(
+        getattr(libcvhf, intor), cintopt,
+        q_cond.ctypes.data_as(ctypes.c_void_p), c_mask,
+        ao_loc.ctypes.data_as(ctypes.c_void_p),
+        mol._atm.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(mol.natm),
+        mol._bas.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(nbas),
+        mol._env.ctypes.data_as(ctypes.c_void_p))
+    return q_cond
+
+def _q_cond_key(mol, intor):
+    '''Fingerprint of the basis set and the integral screening parameters.
+    It does not depend on the geometry of the molecule.'''
+    bas = mol._bas
+    env = mol._env
+    h = hashlib.sha1()
+    h.update(mol._add_suffix(intor).encode())
+    h.update(numpy.asarray(mol._atm[:,gto.CHARGE_OF], dtype=numpy.int32).tobytes())
+    h.update(numpy.asarray(bas[:,:gto.PTR_EXP], dtype=numpy.int32).tobytes())
+    h.update(env[gto.PTR_EXPCUTOFF:gto.PTR_EXPCUTOFF+1].tobytes())
+    for ptr_exp, ptr_coeff, nprim, nctr in bas[:,[gto.PTR_EXP, gto.PTR_COEFF,
+                                                  gto.NPRIM_OF, gto.NCTR_OF]]:
+        h.update(env[ptr_exp:ptr_exp+nprim].tobytes())
+        h.update(env[ptr_coeff:ptr_coeff+nprim*nctr].tobytes())
+    return h.hexdigest()
+
+def get_q_cond_cached(mol, intor='int2e', cintopt=None, cache=None,
+                      cachefile=None, geom_tol=1e-10):
+    '''Schwarz inequality conditions sqrt(max|(ij|ij)|) which reuse the
+    results of previous calculations with the same basis set.
+
+    The q_cond of the previous calculation is looked up in the in-memory
+    cache, then in the HDF5 cachefile, using the fingerprint of the basis set.
+    If only some atoms are moved with respect to the cached geometry, q_cond
+    is recomputed for the shell pairs on the moved atoms only.  Both caches
+    are updated with the new q_cond.  The cachefile is not rewritten when
+    q_cond is found in the in-memory cache (e.g. in the steps of a scan)
+    since the in-memory cache carries the updates.  Errors of reading or
+    writing cachefile (e.g. the file is locked by another process) are
+    reported as warnings.
+
+    Kwargs:
+        cache : dict
+            In-memory cache, e.g. to be carried between the steps of SCF
+            scanner.
+        cachefile : str
+            HDF5 file to store q_cond across jobs.
+        geom_tol : float
+            Atoms displaced less than geom_tol (in Bohr) are treated as not
+            moved.
+    '''
+    key = _q_cond_key(mol, intor)
+    coords = mol.atom_coords()
+
+    q_cond = coords_last = None
+    in_memory = cache is not None and cache.get('key') == key
+    if in_memory:
+        coords_last = cache['coords']
+        q_cond = cache['q_cond'].copy()
+    elif cachefile is not None:
+        try:
+            if h5py.is_hdf5(cachefile):
+                with h5py.File(cachefile, 'r') as f:
+                    if key in f:
+                        coords_last = f[key+'/coords'][:]
+                        q_cond = f[key+'/q_cond'][:]
+        except (IOError, OSError) as e:
+            lib.logger.warn(mol, 'Failed to read q_cond cache %s: %s',
+                            cachefile, e)
+            q_cond = coords_last = None
+
+    if q_cond is None:
+        q_cond = get_q_cond(mol, intor, cintopt)
+        moved = True
+    else:
+        atm_moved = abs(coords - coords_last).max(axis=1) > geom_tol
+        moved = atm_moved.any()
+        if moved:
+            shls_mask = atm_moved[mol._bas[:,gto.ATOM_OF]]
+            q_cond = get_q_cond(mol, intor, cintopt, q_cond, shls_mask)
+
+    if cache is not None:
+        cache['key'] = key
+        cache['coords'] = coords
+        cache['q_cond'] = q_cond.copy()
+    if cachefile is not None and moved and not in_memory:
+        try:
+            with h5py.File(cachefile, 'a') as f:
+                if key in f:
+                    del(f[key])
+                f[key+'/coords'] = coords
+                f[key+'/q_cond'] = q_cond
+        except (IOError, OSError) as e:
+            # e.g. the file is locked by another process
+            lib.logger.warn(mol, 'Failed to update q_cond cache %s: %s',
+                            cachefile, e)
+    return q_cond
+
+
 class _CVHFOpt(ctypes.Structure):
     _fields_ = [('nbas', ctypes.c_int),
                 ('_padding', ctypes.c_int),
@@ -231,21 +359,31 @@ def incore(eri, dms, hermi=0, with_j=True, with_k=True):
         vk = vk.reshape(dms_shape)
     return vj, vk
 
+def _direct_cost(dms, atm, bas, env, vhfopt=None, hermi=0, cart=False,
+                 with_j=True, with_k=True):
+    '''Estimated (FLOPs, bytes) of :func:`direct`.  Integral screening is not
+    taken into account.'''
+    nao = numpy.shape(dms)[-1]
+    n_dm = numpy.size(dms) // nao**2
+    n_ops = n_dm * (bool(with_j) + bool(with_k))
+    # nao**4/8 integrals, each contracted with 8 density matrix elements
+    flops = 2. * nao**4 * n_ops
+    nbytes = 8. * nao**2 * (n_dm + n_ops)
+    return flops, nbytes
+
 # use int2e_sph as cintor, CVHFnrs8_ij_s2kl, CVHFnrs8_jk_s2il as fjk to call
 # direct_mapdm
+@lib.profiler.profile('scf._vhf.direct', _direct_cost)
 def direct(dms, atm, bas, env, vhfopt=None, hermi=0, cart=False,
            with_j=True, with_k=True):
     c_atm = numpy.asarray(atm, dtype=numpy.int32, order='C')
     c_bas = numpy.asarray(bas, dtype=numpy.int32, order='C')
     c_env = numpy.asarray(env, dtype=numpy.double, order='C')
-    natm = ctypes.c_int(c_atm.shape[0])
-    nbas = ctypes.c_int(c_bas.shape[0])
 
     dms = numpy.asarray(dms, order='C')
     dms_shape = dms.shape
     nao = dms_shape[-1]
     dms = dms.reshape(-1,nao,nao)
-    n_dm = dms.shape[0]
 
     if vhfopt is None:
         if cart:
@@ -259,6 +397,53 @@ def direct(dms, atm, bas, env, vhfopt=None, hermi=0, cart=False,
         cvhfopt = vhfopt._this
         cintopt = vhfopt._cintopt
         intor = vhfopt._intor
+    vj, vk = _nr_direct_jk(dms if with_j else None, dms if with_k else None,
+                           hermi, intor, cintopt, cvhfopt, c_atm, c_bas, c_env)
+    if with_j:
+        vj = vj.reshape(dms_shape)
+    if with_k:
+        vk = vk.reshape(dms_shape)
+    return vj, vk
+
+def direct_jk_split(dms_j, dms_k, dm_cond, atm, bas, env, vhfopt, hermi=0):
+    '''J matrices of the density matrices dms_j and K matrices of the density
+    matrices dms_k in one integral pass.
+
+    Args:
+        dm_cond : (2,nbas,nbas) array
+            Upper bounds of the shell blocks of dms_j (dm_cond[0]) and dms_k
+            (dm_cond[1]) for the integral prescreen.  They should be
+            symmetric.
+        vhfopt : VHFOpt
+            It provides q_cond.  Its dm_cond is overwritten.
+    '''
+    c_atm = numpy.asarray(atm, dtype=numpy.int32, order='C')
+    c_bas = numpy.asarray(bas, dtype=numpy.int32, order='C')
+    c_env = numpy.asarray(env, dtype=numpy.double, order='C')
+    dms_j = numpy.asarray(dms_j, order='C')
+    dms_k = numpy.asarray(dms_k, order='C')
+    dms_shape = dms_j.shape
+    nao = dms_shape[-1]
+    assert(dms_k.shape == dms_shape)
+
+    dm_cond = numpy.asarray(dm_cond, order='C')
+    assert(dm_cond.shape == (2, c_bas.shape[0], c_bas.shape[0]))
+    libcvhf.CVHFset_dm_cond(vhfopt._this,
+                            dm_cond.ctypes.data_as(ctypes.c_void_p),
+                            ctypes.c_int(dm_cond.size))
+    with lib.temporary_env(vhfopt, prescreen='CVHFnrs8_jk_split_prescreen'):
+        vj, vk = _nr_direct_jk(dms_j.reshape(-1,nao,nao),
+                               dms_k.reshape(-1,nao,nao), hermi,
+                               vhfopt._intor, vhfopt._cintopt, vhfopt._this,
+                               c_atm, c_bas, c_env)
+    return vj.reshape(dms_shape), vk.reshape(dms_shape)
+
+def _nr_direct_jk(dms_j, dms_k, hermi, intor, cintopt, cvhfopt,
+                  c_atm, c_bas, c_env):
+    '''J matrices of dms_j and K matrices of dms_k (either can be None)
+    in one call of CVHFnr_direct_drv'''
+    natm = ctypes.c_int(c_atm.shape[0])
+    nbas = ctypes.c_int(c_bas.shape[0])
     cintor = _fpointer(intor)
 
     fdrv = getattr(libcvhf, 'CVHFnr_direct_drv')
@@ -269,27 +454,29 @@ def direct(dms, atm, bas, env, vhfopt=None, hermi=0, cart=False,
     vjkptr = []
     fjk = []
 
-    if with_j:
+    if dms_j is not None:
+        n_dm, nao = dms_j.shape[:2]
         fvj = _fpointer('CVHFnrs8_ji_s2kl')
         vj = numpy.empty((n_dm,nao,nao))
-        for i, dm in enumerate(dms):
+        for i, dm in enumerate(dms_j):
             dmsptr.append(dm.ctypes.data_as(ctypes.c_void_p))
             vjkptr.append(vj[i].ctypes.data_as(ctypes.c_void_p))
             fjk.append(fvj)
 
-    if with_k:
+    if dms_k is not None:
+        n_dm, nao = dms_k.shape[:2]
         if hermi == 1:
             fvk = _fpointer('CVHFnrs8_li_s2kj')
         else:
             fvk = _fpointer('CVHFnrs8_li_s1kj')
         vk = numpy.empty((n_dm,nao,nao))
-        for i, dm in enumerate(dms):
+        for i, dm in enumerate(dms_k):
             dmsptr.append(dm.ctypes.data_as(ctypes.c_void_p))
             vjkptr.append(vk[i].ctypes.data_as(ctypes.c_void_p))
             fjk.append(fvk)
 
     shls_slice = (ctypes.c_int*8)(*([0, c_bas.shape[0]]*4))
-    ao_loc = make_loc(bas, intor)
+    ao_loc = make_loc(c_bas, intor)
     n_ops = len(dmsptr)
     comp = 1
     fdrv(cintor, fdot, (ctypes.c_void_p*n_ops)(*fjk),
@@ -300,16 +487,14 @@ def direct(dms, atm, bas, env, vhfopt=None, hermi=0, cart=False,
          c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
          c_env.ctypes.data_as(ctypes.c_void_p))
 
-    if with_j:
+    if vj is not None:
         # vj must be symmetric
-        for i in range(n_dm):
+        for i in range(len(vj)):
             lib.hermi_triu(vj[i], 1, inplace=True)
-        vj = vj.reshape(dms_shape)
-    if with_k:
+    if vk is not None:
         if hermi != 0:
-            for i in range(n_dm):
+            for i in range(len(vk)):
                 lib.hermi_triu(vk[i], hermi, inplace=True)
-        vk = vk.reshape(dms_shape)
     return vj, vk
 
 # call all fjk for each dm, the return array has len(dms)*len(jkdescript)*ncomp components
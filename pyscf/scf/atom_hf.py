@@ -17,15 +17,38 @@
 #
 
 import copy
+import hashlib
 import numpy
+import h5py
 from pyscf import gto
 from pyscf.lib import logger
 from pyscf.lib import param
 from pyscf.data import elements
 from pyscf.scf import hf, rohf
-
-
-def get_atm_nrhf(mol, atomic_configuration=elements.NRSRHF_CONFIGURATION):
+from pyscf import __config__
+
+# HDF5 file to store the atomic SCF results across jobs
+CACHEFILE = getattr(__config__, 'scf_atom_hf_cachefile', None)
+
+# Atomic SCF results of the elements met in the current process, keyed by the
+# fingerprint of the atomic basis, ECP and occupancy configuration
+_atm_scf_cache = {}
+
+def get_atm_nrhf(mol, atomic_configuration=elements.NRSRHF_CONFIGURATION,
+                 cachefile=None):
+    '''Occupancy averaged atomic RHF for each element of mol.
+
+    The atomic SCF results are cached in memory for the current process and
+    in the HDF5 file cachefile (default: the config option
+    scf_atom_hf_cachefile) across processes and jobs.  The cache is keyed by
+    the nuclear model, the basis set, the ECP and the occupancy configuration
+    of the element.
+
+    Returns:
+        A dict {element: (e_tot, mo_energy, mo_coeff, mo_occ)}
+    '''
+    if cachefile is None:
+        cachefile = CACHEFILE
     atm_scf_result = {}
 
     atm_template = copy.copy(mol)
@@ -56,18 +79,73 @@ def get_atm_nrhf(mol, atomic_configuration=elements.NRSRHF_CONFIGURATION):
             mo_coeff = numpy.zeros((nao,nao))
             atm_scf_result[element] = (0, mo_energy, mo_coeff, mo_occ)
         else:
-            if atm.nelectron == 1:
-                atm_hf = AtomHF1e(atm)
-            else:
-                atm_hf = AtomSphericAverageRHF(atm)
-                atm_hf.atomic_configuration = atomic_configuration
-
-            atm_hf.verbose = 4
-            atm_hf.run()
-            atm_scf_result[element] = (atm_hf.e_tot, atm_hf.mo_energy,
-                                       atm_hf.mo_coeff, atm_hf.mo_occ)
+            key = _atom_key(atm, atomic_configuration)
+            if key not in _atm_scf_cache and cachefile:
+                _load_atm_scf(cachefile, key)
+            if key not in _atm_scf_cache:
+                if atm.nelectron == 1:
+                    atm_hf = AtomHF1e(atm)
+                else:
+                    atm_hf = AtomSphericAverageRHF(atm)
+                    atm_hf.atomic_configuration = atomic_configuration
+
+                atm_hf.verbose = 4
+                atm_hf.run()
+                _atm_scf_cache[key] = (atm_hf.e_tot, atm_hf.mo_energy,
+                                      atm_hf.mo_coeff, atm_hf.mo_occ)
+                if cachefile:
+                    _save_atm_scf(mol, cachefile, key)
+            atm_scf_result[element] = _atm_scf_cache[key]
     return atm_scf_result
 
+def _atom_key(atm, atomic_configuration):
+    '''Fingerprint of the basis set, ECP and occupancy configuration of the
+    single-atom molecule atm'''
+    env = atm._env
+    h = hashlib.sha1()
+    h.update(numpy.asarray(atm._atm[0,[gto.CHARGE_OF,gto.NUC_MOD_OF]],
+                           dtype=numpy.int32).tobytes())
+    h.update(env[atm._atm[0,gto.PTR_ZETA]:atm._atm[0,gto.PTR_ZETA]+1].tobytes())
+    h.update(str(atomic_configuration[gto.charge(atm.atom_symbol(0))]).encode())
+    h.update(numpy.asarray(atm._bas[:,gto.ANG_OF:gto.PTR_EXP], dtype=numpy.int32).tobytes())
+    for ptr_exp, ptr_coeff, nprim, nctr in atm._bas[:,[gto.PTR_EXP, gto.PTR_COEFF,
+                                                       gto.NPRIM_OF, gto.NCTR_OF]]:
+        h.update(env[ptr_exp:ptr_exp+nprim].tobytes())
+        h.update(env[ptr_coeff:ptr_coeff+nprim*nctr].tobytes())
+    # ECP: each shell has nprim exponents and nprim coefficients
+    h.update(numpy.asarray(atm._ecpbas[:,gto.ANG_OF:gto.PTR_EXP], dtype=numpy.int32).tobytes())
+    for ptr_exp, ptr_coeff, nprim in atm._ecpbas[:,[gto.PTR_EXP, gto.PTR_COEFF,
+                                                    gto.NPRIM_OF]]:
+        h.update(env[ptr_exp:ptr_exp+nprim].tobytes())
+        h.update(env[ptr_coeff:ptr_coeff+nprim].tobytes())
+    if atm._pseudo:
+        h.update(str(atm._pseudo).encode())
+    return h.hexdigest()
+
+def _load_atm_scf(cachefile, key):
+    if not h5py.is_hdf5(cachefile):
+        return
+    with h5py.File(cachefile, 'r') as f:
+        if key in f:
+            g = f[key]
+            _atm_scf_cache[key] = (g['e_tot'][()], g['mo_energy'][:],
+                                   g['mo_coeff'][:], g['mo_occ'][:])
+
+def _save_atm_scf(mol, cachefile, key):
+    e_tot, mo_energy, mo_coeff, mo_occ = _atm_scf_cache[key]
+    try:
+        with h5py.File(cachefile, 'a') as f:
+            if key in f:
+                del(f[key])
+            f[key+'/e_tot'] = e_tot
+            f[key+'/mo_energy'] = mo_energy
+            f[key+'/mo_coeff'] = mo_coeff
+            f[key+'/mo_occ'] = mo_occ
+    except (IOError, OSError) as e:
+        # e.g. the file is locked by another process
+        logger.warn(mol, 'Failed to update atomic SCF cache %s: %s',
+                    cachefile, e)
+
 
 class AtomSphericAverageRHF(hf.RHF):
     def __init__(self, mol):
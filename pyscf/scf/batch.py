@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# Copyright 2014-2020 The PySCF Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+High-throughput SCF for a large number of small molecules
+
+The SCF calculations are distributed over a pool of worker processes.  The
+worker processes are kept alive for the entire batch.  The atomic grids
+(see :func:`dft.gen_grid.gen_atomic_grids`) and the atomic HF densities of the
+initial guess (see :func:`scf.atom_hf.get_atm_nrhf`) are cached in each
+worker process, so they are computed once for each element rather than once
+for each molecule.  Basis sets are parsed once in the main process.
+
+Examples:
+
+>>> from pyscf import gto, scf
+>>> mols = ['O 0 0 0; H 0 .757 .587; H 0 -.757 .587', 'N 0 0 0; N 0 0 1.1']
+>>> results = scf.batch_kernel(mols, method='B3LYP', basis='6-31g', nproc=2)
+>>> results['e_tot']
+array([ -76.38..., -109.44...])
+'''
+
+import sys
+import traceback
+import multiprocessing
+import numpy
+from pyscf import lib
+from pyscf import gto
+from pyscf.data.elements import _std_symbol_without_ghost
+from pyscf import __config__
+
+if sys.version_info >= (3,):
+    unicode = str
+
+CONV_TOL = getattr(__config__, 'scf_batch_conv_tol', 1e-9)
+MAX_CYCLE = getattr(__config__, 'scf_batch_max_cycle', 50)
+INIT_GUESS = getattr(__config__, 'scf_batch_init_guess', 'atom')
+GRIDS_LEVEL = getattr(__config__, 'scf_batch_grids_level', 3)
+
+# Columns of the result table.  mo_energy is stored as an object since the
+# number of orbitals differs between molecules.
+RESULT_DTYPE = numpy.dtype([('index', numpy.int64),
+                            ('converged', numpy.bool_),
+                            ('e_tot', numpy.float64),
+                            ('nao', numpy.int32),
+                            ('homo', numpy.float64),
+                            ('lumo', numpy.float64),
+                            ('mo_energy', object)])
+
+# Settings shared by all jobs in a worker process
+_worker_options = {}
+
+def _init_worker(options, threads):
+    _worker_options.clear()
+    _worker_options.update(options)
+    if threads is not None:
+        lib.num_threads(threads)
+
+def _pool_context():
+    '''Multiprocessing context of the worker pool.  The workers are not forked
+    from the current process because forking after the OpenMP threads (GNU
+    libgomp) were started may hang the workers.'''
+    if sys.version_info < (3,):
+        return multiprocessing
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    else:
+        return multiprocessing.get_context('spawn')
+
+def _build_mol(job, options):
+    '''Create the Mole object for a job.  job is either the dumps of a Mole
+    object or an atom string which is built with the pre-parsed basis.'''
+    kind, spec = job
+    if kind == 'mol':
+        return gto.loads(spec)
+    else:
+        atom, charge, spin = spec
+        return gto.M(atom=atom, basis=options['basis'], ecp=options['ecp'],
+                     charge=charge, spin=spin, unit=options['unit'],
+                     verbose=0, output=None)
+
+def _new_mf(mol, options):
+    from pyscf import scf, dft
+    method = options['method']
+    if method.upper() in ('HF', 'RHF', 'UHF', 'ROHF'):
+        mf = getattr(scf, method.upper())(mol)
+    else:
+        mf = dft.KS(mol)
+        mf.xc = method
+        mf.grids.level = options['grids_level']
+    mf.conv_tol = options['conv_tol']
+    mf.max_cycle = options['max_cycle']
+    mf.init_guess = options['init_guess']
+    mf.chkfile = None
+    mf.verbose = options['verbose']
+    mf.max_memory = options['max_memory']
+    if options['density_fit']:
+        mf = mf.density_fit()
+    return mf
+
+def _run_job(args):
+    '''Worker function.  Returns (index, converged, e_tot, nao, homo, lumo,
+    mo_energy) for one molecule.  Errors in one job do not stop the batch.'''
+    index, job = args
+    options = _worker_options
+    try:
+        mol = _build_mol(job, options)
+        mf = _new_mf(mol, options)
+        mf.kernel()
+        mo_energy = numpy.asarray(mf.mo_energy)
+        mo_occ = numpy.asarray(mf.mo_occ)
+        e_occ = mo_energy[mo_occ > 0]
+        e_vir = mo_energy[mo_occ == 0]
+        homo = e_occ.max() if e_occ.size > 0 else numpy.nan
+        lumo = e_vir.min() if e_vir.size > 0 else numpy.nan
+        return (index, mf.converged, mf.e_tot, mol.nao, homo, lumo, mo_energy)
+    except Exception:
+        sys.stderr.write('SCF job %d failed\n%s' % (index, traceback.format_exc()))
+        return (index, False, numpy.nan, 0, numpy.nan, numpy.nan, None)
+
+def _parse_basis(basis, elements):
+    '''Parse basis set for the given elements once, so that the worker
+    processes do not have to read the basis set files.'''
+    if isinstance(basis, dict):
+        parsed = {}
+        for symb, bas in basis.items():
+            if isinstance(bas, (str, unicode)):
+                parsed[symb] = gto.basis.load(bas, _std_symbol_without_ghost(symb))
+            else:
+                parsed[symb] = bas
+        if 'default' in basis:
+            for symb in elements:
+                if symb not in parsed:
+                    parsed[symb] = _parse_basis(basis['default'], [symb])[symb]
+        return parsed
+    elif isinstance(basis, (str, unicode)):
+        return dict([(symb, gto.basis.load(basis, symb)) for symb in elements])
+    else:
+        return dict([(symb, basis) for symb in elements])
+
+def _nao_of_basis(bas):
+    '''Number of spherical AOs of a parsed basis of an element'''
+    nao = 0
+    for b in bas:
+        l = b[0]
+        if isinstance(b[1], int):  # kappa
+            prim = b[2]
+        else:
+            prim = b[1]
+        nao += (l * 2 + 1) * (len(prim) - 1)
+    return nao
+
+def _make_jobs(mols, basis, unit):
+    '''Serialize the inputs and estimate the cost of each job.  mols can be
+    a mixture of Mole objects, atom strings and (atom, charge, spin) tuples.'''
+    specs = []
+    elements = set()
+    for mol in mols:
+        if isinstance(mol, gto.Mole):
+            if not mol._built:
+                mol.build(False, False)
+            specs.append(('mol', mol))
+        else:
+            if isinstance(mol, (str, unicode)):
+                atom, charge, spin = mol, 0, None
+            else:
+                atom, charge, spin = mol
+            symbs = [a[0] for a in gto.format_atom(atom, unit=unit)]
+            elements.update([_std_symbol_without_ghost(x) for x in symbs])
+            specs.append(('atom', (atom, charge, spin, symbs)))
+
+    if elements:
+        if basis is None:
+            raise ValueError('basis is required for the molecules given as '
+                             'atom strings')
+        basis = _parse_basis(basis, elements)
+        nao_of_element = dict([(symb, _nao_of_basis(basis[symb]))
+                               for symb in elements])
+
+    jobs = []
+    costs = []
+    for kind, spec in specs:
+        if kind == 'mol':
+            nao = spec.nao
+            jobs.append(('mol', spec.dumps()))
+        else:
+            atom, charge, spin, symbs = spec
+            nao = sum([nao_of_element[_std_symbol_without_ghost(x)]
+                       for x in symbs])
+            if spin is None:
+                nelec = sum([gto.charge(symb) for symb in symbs]) - charge
+                spin = nelec % 2
+            jobs.append(('atom', (atom, charge, spin)))
+        costs.append(nao**3)
+    return jobs, numpy.asarray(costs, dtype=float), basis
+
+def iter_kernel(mols, method='HF', nproc=None, basis=None, ecp=None,
+                unit='Angstrom', density_fit=False, conv_tol=CONV_TOL,
+                max_cycle=MAX_CYCLE, init_guess=INIT_GUESS,
+                grids_level=GRIDS_LEVEL, max_memory=None, verbose=0):
+    '''Run SCF for each molecule in mols on a process pool.  Results are
+    yielded in the order they finish.
+
+    Args:
+        mols : list
+            Each item can be a :class:`Mole` object, an atom string, or a tuple
+            (atom, charge, spin).  spin=None means the lowest spin state.
+
+    Kwargs:
+        method : str
+            'HF' (or RHF, UHF, ROHF) for Hartree-Fock.  Otherwise it is
+            treated as the XC functional of a KS-DFT calculation.
+        nproc : int
+            Number of worker processes.  The OpenMP threads are divided among
+            the workers.  nproc=1 runs the jobs in the current process.  The
+            workers are started by a fork server (or spawned) in Python 3.
+        basis : str or dict
+            Basis set for the molecules given as atom strings.
+
+    Yields:
+        (index, converged, e_tot, nao, homo, lumo, mo_energy) for each
+        molecule.  index is the position of the molecule in mols.
+    '''
+    jobs, costs, basis = _make_jobs(mols, basis, unit)
+    if max_memory is None:
+        max_memory = getattr(__config__, 'MAX_MEMORY', 4000)
+    if nproc is None:
+        nproc = lib.num_threads()
+    nproc = max(1, min(nproc, len(jobs)))
+    options = {'method': method, 'basis': basis, 'ecp': ecp, 'unit': unit,
+               'density_fit': density_fit, 'conv_tol': conv_tol,
+               'max_cycle': max_cycle, 'init_guess': init_guess,
+               'grids_level': grids_level, 'verbose': verbose,
+               'max_memory': max_memory / nproc}
+
+    # Largest jobs first.  Together with the one-by-one dispatching of the
+    # pool, this balances the uneven job sizes across the workers.
+    order = numpy.argsort(-costs, kind='mergesort')
+    tasks = [(i, jobs[i]) for i in order]
+
+    if nproc == 1:
+        _init_worker(options, None)
+        for task in tasks:
+            yield _run_job(task)
+    else:
+        threads = max(1, lib.num_threads() // nproc)
+        pool = _pool_context().Pool(nproc, _init_worker, (options, threads))
+        try:
+            for result in pool.imap_unordered(_run_job, tasks, chunksize=1):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+def batch_kernel(mols, method='HF', nproc=None, basis=None, ecp=None,
+                 unit='Angstrom', density_fit=False, conv_tol=CONV_TOL,
+                 max_cycle=MAX_CYCLE, init_guess=INIT_GUESS,
+                 grids_level=GRIDS_LEVEL, max_memory=None, verbose=0):
+    '''Run SCF for a list of molecules on a process pool.  See
+    :func:`iter_kernel` for the arguments.
+
+    Returns:
+        A numpy record array with the fields index, converged, e_tot, nao,
+        homo, lumo and mo_energy, in the order of the input molecules.
+    '''
+    results = numpy.empty(len(mols), dtype=RESULT_DTYPE)
+    for res in iter_kernel(mols, method, nproc, basis, ecp, unit, density_fit,
+                           conv_tol, max_cycle, init_guess, grids_level,
+                           max_memory, verbose):
+        results[res[0]] = res
+    return results
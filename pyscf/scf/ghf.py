@@ -445,13 +445,12 @@ class GHF(hf.SCF):
     def get_veff(self, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
         if mol is None: mol = self.mol
         if dm is None: dm = self.make_rdm1()
-        if self._eri is not None or not self.direct_scf:
-            vj, vk = self.get_jk(mol, dm, hermi)
-            vhf = vj - vk
-        else:
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
+        ddm, incremental, tol = self._direct_scf_ddm(dm, dm_last)
+        with hf._direct_scf_tol(self, tol):
             vj, vk = self.get_jk(mol, ddm, hermi)
-            vhf = vj - vk + numpy.asarray(vhf_last)
+        vhf = vj - vk
+        if incremental:
+            vhf += numpy.asarray(vhf_last)
         return vhf
 
     def analyze(self, verbose=None, **kwargs):
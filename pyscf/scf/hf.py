@@ -46,6 +46,7 @@ MUTE_CHKFILE = getattr(__config__, 'scf_hf_SCF_mute_chkfile', False)
 if sys.version_info >= (3,):
     unicode = str
 
+@lib.profiler.profile('scf.hf.kernel')
 def kernel(mf, conv_tol=1e-10, conv_tol_grad=None,
            dump_chk=True, dm0=None, callback=None, conv_check=True, **kwargs):
     '''kernel: the SCF driver.
@@ -330,6 +331,10 @@ def get_ovlp(mol):
     return mol.intor_symmetric('int1e_ovlp')
 
 
+# Occupancies and truncated ANO basis of the MINAO guess for each element
+# met in the current process
+_minao_basis_cache = {}
+
 def init_guess_by_minao(mol):
     '''Generate initial guess density matrix based on ANO basis, then project
     the density matrix to the basis set defined by ``mol``
@@ -422,7 +427,18 @@ def init_guess_by_minao(mol):
     basis = {}
     occdic = {}
     for symb, nelec_ecp in nelec_ecp_dic.items():
-        occ_add, basis_add = minao_basis(symb, nelec_ecp)
+        if gto.is_ghost_atom(symb):
+            occ_add, basis_add = minao_basis(symb, nelec_ecp)
+        else:
+            # The ECP basis may be used in the guess when ECP is applied
+            if nelec_ecp > 0:
+                key = (gto.mole._std_symbol(symb), nelec_ecp,
+                       repr(mol._basis[symb]))
+            else:
+                key = (gto.mole._std_symbol(symb), 0)
+            if key not in _minao_basis_cache:
+                _minao_basis_cache[key] = minao_basis(symb, nelec_ecp)
+            occ_add, basis_add = _minao_basis_cache[key]
         occdic[symb] = occ_add
         basis[symb] = basis_add
 
@@ -850,6 +866,124 @@ def get_veff(mol, dm, dm_last=None, vhf_last=None, hermi=1, vhfopt=None):
         vj, vk = get_jk(mol, ddm, hermi, vhfopt)
         return vj - vk * .5 + numpy.asarray(vhf_last)
 
+def _direct_scf_tol(mf, tol):
+    '''Temporarily change the integral screening threshold of the direct SCF
+    optimizer mf.opt'''
+    if isinstance(mf.opt, _vhf.VHFOpt) and tol != mf.opt.direct_scf_tol:
+        return lib.temporary_env(mf.opt, direct_scf_tol=tol)
+    else:
+        return lib.temporary_env(mf.opt)
+
+def _occ_tagged_ddm(mf, dm, dm_last):
+    '''dm - dm_last.  If both dm and dm_last carry the orbitals (see
+    :func:`make_rdm1`), the difference is tagged with the orbitals of the two
+    density matrices and the signed occupations, so that
+    ddm = C n C^T - C_last n_last C_last^T can be used by the
+    occupied-orbital exchange of :meth:`SCF.get_jk`.'''
+    ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
+    if (not mf.occ_k_tol or getattr(dm, 'mo_coeff', None) is None or
+        numpy.iscomplexobj(dm.mo_coeff)):
+        return ddm
+
+    mo_coeff = numpy.asarray(dm.mo_coeff)
+    mo_occ = numpy.asarray(dm.mo_occ)
+    if mo_occ.shape[:-1] != ddm.shape[:-2]:  # e.g. ROHF
+        return ddm
+    if numpy.ndim(dm_last) == 0:
+        return lib.tag_array(ddm, mo_coeff=mo_coeff, mo_occ=mo_occ)
+    elif getattr(dm_last, 'mo_coeff', None) is None:
+        return ddm
+
+    mo_coeff_last = numpy.asarray(dm_last.mo_coeff)
+    mo_occ_last = numpy.asarray(dm_last.mo_occ)
+    if (mo_occ_last.shape[:-1] != mo_occ.shape[:-1] or
+        numpy.iscomplexobj(mo_coeff_last)):
+        return ddm
+    # Only the occupied orbitals are needed to represent the difference
+    nao = ddm.shape[-1]
+    nset = mo_occ[...,0].size
+    mo_coeff = mo_coeff.reshape(nset,nao,-1)
+    mo_occ = mo_occ.reshape(nset,-1)
+    mo_coeff_last = mo_coeff_last.reshape(nset,nao,-1)
+    mo_occ_last = mo_occ_last.reshape(nset,-1)
+    c = []
+    n = []
+    for k in range(nset):
+        idx = mo_occ[k] != 0
+        idx_last = mo_occ_last[k] != 0
+        c.append(numpy.hstack((mo_coeff[k][:,idx], mo_coeff_last[k][:,idx_last])))
+        n.append(numpy.hstack((mo_occ[k][idx], -mo_occ_last[k][idx_last])))
+    if ddm.ndim == 2:
+        return lib.tag_array(ddm, mo_coeff=c[0], mo_occ=n[0])
+
+    # Pad with zero occupations if alpha and beta have different numbers of
+    # occupied orbitals
+    nmo = max([x.size for x in n])
+    c_pad = numpy.zeros((nset,nao,nmo))
+    n_pad = numpy.zeros((nset,nmo))
+    for k in range(nset):
+        c_pad[k,:,:n[k].size] = c[k]
+        n_pad[k,:n[k].size] = n[k]
+    return lib.tag_array(ddm, mo_coeff=c_pad.reshape(ddm.shape[:-1]+(nmo,)),
+                         mo_occ=n_pad.reshape(ddm.shape[:-2]+(nmo,)))
+
+def _occ_k_dm(mol, dm, tol):
+    '''Density matrices for the exchange matrix built from the (signed)
+    occupied orbitals of the tagged dm, and the bounds of the shell blocks of
+    dm and of the exchange density matrices for the integral prescreen
+    (see :func:`_vhf.direct_jk_split`).
+
+    The coefficients of orbital p on AO shell I are bounded by
+    a[I,p] = max_{i in I} |C_ip| sqrt(|n_p|).  The coefficients with
+    a[I,p] < tol are dropped.  The shell blocks of the resultant density
+    matrix which have no orbital coefficients left are zero, and their
+    integrals are skipped by the prescreen of the K contributions.
+
+    Returns None if no coefficient is dropped, or the orbitals are not
+    available.'''
+    if getattr(dm, 'mo_coeff', None) is None:
+        return None
+    mo_coeff = numpy.asarray(dm.mo_coeff)
+    mo_occ = numpy.asarray(dm.mo_occ)
+    ao_loc = mol.ao_loc_nr(mol.cart)
+    nao = dm.shape[-1]
+    if (nao != ao_loc[-1] or numpy.iscomplexobj(mo_coeff) or
+        numpy.iscomplexobj(dm) or mo_occ.shape[:-1] != dm.shape[:-2]):
+        return None
+
+    def shell_max(a):
+        a = numpy.maximum.reduceat(a, ao_loc[:-1], axis=0)
+        return numpy.maximum.reduceat(a, ao_loc[:-1], axis=1)
+
+    nset = mo_occ[...,0].size
+    dms = numpy.asarray(dm).reshape(nset,nao,nao)
+    mo_coeff = mo_coeff.reshape(nset,nao,-1)
+    mo_occ = mo_occ.reshape(nset,-1)
+    dm_k = numpy.zeros((nset,nao,nao))
+    # The bounds should be symmetric, since the prescreen of the 8-fold
+    # symmetric integrals tests only one of the transposed shell pairs
+    dm_cond = numpy.zeros((2,mol.nbas,mol.nbas))
+    kept = total = 0
+    for k in range(nset):
+        a = abs(dms[k])
+        dm_cond[0] = numpy.maximum(dm_cond[0], shell_max(a + a.T) * .5)
+        idx = mo_occ[k] != 0
+        c = mo_coeff[k][:,idx] * numpy.sqrt(abs(mo_occ[k][idx]))
+        if c.size == 0:
+            continue
+        cmax = numpy.maximum.reduceat(abs(c), ao_loc[:-1], axis=0)
+        mask = numpy.repeat(cmax >= tol, ao_loc[1:]-ao_loc[:-1], axis=0)
+        c[~mask] = 0
+        kept += numpy.count_nonzero(mask)
+        total += mask.size
+        dm_k[k] = lib.dot(c * numpy.sign(mo_occ[k][idx]), c.T)
+        dm_cond[1] = numpy.maximum(dm_cond[1], shell_max(abs(dm_k[k])))
+    if kept == total:
+        return None
+    logger.debug(mol, 'Occupied-orbital K: %d of %d coefficients kept',
+                 kept, total)
+    return dm_k.reshape(dm.shape), dm_cond
+
 def get_fock(mf, h1e=None, s1e=None, vhf=None, dm=None, cycle=-1, diis=None,
              diis_start_cycle=None, level_shift_factor=None, damp_factor=None):
     '''F = h^{core} + V^{HF}
@@ -1310,6 +1444,9 @@ class SCF(lib.StreamObject):
         chkfile : str
             checkpoint file to save MOs, orbital energies etc.  Writing to
             chkfile can be disabled if this attribute is set to None or False.
+        async_chk : bool
+            Whether to write the checkpoints in a background thread (see
+            :class:`lib.chkfile.AsyncWriter`).  Default is False.
         conv_tol : float
             converge threshold.  Default is 1e-9
         conv_tol_grad : float
@@ -1344,6 +1481,33 @@ class SCF(lib.StreamObject):
             Direct SCF is used by default.
         direct_scf_tol : float
             Direct SCF cutoff threshold.  Default is 1e-13.
+        direct_scf_adaptive : bool
+            Whether to adjust the integral screening threshold of the
+            incremental Fock build according to the change of density matrix.
+            The threshold starts from direct_scf_loose_tol and is tightened
+            to direct_scf_tol when SCF converges.  The largest element of
+            dm-dm_last rather than the DIIS error is used to measure the
+            convergence, since get_veff does not have access to the DIIS
+            error.  Default is False.
+        direct_scf_loose_tol : float
+            The loosest screening threshold for the adaptive incremental Fock
+            build.  Default is 1e-8.
+        direct_scf_rebuild_cycle : int
+            Rebuild the Fock matrix from scratch after every N incremental
+            builds.  0 means no periodic rebuild.  Default is 0.
+        direct_scf_cache : str
+            HDF5 file to store the Schwarz screening conditions of direct SCF.
+            The screening conditions are reused in later calculations with the
+            same basis set and updated for the atoms which are moved.
+            Default is None.
+        occ_k_tol : float
+            If > 0, the exchange matrix of direct SCF is built from the
+            occupied orbitals of the density matrix (when the orbitals are
+            attached to the density matrix, see :func:`make_rdm1`).  The
+            orbital coefficients smaller than occ_k_tol on an AO shell are
+            dropped.  J and K are computed in one integral pass in which the
+            K contributions are screened with the density matrix of the
+            remaining orbital coefficients.  Default is 0.
         callback : function(envs_dict) => None
             callback function takes one dict as the argument which is
             generated by the builtin function :func:`locals`, so that the
@@ -1396,7 +1560,13 @@ class SCF(lib.StreamObject):
     level_shift = getattr(__config__, 'scf_hf_SCF_level_shift', 0)
     direct_scf = getattr(__config__, 'scf_hf_SCF_direct_scf', True)
     direct_scf_tol = getattr(__config__, 'scf_hf_SCF_direct_scf_tol', 1e-13)
+    direct_scf_adaptive = getattr(__config__, 'scf_hf_SCF_direct_scf_adaptive', False)
+    direct_scf_loose_tol = getattr(__config__, 'scf_hf_SCF_direct_scf_loose_tol', 1e-8)
+    direct_scf_rebuild_cycle = getattr(__config__, 'scf_hf_SCF_direct_scf_rebuild_cycle', 0)
+    direct_scf_cache = getattr(__config__, 'scf_hf_SCF_direct_scf_cache', None)
+    occ_k_tol = getattr(__config__, 'scf_hf_SCF_occ_k_tol', 0)
     conv_check = getattr(__config__, 'scf_hf_SCF_conv_check', True)
+    async_chk = getattr(__config__, 'scf_hf_SCF_async_chk', False)
 
     def __init__(self, mol):
         if not mol._built:
@@ -1429,11 +1599,18 @@ class SCF(lib.StreamObject):
 
         self.opt = None
         self._eri = None # Note: self._eri requires large amount of memory
+        # (screening threshold, num. incremental builds) of incremental Fock build
+        self._direct_scf_state = None
+        # Schwarz conditions of the last direct SCF, kept through reset()
+        self._q_cond_cache = {}
 
         keys = set(('conv_tol', 'conv_tol_grad', 'max_cycle', 'init_guess',
                     'DIIS', 'diis', 'diis_space', 'diis_start_cycle',
                     'diis_file', 'diis_space_rollback', 'damp', 'level_shift',
-                    'direct_scf', 'direct_scf_tol', 'conv_check'))
+                    'direct_scf', 'direct_scf_tol', 'direct_scf_adaptive',
+                    'direct_scf_loose_tol', 'direct_scf_rebuild_cycle',
+                    'direct_scf_cache', 'occ_k_tol', 'conv_check',
+                    'async_chk'))
         self._keys = set(self.__dict__.keys()).union(keys)
 
     def build(self, mol=None):
@@ -1442,6 +1619,7 @@ class SCF(lib.StreamObject):
             self.check_sanity()
         # lazily initialize direct SCF
         self.opt = None
+        self._direct_scf_state = None
         return self
 
     def dump_flags(self, verbose=None):
@@ -1471,8 +1649,19 @@ class SCF(lib.StreamObject):
         log.info('direct_scf = %s', self.direct_scf)
         if self.direct_scf:
             log.info('direct_scf_tol = %g', self.direct_scf_tol)
+            if self.direct_scf_cache:
+                log.info('direct_scf_cache = %s', self.direct_scf_cache)
+            if self.direct_scf_adaptive:
+                log.info('direct_scf_loose_tol = %g', self.direct_scf_loose_tol)
+            if self.direct_scf_rebuild_cycle > 0:
+                log.info('direct_scf_rebuild_cycle = %d',
+                         self.direct_scf_rebuild_cycle)
+            if self.occ_k_tol > 0:
+                log.info('occ_k_tol = %g', self.occ_k_tol)
         if self.chkfile:
             log.info('chkfile to save SCF result = %s', self.chkfile)
+            if self.async_chk:
+                log.info('async_chk = %s', self.async_chk)
         log.info('max_memory %d MB (current use %d MB)',
                  self.max_memory, lib.current_memory()[0])
         return self
@@ -1508,7 +1697,12 @@ class SCF(lib.StreamObject):
         return get_grad(mo_coeff, mo_occ, fock)
 
     def dump_chk(self, envs):
-        if self.chkfile:
+        if self.chkfile and self.async_chk:
+            lib.chkfile.async_writer().submit(
+                (self.chkfile, 'scf'), chkfile.dump_scf, self.mol, self.chkfile,
+                envs['e_tot'], envs['mo_energy'], envs['mo_coeff'],
+                envs['mo_occ'], False)
+        elif self.chkfile:
             chkfile.dump_scf(self.mol, self.chkfile,
                              envs['e_tot'], envs['mo_energy'],
                              envs['mo_coeff'], envs['mo_occ'],
@@ -1636,19 +1830,21 @@ class SCF(lib.StreamObject):
         self.dump_flags()
         self.build(self.mol)
 
-        if self.max_cycle > 0 or self.mo_coeff is None:
-            self.converged, self.e_tot, \
-                    self.mo_energy, self.mo_coeff, self.mo_occ = \
-                    kernel(self, self.conv_tol, self.conv_tol_grad,
-                           dm0=dm0, callback=self.callback,
-                           conv_check=self.conv_check, **kwargs)
-        else:
-            # Avoid to update SCF orbitals in the non-SCF initialization
-            # (issue #495).  But run regular SCF for initial guess if SCF was
-            # not initialized.
-            self.e_tot = kernel(self, self.conv_tol, self.conv_tol_grad,
-                                dm0=dm0, callback=self.callback,
-                                conv_check=self.conv_check, **kwargs)[1]
+        # Pending checkpoints are written before returning or raising
+        with lib.chkfile.async_flush(self):
+            if self.max_cycle > 0 or self.mo_coeff is None:
+                self.converged, self.e_tot, \
+                        self.mo_energy, self.mo_coeff, self.mo_occ = \
+                        kernel(self, self.conv_tol, self.conv_tol_grad,
+                               dm0=dm0, callback=self.callback,
+                               conv_check=self.conv_check, **kwargs)
+            else:
+                # Avoid to update SCF orbitals in the non-SCF initialization
+                # (issue #495).  But run regular SCF for initial guess if SCF
+                # was not initialized.
+                self.e_tot = kernel(self, self.conv_tol, self.conv_tol_grad,
+                                    dm0=dm0, callback=self.callback,
+                                    conv_check=self.conv_check, **kwargs)[1]
 
         logger.timer(self, 'SCF', *cput0)
         self._finalize()
@@ -1670,11 +1866,92 @@ class SCF(lib.StreamObject):
         # Higher accuracy is required for Schwartz inequality prescreening.
         with mol.with_integral_screen(self.direct_scf_tol**2):
             opt = _vhf.VHFOpt(mol, 'int2e', 'CVHFnrs8_prescreen',
-                              'CVHFsetnr_direct_scf',
-                              'CVHFsetnr_direct_scf_dm')
+                              dmcondname='CVHFsetnr_direct_scf_dm')
+            opt.q_cond = _vhf.get_q_cond_cached(mol, 'int2e', opt._cintopt,
+                                                self._q_cond_cache,
+                                                self.direct_scf_cache)
             opt.direct_scf_tol = self.direct_scf_tol
         return opt
 
+    def _direct_scf_schedule(self, dm, dm_last=0):
+        '''Whether the J/K matrices can be built incrementally from the
+        density difference dm-dm_last, and the integral screening threshold
+        for the build.
+
+        When direct_scf_adaptive is enabled, the screening threshold follows
+        the largest element of dm-dm_last.  It is bounded by
+        direct_scf_loose_tol and direct_scf_tol and can only be tightened
+        during the SCF iterations.  The J/K matrices are rebuilt from the full
+        density matrix each time the threshold is tightened or after every
+        direct_scf_rebuild_cycle incremental builds, to remove the errors
+        accumulated in the incremental builds.
+
+        Returns:
+            incremental : bool
+                False means a full build is required.
+            tol : float
+                Screening threshold for the J/K build
+        '''
+        if dm_last is None or numpy.ndim(dm_last) == 0:
+            self._direct_scf_state = None
+            return False, self.direct_scf_tol
+
+        if not self.direct_scf_adaptive and self.direct_scf_rebuild_cycle <= 0:
+            return True, self.direct_scf_tol
+
+        if self._direct_scf_state is None:
+            tol_last, count = None, 0
+        else:
+            tol_last, count = self._direct_scf_state
+
+        tol = self.direct_scf_tol
+        if self.direct_scf_adaptive:
+            ddm_max = abs(numpy.asarray(dm) - numpy.asarray(dm_last)).max()
+            tol = self.direct_scf_loose_tol * ddm_max
+            if tol > 0:
+                # Round down to decades to avoid frequent rebuilds
+                tol = 10**float(numpy.floor(numpy.log10(tol)))
+            tol = min(max(tol, self.direct_scf_tol), self.direct_scf_loose_tol)
+            if tol_last is not None:
+                tol = min(tol, tol_last)
+
+        if tol_last is not None and tol < tol_last:
+            logger.debug(self, 'Rebuild JK with direct_scf_tol %g', tol)
+            incremental = False
+            count = 0
+        elif 0 < self.direct_scf_rebuild_cycle <= count:
+            logger.debug(self, 'Rebuild JK after %d incremental builds', count)
+            incremental = False
+            count = 0
+        else:
+            incremental = True
+            count += 1
+        self._direct_scf_state = (tol, count)
+        return incremental, tol
+
+    def _direct_scf_ddm(self, dm, dm_last=0, incremental=True):
+        '''The density matrix for the J/K build and the integral screening
+        threshold (see :meth:`_direct_scf_schedule`).
+
+        Kwargs:
+            incremental : bool
+                Whether the J/K matrices of dm_last are available for an
+                incremental build.
+
+        Returns:
+            ddm : dm-dm_last for the incremental build, otherwise dm
+            incremental : bool
+            tol : float
+                Screening threshold for the J/K build
+        '''
+        if incremental and self._eri is None and self.direct_scf:
+            incremental, tol = self._direct_scf_schedule(dm, dm_last)
+        else:
+            incremental, tol = self._direct_scf_schedule(dm, None)
+        if incremental:
+            dm = _occ_tagged_ddm(self, dm, dm_last)
+        return dm, incremental, tol
+
     @lib.with_doc(get_jk.__doc__)
     def get_jk(self, mol=None, dm=None, hermi=1, with_j=True, with_k=True,
                omega=None):
@@ -1684,7 +1961,18 @@ class SCF(lib.StreamObject):
         if self.direct_scf and self.opt is None:
             self.opt = self.init_direct_scf(mol)
 
-        if with_j and with_k:
+        occ_k = None
+        if (with_j and with_k and omega is None and self.occ_k_tol > 0 and
+            isinstance(self.opt, _vhf.VHFOpt)):
+            occ_k = _occ_k_dm(mol, dm, self.occ_k_tol)
+
+        if occ_k is not None:
+            # J of the full density matrix and K of the screened occupied
+            # orbitals in one integral pass
+            dm_k, dm_cond = occ_k
+            vj, vk = _vhf.direct_jk_split(dm, dm_k, dm_cond, mol._atm, mol._bas,
+                                          mol._env, self.opt, hermi)
+        elif with_j and with_k:
             vj, vk = get_jk(mol, dm, hermi, self.opt, with_j, with_k, omega)
         else:
             if with_j:
@@ -1712,12 +2000,12 @@ class SCF(lib.StreamObject):
 # Be carefule with the effects of :attr:`SCF.direct_scf` on this function
         if mol is None: mol = self.mol
         if dm is None: dm = self.make_rdm1()
-        if self.direct_scf:
-            ddm = numpy.asarray(dm) - dm_last
+        ddm, incremental, tol = self._direct_scf_ddm(dm, dm_last)
+        with _direct_scf_tol(self, tol):
             vj, vk = self.get_jk(mol, ddm, hermi=hermi)
+        if incremental:
             return vhf_last + vj - vk * .5
         else:
-            vj, vk = self.get_jk(mol, dm, hermi=hermi)
             return vj - vk * .5
 
     @lib.with_doc(analyze.__doc__)
@@ -1761,9 +2049,11 @@ class SCF(lib.StreamObject):
         nbf = self.mol.nao_nr()
         return nbf**4/1e6+lib.current_memory()[0] < self.max_memory*.95
 
-    def density_fit(self, auxbasis=None, with_df=None, only_dfj=False):
+    def density_fit(self, auxbasis=None, with_df=None, only_dfj=False,
+                    local_k_radius=None):
         import pyscf.df.df_jk
-        return pyscf.df.df_jk.density_fit(self, auxbasis, with_df, only_dfj)
+        return pyscf.df.df_jk.density_fit(self, auxbasis, with_df, only_dfj,
+                                          local_k_radius)
 
     def sfx2c1e(self):
         import pyscf.x2c.sfx2c1e
@@ -1797,6 +2087,7 @@ class SCF(lib.StreamObject):
             self.mol = mol
         self.opt = None
         self._eri = None
+        self._direct_scf_state = None
         return self
 
     @property
@@ -1956,13 +2247,11 @@ class RHF(SCF):
     def get_veff(self, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
         if mol is None: mol = self.mol
         if dm is None: dm = self.make_rdm1()
-        if self._eri is not None or not self.direct_scf:
-            vj, vk = self.get_jk(mol, dm, hermi)
-            vhf = vj - vk * .5
-        else:
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
+        ddm, incremental, tol = self._direct_scf_ddm(dm, dm_last)
+        with _direct_scf_tol(self, tol):
             vj, vk = self.get_jk(mol, ddm, hermi)
-            vhf = vj - vk * .5
+        vhf = vj - vk * .5
+        if incremental:
             vhf += numpy.asarray(vhf_last)
         return vhf
 
@@ -419,10 +419,12 @@ class ROHF(hf.RHF):
             vj, vk = self.get_jk(mol, dm, hermi)
             vhf = vj[0] + vj[1] - vk
         else:
-            ddm = dm - numpy.asarray(dm_last)
-            vj, vk = self.get_jk(mol, ddm, hermi)
+            ddm, incremental, tol = self._direct_scf_ddm(dm, dm_last)
+            with hf._direct_scf_tol(self, tol):
+                vj, vk = self.get_jk(mol, ddm, hermi)
             vhf = vj[0] + vj[1] - vk
-            vhf += numpy.asarray(vhf_last)
+            if incremental:
+                vhf += numpy.asarray(vhf_last)
         return vhf
 
     @lib.with_doc(analyze.__doc__)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# Copyright 2014-2020 The PySCF Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+from pyscf import gto
+from pyscf import scf
+from pyscf import dft
+
+mols = ['O 0 0 0; H 0 .757 .587; H 0 -.757 .587',
+        ('O 0 0 0; H 0 0 .97', -1, 0),
+        'H 0 0 0; F 0 0 .92']
+
+def ref_energy(atom, charge, spin, xc):
+    mol = gto.M(atom=atom, basis='6-31g', charge=charge, spin=spin,
+                verbose=0, output=None)
+    if xc == 'HF':
+        mf = scf.HF(mol)
+    else:
+        mf = dft.KS(mol)
+        mf.xc = xc
+    mf.conv_tol = 1e-9
+    return mf.kernel()
+
+class KnownValues(unittest.TestCase):
+    def test_batch_hf(self):
+        res = scf.batch_kernel(mols, basis='6-31g', nproc=2)
+        self.assertTrue(all(res['converged']))
+        self.assertEqual(list(res['index']), [0, 1, 2])
+        self.assertAlmostEqual(res['e_tot'][1],
+                               ref_energy('O 0 0 0; H 0 0 .97', -1, 0, 'HF'), 7)
+
+    def test_batch_dft_serial(self):
+        mol = gto.M(atom=mols[2], basis='6-31g', verbose=0, output=None)
+        res = scf.batch_kernel([mols[0], mol], method='lda,vwn', nproc=1,
+                               basis='6-31g')
+        self.assertAlmostEqual(res['e_tot'][1],
+                               ref_energy(mols[2], 0, 0, 'lda,vwn'), 7)
+        self.assertTrue(res['homo'][0] < res['lumo'][0])
+
+
+if __name__ == "__main__":
+    print("Full Tests for batch SCF")
+    unittest.main()
@@ -17,6 +17,7 @@
 #
 
 import copy
+import tempfile
 import numpy
 import unittest
 from pyscf import lib
@@ -409,6 +410,46 @@ H     0    0.757    0.587'''
         self.assertAlmostEqual(lib.fp(vhf4), 4.9026999849223287, 12)
         self.assertAlmostEqual(abs(vhf4[0]-vhf3).max(), 0, 12)
 
+    def test_direct_scf_adaptive(self):
+        mf1 = scf.RHF(mol)
+        mf1.max_memory = 0
+        mf1.conv_tol = 1e-10
+        mf1.direct_scf_adaptive = True
+        mf1.direct_scf_rebuild_cycle = 4
+        mf1.kernel()
+        self.assertAlmostEqual(mf1.e_tot, mf.e_tot, 9)
+        self.assertAlmostEqual(mf1._direct_scf_state[0], mf1.direct_scf_tol, 14)
+
+    def test_occ_k(self):
+        mf1 = scf.RHF(mol)
+        mf1.max_memory = 0
+        mf1.occ_k_tol = 1e-3
+        dm = mf.make_rdm1()
+        vj0, vk0 = mf.get_jk(mol, numpy.asarray(dm))
+        dm_k = scf.hf._occ_k_dm(mol, dm, mf1.occ_k_tol)[0]
+        vk_ref = scf.hf.get_jk(mol, dm_k, with_j=False)[1]
+        vj1, vk1 = mf1.get_jk(mol, dm)
+        self.assertAlmostEqual(abs(vj1-vj0).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk1-vk_ref).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 2)
+
+        mf1.occ_k_tol = 1e-9
+        mf1.conv_tol = 1e-10
+        mf1.kernel()
+        self.assertAlmostEqual(mf1.e_tot, mf.e_tot, 8)
+
+    def test_init_guess_by_atom_cachefile(self):
+        from pyscf.scf import atom_hf
+        ftmp = tempfile.NamedTemporaryFile()
+        atom_hf._atm_scf_cache.clear()
+        ref = atom_hf.get_atm_nrhf(mol, cachefile=ftmp.name)
+        atom_hf._atm_scf_cache.clear()
+        with lib.temporary_env(atom_hf.AtomSphericAverageRHF, run=None):
+            atm_scf = atom_hf.get_atm_nrhf(mol, cachefile=ftmp.name)
+        for symb in ('O', 'H'):
+            self.assertAlmostEqual(atm_scf[symb][0], ref[symb][0], 12)
+            self.assertAlmostEqual(abs(atm_scf[symb][2]-ref[symb][2]).max(), 0, 12)
+
     def test_hf_symm(self):
         pmol = mol.copy()
         pmol.symmetry = 1
@@ -16,6 +16,8 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
+import os
+import tempfile
 import numpy
 import unittest
 from pyscf import gto
@@ -150,6 +152,29 @@ class KnownValues(unittest.TestCase):
                                  dm, 1, mol._atm, mol._bas, mol._env, opt_llll)
         self.assertTrue(numpy.allclose(vk0,vk1))
 
+    def test_q_cond_cache(self):
+        ref = _vhf.VHFOpt(mol, 'int2e', 'CVHFnrs8_prescreen',
+                          'CVHFsetnr_direct_scf').q_cond
+        self.assertAlmostEqual(abs(_vhf.get_q_cond(mol) - ref).max(), 0, 12)
+
+        mol1 = mol.set_geom_('''
+O     0    0        0
+H     0    -0.757   0.587
+H     0    0.8      0.6''', inplace=False)
+        ref1 = _vhf.get_q_cond(mol1)
+        cache = {}
+        with tempfile.NamedTemporaryFile() as ftmp:
+            q_cond = _vhf.get_q_cond_cached(mol, cache=cache, cachefile=ftmp.name)
+            self.assertAlmostEqual(abs(q_cond - ref).max(), 0, 12)
+            q_cond = _vhf.get_q_cond_cached(mol1, cache=cache)
+            self.assertAlmostEqual(abs(q_cond - ref1).max(), 0, 12)
+            q_cond = _vhf.get_q_cond_cached(mol1, cachefile=ftmp.name)
+            self.assertAlmostEqual(abs(q_cond - ref1).max(), 0, 12)
+
+        # The file cannot be created.  q_cond is computed without the cache
+        cachefile = os.path.join(tempfile.mkdtemp(), 'no-such-dir', 'q_cond.h5')
+        q_cond = _vhf.get_q_cond_cached(mol1, cachefile=cachefile)
+        self.assertAlmostEqual(abs(q_cond - ref1).max(), 0, 12)
 
 if __name__ == "__main__":
     print("Full Tests for _vhf")
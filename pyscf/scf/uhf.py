@@ -878,13 +878,11 @@ class UHF(hf.SCF):
         if dm is None: dm = self.make_rdm1()
         if isinstance(dm, numpy.ndarray) and dm.ndim == 2:
             dm = numpy.asarray((dm*.5,dm*.5))
-        if self._eri is not None or not self.direct_scf:
-            vj, vk = self.get_jk(mol, dm, hermi)
-            vhf = vj[0] + vj[1] - vk
-        else:
-            ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
+        ddm, incremental, tol = self._direct_scf_ddm(dm, dm_last)
+        with hf._direct_scf_tol(self, tol):
             vj, vk = self.get_jk(mol, ddm, hermi)
-            vhf = vj[0] + vj[1] - vk
+        vhf = vj[0] + vj[1] - vk
+        if incremental:
             vhf += numpy.asarray(vhf_last)
         return vhf
 